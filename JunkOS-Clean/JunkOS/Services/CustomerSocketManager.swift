@@ -19,6 +19,9 @@ class CustomerSocketManager: ObservableObject {
     @Published var driverLatitude: Double?
     @Published var driverLongitude: Double?
 
+    /// Highest `v` seen per job, so a late `job:status` cannot roll a job back.
+    private var statusVersions: [String: Int] = [:]
+
     private init() {}
 
     // MARK: - Connection
@@ -65,10 +68,14 @@ class CustomerSocketManager: ObservableObject {
         }
 
         // Listen for job status changes
-        socket?.on("job:status") { data, _ in
+        socket?.on("job:status") { [weak self] data, _ in
             guard let dict = data.first as? [String: Any] else { return }
 
             DispatchQueue.main.async {
+                if let self, let jobId = dict["job_id"] as? String, let version = dict["v"] as? Int {
+                    if let seen = self.statusVersions[jobId], seen > version { return }
+                    self.statusVersions[jobId] = version
+                }
                 NotificationCenter.default.post(
                     name: NSNotification.Name("jobStatusUpdated"),
                     object: nil,
@@ -25,7 +25,8 @@ final class LocationManager: NSObject, CLLocationManagerDelegate {
     var activeJobId: String?
     var contractorId: String?
     private var lastEmitTime: Date?
-    private let emitInterval: TimeInterval = 5.0
+    /// The server-directed rate, 5 s until the server has sent one.
+    private var emitInterval: TimeInterval { SocketIOManager.shared.locationInterval ?? 5.0 }
 
     override init() {
         super.init()
@@ -105,7 +106,8 @@ final class LocationManager: NSObject, CLLocationManagerDelegate {
 
         // Throttled Socket.IO emission during active jobs
         if let activeJobId = activeJobId,
-           let contractorId = contractorId {
+           let contractorId = contractorId,
+           emitInterval > 0 {
             let now = Date()
             let shouldEmit = lastEmitTime == nil || now.timeIntervalSince(lastEmitTime!) >= emitInterval
             if shouldEmit {
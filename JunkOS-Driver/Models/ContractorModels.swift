@@ -158,6 +158,23 @@ struct AvailabilityRequest: Codable {
 struct AvailabilityResponse: Codable {
     let success: Bool
     let contractor: ContractorProfile
+    let locationRate: LocationRate?
+
+    enum CodingKeys: String, CodingKey {
+        case success, contractor
+        case locationRate = "location_rate"
+    }
+}
+
+/// How often the server wants GPS updates (also sent as `driver:location-rate`).
+struct LocationRate: Codable {
+    let mode: String
+    let intervalSeconds: Double     // 0 = stop sending
+
+    enum CodingKeys: String, CodingKey {
+        case mode
+        case intervalSeconds = "interval_seconds"
+    }
 }
 
 // MARK: - Location Update
@@ -169,6 +186,13 @@ struct LocationUpdateRequest: Codable {
 
 struct LocationUpdateResponse: Codable {
     let success: Bool
+    let accepted: Bool?
     let lat: Double
     let lng: Double
+    let locationRate: LocationRate?
+
+    enum CodingKeys: String, CodingKey {
+        case success, accepted, lat, lng
+        case locationRate = "location_rate"
+    }
 }
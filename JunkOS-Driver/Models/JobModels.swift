@@ -179,6 +179,42 @@ struct DriverJob: Codable, Identifiable {
     }
 }
 
+// MARK: - Decoding
+
+extension DriverJob {
+    /// REST endpoints send the full job; the `job:new` socket event sends a
+    /// compact one (no customer, photos or price breakdown), so those fall
+    /// back to empty values here.
+    init(from decoder: Decoder) throws {
+        let container = try decoder.container(keyedBy: CodingKeys.self)
+        id = try container.decode(String.self, forKey: .id)
+        customerId = try container.decodeIfPresent(String.self, forKey: .customerId) ?? ""
+        driverId = try container.decodeIfPresent(String.self, forKey: .driverId)
+        status = try container.decode(String.self, forKey: .status)
+        address = try container.decode(String.self, forKey: .address)
+        lat = try container.decodeIfPresent(Double.self, forKey: .lat)
+        lng = try container.decodeIfPresent(Double.self, forKey: .lng)
+        items = try container.decodeIfPresent([JobItem].self, forKey: .items)
+        volumeEstimate = try container.decodeIfPresent(Double.self, forKey: .volumeEstimate)
+        photos = try container.decodeIfPresent([String].self, forKey: .photos) ?? []
+        beforePhotos = try container.decodeIfPresent([String].self, forKey: .beforePhotos) ?? []
+        afterPhotos = try container.decodeIfPresent([String].self, forKey: .afterPhotos) ?? []
+        scheduledAt = try container.decodeIfPresent(String.self, forKey: .scheduledAt)
+        startedAt = try container.decodeIfPresent(String.self, forKey: .startedAt)
+        completedAt = try container.decodeIfPresent(String.self, forKey: .completedAt)
+        basePrice = try container.decodeIfPresent(Double.self, forKey: .basePrice) ?? 0
+        itemTotal = try container.decodeIfPresent(Double.self, forKey: .itemTotal) ?? 0
+        volumePrice = try container.decodeIfPresent(Double.self, forKey: .volumePrice) ?? 0
+        serviceFee = try container.decodeIfPresent(Double.self, forKey: .serviceFee) ?? 0
+        surgeMultiplier = try container.decodeIfPresent(Double.self, forKey: .surgeMultiplier) ?? 1
+        totalPrice = try container.decodeIfPresent(Double.self, forKey: .totalPrice) ?? 0
+        notes = try container.decodeIfPresent(String.self, forKey: .notes)
+        createdAt = try container.decodeIfPresent(String.self, forKey: .createdAt)
+        updatedAt = try container.decodeIfPresent(String.self, forKey: .updatedAt)
+        distanceKm = try container.decodeIfPresent(Double.self, forKey: .distanceKm)
+    }
+}
+
 // MARK: - API Responses
 
 struct AvailableJobsResponse: Codable {
@@ -25,6 +25,9 @@ final class SocketIOManager {
     var newJobAlert: DriverJob?
     var assignedJobId: String?
 
+    /// Seconds between GPS updates the server asked for (0 = none); nil until it says.
+    var locationInterval: TimeInterval?
+
     private var pendingDriverId: String?
     private var hasLoggedEmitWhileDisconnected = false
 
@@ -141,6 +144,14 @@ final class SocketIOManager {
             }
         }
 
+        // Server-directed GPS rate; sent on joining the driver room and on changes
+        socket?.on("driver:location-rate") { [weak self] data, _ in
+            guard let dict = data.first as? [String: Any],
+                  let seconds = dict["interval_seconds"] as? Double else { return }
+            self?.locationInterval = seconds
+            print("📍 SocketIO: Location rate \(dict["mode"] ?? "?") every \(seconds)s")
+        }
+
         // Listen for room join confirmation from backend
         socket?.on("joined") { [weak self] data, _ in
             guard let dict = data.first as? [String: Any],
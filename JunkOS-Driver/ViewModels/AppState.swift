@@ -47,6 +47,7 @@ final class AppState {
     private var isProfileLoadInFlight = false
     private var lastProfileLoadAt: Date?
     private let minProfileReloadInterval: TimeInterval = 5
+    private var lastLocationSentAt: Date?
 
     // MARK: - Load Profile
 
@@ -156,6 +157,9 @@ final class AppState {
             isOnline = response.contractor.isOnline
             contractorProfile = response.contractor
             toggleError = nil
+            if let rate = response.locationRate {
+                socket.locationInterval = rate.intervalSeconds
+            }
 
             if isOnline {
                 // CRITICAL: Load profile first to ensure we have contractor ID
@@ -182,20 +186,33 @@ final class AppState {
         socket.connect(token: token, contractorId: contractorProfile?.id)
 
         locationManager.onLocationUpdate = { [weak self] location in
+            guard let self else { return }
+            // Send no faster than the server asked (it drops over-rate pings)
+            if let interval = self.socket.locationInterval {
+                guard interval > 0 else { return }
+                if let last = self.lastLocationSentAt,
+                   Date().timeIntervalSince(last) < interval {
+                    return
+                }
+            }
+            self.lastLocationSentAt = Date()
+
             let lat = location.coordinate.latitude
             let lng = location.coordinate.longitude
 
             // Emit via socket for real-time (include contractor_id and active job_id)
-            self?.socket.emitLocation(
+            self.socket.emitLocation(
                 lat: lat,
                 lng: lng,
-                contractorId: self?.contractorProfile?.id,
-                jobId: self?.activeJob?.id
+                contractorId: self.contractorProfile?.id,
+                jobId: self.activeJob?.id
             )
 
             // Also update via REST periodically
             Task {
-                _ = try? await DriverAPIClient.shared.updateLocation(lat: lat, lng: lng)
+                if let rate = try? await DriverAPIClient.shared.updateLocation(lat: lat, lng: lng).locationRate {
+                    self.socket.locationInterval = rate.intervalSeconds
+                }
             }
         }
     }
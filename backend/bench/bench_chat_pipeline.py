@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Benchmark: chat messages per second on one worker, one commit per message
+vs chat_pipeline's group commit.
+
+Seeds N jobs and has S sender threads (a socket handler each) send M
+messages apiece round-robin over the jobs, two ways:
+
+    per message   the old handler: INSERT + commit per message
+    group commit  chat_pipeline.send(...).wait() -- the sender is
+                  acknowledged once the group holding its message commits
+
+then replays R read events the old way (UPDATE + commit each) and through
+the pipeline (coalesced per job and role, skipped once clean).  Reports
+messages/s, commits and p50 / p99 time to acknowledgement.
+
+Uses a throwaway SQLite database unless DATABASE_URL is set -- point it at
+a scratch PostgreSQL database for production-like numbers.
+
+Usage:
+    python bench/bench_chat_pipeline.py                 # 50 jobs, 32 senders x 100 messages
+    python bench/bench_chat_pipeline.py 200 64 200
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+if not os.environ.get("DATABASE_URL"):
+    _tmpdir = tempfile.mkdtemp(prefix="umuve-bench-")
+    os.environ["DATABASE_URL"] = "sqlite:///{}".format(os.path.join(_tmpdir, "bench.db"))
+os.environ.setdefault("FLASK_ENV", "development")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+
+from server import app  # noqa: E402
+from models import db, User, Job, ChatMessage, generate_uuid, utcnow  # noqa: E402
+from chat_pipeline import chat_pipeline  # noqa: E402
+import socket_events  # noqa: E402
+
+READS = 2000
+
+commits = [0]
+
+
+def _seed(n):
+    with app.app_context():
+        customer = User(id=generate_uuid(), email="chat-{}@bench.test".format(generate_uuid()[:8]), role="customer")
+        db.session.add(customer)
+        jobs = [Job(id=generate_uuid(), customer_id=customer.id, status="en_route", address="{} Bench St".format(i))
+                for i in range(n)]
+        db.session.add_all(jobs)
+        db.session.commit()
+        return customer.id, [job.id for job in jobs]
+
+
+def _old_send(job_id, sender_id):
+    msg = ChatMessage(id=generate_uuid(), job_id=job_id, sender_id=sender_id, sender_role="customer", message="On my way")
+    db.session.add(msg)
+    db.session.commit()
+    msg.to_dict()
+
+
+def _new_send(job_id, sender_id):
+    chat_pipeline.send(job_id, sender_id, "customer", "On my way").wait()
+
+
+def _old_read(job_id):
+    (ChatMessage.query
+     .filter_by(job_id=job_id, sender_role="customer")
+     .filter(ChatMessage.read_at.is_(None))
+     .update({"read_at": utcnow()}))
+    db.session.commit()
+
+
+def _new_read(job_id):
+    chat_pipeline.mark_read(job_id, "driver")
+
+
+def _senders(send, jobs, sender_id, threads, per_thread):
+    latencies = []
+    lock = threading.Lock()
+
+    def run(t):
+        mine = []
+        with app.app_context():
+            for k in range(per_thread):
+                start = time.perf_counter()
+                send(jobs[(t + k) % len(jobs)], sender_id)
+                mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    workers = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    commits[0] = 0
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return elapsed, latencies
+
+
+def main():
+    n_jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    per_thread = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    socket_events.socketio.emit = lambda *args, **kwargs: None      # no clients
+    with app.app_context():
+        event.listen(db.engine, "commit", lambda conn: commits.__setitem__(0, commits[0] + 1))
+        dialect = db.engine.dialect.name
+    sender_id, jobs = _seed(n_jobs)
+    total = threads * per_thread
+
+    print("{}, flush {:.0f} ms, {} jobs, {} senders x {} messages".format(
+        dialect, chat_pipeline.flush_seconds * 1000, n_jobs, threads, per_thread))
+    for name, send in (("per message", _old_send), ("group commit", _new_send)):
+        elapsed, lat = _senders(send, jobs, sender_id, threads, per_thread)
+        print("  {:13s} {:8.0f} msg/s  {:6d} commits  ack p50 {:6.1f} ms  p99 {:6.1f} ms".format(
+            name, total / elapsed, commits[0], lat[len(lat) // 2] * 1000, lat[int(len(lat) * 0.99)] * 1000))
+
+    print("{} read events over {} jobs".format(READS, n_jobs))
+    for name, read in (("per event", _old_read), ("coalesced", _new_read)):
+        commits[0] = 0
+        t0 = time.perf_counter()
+        with app.app_context():
+            for k in range(READS):
+                read(jobs[k % n_jobs])
+        chat_pipeline.flush()
+        elapsed = time.perf_counter() - t0
+        print("  {:13s} {:8.0f} reads/s  {:6d} commits".format(name, READS / elapsed, commits[0]))
+    print(chat_pipeline.snapshot())
+
+
+if __name__ == "__main__":
+    main()
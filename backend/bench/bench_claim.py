@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark: 50 drivers accepting the same job at once.
+
+Spins up the Flask app against a throwaway SQLite database and, for each
+round, releases the drivers' threads together at a barrier to claim one
+fresh job, three ways:
+
+    read-check-write  load the job, check its status in Python, set the
+                      driver and commit (how accept_job used to work)
+    claim_job         dispatch.claim_job (one conditional UPDATE) and commit
+    accept endpoint   POST /api/drivers/jobs/<id>/accept, the full request
+
+and reports how many threads believed they won each round (anything but 1
+is a double assignment) and per-attempt latency.
+
+Usage:
+    python bench/bench_claim.py                 # 50 drivers, 20 rounds
+    python bench/bench_claim.py 100 10
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix="umuve-bench-")
+os.environ["DATABASE_URL"] = "sqlite:///{}".format(os.path.join(_tmpdir, "bench.db"))
+os.environ.setdefault("FLASK_ENV", "development")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import app  # noqa: E402
+from models import db, User, Contractor, Job, generate_uuid, utcnow  # noqa: E402
+from auth_routes import generate_token  # noqa: E402
+from extensions import limiter  # noqa: E402
+from dispatch import claim_job  # noqa: E402
+
+limiter.enabled = False
+
+
+def _seed(n):
+    with app.app_context():
+        customer = User(id=generate_uuid(), email="customer@bench.test", role="customer")
+        db.session.add(customer)
+        drivers = []
+        for _ in range(n):
+            user = User(id=generate_uuid(), email="{}@bench.test".format(generate_uuid()), role="driver")
+            contractor = Contractor(id=generate_uuid(), user_id=user.id, is_online=True,
+                                    approval_status="approved", current_lat=26.1, current_lng=-80.1)
+            db.session.add_all([user, contractor])
+            drivers.append((contractor.id, generate_token(user.id)))
+        db.session.commit()
+        return customer.id, drivers
+
+
+def _new_job(customer_id):
+    with app.app_context():
+        job = Job(id=generate_uuid(), customer_id=customer_id, status="confirmed",
+                  address="bench", lat=26.1, lng=-80.1)
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+
+def _read_check_write(job_id, contractor_id, _token):
+    with app.app_context():
+        try:
+            job = db.session.get(Job, job_id)
+            if job.status not in ("pending", "confirmed", "assigned"):
+                return False
+            job.driver_id = contractor_id
+            job.status = "accepted"
+            job.updated_at = utcnow()
+            db.session.commit()
+            return True
+        except Exception:
+            db.session.rollback()
+            return False
+
+
+def _claim(job_id, contractor_id, _token):
+    with app.app_context():
+        try:
+            won = claim_job(job_id, ("pending", "confirmed", "assigned"),
+                            {"driver_id": contractor_id, "status": "accepted"})
+            db.session.commit()
+            return won
+        except Exception:
+            db.session.rollback()
+            return False
+
+
+def _accept(job_id, _contractor_id, token):
+    client = app.test_client()
+    r = client.post("/api/drivers/jobs/{}/accept".format(job_id),
+                    headers={"Authorization": "Bearer " + token})
+    return r.status_code == 200
+
+
+def _round(claim, job_id, drivers):
+    barrier = threading.Barrier(len(drivers))
+    wins, latencies = [], []
+    lock = threading.Lock()
+
+    def worker(contractor_id, token):
+        barrier.wait()
+        t0 = time.perf_counter()
+        won = claim(job_id, contractor_id, token)
+        with lock:
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if won:
+                wins.append(contractor_id)
+
+    threads = [threading.Thread(target=worker, args=d) for d in drivers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return wins, latencies
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    customer_id, drivers = _seed(n)
+
+    print("{} drivers claiming 1 job, {} rounds".format(n, rounds))
+    for name, claim in (("read-check-write", _read_check_write), ("claim_job", _claim),
+                        ("accept endpoint", _accept)):
+        winners, latencies = [], []
+        for _ in range(rounds):
+            wins, lat = _round(claim, _new_job(customer_id), drivers)
+            winners.append(len(wins))
+            latencies += lat
+        latencies.sort()
+        print("  {:17} winners/round {}  double-claimed rounds {}/{}  p50 {:.1f} ms  p99 {:.1f} ms".format(
+            name, sorted(set(winners)), sum(1 for w in winners if w > 1), rounds,
+            latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]))
+
+
+if __name__ == "__main__":
+    main()
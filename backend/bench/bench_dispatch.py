@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: nearby-driver lookups against the in-memory driver index vs. the
+old full-table scan (load every online contractor, haversine each row).
+
+Spins up the Flask app against a throwaway SQLite database, seeds N online
+drivers around South Florida and times both ways of finding the nearest
+free driver and the drivers within the broadcast radius for random jobs.
+
+Usage:
+    python bench/bench_dispatch.py                 # 50, 500 and 5000 drivers
+    python bench/bench_dispatch.py 20000
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix="umuve-bench-")
+os.environ["DATABASE_URL"] = "sqlite:///{}".format(os.path.join(_tmpdir, "bench.db"))
+os.environ.setdefault("FLASK_ENV", "development")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import app  # noqa: E402
+from models import db, User, Contractor, generate_uuid  # noqa: E402
+from driver_index import driver_index  # noqa: E402
+from geofencing import _haversine  # noqa: E402
+from socket_events import DRIVER_BROADCAST_RADIUS_KM  # noqa: E402
+
+LOOKUPS = 200
+
+
+def _random_point(rng):
+    return 25.3 + rng.random() * 1.7, -80.85 + rng.random() * 1.0
+
+
+def _seed(rng, n):
+    with app.app_context():
+        Contractor.query.delete()
+        User.query.filter_by(role="driver").delete()
+        for _ in range(n):
+            lat, lng = _random_point(rng)
+            user = User(id=generate_uuid(), email="{}@bench.test".format(generate_uuid()), role="driver")
+            db.session.add(user)
+            db.session.add(Contractor(id=generate_uuid(), user_id=user.id, is_online=True,
+                                      approval_status="approved", current_lat=lat, current_lng=lng))
+        db.session.commit()
+        driver_index.reload()
+
+
+def _scan(lat, lng):
+    contractors = Contractor.query.filter(
+        Contractor.is_online == True,  # noqa: E712
+        Contractor.approval_status == "approved",
+        Contractor.current_lat.isnot(None),
+    ).all()
+    dists = sorted(((_haversine(lat, lng, c.current_lat, c.current_lng), c.id) for c in contractors),
+                   key=lambda h: h[0])
+    return dists[0][1], [cid for d, cid in dists if d <= DRIVER_BROADCAST_RADIUS_KM]
+
+
+def _indexed(lat, lng):
+    nearest = driver_index.nearest(lat, lng, k=1, include_busy=False)
+    nearby = driver_index.within(lat, lng, DRIVER_BROADCAST_RADIUS_KM)
+    return nearest[0][1].id, [d.id for _dist, d in nearby]
+
+
+def _run(n):
+    rng = random.Random(n)
+    _seed(rng, n)
+    points = [_random_point(rng) for _ in range(LOOKUPS)]
+
+    with app.app_context():
+        t0 = time.perf_counter()
+        scanned = [_scan(lat, lng) for lat, lng in points]
+        t_scan = time.perf_counter() - t0
+        db.session.remove()
+
+        t0 = time.perf_counter()
+        indexed = [_indexed(lat, lng) for lat, lng in points]
+        t_index = time.perf_counter() - t0
+
+    mismatches = sum(1 for a, b in zip(scanned, indexed) if a != b)
+    print("  {:>6} drivers | scan {:8.3f} ms | index {:7.3f} ms | {:6.1f}x | mismatches {}".format(
+        n, t_scan * 1000 / LOOKUPS, t_index * 1000 / LOOKUPS,
+        t_scan / t_index if t_index else float("inf"), mismatches))
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [50, 500, 5000]
+    print("=" * 72)
+    print("Dispatch lookup benchmark: nearest + {:.0f} km radius, per job ({} jobs)".format(
+        DRIVER_BROADCAST_RADIUS_KM, LOOKUPS))
+    print("-" * 72)
+    for n in sizes:
+        _run(n)
+    print("=" * 72)
+
+
+if __name__ == "__main__":
+    main()
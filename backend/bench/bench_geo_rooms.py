@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: job:new / job:accepted broadcast cost against fleet size.
+
+Builds a DriverIndex and a Socket.IO server with one connected socket per
+driver (no transport: packets handed to the socket are counted, not
+sent), spread over several metro markets, and times one broadcast for a
+random job two ways:
+
+    per-driver   the old path: job:new emitted to each driver within the
+                 radius (index lookup + haversine), job:accepted to every
+                 driver's own room
+    geo rooms    one emit to the cell rooms covering the radius
+
+Reports emits per event, sockets reached and time per event.  Sockets
+reached is what each event must cost; everything above it used to grow
+with the fleet.
+
+Usage:
+    python bench/bench_geo_rooms.py               # 1000, 10000 and 50000 drivers
+    python bench/bench_geo_rooms.py 200000
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio  # noqa: E402
+
+from driver_index import DriverIndex, IndexedDriver  # noqa: E402
+from geo_rooms import GeoRooms  # noqa: E402
+
+EVENTS = 200
+RADIUS_KM = 30.0
+TAKEN_RADIUS_KM = 45.0
+
+# (lat, lng) of the markets drivers are spread over, ~40 km around each.
+MARKETS = [
+    (25.77, -80.19),    # Miami
+    (26.12, -80.14),    # Fort Lauderdale
+    (26.71, -80.05),    # West Palm Beach
+    (27.95, -82.46),    # Tampa
+    (28.54, -81.38),    # Orlando
+    (30.33, -81.66),    # Jacksonville
+    (33.75, -84.39),    # Atlanta
+    (29.76, -95.37),    # Houston
+]
+
+
+def _random_point(rng):
+    lat, lng = rng.choice(MARKETS)
+    return lat + rng.uniform(-0.35, 0.35), lng + rng.uniform(-0.35, 0.35)
+
+
+def run(n, rng):
+    index = DriverIndex()
+    index._loaded_at = float("inf")         # never reload from a database
+    rooms = GeoRooms()
+    server = socketio.Server(async_mode="threading")
+    sent = [0]
+    server._send_eio_packet = lambda eio_sid, pkt: sent.__setitem__(0, sent[0] + 1)
+
+    for i in range(n):
+        lat, lng = _random_point(rng)
+        index._attach(IndexedDriver("d{}".format(i), None, None, False, lat, lng))
+        sid = server.manager.connect("eio{}".format(i), "/")
+        server.enter_room(sid, "driver:d{}".format(i))
+        server.enter_room(sid, rooms.room_for(lat, lng))
+
+    jobs = [_random_point(rng) for _ in range(EVENTS)]
+    results = {}
+
+    sent[0] = 0
+    emits = 0
+    t0 = time.perf_counter()
+    for lat, lng in jobs:
+        for _dist, d in index.within(lat, lng, RADIUS_KM, where=lambda d: not d.is_operator):
+            server.emit("job:new", {"lat": lat}, room="driver:{}".format(d.id))
+            emits += 1
+        for d in index.drivers(where=lambda d: not d.is_operator):
+            server.emit("job:accepted", {"lat": lat}, room="driver:{}".format(d.id))
+            emits += 1
+    results["per-driver"] = (emits, sent[0], time.perf_counter() - t0)
+
+    sent[0] = 0
+    emits = 0
+    t0 = time.perf_counter()
+    for lat, lng in jobs:
+        server.emit("job:new", {"lat": lat}, room=rooms.rooms_covering(lat, lng, RADIUS_KM))
+        server.emit("job:accepted", {"lat": lat}, room=rooms.rooms_covering(lat, lng, TAKEN_RADIUS_KM))
+        emits += 2
+    results["geo rooms"] = (emits, sent[0], time.perf_counter() - t0)
+
+    print("{} drivers, {} jobs (job:new + job:accepted each)".format(n, EVENTS))
+    for name, (emits, packets, elapsed) in results.items():
+        print("  {:10s}  {:8.1f} emits/job  {:7.0f} sockets/job  {:8.2f} ms/job".format(
+            name, emits / EVENTS, packets / EVENTS, elapsed / EVENTS * 1000))
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [1000, 10000, 50000]
+    for n in sizes:
+        run(n, random.Random(n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark: the driver job feed's radius search with many open jobs.
+
+Seeds a throwaway SQLite database with N open jobs spread over several
+metro markets and times one feed page (nearest 50 within 30 km) for random
+drivers three ways:
+
+    scan    load every open job and haversine it (the original feed)
+    bbox    bounding-box range query on ix_jobs_location, then haversine
+    rtree   the jobs_rtree R*Tree used by geo_search on SQLite
+
+Usage:
+    python bench/bench_geo_search.py               # 100000 jobs
+    python bench/bench_geo_search.py 20000
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix="umuve-bench-")
+os.environ["DATABASE_URL"] = "sqlite:///{}".format(os.path.join(_tmpdir, "bench.db"))
+os.environ.setdefault("FLASK_ENV", "development")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import app  # noqa: E402
+from models import db, User, Job, generate_uuid  # noqa: E402
+from geofencing import _haversine  # noqa: E402
+import geo_search  # noqa: E402
+
+LOOKUPS = 200
+RADIUS_KM = 30.0
+PAGE = 50
+
+# (lat, lng) of the markets jobs are spread over, ~40 km around each.
+MARKETS = [
+    (25.77, -80.19),    # Miami
+    (26.12, -80.14),    # Fort Lauderdale
+    (26.71, -80.05),    # West Palm Beach
+    (27.95, -82.46),    # Tampa
+    (28.54, -81.38),    # Orlando
+    (30.33, -81.66),    # Jacksonville
+    (33.75, -84.39),    # Atlanta
+    (29.76, -95.37),    # Houston
+]
+
+
+def _random_point(rng):
+    lat, lng = rng.choice(MARKETS)
+    return lat + rng.uniform(-0.35, 0.35), lng + rng.uniform(-0.35, 0.35)
+
+
+def _seed(rng, n):
+    with app.app_context():
+        customer = User(id=generate_uuid(), email="bench@bench.test", role="customer")
+        db.session.add(customer)
+        db.session.commit()
+        rows = []
+        for _ in range(n):
+            lat, lng = _random_point(rng)
+            rows.append({"id": generate_uuid(), "customer_id": customer.id, "address": "bench",
+                         "status": rng.choice(geo_search.OPEN_JOB_STATUSES), "lat": lat, "lng": lng,
+                         "confirmation_code": None})
+        db.session.execute(Job.__table__.insert(), rows)
+        db.session.commit()
+
+
+def _scan(lat, lng):
+    rows = db.session.execute(db.text(
+        "SELECT id, lat, lng FROM jobs WHERE status IN ('pending', 'confirmed')"
+    ))
+    hits = [(_haversine(lat, lng, la, ln), job_id) for job_id, la, ln in rows
+            if la is not None and ln is not None]
+    hits = sorted(h for h in hits if h[0] <= RADIUS_KM)
+    return [job_id for _d, job_id in hits[:PAGE]]
+
+
+def _search(lat, lng):
+    hits, _cursor = geo_search.open_jobs_page(db.session, lat, lng, RADIUS_KM, PAGE)
+    return [job_id for job_id, _d in hits if _d is not None]
+
+
+def _time(fn, points):
+    t0 = time.perf_counter()
+    results = [fn(lat, lng) for lat, lng in points]
+    return (time.perf_counter() - t0) / len(points) * 1000, results
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = random.Random(n)
+    _seed(rng, n)
+    points = [_random_point(rng) for _ in range(LOOKUPS)]
+
+    with app.app_context():
+        print("{} open jobs in {} markets, {} lookups, page of {} within {:.0f} km".format(
+            n, len(MARKETS), LOOKUPS, PAGE, RADIUS_KM))
+        t_scan, expected = _time(_scan, points)
+        print("  scan   {:8.2f} ms/page".format(t_scan))
+        for backend in ("bbox", "rtree"):
+            geo_search._backend = backend
+            t, got = _time(_search, points)
+            mismatches = sum(a != b for a, b in zip(expected, got))
+            print("  {:6} {:8.2f} ms/page  ({:.0f}x, {} mismatches)".format(
+                backend, t, t_scan / t, mismatches))
+
+
+if __name__ == "__main__":
+    main()
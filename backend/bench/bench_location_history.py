@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Benchmark: driver GPS history as binary day segments vs a row-per-ping table.
+
+Generates a synthetic shift for N drivers (a ping every 3 s: driving legs
+with turns, plus stops at jobs) and stores it two ways:
+
+    segments  location_history (16-byte records, memory-mapped reads)
+    sql       SQLite table (id, contractor_id, recorded_at, lat, lng) with
+              an index on (contractor_id, recorded_at) -- the obvious schema
+
+Reports ingest cost per ping, bytes per ping, and the time to fetch one
+driver's one-hour track.  The segments are then compacted with
+Douglas-Peucker and measured again, including the worst error of a
+time-interpolated replay against the raw pings.
+
+Usage:
+    python bench/bench_location_history.py              # 100 drivers, 8 hours
+    python bench/bench_location_history.py 300 10
+"""
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from math import cos, radians, sin
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from location_history import LocationHistory, SECONDS_PER_DAY, METRES_PER_DEG  # noqa: E402
+
+PING_SECONDS = 3
+LOOKUPS = 200
+DAY = 20000     # 2024-10-04, far enough back to be compacted
+
+
+def _shift(rng, hours):
+    """One driver's pings: ``[(t, lat, lng), ...]``."""
+    lat, lng = 26.1 + rng.uniform(-0.3, 0.3), -80.2 + rng.uniform(-0.2, 0.2)
+    heading = rng.uniform(0, 360)
+    t = DAY * SECONDS_PER_DAY + 12 * 3600 + rng.randrange(0, 600)
+    end = t + int(hours * 3600)
+    points = []
+    while t < end:
+        if rng.random() < 0.002:
+            # At a job: noisy pings around one spot for 20-40 minutes
+            for _ in range(rng.randrange(400, 800)):
+                points.append((t, lat + rng.gauss(0, 2e-5), lng + rng.gauss(0, 2e-5)))
+                t += PING_SECONDS
+            continue
+        if rng.random() < 0.03:
+            heading += rng.choice((-90, 90)) + rng.gauss(0, 10)
+        metres = rng.uniform(20, 40)
+        lat += metres * cos(radians(heading)) / METRES_PER_DEG
+        lng += metres * sin(radians(heading)) / (METRES_PER_DEG * cos(radians(lat)))
+        points.append((t, lat + rng.gauss(0, 3e-5), lng + rng.gauss(0, 3e-5)))
+        t += PING_SECONDS
+    return points
+
+
+def _dir_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _dirs, files in os.walk(path) for f in files)
+
+
+def _max_deviation_m(raw, kept):
+    """Worst distance (m) between a raw ping and the simplified track replayed
+    at the ping's time."""
+    t = np.array([p[0] for p in raw], dtype=np.float64)
+    kt = np.array([p[0] for p in kept], dtype=np.float64)
+    error = []
+    for axis, scale in ((1, METRES_PER_DEG), (2, METRES_PER_DEG * cos(radians(26.1)))):
+        v = np.array([p[axis] for p in raw])
+        kv = np.array([p[axis] for p in kept])
+        error.append((np.interp(t, kt, kv) - v) * scale)
+    return float(np.max(np.hypot(*error)))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    hours = float(sys.argv[2]) if len(sys.argv) > 2 else 8.0
+    rng = random.Random(n)
+    tracks = {"driver-{:04d}".format(i): _shift(rng, hours) for i in range(n)}
+    pings = sorted((t, cid, lat, lng) for cid, pts in tracks.items() for t, lat, lng in pts)
+    tmp = tempfile.mkdtemp(prefix="umuve-bench-")
+    print("{} drivers, {:.0f} h shift, {} pings".format(n, hours, len(pings)))
+
+    try:
+        # -- segments ------------------------------------------------------
+        history = LocationHistory(root=os.path.join(tmp, "history"), raw_days=1)
+        history.compact_old_days = lambda today=None: {}    # measure raw first
+        t0 = time.perf_counter()
+        for t, cid, lat, lng in pings:
+            history.append(cid, lat, lng, when=t)
+        history.close()
+        seg_us = (time.perf_counter() - t0) / len(pings) * 1e6
+        seg_bytes = _dir_bytes(history.root)
+
+        # -- sql -----------------------------------------------------------
+        db_path = os.path.join(tmp, "pings.db")
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE location_pings (id INTEGER PRIMARY KEY, contractor_id VARCHAR(36), "
+                     "recorded_at DATETIME, lat FLOAT, lng FLOAT)")
+        conn.execute("CREATE INDEX ix_pings_contractor_time ON location_pings (contractor_id, recorded_at)")
+        t0 = time.perf_counter()
+        for start in range(0, len(pings), 1000):
+            conn.executemany(
+                "INSERT INTO location_pings (contractor_id, recorded_at, lat, lng) VALUES (?, ?, ?, ?)",
+                [(cid, t, lat, lng) for t, cid, lat, lng in pings[start:start + 1000]])
+            conn.commit()
+        sql_us = (time.perf_counter() - t0) / len(pings) * 1e6
+        conn.execute("VACUUM")
+        sql_bytes = os.path.getsize(db_path)
+
+        print("  ingest      segments {:6.2f} us/ping   sql (1000-row batches) {:6.2f} us/ping".format(
+            seg_us, sql_us))
+        print("  storage     segments {:6.1f} B/ping    sql {:6.1f} B/ping  ({:.1f}% of sql)".format(
+            seg_bytes / len(pings), sql_bytes / len(pings), 100.0 * seg_bytes / sql_bytes))
+
+        # -- one-hour track lookups ----------------------------------------
+        ids = sorted(tracks)
+        queries = []
+        for _ in range(LOOKUPS):
+            cid = rng.choice(ids)
+            start = tracks[cid][0][0] + rng.randrange(0, int(max(hours - 1, 0) * 3600) + 1)
+            queries.append((cid, start, start + 3600))
+
+        def seg_query(cid, a, b):
+            return history.track(cid, a, b)
+
+        def sql_query(cid, a, b):
+            return conn.execute("SELECT recorded_at, lat, lng FROM location_pings WHERE contractor_id = ? "
+                                "AND recorded_at BETWEEN ? AND ? ORDER BY recorded_at", (cid, a, b)).fetchall()
+
+        for name, fn in (("segments", seg_query), ("sql", sql_query)):
+            t0 = time.perf_counter()
+            got = [len(fn(*q)) for q in queries]
+            print("  1 h track   {:8} {:6.2f} ms  ({:.0f} points avg)".format(
+                name, (time.perf_counter() - t0) / LOOKUPS * 1000, sum(got) / len(got)))
+        conn.close()
+
+        # -- compaction ----------------------------------------------------
+        t0 = time.perf_counter()
+        result = LocationHistory.compact_day(history, DAY)
+        elapsed = time.perf_counter() - t0
+        before, after = result
+        compact_bytes = _dir_bytes(history.root)
+        worst = max(_max_deviation_m(tracks[cid], history.track(cid, 0, (DAY + 1) * SECONDS_PER_DAY))
+                    for cid in ids[:20])
+        print("  compacted   {} -> {} points ({:.1f}%) in {:.1f} s, {:.2f} B/raw ping "
+              "({:.2f}% of sql)".format(before, after, 100.0 * after / before, elapsed,
+                                        compact_bytes / len(pings), 100.0 * compact_bytes / sql_bytes))
+        print("  worst replay error vs raw pings (20 drivers): {:.1f} m (tolerance {:.0f} m, "
+              "float32 storage adds ~0.2 m)".format(worst, history.tolerance_m))
+        t0 = time.perf_counter()
+        for q in queries:
+            seg_query(*q)
+        print("  1 h track   compact  {:6.2f} ms".format((time.perf_counter() - t0) / LOOKUPS * 1000))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
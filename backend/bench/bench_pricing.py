@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark: batch pricing vs. N sequential estimate calls.
+
+Spins up the Flask app against a throwaway SQLite database, seeds a few
+pricing rules and surge zones, then prices the same N carts two ways:
+
+  1. N sequential POST /api/pricing/estimate requests
+  2. one POST /api/pricing/estimate/batch request
+
+Usage:
+    python bench/bench_pricing.py            # 500 carts
+    python bench/bench_pricing.py 2000
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix="umuve-bench-")
+os.environ["DATABASE_URL"] = "sqlite:///{}".format(os.path.join(_tmpdir, "bench.db"))
+os.environ.setdefault("FLASK_ENV", "development")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server import app  # noqa: E402
+from extensions import limiter  # noqa: E402
+from models import db, PricingRule, SurgeZone, generate_uuid  # noqa: E402
+from routes.booking import CATEGORY_PRICES  # noqa: E402
+
+SIZES = ["small", "medium", "large", None]
+
+
+def _seed():
+    with app.app_context():
+        db.session.add(PricingRule(id=generate_uuid(), item_type="furniture:large", base_price=95.0))
+        db.session.add(PricingRule(id=generate_uuid(), item_type="mattress", base_price=55.0))
+        db.session.add(SurgeZone(id=generate_uuid(), name="Downtown", surge_multiplier=1.2,
+                                  boundary={"type": "Polygon", "coordinates": [[
+                                      [-80.25, 25.74], [-80.15, 25.74], [-80.15, 25.82],
+                                      [-80.25, 25.82], [-80.25, 25.74]]]}))
+        db.session.add(SurgeZone(id=generate_uuid(), name="Citywide weekend", surge_multiplier=1.1,
+                                  days_of_week=[5, 6]))
+        db.session.commit()
+
+
+def _random_cart(rng):
+    items = []
+    for _ in range(rng.randint(1, 6)):
+        items.append({
+            "category": rng.choice(list(CATEGORY_PRICES)),
+            "quantity": rng.randint(1, 5),
+            "size": rng.choice(SIZES),
+        })
+    return {
+        "items": items,
+        "scheduledDate": "2030-01-{:02d}".format(rng.randint(1, 28)),
+        "address": {"lat": 25.7 + rng.random() * 1.2, "lng": -80.4 + rng.random() * 0.3},
+    }
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    limiter.enabled = False
+    _seed()
+
+    rng = random.Random(42)
+    carts = [_random_cart(rng) for _ in range(n)]
+    client = app.test_client()
+
+    # Warm the pricing snapshot so both runs measure steady state.
+    client.post("/api/pricing/estimate", json=carts[0])
+
+    t0 = time.perf_counter()
+    sequential = [client.post("/api/pricing/estimate", json=c).get_json()["estimate"] for c in carts]
+    t_seq = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch = client.post("/api/pricing/estimate/batch", json={"carts": carts}).get_json()["estimates"]
+    t_batch = time.perf_counter() - t0
+
+    mismatches = sum(1 for a, b in zip(sequential, batch) if a != b)
+
+    print("=" * 60)
+    print("Pricing benchmark: {} carts".format(n))
+    print("-" * 60)
+    print("  sequential /estimate : {:8.1f} ms  ({:.3f} ms/cart)".format(t_seq * 1000, t_seq * 1000 / n))
+    print("  /estimate/batch      : {:8.1f} ms  ({:.3f} ms/cart)".format(t_batch * 1000, t_batch * 1000 / n))
+    print("  speed-up             : {:8.1f}x".format(t_seq / t_batch if t_batch else float("inf")))
+    print("  mismatched breakdowns: {}".format(mismatches))
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Benchmark: Socket.IO clients spread over several worker processes that
+share a SOCKETIO_MESSAGE_QUEUE.
+
+Starts W server processes (server.py on consecutive ports, each with its
+own throwaway SQLite database) on one queue, connects C clients
+round-robin across them and has each join the room "bench".  A separate
+write-only manager -- what a cron job or another service would use --
+then emits M messages to the room at a fixed rate, and every client
+must receive every message whichever worker holds it.
+
+Reports connect time, clients per worker, messages delivered vs
+expected, delivered messages/s and emit-to-receive latency p50 / p99.
+
+The default queue is a SQLite file, which needs nothing else running;
+pass a redis:// or postgresql:// URL to measure those.  Clients use the
+polling transport (websocket-client is not a dependency) and all run in
+this process, so latency includes some client-side contention.
+
+Usage:
+    python bench/bench_socket_cluster.py                     # 2 workers, 200 clients, 200 msgs
+    python bench/bench_socket_cluster.py 4 1000 500 50       # workers clients messages rate/s
+    python bench/bench_socket_cluster.py 4 1000 500 50 redis://localhost:6379/1
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BASE_PORT = 5710
+ROOM = "bench"
+
+
+def run_worker(port):
+    """Child process: one server on *port*."""
+    from server import app, socketio
+    socketio.run(app, host="127.0.0.1", port=port, debug=False, use_reloader=False,
+                 allow_unsafe_werkzeug=True, log_output=False)
+
+
+def wait_for_port(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("worker on port {} did not start".format(port))
+
+
+def percentile(values, q):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    import engineio.payload
+    import socketio
+    from socket_backplane import client_manager_for
+
+    # A polling response batches everything queued since the last poll;
+    # the Python client refuses more than 16 packets per batch by default
+    # (browsers have no such limit).
+    engineio.payload.Payload.max_decode_packets = 10000
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else 2
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    messages = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    rate = float(sys.argv[4]) if len(sys.argv) > 4 else 20
+    tmpdir = tempfile.mkdtemp(prefix="umuve-bench-")
+    queue = sys.argv[5] if len(sys.argv) > 5 else "sqlite:///{}".format(os.path.join(tmpdir, "socketio.db"))
+
+    procs = []
+    for i in range(workers):
+        env = dict(os.environ,
+                   SOCKETIO_MESSAGE_QUEUE=queue,
+                   SOCKETIO_ASYNC_MODE="threading",
+                   DATABASE_URL="sqlite:///{}".format(os.path.join(tmpdir, "worker{}.db".format(i))),
+                   FLASK_ENV="development")
+        procs.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", str(BASE_PORT + i)],
+                                      env=env, cwd=tmpdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    try:
+        for i in range(workers):
+            wait_for_port(BASE_PORT + i)
+
+        lock = threading.Lock()
+        latencies = []
+        received = [0]
+        joined = threading.Semaphore(0)
+        sios = []
+        per_worker = [0] * workers
+
+        def make_client():
+            sio = socketio.Client(reconnection=False)
+
+            @sio.on("joined")
+            def _joined(data):
+                joined.release()
+
+            @sio.on("bench")
+            def _bench(data):
+                now = time.time()
+                with lock:
+                    received[0] += 1
+                    latencies.append(now - data["t"])
+            return sio
+
+        t0 = time.perf_counter()
+        for n in range(clients):
+            worker = n % workers
+            sio = make_client()
+            sio.connect("http://127.0.0.1:{}".format(BASE_PORT + worker), transports=["polling"])
+            sio.emit("join", {"room": ROOM})
+            sios.append(sio)
+            per_worker[worker] += 1
+        for _ in range(clients):
+            if not joined.acquire(timeout=30):
+                raise RuntimeError("clients did not all join the room")
+        connect_time = time.perf_counter() - t0
+
+        emitter = client_manager_for(queue, write_only=True)
+        t0 = time.perf_counter()
+        for i in range(messages):
+            emitter.emit("bench", {"i": i, "t": time.time()}, room=ROOM, namespace="/")
+            next_at = t0 + (i + 1) / rate
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+        expected = messages * clients
+        deadline = time.time() + 30
+        while received[0] < expected and time.time() < deadline:
+            time.sleep(0.1)
+        elapsed = time.perf_counter() - t0
+
+        print("{} workers on {}, {} clients (polling), {} messages at {:.0f}/s".format(
+            workers, queue.split(":", 1)[0], clients, messages, rate))
+        print("  connect     {:6.2f} s for all clients ({:.1f} ms each); per worker {}".format(
+            connect_time, connect_time / clients * 1000, per_worker))
+        print("  delivered   {} / {} ({:.1%})".format(received[0], expected, received[0] / expected))
+        print("  throughput  {:8.0f} deliveries/s".format(received[0] / elapsed))
+        print("  latency     p50 {:6.1f} ms   p99 {:6.1f} ms".format(
+            percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000))
+        for sio in sios:
+            sio.disconnect()
+    finally:
+        for proc in procs:
+            proc.terminate()
+        for proc in procs:
+            proc.wait()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--worker":
+        run_worker(int(sys.argv[2]))
+    else:
+        main()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cost of the socket_metrics hooks against real Socket.IO events.
+
+Two measurements in one process:
+
+    hook cost   a bare python-socketio server (no transport) with one
+                handler that emits to a room of 20 sockets, dispatched
+                with and without SocketMetrics hooked in -- the handler
+                is next to free, so the difference is what recording
+                one handler call plus one emit costs
+    event cost  the app itself: a throwaway SQLite database with N
+                online drivers, each on a job, one Flask-SocketIO test
+                client per driver (joined to its driver room) and W
+                customers per job, replaying driver:location pings
+                through the app's own handlers (rate limiting off, so
+                every ping does the full index / geo room / history /
+                broadcast work) with a job:status broadcast from the
+                REST helper every PINGS_PER_STATUS pings
+
+The overhead is hook cost / event cost.  Also prints the snapshot the
+app's hooked server produced.
+
+Usage:
+    python bench/bench_socket_metrics.py              # 50 drivers, 3 customers each, 5000 pings
+    python bench/bench_socket_metrics.py 200 5 20000
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix="umuve-bench-")
+os.environ["DATABASE_URL"] = "sqlite:///{}".format(os.path.join(_tmpdir, "bench.db"))
+os.environ.setdefault("FLASK_ENV", "development")
+os.environ["SOCKET_METRICS_ENABLED"] = "1"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio  # noqa: E402
+
+from server import app  # noqa: E402
+from models import db, User, Contractor, Job, generate_uuid  # noqa: E402
+from extensions import limiter  # noqa: E402
+from location_rate import location_rate  # noqa: E402
+from socket_events import socketio as app_socketio, broadcast_job_status  # noqa: E402
+from socket_metrics import SocketMetrics, socket_metrics  # noqa: E402
+
+limiter.enabled = False
+location_rate.enabled = False
+
+HOOK_EVENTS = 50000
+ROUNDS = 5
+PINGS_PER_STATUS = 20
+
+
+class _App:
+    """Stands in for the Flask-SocketIO object: only ``server`` is used."""
+
+    def __init__(self, server):
+        self.server = server
+
+
+def _bare_server():
+    server = socketio.Server(async_mode="threading")
+    server._send_eio_packet = lambda eio_sid, pkt: None
+    sid = server.manager.connect("eio-driver", "/")
+    for i in range(20):
+        server.enter_room(server.manager.connect("eio{}".format(i), "/"), "job-1")
+
+    @server.on("driver:location")
+    def location(sid, data):
+        server.emit("driver:location", data, room="job-1")
+
+    return server, sid
+
+
+def hook_cost():
+    """Microseconds the hooks add to one handler call with one emit."""
+    bare, bare_sid = _bare_server()
+    hooked, hooked_sid = _bare_server()
+    SocketMetrics().init_app(_App(hooked))
+    data = {"contractor_id": "d1", "lat": 26.12346, "lng": -80.14322}
+
+    def run(server, sid):
+        t0 = time.perf_counter()
+        for _ in range(HOOK_EVENTS):
+            server._trigger_event("driver:location", "/", sid, data)
+        return time.perf_counter() - t0
+
+    plain = timed = 0.0
+    for _ in range(ROUNDS):             # interleaved, so drift hits both alike
+        plain += run(bare, bare_sid)
+        timed += run(hooked, hooked_sid)
+    return (timed - plain) / (ROUNDS * HOOK_EVENTS) * 1e6
+
+
+def event_cost(drivers, watchers, pings):
+    """Microseconds per event through the app's real handlers."""
+    rng = random.Random(drivers)
+
+    with app.app_context():
+        customer = User(id=generate_uuid(), email="customer@bench.test", role="customer")
+        db.session.add(customer)
+        fleet = []
+        for i in range(drivers):
+            user = User(id=generate_uuid(), email="d{}@bench.test".format(i), role="driver", name="Driver {}".format(i))
+            contractor = Contractor(id=generate_uuid(), user_id=user.id, is_online=True, approval_status="approved",
+                                    current_lat=26.1 + rng.uniform(-0.3, 0.3), current_lng=-80.15 + rng.uniform(-0.3, 0.3))
+            job = Job(id=generate_uuid(), customer_id=customer.id, driver_id=contractor.id, status="en_route",
+                      address="{} Bench St".format(i), lat=26.1, lng=-80.15, total_price=250.0)
+            db.session.add_all([user, contractor, job])
+            fleet.append((contractor.id, job.id, contractor.current_lat, contractor.current_lng))
+        db.session.commit()
+
+    clients = []
+    for contractor_id, job_id, _lat, _lng in fleet:
+        driver = app_socketio.test_client(app)
+        driver.emit("join", {"room": "driver:{}".format(contractor_id)})
+        clients.append(driver)
+        for _ in range(watchers):
+            customer = app_socketio.test_client(app)
+            customer.emit("customer:join", {"job_id": job_id})
+
+    def replay(n):
+        for k in range(n):
+            i = k % drivers
+            contractor_id, job_id, lat, lng = fleet[i]
+            clients[i].emit("driver:location", {"contractor_id": contractor_id, "job_id": job_id,
+                                                "lat": lat + k * 1e-5, "lng": lng})
+            if k % PINGS_PER_STATUS == 0:
+                with app.app_context():
+                    broadcast_job_status(job_id, "en_route", {"driver_id": contractor_id})
+        for client in clients:
+            client.get_received()
+
+    replay(pings // 10)
+    t0 = time.perf_counter()
+    replay(pings)
+    return (time.perf_counter() - t0) / (pings + pings // PINGS_PER_STATUS) * 1e6
+
+
+def main():
+    drivers = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    watchers = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    pings = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+
+    hook = hook_cost()
+    event = event_cost(drivers, watchers, pings)
+    print("{} drivers, {} customers per job, {} pings + {} job:status broadcasts".format(
+        drivers, watchers, pings, pings // PINGS_PER_STATUS))
+    print("  hooks            {:8.2f} us per handler call + emit".format(hook))
+    print("  event            {:8.2f} us through the real handlers".format(event))
+    print("  overhead         {:8.2f} %".format(hook / event * 100))
+    print(json.dumps(socket_metrics.snapshot(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bytes per event and CPU per broadcast for the job and location
+socket events, before and after the compact payloads in socket_payloads.
+
+Builds a typical booked job (three items, four photos, every timestamp)
+without a database and a Socket.IO server with N connected drivers (no
+transport: the bytes handed to each socket are summed, not sent), then
+reports for each event
+
+    bytes   the encoded Socket.IO packet one client receives
+    CPU     building the payload and broadcasting it to N clients: job:new
+            the old way (job.to_dict(), encoded again by one emit per
+            driver room) and the new way (compact payload, one emit to the
+            cell rooms); the other events were already one emit to a room,
+            so only their payloads change
+
+with the JSON packet codec, and with MessagePack when ``msgpack`` is
+installed.
+
+Usage:
+    python bench/bench_socket_payloads.py          # 50 drivers in range, 500 broadcasts
+    python bench/bench_socket_payloads.py 500 200
+"""
+from datetime import datetime, timedelta, timezone
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import socketio  # noqa: E402
+
+from models import Job, Contractor, User  # noqa: E402
+import socket_payloads  # noqa: E402
+
+
+def _job():
+    now = datetime.now(timezone.utc)
+    photo = "https://umuve-uploads.s3.amazonaws.com/jobs/2f6c1e0a-61b4-4c1e-9f0e-{:012d}.jpg"
+    return Job(
+        id="9b2f4e1c-7d3a-4c55-8e0b-2a6f1d9c3e47",
+        customer_id="c81d4fae-7dec-11d0-a765-00a0c91e6bf6",
+        driver_id=None, operator_id=None, status="confirmed",
+        address="1234 Las Olas Blvd, Apt 5B, Fort Lauderdale, FL 33301",
+        lat=26.119283746, lng=-80.137462819,
+        items=[{"category": "furniture", "quantity": 2, "size": "large", "price": 89.0},
+               {"category": "appliances", "quantity": 1, "size": "medium", "price": 65.0},
+               {"category": "boxes", "quantity": 6, "size": "small", "price": 10.0}],
+        volume_estimate=4.5,
+        photos=[photo.format(i) for i in range(4)], before_photos=[], after_photos=[],
+        scheduled_at=now + timedelta(days=1), base_price=89.0, item_total=214.0,
+        volume_price=45.0, service_fee=12.5, surge_multiplier=1.15, total_price=342.75,
+        discount_amount=0.0, notes="Gate code 4521. Couch is on the second floor.",
+        confirmation_code="K7QX2M9A", cancellation_fee=0.0, rescheduled_count=0,
+        volume_adjustment_proposed=False, created_at=now, updated_at=now,
+    )
+
+
+def _events(job, contractor):
+    """(event, old payload builder, new payload builder)."""
+    lat, lng = 26.123456789, -80.14321987
+    return [
+        ("job:new", lambda: job.to_dict(), lambda: socket_payloads.job_new(job)),
+        ("job:status",
+         lambda: {"job_id": job.id, "status": "en_route", "driver_id": contractor.id},
+         lambda: socket_payloads.job_status(job.id, "en_route", {"driver_id": contractor.id}, job=job)),
+        ("job:assigned",
+         lambda: {"job_id": job.id, "contractor_id": contractor.id,
+                  "contractor_name": contractor.user.name if contractor.user else None},
+         lambda: socket_payloads.job_assigned(job, contractor)),
+        ("driver:location",
+         lambda: {"contractor_id": contractor.id, "lat": lat, "lng": lng},
+         lambda: socket_payloads.driver_location(contractor.id, lat, lng)),
+    ]
+
+
+def run(serializer, drivers, broadcasts):
+    job = _job()
+    contractor = Contractor(id="5f0c8a2e-3b1d-4e6f-9a7c-1d2e3f4a5b6c", user=User(name="Marcus Johnson"))
+    server = socketio.Server(async_mode="threading", serializer=serializer)
+    sent = [0]
+
+    def _count(eio_sid, pkt):
+        sent[0] += len(pkt.encode()) if not pkt.binary else len(pkt.data)
+    server._send_eio_packet = _count
+    for i in range(drivers):
+        sid = server.manager.connect("eio{}".format(i), "/")
+        server.enter_room(sid, "driver:{}".format(i))
+        server.enter_room(sid, "cell:0:{}".format(i % 4))
+    rooms = ["cell:0:{}".format(j) for j in range(4)]
+
+    print("{} codec, {} drivers per broadcast".format("JSON" if serializer == "default" else "MessagePack", drivers))
+    for event, old, new in _events(job, contractor):
+        sizes = []
+        for build in (old, new):
+            sent[0] = 0
+            server.emit(event, build(), room="driver:0")
+            sizes.append(sent[0])
+
+        sent[0] = 0
+        t0 = time.perf_counter()
+        for _ in range(broadcasts):
+            if event == "job:new":
+                payload = old()
+                for i in range(drivers):
+                    server.emit(event, payload, room="driver:{}".format(i))
+            else:
+                server.emit(event, old(), room=rooms)
+        old_cpu = (time.perf_counter() - t0) / broadcasts
+        old_bytes = sent[0] / broadcasts
+
+        sent[0] = 0
+        t0 = time.perf_counter()
+        for _ in range(broadcasts):
+            server.emit(event, new(), room=rooms)
+        new_cpu = (time.perf_counter() - t0) / broadcasts
+        new_bytes = sent[0] / broadcasts
+
+        print("  {:16s} {:5d} -> {:4d} B/event   {:6.3f} -> {:6.3f} ms/broadcast   {:7.0f} -> {:6.0f} B/broadcast".format(
+            event, sizes[0], sizes[1], old_cpu * 1000, new_cpu * 1000, old_bytes, new_bytes))
+
+
+def main():
+    drivers = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    broadcasts = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    run("default", drivers, broadcasts)
+    try:
+        import msgpack  # noqa: F401
+    except ImportError:
+        print("MessagePack codec: msgpack not installed, skipped")
+        return
+    run("msgpack", drivers, broadcasts)
+
+
+if __name__ == "__main__":
+    main()
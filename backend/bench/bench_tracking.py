@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark: customer tracking polls per second on one worker.
+
+Seeds a throwaway SQLite database with N in-progress jobs (each with a
+driver, payment and position) and polls GET /api/tracking/<job_id>
+round-robin through the Flask test client, single-threaded, three ways:
+
+    uncached      view rebuilt on every poll (what every poll used to cost)
+    cached 200    view cached, full body served
+    304           view cached, If-None-Match matches the last ETag
+
+Reports polls/s and SQL statements per poll for each.
+
+Usage:
+    python bench/bench_tracking.py              # 200 jobs, 5000 polls per mode
+    python bench/bench_tracking.py 1000 20000
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+_tmpdir = tempfile.mkdtemp(prefix="umuve-bench-")
+os.environ["DATABASE_URL"] = "sqlite:///{}".format(os.path.join(_tmpdir, "bench.db"))
+os.environ.setdefault("FLASK_ENV", "development")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+
+from server import app  # noqa: E402
+from models import db, User, Contractor, Job, Payment, generate_uuid  # noqa: E402
+from extensions import limiter  # noqa: E402
+import routes.tracking as tracking  # noqa: E402
+
+limiter.enabled = False
+
+
+def _seed(rng, n):
+    with app.app_context():
+        customer = User(id=generate_uuid(), email="customer@bench.test", role="customer")
+        db.session.add(customer)
+        job_ids = []
+        for i in range(n):
+            user = User(id=generate_uuid(), email="d{}@bench.test".format(i), role="driver", name="Driver {}".format(i))
+            contractor = Contractor(id=generate_uuid(), user_id=user.id, is_online=True, approval_status="approved",
+                                    truck_type="Box truck", current_lat=26.1 + rng.uniform(-0.2, 0.2),
+                                    current_lng=-80.15 + rng.uniform(-0.2, 0.2))
+            job = Job(id=generate_uuid(), customer_id=customer.id, driver_id=contractor.id, status="en_route",
+                      address="{} Bench St".format(i), lat=26.1 + rng.uniform(-0.2, 0.2),
+                      lng=-80.15 + rng.uniform(-0.2, 0.2), total_price=250.0,
+                      items=[{"category": "furniture", "quantity": 2}])
+            payment = Payment(id=generate_uuid(), job_id=job.id, amount=250.0, payment_status="succeeded")
+            db.session.add_all([user, contractor, job, payment])
+            job_ids.append(job.id)
+        db.session.commit()
+        return job_ids
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    polls = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    rng = random.Random(n)
+    job_ids = _seed(rng, n)
+    client = app.test_client()
+
+    statements = [0]
+    with app.app_context():
+        @event.listens_for(db.engine, "before_cursor_execute")
+        def _count(*_args, **_kwargs):
+            statements[0] += 1
+
+    etags = {}
+
+    def uncached(job_id):
+        tracking.invalidate_tracking_view(job_id)
+        return client.get("/api/tracking/" + job_id)
+
+    def cached(job_id):
+        return client.get("/api/tracking/" + job_id)
+
+    def conditional(job_id):
+        return client.get("/api/tracking/" + job_id, headers={"If-None-Match": etags[job_id]})
+
+    # Warm up: build every view and remember its ETag
+    for job_id in job_ids:
+        etags[job_id] = client.get("/api/tracking/" + job_id).headers["ETag"]
+
+    print("{} jobs, {} polls per mode, 1 worker thread".format(n, polls))
+    for name, poll, expect in (("uncached", uncached, 200), ("cached 200", cached, 200), ("304", conditional, 304)):
+        statements[0] = 0
+        t0 = time.perf_counter()
+        for i in range(polls):
+            r = poll(job_ids[i % n])
+            assert r.status_code == expect, (name, r.status_code)
+        elapsed = time.perf_counter() - t0
+        print("  {:11} {:8.0f} polls/s  {:6.3f} ms/poll  {:.2f} SQL statements/poll".format(
+            name, polls / elapsed, elapsed / polls * 1000, statements[0] / polls))
+
+
+if __name__ == "__main__":
+    main()
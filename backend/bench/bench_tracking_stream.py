@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark: idle tracking streams held by one worker, and what they cost
+against polling.
+
+Opens N streams spread over J jobs on a TrackingStreamHub, then feeds it
+driver pings for every job (one per second per job) for S simulated
+seconds, ticking the hub as the worker would.  Reports memory per open
+stream, hub CPU per ping and per tick, and the bytes one customer
+receives per minute from the stream vs polling GET /api/tracking/<id>
+every 5 seconds with a 200 each time.
+
+Streams are not read by threads here: an idle stream is the hub state
+plus one parked green thread under the eventlet worker, which this does
+not measure.
+
+Usage:
+    python bench/bench_tracking_stream.py                # 5000 streams, 1000 jobs, 60 s
+    python bench/bench_tracking_stream.py 20000 4000 120
+"""
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tracking_stream import TrackingStreamHub  # noqa: E402
+
+POLL_SECONDS = 5
+POLL_BYTES = 620        # a typical GET /api/tracking/<id> 200: ~420 B of JSON + headers
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    seconds = int(sys.argv[3]) if len(sys.argv) > 3 else 60
+    rng = random.Random(n)
+    hub = TrackingStreamHub(max_clients=n)
+    hub._ensure_thread = lambda: None       # tick by hand below
+    job_ids = ["job-{:05d}".format(i) for i in range(jobs)]
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    streams = []
+    for i in range(n):
+        job_id = job_ids[i % jobs]
+        streams.append(hub.open(job_id, "en_route", (26.1, -80.15))[0])
+    per_stream = (tracemalloc.get_traced_memory()[0] - before) / n
+    tracemalloc.stop()
+
+    hub.tick()      # load the ETA model outside the timings
+    positions = {job_id: [26.1 + rng.uniform(-0.2, 0.2), -80.15 + rng.uniform(-0.2, 0.2)] for job_id in job_ids}
+    ping_time = tick_time = 0.0
+    ticks = 0
+    for second in range(seconds):
+        t0 = time.perf_counter()
+        for job_id, p in positions.items():
+            p[0] += rng.uniform(-2e-4, 2e-4)
+            p[1] += rng.uniform(-2e-4, 2e-4)
+            hub.note_position(job_id, p[0], p[1])
+        ping_time += time.perf_counter() - t0
+        if (second + 1) % hub.position_seconds < 1:
+            t0 = time.perf_counter()
+            hub.tick()
+            tick_time += time.perf_counter() - t0
+            ticks += 1
+
+    sent = 0
+    for stream in streams[:jobs]:
+        sent += sum(len(frame) for frame in hub.wait(stream, 0))
+    stream_bytes = sent / jobs / seconds * 60
+    poll_bytes = POLL_BYTES * 60 / POLL_SECONDS
+
+    print("{} streams over {} jobs, {} s of pings (1/s per job), tick every {:.0f} s".format(
+        n, jobs, seconds, hub.position_seconds))
+    print("  memory      {:6.0f} B per open stream (hub state)".format(per_stream))
+    print("  pings       {:6.2f} us per ping".format(ping_time / (seconds * jobs) * 1e6))
+    print("  ticks       {:6.2f} ms per tick ({:.1f} us per job with a new position)".format(
+        tick_time / ticks * 1000, tick_time / ticks / jobs * 1e6))
+    print("  per client  stream {:5.0f} B/min   polling every {} s {:5.0f} B/min ({:.1f}x)".format(
+        stream_bytes, POLL_SECONDS, poll_bytes, poll_bytes / stream_bytes))
+
+
+if __name__ == "__main__":
+    main()
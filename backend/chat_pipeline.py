@@ -0,0 +1,367 @@
+"""
+Group-commit write pipeline for job chat.
+
+Every ``chat:send`` used to be its own INSERT and commit, and every
+``chat:read`` an UPDATE and commit even when nothing was unread.  Both
+now go through one queue per worker, written by a flush thread that wakes
+on the first queued write and, CHAT_FLUSH_MS later, commits everything
+that arrived meanwhile in one transaction:
+
+    messages        one multi-row INSERT for the whole group
+    read receipts   coalesced per (job, role): however many read events a
+                    party sent in the window, one UPDATE marks the other
+                    party's messages created up to the latest of them
+
+A sender waits for the commit holding its message (a few milliseconds)
+and is then acknowledged with the id and created_at the row was given;
+the flush thread broadcasts ``chat:message`` to the job room after the
+commit, and ``chat:read`` when a receipt marked anything.  If one row of
+a group fails (a job deleted meanwhile) the group is retried row by row
+so only that sender gets the error.
+
+Reads that cannot change anything are skipped: once a receipt has marked
+a (job, sender role) pair read, the pair is remembered as clean until a
+message from that role to that job is committed -- on any worker, through
+the backplane -- so the chat screen re-sending ``chat:read`` on every
+render costs nothing.
+
+Typing indicators are throttled per (job, sender): a change of state is
+forwarded at once, a repeat of "typing" at most every
+CHAT_TYPING_INTERVAL_SECONDS.
+"""
+
+from collections import Counter, deque
+import atexit
+import logging
+import os
+import threading
+import time
+
+from socket_backplane import backplane
+
+logger = logging.getLogger(__name__)
+
+CHAT_FLUSH_MS = float(os.environ.get("CHAT_FLUSH_MS", "5"))
+CHAT_ACK_TIMEOUT_SECONDS = float(os.environ.get("CHAT_ACK_TIMEOUT_SECONDS", "5"))
+CHAT_TYPING_INTERVAL_SECONDS = float(os.environ.get("CHAT_TYPING_INTERVAL_SECONDS", "1.5"))
+
+# Bounds on the per-worker read and typing caches; past them the oldest
+# entries are dropped (a dropped clean pair just costs one UPDATE).
+MAX_CLEAN_PAIRS = 50000
+MAX_TYPING_ENTRIES = 20000
+
+
+def other_role(role):
+    return "driver" if role == "customer" else "customer"
+
+
+class ChatWrite:
+    """A queued write; ``wait()`` blocks until its group is committed."""
+
+    __slots__ = ("data", "result", "error", "_done")
+
+    def __init__(self, data):
+        self.data = data
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=CHAT_ACK_TIMEOUT_SECONDS):
+        """The committed message dict (or receipt count).  Raises
+        RuntimeError if the write failed or was not committed in time."""
+        if not self._done.wait(timeout):
+            raise RuntimeError("Chat write not committed within {:.0f} s".format(timeout))
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        return self.result
+
+    def _finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self._done.set()
+
+
+class ChatPipeline:
+    """Queued chat messages and read receipts and the thread that commits them."""
+
+    def __init__(self, flush_ms=CHAT_FLUSH_MS, typing_interval=CHAT_TYPING_INTERVAL_SECONDS):
+        self.flush_seconds = flush_ms / 1000.0
+        self.typing_interval = typing_interval
+        self._app = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._messages = []         # ChatWrite per message, in arrival order
+        self._reads = {}            # (job id, sender role) -> (read up to, generation, [ChatWrite])
+        self._clean = {}            # (job id, sender role) -> None: nothing unread
+        self._dirty = {}            # (job id, sender role) -> generation of its last new message
+        self._generation = 0
+        self._typing = {}           # (job id, sender id) -> (is_typing, forwarded at)
+        self._thread = None
+        self.stats = Counter()
+        self._flush_ms = deque(maxlen=500)
+        self._batch_sizes = deque(maxlen=500)
+        backplane.subscribe("chat_pipeline.unread", self._on_unread)
+
+    def init_app(self, app):
+        """Commit queued chat writes for *app*."""
+        self._app = app
+        atexit.register(self.flush)
+
+    # -- writes ----------------------------------------------------------------
+
+    def send(self, job_id, sender_id, sender_role, message, client_id=None):
+        """Queue a message; ``wait()`` on the result for the committed dict."""
+        from models import generate_uuid, utcnow
+
+        write = ChatWrite({
+            "id": generate_uuid(),
+            "job_id": job_id,
+            "sender_id": sender_id,
+            "sender_role": sender_role,
+            "message": message,
+            "created_at": utcnow(),
+            "client_id": client_id,
+        })
+        with self._lock:
+            self._messages.append(write)
+            self.stats["messages"] += 1
+        self._kick()
+        return write
+
+    def mark_read(self, job_id, reader_role):
+        """Queue a read receipt from *reader_role*; ``wait()`` on the result
+        for the number of messages it marked.  Returns None when the other
+        party has nothing unread."""
+        from models import utcnow
+
+        key = (job_id, other_role(reader_role))
+        with self._lock:
+            self.stats["reads"] += 1
+            if key in self._clean:
+                self.stats["reads_skipped"] += 1
+                return None
+            write = ChatWrite(key)
+            # The generation seen by the latest read: a message committed
+            # after it keeps the pair dirty even if its group is written later
+            entry = self._reads.get(key)
+            if entry is None:
+                self._reads[key] = (utcnow(), self._generation, [write])
+            else:
+                entry[2].append(write)
+                self._reads[key] = (utcnow(), self._generation, entry[2])
+                self.stats["reads_coalesced"] += 1
+        self._kick()
+        return write
+
+    def typing(self, job_id, sender_id, is_typing):
+        """Whether to forward this typing indicator to the job room."""
+        key = (job_id, sender_id)
+        now = time.monotonic()
+        with self._lock:
+            last = self._typing.get(key)
+            if last is not None and last[0] == is_typing and (not is_typing or now - last[1] < self.typing_interval):
+                self.stats["typing_dropped"] += 1
+                return False
+            if last is None and len(self._typing) >= MAX_TYPING_ENTRIES:
+                self._typing.pop(next(iter(self._typing)))
+            self._typing[key] = (is_typing, now)
+            self.stats["typing_forwarded"] += 1
+            return True
+
+    # -- flushing --------------------------------------------------------------
+
+    def flush(self):
+        """Commit every queued write now; returns the number of writes."""
+        if self._app is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                messages, self._messages = self._messages, []
+                reads, self._reads = self._reads, {}
+                generation = self._generation
+            if not messages and not reads:
+                return 0
+
+            t0 = time.monotonic()
+            with self._app.app_context():
+                marked = self._write(messages, reads)
+            done = time.monotonic()
+
+            sent = [w for w in messages if w.error is None]
+            if sent:
+                backplane.publish("chat_pipeline.unread",
+                                  sorted({(w.data["job_id"], w.data["sender_role"]) for w in sent}))
+            with self._lock:
+                for key in marked:
+                    if self._dirty.get(key, 0) <= reads[key][1]:
+                        if len(self._clean) >= MAX_CLEAN_PAIRS:
+                            self._clean.pop(next(iter(self._clean)))
+                        self._clean[key] = None
+                # Reads queued since the swap saw at least *generation*
+                self._dirty = {k: g for k, g in self._dirty.items() if g > generation}
+                self.stats["flushes"] += 1
+                self.stats["messages_written"] += len(sent)
+                self._flush_ms.append((done - t0) * 1000)
+                self._batch_sizes.append(len(messages) + len(reads))
+            self._broadcast(sent, marked)
+            return len(messages) + len(reads)
+
+    def _write(self, messages, reads):
+        """Insert *messages* and apply *reads* in one transaction, falling
+        back to one transaction per message if the group fails.  Finishes
+        every write; returns {(job id, sender role): (rows marked, read at)}
+        for the receipts that committed."""
+        from models import db, ChatMessage
+
+        table = ChatMessage.__table__
+        rows = [{k: v for k, v in w.data.items() if k != "client_id"} for w in messages]
+        marked = {}
+        try:
+            if rows:
+                db.session.execute(table.insert(), rows)
+            marked = self._apply_reads(reads)
+            db.session.commit()
+            for w in messages:
+                w._finish(w.data)
+        except Exception:
+            db.session.rollback()
+            logger.exception("Chat group commit of %d messages failed; retrying one by one", len(rows))
+            self.stats["group_errors"] += 1
+            for w, row in zip(messages, rows):
+                try:
+                    db.session.execute(table.insert(), [row])
+                    db.session.commit()
+                    w._finish(w.data)
+                except Exception:
+                    db.session.rollback()
+                    self.stats["message_errors"] += 1
+                    w._finish(error="Failed to save message")
+            try:
+                marked = self._apply_reads(reads)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                logger.exception("Failed to apply %d chat read receipts", len(reads))
+                marked = {}
+                for _upto, _generation, waiters in reads.values():
+                    for w in waiters:
+                        w._finish(error="Failed to mark messages read")
+                return marked
+        for key, (_upto, _generation, waiters) in reads.items():
+            for w in waiters:
+                w._finish(marked[key][0])
+        return marked
+
+    def _apply_reads(self, reads):
+        from models import db, ChatMessage
+
+        marked = {}
+        for (job_id, sender_role), (upto, _generation, _waiters) in reads.items():
+            count = db.session.execute(
+                ChatMessage.__table__.update()
+                .where(ChatMessage.job_id == job_id,
+                       ChatMessage.sender_role == sender_role,
+                       ChatMessage.read_at.is_(None),
+                       ChatMessage.created_at <= upto)
+                .values(read_at=upto)
+            ).rowcount
+            marked[(job_id, sender_role)] = (count, upto)
+            self.stats["read_updates"] += 1
+        return marked
+
+    def _broadcast(self, sent, marked):
+        try:
+            from socket_events import socketio
+
+            for w in sent:
+                socketio.emit("chat:message", message_payload(w.data), room=w.data["job_id"])
+            for (job_id, sender_role), (count, read_at) in marked.items():
+                if count:
+                    socketio.emit("chat:read", {
+                        "job_id": job_id,
+                        "read_by": other_role(sender_role),
+                        "read_at": read_at.isoformat(),
+                        "count": count,
+                    }, room=job_id)
+        except Exception:
+            logger.exception("Failed to broadcast committed chat writes")
+
+    def _on_unread(self, pairs):
+        """New messages were committed for these (job id, sender role) pairs."""
+        with self._lock:
+            self._generation += 1
+            for job_id, sender_role in pairs:
+                key = (job_id, sender_role)
+                self._clean.pop(key, None)
+                self._dirty[key] = self._generation
+
+    # -- stats -----------------------------------------------------------------
+
+    def snapshot(self):
+        """Group sizes, commit time and read / typing savings (this worker only)."""
+        with self._lock:
+            flush_ms = sorted(self._flush_ms)
+            sizes = sorted(self._batch_sizes)
+            stats = dict(self.stats)
+            queued = len(self._messages) + len(self._reads)
+            clean = len(self._clean)
+
+        def pct(samples, q):
+            return round(samples[min(int(len(samples) * q), len(samples) - 1)], 1) if samples else None
+
+        return {
+            "flush_ms": self.flush_seconds * 1000,
+            "typing_interval_seconds": self.typing_interval,
+            "queued": queued,
+            "clean_pairs": clean,
+            "stats": stats,
+            "commit_ms": {"samples": len(flush_ms), "p50": pct(flush_ms, 0.5),
+                          "p99": pct(flush_ms, 0.99), "max": pct(flush_ms, 1.0)},
+            "group_size": {
+                "samples": len(sizes),
+                "mean": round(sum(sizes) / len(sizes), 1) if sizes else None,
+                "max": sizes[-1] if sizes else None,
+            },
+        }
+
+    # -- internals -------------------------------------------------------------
+
+    def _kick(self):
+        self._wake.set()
+        if self._app is not None and (self._thread is None or not self._thread.is_alive()):
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="chat-flush", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            time.sleep(self.flush_seconds)      # let the group fill
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Chat flush failed")
+
+
+def message_payload(data):
+    """``chat:message`` for a committed message (ChatMessage.to_dict() plus
+    the sender's client_id, if it sent one)."""
+    payload = {
+        "id": data["id"],
+        "job_id": data["job_id"],
+        "sender_id": data["sender_id"],
+        "sender_role": data["sender_role"],
+        "message": data["message"],
+        "read_at": None,
+        "created_at": data["created_at"].isoformat(),
+    }
+    if data.get("client_id"):
+        payload["client_id"] = data["client_id"]
+    return payload
+
+
+# Process-wide pipeline fed by the chat socket events and REST routes.
+chat_pipeline = ChatPipeline()
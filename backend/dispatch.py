@@ -0,0 +1,440 @@
+"""
+Driver candidate selection for dispatch.
+
+Ranks the contractors who could take a job: the in-memory driver index
+supplies the nearest eligible drivers, and a single query against the
+contractors table -- outer-joined to per-driver counts of active jobs --
+confirms they are still online, approved and in the right fleet, and
+reports how busy each one is.  Confirmed drivers are ordered by estimated
+driving time from the ETA engine.  Auto-assignment takes the top available
+candidate; the admin candidates endpoint returns the ranked list.
+
+In batched mode (DISPATCH_MODE=batched) payment confirmation leaves jobs
+unassigned and the scheduler runs a dispatch window every
+DISPATCH_WINDOW_SECONDS: all confirmed, unassigned jobs are matched to free
+drivers at once by a minimum-cost assignment over the job/driver distance
+matrix and committed in one transaction.
+
+Either way the assignment is a timed offer (see offers.py).
+
+Every change of a job's owner (accept, decline, delegate, assign) goes
+through ``claim_job``: one conditional UPDATE whose row count says whether
+the caller won, so concurrent claims on the same job cannot both succeed.
+"""
+
+from collections import namedtuple
+import logging
+import os
+import time
+
+from sqlalchemy import func, update
+
+from driver_index import driver_index, BUSY_JOB_STATUSES
+from eta_engine import eta_engine
+from geofencing import EARTH_RADIUS_KM
+
+logger = logging.getLogger(__name__)
+
+# Search radius for located jobs.  Drivers without a position are ranked
+# after everyone in range.
+AUTO_ASSIGN_RADIUS_KM = 50.0
+
+DEFAULT_CANDIDATE_LIMIT = 10
+
+# Extra drivers pulled from the index beyond *limit*, so a few stale index
+# entries (other workers' writes) don't shorten the confirmed list.
+CANDIDATE_SLACK = 5
+
+# "immediate" assigns each job as its payment succeeds; "batched" leaves it
+# for the next dispatch window.
+DISPATCH_MODE = os.environ.get("DISPATCH_MODE", "immediate").strip().lower()
+DISPATCH_WINDOW_SECONDS = float(os.environ.get("DISPATCH_WINDOW_SECONDS", "10"))
+
+# Jobs matched per window; the oldest go first and the rest wait a window.
+MAX_BATCH_JOBS = 200
+
+# Cost of a pairing where the job or the driver has no position: worse than
+# any pairing in range, so it is only used as a fallback (as auto-assign does).
+UNLOCATED_COST_KM = AUTO_ASSIGN_RADIUS_KM
+
+# Cost of a pairing that is not allowed (out of range, wrong fleet).  Finite
+# so the solver's arithmetic stays exact; such pairs are dropped afterwards.
+_FORBIDDEN = 1e9
+
+Candidate = namedtuple("Candidate", [
+    "contractor",       # Contractor row
+    "distance_km",      # None when the job or the driver has no position
+    "active_jobs",      # jobs the driver is currently working
+    "eta_minutes",      # estimated drive to the job; None without positions
+])
+
+
+def _eligible(job, exclude=()):
+    """Operator jobs go to that operator's fleet; everything else to
+    independent contractors.  Operators themselves never drive."""
+    def predicate(d):
+        return not d.is_operator and d.operator_id == job.operator_id and d.id not in exclude
+    return predicate
+
+
+def _index_pool(job, pool_size, radius_km, include_busy, exclude=()):
+    """Candidate ids from the driver index mapped to their distance."""
+    where = _eligible(job, exclude)
+    if job.lat is None or job.lng is None:
+        drivers = driver_index.drivers(where=where, include_busy=include_busy)
+        return {d.id: None for d in drivers[:pool_size]}
+
+    pool = {
+        d.id: dist for dist, d in driver_index.nearest(
+            job.lat, job.lng, k=pool_size, max_km=radius_km,
+            where=where, include_busy=include_busy,
+        )
+    }
+    if len(pool) < pool_size:
+        for d in driver_index.unlocated(where=where, include_busy=include_busy):
+            pool.setdefault(d.id, None)
+    return pool
+
+
+_ANY_FLEET = object()
+
+
+def _confirm_drivers(driver_ids, include_busy, operator_id=_ANY_FLEET):
+    """Load the given drivers that are still dispatchable, with their active
+    job counts -- one query, outer-joined to per-driver active jobs (an
+    anti-join when busy drivers are excluded).
+
+    Returns ``[(Contractor, active_jobs)]``.
+    """
+    from models import db, Contractor, Job
+    from sqlalchemy.orm import joinedload
+
+    driver_ids = list(driver_ids)
+    active = (
+        db.session.query(Job.driver_id, func.count(Job.id).label("active_jobs"))
+        .filter(Job.driver_id.in_(driver_ids), Job.status.in_(BUSY_JOB_STATUSES))
+        .group_by(Job.driver_id)
+        .subquery()
+    )
+    query = (
+        db.session.query(Contractor, func.coalesce(active.c.active_jobs, 0))
+        .outerjoin(active, active.c.driver_id == Contractor.id)
+        .options(joinedload(Contractor.user))
+        .filter(
+            Contractor.id.in_(driver_ids),
+            Contractor.is_online == True,  # noqa: E712
+            Contractor.approval_status == "approved",
+            db.or_(Contractor.is_operator == False, Contractor.is_operator.is_(None)),  # noqa: E712
+        )
+    )
+    if operator_id is not _ANY_FLEET:
+        query = query.filter(Contractor.operator_id == operator_id)
+    if not include_busy:
+        query = query.filter(active.c.active_jobs.is_(None))
+    return query.all()
+
+
+def rank_candidates(job, limit=DEFAULT_CANDIDATE_LIMIT, radius_km=None,
+                    include_busy=False, exclude=()):
+    """Return up to *limit* :class:`Candidate` for *job*, best first.
+
+    Available drivers rank ahead of busy ones (only returned when
+    *include_busy*), then by estimated driving time, with unlocated drivers
+    last.  Drivers
+    in *exclude* are skipped.  Issues one query regardless of fleet size.
+    """
+    if radius_km is None:
+        radius_km = AUTO_ASSIGN_RADIUS_KM
+    pool = _index_pool(job, limit + CANDIDATE_SLACK, radius_km, include_busy, exclude)
+    if not pool:
+        return []
+
+    confirmed = _confirm_drivers(pool, include_busy, operator_id=job.operator_id)
+    located = [c for c, _n in confirmed
+               if pool[c.id] is not None and c.current_lat is not None and c.current_lng is not None]
+    etas = {}
+    if located:
+        minutes = eta_engine.eta([(c.current_lat, c.current_lng) for c in located],
+                                 [(job.lat, job.lng)])
+        etas = {c.id: float(m) for c, m in zip(located, minutes[:, 0])}
+    candidates = [Candidate(c, pool[c.id], n, etas.get(c.id)) for c, n in confirmed]
+
+    # A pooled driver the database rejected means this worker's index is
+    # behind; have it reload on next use rather than repair entries here.
+    if len(candidates) < len(pool):
+        driver_index.expire()
+
+    candidates.sort(key=lambda cand: (
+        cand.active_jobs > 0,
+        cand.eta_minutes is None,
+        cand.eta_minutes or 0.0,
+        cand.contractor.id,
+    ))
+    return candidates[:limit]
+
+
+# ---------------------------------------------------------------------------
+# Job claims
+# ---------------------------------------------------------------------------
+
+def claim_job(job_id, statuses, values, **match):
+    """Set *values* on job *job_id* only if its status is in *statuses* and
+    each column in *match* still has the given value (None matches NULL).
+
+    Issued as a single ``UPDATE ... WHERE``; returns True when this call
+    changed the row.  Loaded Job objects are synchronised; nothing is
+    committed.
+    """
+    from models import db, Job, utcnow
+    from routes.tracking import mark_job_changed
+
+    conditions = [Job.id == job_id, Job.status.in_(statuses)]
+    for column, value in match.items():
+        attr = getattr(Job, column)
+        conditions.append(attr.is_(None) if value is None else attr == value)
+    stmt = (
+        update(Job)
+        .where(*conditions)
+        .values(dict(values, updated_at=utcnow()))
+        .execution_options(synchronize_session="fetch")
+    )
+    if db.session.execute(stmt).rowcount != 1:
+        return False
+    mark_job_changed(db.session, job_id)
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Batched dispatch
+# ---------------------------------------------------------------------------
+
+def batched_dispatch_enabled():
+    return DISPATCH_MODE == "batched"
+
+
+def solve_assignment(cost):
+    """Minimum-cost assignment for a rectangular cost matrix.
+
+    Returns ``(rows, cols)`` index arrays pairing every row with a distinct
+    column (or every column with a distinct row when there are more rows
+    than columns), like ``scipy.optimize.linear_sum_assignment``.  Hungarian
+    algorithm with potentials (shortest augmenting paths), O(n^2 m) with the
+    inner loop over columns vectorized.
+    """
+    import numpy as np
+
+    cost = np.asarray(cost, dtype=float)
+    if cost.size == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    if cost.shape[0] > cost.shape[1]:
+        cols, rows = solve_assignment(cost.T)
+        order = np.argsort(rows)
+        return rows[order], cols[order]
+
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=int)      # column -> assigned row (1-based, 0 = free)
+    way = np.zeros(m + 1, dtype=int)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            masked = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(masked)) + 1
+            delta = masked[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.nonzero(p[1:])[0]
+    rows = p[1:][cols] - 1
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def _greedy_assignment(cost):
+    """Baseline: rows in order, each takes its cheapest remaining column."""
+    import numpy as np
+
+    taken = np.zeros(cost.shape[1], dtype=bool)
+    rows, cols = [], []
+    for i in range(cost.shape[0]):
+        masked = np.where(taken, np.inf, cost[i])
+        j = int(np.argmin(masked)) if masked.size else -1
+        if j < 0 or masked[j] >= _FORBIDDEN:
+            continue
+        taken[j] = True
+        rows.append(i)
+        cols.append(j)
+    return np.array(rows, dtype=int), np.array(cols, dtype=int)
+
+
+def _distance_matrix(job_lat, job_lng, drv_lat, drv_lng):
+    """Haversine distances (km) between every job and every driver."""
+    import numpy as np
+
+    lat1 = np.radians(job_lat)[:, None]
+    lng1 = np.radians(job_lng)[:, None]
+    lat2 = np.radians(drv_lat)[None, :]
+    lng2 = np.radians(drv_lng)[None, :]
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _coords(points):
+    """Latitude and longitude arrays, NaN where a position is missing."""
+    import numpy as np
+
+    arr = np.array([
+        (lat, lng) if lat is not None and lng is not None else (np.nan, np.nan)
+        for lat, lng in points
+    ], dtype=float).reshape(-1, 2)
+    return arr[:, 0], arr[:, 1]
+
+
+def _dispatch_cost(jobs, drivers, radius_km=None):
+    """Job x driver cost matrix (km) and the matching distance matrix."""
+    import numpy as np
+
+    if radius_km is None:
+        radius_km = AUTO_ASSIGN_RADIUS_KM
+    job_lat, job_lng = _coords([(j.lat, j.lng) for j in jobs])
+    drv_lat, drv_lng = _coords([(d.current_lat, d.current_lng) for d in drivers])
+    dist = _distance_matrix(job_lat, job_lng, drv_lat, drv_lng)
+
+    cost = np.where(np.isnan(dist), UNLOCATED_COST_KM, dist)
+    cost[dist > radius_km] = _FORBIDDEN
+
+    job_fleet = np.array([j.operator_id or "" for j in jobs], dtype=object)
+    drv_fleet = np.array([d.operator_id or "" for d in drivers], dtype=object)
+    cost[job_fleet[:, None] != drv_fleet[None, :]] = _FORBIDDEN
+    return cost, dist
+
+
+def _plan_summary(cost, dist, rows, cols):
+    import numpy as np
+
+    ok = cost[rows, cols] < _FORBIDDEN
+    rows, cols = rows[ok], cols[ok]
+    deadhead = dist[rows, cols]
+    return rows, cols, {
+        "assigned": int(len(rows)),
+        "deadhead_km": round(float(np.nansum(deadhead)), 2),
+        "unlocated_pairs": int(np.isnan(deadhead).sum()),
+    }
+
+
+def run_dispatch_window():
+    """Match every confirmed, unassigned job to a free driver in one pass.
+
+    Jobs and drivers are paired by a minimum-cost assignment over their
+    distances (out-of-range and cross-fleet pairs excluded), and all
+    assignments are committed in one transaction, each claimed with a
+    conditional UPDATE so a job taken from the feed during the solve is
+    skipped.  Jobs offered to OFFER_MAX_ATTEMPTS drivers are left for an
+    admin (``offer_manager.give_up``).  Returns a report comparing
+    total deadhead kilometres with the greedy first-come nearest-driver
+    baseline, or None when there was nothing to dispatch.
+    """
+    from models import db, Job
+    from routes.payments import _assign_driver, _announce_assignment
+    from offers import offer_manager
+
+    started = time.perf_counter()
+    query = Job.query.filter(Job.status == "confirmed", Job.driver_id.is_(None))
+    given_up = offer_manager.given_up()
+    if given_up:
+        query = query.filter(Job.id.notin_(given_up))
+    jobs = query.order_by(Job.created_at).limit(MAX_BATCH_JOBS).all()
+
+    # Too many drivers passed on these -- leave them confirmed for an admin
+    exhausted = {job.id for job in jobs if offer_manager.exhausted(job.id)}
+    for job_id in exhausted:
+        offer_manager.give_up(job_id)
+    jobs = [job for job in jobs if job.id not in exhausted]
+    if not jobs:
+        return None
+
+    # In an optimal assignment every job gets one of its len(jobs) nearest
+    # eligible drivers, so pooling those loses nothing.
+    tried = [offer_manager.tried(job.id) for job in jobs]
+    pool = {}
+    for job, passed in zip(jobs, tried):
+        pool.update(_index_pool(job, len(jobs), AUTO_ASSIGN_RADIUS_KM, include_busy=False,
+                                exclude=passed))
+    confirmed = _confirm_drivers(pool, include_busy=False) if pool else []
+    if len(confirmed) < len(pool):
+        driver_index.expire()
+    drivers = sorted((c for c, _n in confirmed), key=lambda c: c.id)
+
+    report = {"jobs": len(jobs), "drivers": len(drivers)}
+    if drivers:
+        cost, dist = _dispatch_cost(jobs, drivers)
+        # Never re-offer a job to a driver who declined it or let it lapse
+        column = {c.id: j for j, c in enumerate(drivers)}
+        for i, passed in enumerate(tried):
+            for driver_id in passed:
+                if driver_id in column:
+                    cost[i, column[driver_id]] = _FORBIDDEN
+        rows, cols, optimal = _plan_summary(cost, dist, *solve_assignment(cost))
+        _g_rows, _g_cols, greedy = _plan_summary(cost, dist, *_greedy_assignment(cost))
+    else:
+        rows = cols = ()
+        optimal = greedy = {"assigned": 0, "deadhead_km": 0.0, "unlocated_pairs": 0}
+
+    report.update(optimal)
+    report["greedy"] = greedy
+    report["saved_km"] = round(greedy["deadhead_km"] - optimal["deadhead_km"], 2)
+
+    # The jobs were read before the solve: claim each one, so a job a driver
+    # accepted from the feed meanwhile is skipped rather than overwritten
+    pairs = []
+    report["lost"] = 0
+    if len(rows):
+        try:
+            for i, j in zip(rows, cols):
+                job, contractor = jobs[i], drivers[j]
+                if not claim_job(job.id, ("confirmed",), {"driver_id": contractor.id, "status": "assigned"},
+                                 driver_id=None):
+                    report["lost"] += 1
+                    continue
+                _assign_driver(job, contractor)
+                pairs.append((job, contractor, i, j))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Dispatch window failed to commit %d assignments", len(rows))
+            return None
+        report["assigned"] = len(pairs)
+
+        for job, contractor, i, j in pairs:
+            driver_index.note_job(job)
+            _announce_assignment(job, contractor)
+            distance = dist[i, j]
+            offer_manager.open(job, contractor, None if distance != distance else float(distance))
+
+    report["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info(
+        "Dispatch window: %d/%d jobs assigned, %.2f km deadhead (greedy %d jobs, %.2f km)",
+        report["assigned"], report["jobs"], report["deadhead_km"],
+        greedy["assigned"], greedy["deadhead_km"],
+    )
+    return report
@@ -0,0 +1,395 @@
+"""
+Dispatch simulator.
+
+Replays synthetic load through the real dispatch code so radii and the
+assignment strategy can be tuned before they reach drivers.  A fleet of
+simulated drivers wanders between random waypoints inside
+``geofencing.SERVICE_AREA_POLYGON`` and reports its position through
+``PUT /api/drivers/location``; jobs arrive as a Poisson process, are
+booked the way ``POST /api/booking`` books them (``_notify_nearby_contractors``,
+which drives ``notify_nearby_drivers``) and confirmed through
+``POST /api/payments/confirm-simple``, which runs ``_auto_assign_driver``.
+Drivers answer each ``job:offer`` after a short delay -- accepting with
+probability ``accept_rate``, declining otherwise -- then drive to the job
+and walk it through en_route / arrived / started / completed with the real
+status endpoint.
+
+Time is simulated in fixed ticks, so hours of load replay in seconds.  The
+report covers:
+  - dispatch latency: wall-clock ms per ``_auto_assign_driver`` call (or
+    per dispatch window in batched mode) and SQL queries per assignment;
+  - wait to accept: simulated minutes from booking to a driver accepting;
+  - deadhead: km from a driver's position at accept time to the job;
+  - socket emits per job, by event.
+
+Radii are read by the dispatch code at call time, so overrides apply to
+the run without touching the environment.  Offers do not lapse during a
+run (drivers always answer), so the offer timer is pushed out of the way.
+
+Usage (CLI):
+    python dispatch_simulator.py
+    python dispatch_simulator.py --drivers 200 --jobs-per-hour 120 --hours 4
+    python dispatch_simulator.py --mode batched --assign-radius 20
+    python dispatch_simulator.py --database-url postgresql://...   # writes sim rows
+"""
+
+from collections import Counter
+import json
+import logging
+import math
+import os
+import random
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DRIVERS = 50
+DEFAULT_JOBS_PER_HOUR = 30.0
+DEFAULT_HOURS = 2.0
+
+TICK_SECONDS = 15
+PING_SECONDS = 60
+DRIVER_SPEED_KMH = 35.0
+SERVICE_MINUTES = 30
+ACCEPT_RATE = 0.85
+RESPONSE_SECONDS = (5, 25)
+
+# Drivers within this distance of their target have arrived.
+ARRIVED_KM = 0.05
+
+
+# ---------------------------------------------------------------------------
+# Geometry
+# ---------------------------------------------------------------------------
+
+def _random_point(rng):
+    """Uniform point inside the service-area polygon."""
+    from geofencing import SERVICE_AREA_BOUNDS, is_in_service_area
+
+    b = SERVICE_AREA_BOUNDS
+    while True:
+        lat = rng.uniform(b["south"], b["north"])
+        lng = rng.uniform(b["west"], b["east"])
+        if is_in_service_area(lat, lng):
+            return lat, lng
+
+
+def _step_towards(lat, lng, target, km):
+    """Move up to *km* along the straight line to *target*."""
+    from geofencing import _haversine
+
+    remaining = _haversine(lat, lng, target[0], target[1])
+    if remaining <= km or remaining == 0:
+        return target[0], target[1], remaining
+    f = km / remaining
+    return lat + (target[0] - lat) * f, lng + (target[1] - lng) * f, km
+
+
+def _percentiles(samples):
+    if not samples:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    s = sorted(samples)
+
+    def pct(q):
+        return round(s[min(len(s) - 1, int(math.ceil(q * len(s))) - 1)], 2)
+
+    return {"count": len(s), "p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "max": round(s[-1], 2)}
+
+
+# ---------------------------------------------------------------------------
+# Simulation
+# ---------------------------------------------------------------------------
+
+class _SimDriver:
+    __slots__ = ("id", "user_id", "token", "lat", "lng", "target", "state", "job_id",
+                 "until", "next_ping")
+
+    def __init__(self, contractor_id, user_id, token, lat, lng, next_ping):
+        self.id = contractor_id
+        self.user_id = user_id
+        self.token = token
+        self.lat, self.lng = lat, lng
+        self.target = None
+        self.state = "idle"         # idle | to_job | on_site
+        self.job_id = None
+        self.until = None
+        self.next_ping = next_ping
+
+
+class _Probe:
+    """Counts SQL statements and socket emits, and hands ``job:offer``
+    events to the simulated drivers."""
+
+    def __init__(self, engine, socketio):
+        from sqlalchemy import event
+
+        self.queries = 0
+        self.emits = Counter()
+        self.offers = []
+        self._socketio = socketio
+        self._emit = socketio.emit
+        self._engine = engine
+        self._listener = self._count_query
+        event.listen(engine, "before_cursor_execute", self._listener)
+        socketio.emit = self._count_emit
+
+    def _count_query(self, *_args, **_kwargs):
+        self.queries += 1
+
+    def _count_emit(self, event_name, *args, **kwargs):
+        self.emits[event_name] += 1
+        room = kwargs.get("room") or ""
+        if event_name == "job:offer" and room.startswith("driver:") and args:
+            self.offers.append((room[len("driver:"):], args[0]["job_id"]))
+        return self._emit(event_name, *args, **kwargs)
+
+    def close(self):
+        from sqlalchemy import event
+
+        event.remove(self._engine, "before_cursor_execute", self._listener)
+        self._socketio.emit = self._emit
+
+
+def simulate_dispatch(app, drivers=DEFAULT_DRIVERS, jobs_per_hour=DEFAULT_JOBS_PER_HOUR,
+                      hours=DEFAULT_HOURS, mode="immediate", assign_radius_km=None,
+                      broadcast_radius_km=None, nearby_radius_km=None,
+                      accept_rate=ACCEPT_RATE, seed=1):
+    """Run one simulation against *app*'s database and return the report."""
+    import dispatch
+    import routes.booking as booking
+    import routes.payments as payments
+    import socket_events
+    from auth_routes import generate_token
+    from driver_index import driver_index
+    from geofencing import _haversine
+    from models import db, User, Contractor, Job, Payment, generate_uuid
+    from extensions import limiter
+    from location_rate import location_rate
+
+    # Demand has its own stream so runs with different settings see the
+    # same jobs at the same times and places.
+    rng = random.Random(seed)
+    demand = random.Random(seed + 1)
+    overrides = [
+        (dispatch, "AUTO_ASSIGN_RADIUS_KM", assign_radius_km),
+        (socket_events, "DRIVER_BROADCAST_RADIUS_KM", broadcast_radius_km),
+        (booking, "NEARBY_CONTRACTOR_RADIUS_KM", nearby_radius_km),
+        (dispatch, "DISPATCH_MODE", mode),
+    ]
+    saved = [(module, name, getattr(module, name)) for module, name, _v in overrides]
+    for module, name, value in overrides:
+        if value is not None:
+            setattr(module, name, value)
+    limiter_enabled = limiter.enabled
+    limiter.enabled = False
+    # Simulated pings are seconds apart in wall time
+    rate_enabled = location_rate.enabled
+    location_rate.enabled = False
+
+    client = app.test_client()
+    dispatch_ms, dispatch_queries, waits, deadhead = [], [], [], []
+    auto_assign = payments._auto_assign_driver
+    run_window = dispatch.run_dispatch_window
+
+    with app.app_context():
+        probe = _Probe(db.engine, socket_events.socketio)
+
+        def timed_auto_assign(job):
+            if dispatch.batched_dispatch_enabled():
+                return auto_assign(job)     # a no-op; the window assigns
+            q0, t0 = probe.queries, time.perf_counter()
+            auto_assign(job)
+            dispatch_ms.append((time.perf_counter() - t0) * 1000)
+            dispatch_queries.append(probe.queries - q0)
+
+        payments._auto_assign_driver = timed_auto_assign
+        try:
+            # -- fleet and customer --------------------------------------------
+            tag = generate_uuid()[:8]
+            customer = User(id=generate_uuid(), email="sim-{}@sim.test".format(tag),
+                            role="customer", name="Sim Customer")
+            db.session.add(customer)
+            fleet = {}
+            for n in range(drivers):
+                user = User(id=generate_uuid(), email="sim-{}-{}@sim.test".format(tag, n),
+                            role="driver", name="Sim Driver {}".format(n))
+                lat, lng = _random_point(rng)
+                contractor = Contractor(id=generate_uuid(), user_id=user.id, is_online=True,
+                                        approval_status="approved", current_lat=lat, current_lng=lng)
+                db.session.add_all([user, contractor])
+                fleet[contractor.id] = _SimDriver(contractor.id, user.id, None, lat, lng,
+                                                  rng.uniform(0, PING_SECONDS))
+            db.session.commit()
+            customer_id = customer.id
+            for d in fleet.values():
+                d.token = {"Authorization": "Bearer " + generate_token(d.user_id)}
+                d.target = _random_point(rng)
+            driver_index.reload()
+
+            jobs = {}                   # job id -> {"booked": t, "accepted": t | None}
+            decisions = []              # (due, driver id, job id)
+            next_arrival = demand.expovariate(jobs_per_hour / 3600.0)
+            next_window = dispatch.DISPATCH_WINDOW_SECONDS
+            window_stats = Counter()
+            end = hours * 3600.0
+            step_km = DRIVER_SPEED_KMH * TICK_SECONDS / 3600.0
+            t = 0.0
+            q_start = probe.queries
+            started = time.perf_counter()
+
+            def set_status(d, status, **extra):
+                body = dict(extra, status=status)
+                r = client.put("/api/drivers/jobs/{}/status".format(d.job_id), json=body, headers=d.token)
+                if r.status_code != 200:
+                    logger.warning("Sim driver %s could not set %s: %s", d.id, status, r.get_json())
+
+            while t < end:
+                t += TICK_SECONDS
+
+                # -- drivers move, arrive and finish jobs ----------------------
+                for d in fleet.values():
+                    if d.state == "on_site":
+                        if t >= d.until:
+                            set_status(d, "completed")
+                            d.state, d.job_id = "idle", None
+                            d.target = _random_point(rng)
+                        continue
+                    d.lat, d.lng, _moved = _step_towards(d.lat, d.lng, d.target, step_km)
+                    if _haversine(d.lat, d.lng, d.target[0], d.target[1]) <= ARRIVED_KM:
+                        if d.state == "to_job":
+                            set_status(d, "arrived")
+                            set_status(d, "started", before_photos=["sim://before"],
+                                       after_photos=["sim://after"])
+                            d.state, d.until = "on_site", t + SERVICE_MINUTES * 60
+                        else:
+                            d.target = _random_point(rng)
+                    if t >= d.next_ping:
+                        client.put("/api/drivers/location", json={"lat": d.lat, "lng": d.lng},
+                                   headers=d.token)
+                        d.next_ping = t + PING_SECONDS
+
+                # -- job arrivals ----------------------------------------------
+                while next_arrival <= t:
+                    lat, lng = _random_point(demand)
+                    job = Job(id=generate_uuid(), customer_id=customer_id, status="pending",
+                              address="Sim job {}".format(len(jobs) + 1), lat=lat, lng=lng,
+                              total_price=round(demand.uniform(99, 600), 2))
+                    intent_id = "pi_dev_sim{}".format(generate_uuid()[:8])
+                    db.session.add(job)
+                    db.session.add(Payment(id=generate_uuid(), job_id=job.id, amount=job.total_price,
+                                           payment_status="pending", stripe_payment_intent_id=intent_id))
+                    booking._notify_nearby_contractors(job)
+                    db.session.commit()
+                    jobs[job.id] = {"booked": next_arrival, "accepted": None}
+                    client.post("/api/payments/confirm-simple", json={"paymentIntentId": intent_id})
+                    next_arrival += demand.expovariate(jobs_per_hour / 3600.0)
+
+                # -- batched dispatch ------------------------------------------
+                if dispatch.batched_dispatch_enabled() and t >= next_window:
+                    q0, t0 = probe.queries, time.perf_counter()
+                    report = run_window() or {"assigned": 0}
+                    if report["assigned"]:
+                        dispatch_ms.append((time.perf_counter() - t0) * 1000)
+                        dispatch_queries.append((probe.queries - q0) / report["assigned"])
+                    window_stats["windows"] += 1
+                    window_stats["assigned"] += report["assigned"]
+                    next_window = t + dispatch.DISPATCH_WINDOW_SECONDS
+
+                # -- drivers answer offers -------------------------------------
+                for driver_id, job_id in probe.offers:
+                    if driver_id in fleet:
+                        decisions.append((t + rng.uniform(*RESPONSE_SECONDS), driver_id, job_id))
+                probe.offers.clear()
+                due = [x for x in decisions if x[0] <= t]
+                decisions = [x for x in decisions if x[0] > t]
+                for _due, driver_id, job_id in sorted(due):
+                    d = fleet[driver_id]
+                    if d.state == "idle" and rng.random() < accept_rate:
+                        r = client.post("/api/drivers/jobs/{}/accept".format(job_id), headers=d.token)
+                        if r.status_code != 200:
+                            continue
+                        job = r.get_json()["job"]
+                        jobs[job_id]["accepted"] = t
+                        waits.append((t - jobs[job_id]["booked"]) / 60.0)
+                        deadhead.append(_haversine(d.lat, d.lng, job["lat"], job["lng"]))
+                        d.state, d.job_id, d.target = "to_job", job_id, (job["lat"], job["lng"])
+                        set_status(d, "en_route")
+                    else:
+                        client.post("/api/drivers/jobs/{}/decline".format(job_id), headers=d.token)
+
+            elapsed = time.perf_counter() - started
+            accepted = sum(1 for j in jobs.values() if j["accepted"] is not None)
+            emits = sum(probe.emits.values())
+            return {
+                "config": {
+                    "mode": dispatch.DISPATCH_MODE,
+                    "drivers": drivers,
+                    "jobs_per_hour": jobs_per_hour,
+                    "hours": hours,
+                    "accept_rate": accept_rate,
+                    "assign_radius_km": dispatch.AUTO_ASSIGN_RADIUS_KM,
+                    "broadcast_radius_km": socket_events.DRIVER_BROADCAST_RADIUS_KM,
+                    "nearby_radius_km": booking.NEARBY_CONTRACTOR_RADIUS_KM,
+                    "seed": seed,
+                },
+                "jobs": len(jobs),
+                "accepted": accepted,
+                "unserved": len(jobs) - accepted,
+                "dispatch_ms": _percentiles(dispatch_ms),
+                "queries_per_assignment": _percentiles(dispatch_queries),
+                "wait_to_accept_min": _percentiles(waits),
+                "deadhead_km": dict(_percentiles(deadhead),
+                                    total=round(sum(deadhead), 2),
+                                    mean=round(sum(deadhead) / len(deadhead), 2) if deadhead else None),
+                "socket_emits": {
+                    "total": emits,
+                    "per_job": round(emits / len(jobs), 2) if jobs else None,
+                    "by_event": dict(probe.emits.most_common()),
+                },
+                "batched_windows": dict(window_stats) or None,
+                "total_queries": probe.queries - q_start,
+                "elapsed_s": round(elapsed, 2),
+            }
+        finally:
+            payments._auto_assign_driver = auto_assign
+            probe.close()
+            limiter.enabled = limiter_enabled
+            location_rate.enabled = rate_enabled
+            for module, name, value in saved:
+                setattr(module, name, value)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Simulate dispatch load with a synthetic fleet.")
+    parser.add_argument("--drivers", type=int, default=DEFAULT_DRIVERS)
+    parser.add_argument("--jobs-per-hour", type=float, default=DEFAULT_JOBS_PER_HOUR)
+    parser.add_argument("--hours", type=float, default=DEFAULT_HOURS)
+    parser.add_argument("--mode", choices=("immediate", "batched"), default="immediate")
+    parser.add_argument("--assign-radius", type=float, help="AUTO_ASSIGN_RADIUS_KM")
+    parser.add_argument("--broadcast-radius", type=float, help="DRIVER_BROADCAST_RADIUS_KM")
+    parser.add_argument("--nearby-radius", type=float, help="NEARBY_CONTRACTOR_RADIUS_KM")
+    parser.add_argument("--accept-rate", type=float, default=ACCEPT_RATE)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database-url", help="default: a throwaway SQLite file")
+    args = parser.parse_args()
+
+    # The app reads these at import time
+    os.environ["DATABASE_URL"] = args.database_url or "sqlite:///{}".format(
+        os.path.join(tempfile.mkdtemp(prefix="umuve-sim-"), "sim.db"))
+    os.environ["OFFER_TTL_SECONDS"] = str(10 ** 6)
+    os.environ.pop("ENABLE_SCHEDULER", None)
+    os.environ.setdefault("FLASK_ENV", "development")
+    logging.basicConfig(level=logging.WARNING)
+
+    from server import app
+
+    report = simulate_dispatch(
+        app, drivers=args.drivers, jobs_per_hour=args.jobs_per_hour, hours=args.hours,
+        mode=args.mode, assign_radius_km=args.assign_radius,
+        broadcast_radius_km=args.broadcast_radius, nearby_radius_km=args.nearby_radius,
+        accept_rate=args.accept_rate, seed=args.seed,
+    )
+    print(json.dumps(report, indent=2))
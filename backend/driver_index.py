@@ -0,0 +1,409 @@
+"""
+In-memory geospatial index of dispatchable drivers.
+
+Holds every online, approved contractor in a uniform lat/lng grid together
+with the fields dispatch filters on (operator flag, fleet) and a count of
+the active jobs each driver is working.  Nearby-driver lookups --
+auto-assignment and geo-room placement -- read it
+instead of loading the contractors table and running haversine over every
+row, so their cost depends on how many drivers are near the job rather
+than on the size of the fleet.
+
+Writes come from the places that change dispatch state: GPS updates (REST
+and socket), availability toggles, approval changes and job status
+transitions.  Each worker process keeps its own index; it is loaded lazily
+from the database (plus positions still in the location buffer) and
+reloaded every DRIVER_INDEX_REFRESH_SECONDS, which bounds drift from
+writes served by other workers.
+"""
+
+from collections import namedtuple
+from math import cos, floor, radians
+import logging
+import os
+import threading
+import time
+
+from geofencing import _haversine
+from location_buffer import LOCATION_FLUSH_SECONDS, location_buffer
+
+logger = logging.getLogger(__name__)
+
+# ~5.5 km cells at South Florida latitudes.
+GRID_CELL_DEG = 0.05
+
+# Matches geofencing._haversine (R = 6371 km).
+KM_PER_DEG_LAT = 111.19
+
+DRIVER_INDEX_REFRESH_SECONDS = float(os.environ.get("DRIVER_INDEX_REFRESH_SECONDS", "30"))
+
+# A driver with a job in one of these states is busy (not auto-assignable).
+BUSY_JOB_STATUSES = ("accepted", "en_route", "arrived", "started")
+
+IndexedDriver = namedtuple("IndexedDriver", [
+    "id",
+    "user_id",
+    "operator_id",
+    "is_operator",
+    "lat",          # None when the driver has not reported a position yet
+    "lng",
+])
+
+
+def bounding_box(lat, lng, radius_km):
+    """Return ``(south, west, north, east)`` enclosing a radius around a point."""
+    radius_km *= 1.01  # margin for meridian convergence across the box
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlng = radius_km / (KM_PER_DEG_LAT * max(cos(radians(lat)), 0.01))
+    return lat - dlat, lng - dlng, lat + dlat, lng + dlng
+
+
+def _is_dispatchable(contractor):
+    return bool(contractor.is_online) and contractor.approval_status == "approved"
+
+
+def _entry_for(contractor):
+    lat, lng = contractor.current_lat, contractor.current_lng
+    if lat is None or lng is None:
+        lat = lng = None
+    return IndexedDriver(
+        id=contractor.id,
+        user_id=contractor.user_id,
+        operator_id=contractor.operator_id,
+        is_operator=bool(contractor.is_operator),
+        lat=lat,
+        lng=lng,
+    )
+
+
+class DriverIndex:
+    """Grid index of online, approved contractors plus per-driver busy state."""
+
+    def __init__(self, cell_deg=GRID_CELL_DEG, refresh_seconds=DRIVER_INDEX_REFRESH_SECONDS):
+        self.cell_deg = cell_deg
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._drivers = {}          # driver id -> IndexedDriver
+        self._cells = {}            # (row, col) -> set of driver ids
+        self._unlocated = set()     # driver ids without a position
+        self._job_driver = {}       # busy job id -> driver id
+        self._job_status = {}       # busy job id -> status
+        self._busy = {}             # driver id -> number of busy jobs
+        self._moved_at = {}         # driver id -> time.time() of its last ping here
+        self._loaded_as_of = 0.0    # wall time the reloaded positions were current at
+        self._loaded_at = None
+
+    # -- loading ---------------------------------------------------------------
+
+    def ensure_loaded(self):
+        """Load from the database on first use and when the refresh TTL expires."""
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at < self.refresh_seconds:
+            return
+        # Only one thread reloads; others keep using the current data unless
+        # there is none yet.
+        if not self._reload_lock.acquire(blocking=loaded_at is None):
+            return
+        try:
+            if self._loaded_at is loaded_at:
+                self.reload()
+        finally:
+            self._reload_lock.release()
+
+    def expire(self):
+        """Reload from the database on next use (without blocking readers)."""
+        if self._loaded_at is not None:
+            self._loaded_at = float("-inf")
+
+    def reload(self):
+        """Rebuild the index from the database (two column-only queries)."""
+        from models import db, Contractor, Job
+
+        try:
+            rows = db.session.query(
+                Contractor.id, Contractor.user_id, Contractor.operator_id,
+                Contractor.is_operator, Contractor.current_lat, Contractor.current_lng,
+            ).filter(
+                Contractor.is_online == True,  # noqa: E712
+                Contractor.approval_status == "approved",
+            ).all()
+            busy_rows = db.session.query(Job.id, Job.driver_id, Job.status).filter(
+                Job.driver_id.isnot(None),
+                Job.status.in_(BUSY_JOB_STATUSES),
+            ).all()
+        except Exception:
+            logger.exception("Failed to load driver index")
+            return
+
+        # The database lags a ping by at most one flush interval
+        loaded_as_of = time.time() - LOCATION_FLUSH_SECONDS
+        drivers = {}
+        cells = {}
+        unlocated = set()
+        buffered = set()
+        for row in rows:
+            position = location_buffer.position(row.id)
+            if position is not None:
+                buffered.add(row.id)
+            lat, lng = position or (row.current_lat, row.current_lng)
+            if lat is None or lng is None:
+                lat = lng = None
+            entry = IndexedDriver(row.id, row.user_id, row.operator_id, bool(row.is_operator), lat, lng)
+            drivers[entry.id] = entry
+            if lat is None:
+                unlocated.add(entry.id)
+            else:
+                cells.setdefault(self._cell(lat, lng), set()).add(entry.id)
+
+        job_driver = {}
+        job_status = {}
+        busy = {}
+        for job_id, driver_id, status in busy_rows:
+            job_driver[job_id] = driver_id
+            job_status[job_id] = status
+            busy[driver_id] = busy.get(driver_id, 0) + 1
+
+        with self._lock:
+            self._drivers = drivers
+            self._cells = cells
+            self._unlocated = unlocated
+            self._job_driver = job_driver
+            self._job_status = job_status
+            self._busy = busy
+            # Positions still buffered are this worker's own pings
+            self._moved_at = {d: t for d, t in self._moved_at.items() if d in buffered}
+            self._loaded_as_of = loaded_as_of
+            self._loaded_at = time.monotonic()
+
+    # -- writes ----------------------------------------------------------------
+
+    def upsert(self, contractor):
+        """Apply a Contractor row's current state (adds, moves or removes it)."""
+        if not _is_dispatchable(contractor):
+            self.remove(contractor.id)
+            return
+        entry = _entry_for(contractor)
+        with self._lock:
+            self._detach(entry.id)
+            self._attach(entry)
+
+    def update_location(self, contractor_id, lat, lng):
+        """Move an indexed driver.  Unknown (offline) drivers are ignored."""
+        with self._lock:
+            entry = self._drivers.get(contractor_id)
+            if entry is None:
+                return
+            self._detach(contractor_id)
+            self._attach(entry._replace(lat=float(lat), lng=float(lng)))
+            self._moved_at[contractor_id] = time.time()
+
+    def remove(self, contractor_id):
+        with self._lock:
+            self._detach(contractor_id)
+            self._moved_at.pop(contractor_id, None)
+
+    def note_job(self, job):
+        """Track a job's driver/status change for the busy state."""
+        with self._lock:
+            previous = self._job_driver.pop(job.id, None)
+            self._job_status.pop(job.id, None)
+            if previous is not None:
+                remaining = self._busy.get(previous, 0) - 1
+                if remaining > 0:
+                    self._busy[previous] = remaining
+                else:
+                    self._busy.pop(previous, None)
+            if job.driver_id and job.status in BUSY_JOB_STATUSES:
+                self._job_driver[job.id] = job.driver_id
+                self._job_status[job.id] = job.status
+                self._busy[job.driver_id] = self._busy.get(job.driver_id, 0) + 1
+
+    # -- queries ---------------------------------------------------------------
+
+    def position(self, contractor_id):
+        """``(lat, lng)`` of an indexed, located driver, or None.  Reads what
+        the index holds now -- never triggers a reload."""
+        entry = self._drivers.get(contractor_id)
+        if entry is None or entry.lat is None:
+            return None
+        return entry.lat, entry.lng
+
+    def located(self, contractor_id):
+        """``(lat, lng, as_of)`` like position(), where *as_of* is the wall
+        time the position was known to be current: the driver's last ping
+        through this worker, else the last reload less one location flush."""
+        entry = self._drivers.get(contractor_id)
+        if entry is None or entry.lat is None:
+            return None
+        return entry.lat, entry.lng, self._moved_at.get(contractor_id, self._loaded_as_of)
+
+    def get(self, contractor_id):
+        """The driver's IndexedDriver, or None if offline / not approved."""
+        self.ensure_loaded()
+        return self._drivers.get(contractor_id)
+
+    def is_busy(self, contractor_id):
+        return self._busy.get(contractor_id, 0) > 0
+
+    def is_indexed(self, contractor_id):
+        """Whether the driver is online and approved, per the index."""
+        self.ensure_loaded()
+        return contractor_id in self._drivers
+
+    def driver_of(self, job_id):
+        """Driver working busy job *job_id*, or None."""
+        return self._job_driver.get(job_id)
+
+    def active_jobs(self, contractor_id):
+        """``[(job_id, status), ...]`` of the driver's busy jobs."""
+        if not self._busy.get(contractor_id):
+            return []
+        with self._lock:
+            return [(job_id, self._job_status.get(job_id))
+                    for job_id, driver_id in self._job_driver.items() if driver_id == contractor_id]
+
+    def within(self, lat, lng, radius_km, where=None, include_busy=True):
+        """Located drivers within *radius_km*, as ``(distance_km, driver)``
+        sorted nearest first."""
+        self.ensure_loaded()
+        lat, lng = float(lat), float(lng)
+        south, west, north, east = bounding_box(lat, lng, radius_km)
+        lo = self._cell(south, west)
+        hi = self._cell(north, east)
+
+        hits = []
+        with self._lock:
+            n_cells = (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1)
+            if n_cells > len(self._cells):
+                cells = [ids for cell, ids in self._cells.items()
+                         if lo[0] <= cell[0] <= hi[0] and lo[1] <= cell[1] <= hi[1]]
+            else:
+                cells = [self._cells[(i, j)]
+                         for i in range(lo[0], hi[0] + 1)
+                         for j in range(lo[1], hi[1] + 1)
+                         if (i, j) in self._cells]
+            for ids in cells:
+                for driver_id in ids:
+                    d = self._drivers[driver_id]
+                    if not include_busy and self._busy.get(driver_id):
+                        continue
+                    if where is not None and not where(d):
+                        continue
+                    dist = _haversine(lat, lng, d.lat, d.lng)
+                    if dist <= radius_km:
+                        hits.append((dist, d))
+        hits.sort(key=lambda h: h[0])
+        return hits
+
+    def nearest(self, lat, lng, k=1, max_km=None, where=None, include_busy=True):
+        """The *k* nearest located drivers (optionally within *max_km*), as
+        ``(distance_km, driver)`` sorted nearest first.
+
+        Searches outward ring by ring and stops as soon as no unvisited cell
+        can hold anything closer than the current k-th hit.
+        """
+        self.ensure_loaded()
+        lat, lng = float(lat), float(lng)
+        ci, cj = self._cell(lat, lng)
+
+        hits = []
+        with self._lock:
+            if not self._cells:
+                return []
+            rows = [c[0] for c in self._cells]
+            cols = [c[1] for c in self._cells]
+            max_ring = max(abs(ci - min(rows)), abs(ci - max(rows)),
+                           abs(cj - min(cols)), abs(cj - max(cols)))
+            ring = 0
+            while ring <= max_ring:
+                # Nothing in ring >= r can be closer than r - 1 whole cells.
+                reach = (ring - 1) * self._cell_km(lat, ring) if ring else 0.0
+                if max_km is not None and reach > max_km:
+                    break
+                if len(hits) >= k and hits[k - 1][0] <= reach:
+                    break
+                for cell in self._ring_cells(ci, cj, ring):
+                    for driver_id in self._cells.get(cell, ()):
+                        d = self._drivers[driver_id]
+                        if not include_busy and self._busy.get(driver_id):
+                            continue
+                        if where is not None and not where(d):
+                            continue
+                        dist = _haversine(lat, lng, d.lat, d.lng)
+                        if max_km is None or dist <= max_km:
+                            hits.append((dist, d))
+                hits.sort(key=lambda h: h[0])
+                ring += 1
+        return hits[:k]
+
+    def unlocated(self, where=None, include_busy=True):
+        """Drivers that have not reported a position."""
+        self.ensure_loaded()
+        with self._lock:
+            return [
+                self._drivers[i] for i in self._unlocated
+                if (include_busy or not self._busy.get(i))
+                and (where is None or where(self._drivers[i]))
+            ]
+
+    def drivers(self, where=None, include_busy=True):
+        """Every indexed driver, located or not."""
+        self.ensure_loaded()
+        with self._lock:
+            return [
+                d for i, d in self._drivers.items()
+                if (include_busy or not self._busy.get(i))
+                and (where is None or where(d))
+            ]
+
+    def __len__(self):
+        return len(self._drivers)
+
+    # -- internals -------------------------------------------------------------
+
+    def _cell(self, lat, lng):
+        return (floor(lat / self.cell_deg), floor(lng / self.cell_deg))
+
+    def _cell_km(self, lat, ring):
+        """Lower bound on a cell side (km) within *ring* cells of *lat*."""
+        far_lat = min(abs(lat) + (ring + 1) * self.cell_deg, 89.0)
+        return 0.99 * self.cell_deg * KM_PER_DEG_LAT * cos(radians(far_lat))
+
+    @staticmethod
+    def _ring_cells(ci, cj, ring):
+        if ring == 0:
+            return [(ci, cj)]
+        cells = []
+        for j in range(cj - ring, cj + ring + 1):
+            cells.append((ci - ring, j))
+            cells.append((ci + ring, j))
+        for i in range(ci - ring + 1, ci + ring):
+            cells.append((i, cj - ring))
+            cells.append((i, cj + ring))
+        return cells
+
+    def _attach(self, entry):
+        self._drivers[entry.id] = entry
+        if entry.lat is None:
+            self._unlocated.add(entry.id)
+        else:
+            self._cells.setdefault(self._cell(entry.lat, entry.lng), set()).add(entry.id)
+
+    def _detach(self, driver_id):
+        entry = self._drivers.pop(driver_id, None)
+        if entry is None:
+            return
+        if entry.lat is None:
+            self._unlocated.discard(driver_id)
+            return
+        cell = self._cell(entry.lat, entry.lng)
+        ids = self._cells.get(cell)
+        if ids is not None:
+            ids.discard(driver_id)
+            if not ids:
+                del self._cells[cell]
+
+
+# Process-wide index used by the dispatch paths.
+driver_index = DriverIndex()
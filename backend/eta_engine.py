@@ -0,0 +1,369 @@
+"""
+Offline travel-time (ETA) engine.
+
+Estimates driving time between any points in the service area without an
+external routing service.  The service area is cut into a coarse grid
+(ETA_CELL_DEG); each cell has a driving speed for every hour of the day,
+learned from our own driver GPS pings and shrunk towards a built-in
+time-of-day prior where data is thin.  Travel time between two points is
+their road distance (haversine x ROAD_FACTOR) times the *pace* (minutes per
+km) averaged over the cells the trip crosses.
+
+Pace rows -- one origin cell at one hour, against every destination cell --
+are computed with NumPy on first use and kept in an LRU keyed by
+(origin cell, hour) that is large enough to hold the whole matrix once
+``precompute()`` has run.  Bulk ``eta(origins, destinations)`` queries are
+answered by gathering from those rows, as are ``eta_pairs()`` queries for
+many independent (origin, destination) trips.
+
+Learning is O(1) per ping: consecutive pings from the same driver give a
+speed sample that is added to the cell/hour it happened in.  The learned
+profile is published (and the cache dropped) every
+ETA_PROFILE_REFRESH_SECONDS.
+
+Learned state lives in the process.  ``start()`` (called at server start-up)
+runs a background thread that first replays the last ETA_SEED_DAYS days of
+location history, so a restarted worker does not fall back to the prior,
+and then republishes the profile on schedule, precomputing the rows for
+the current and the next hour each time so queries rarely build a row.
+"""
+
+from collections import OrderedDict
+from datetime import datetime, timezone
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from geofencing import SERVICE_AREA_BOUNDS, EARTH_RADIUS_KM, _haversine
+
+logger = logging.getLogger(__name__)
+
+try:
+    from zoneinfo import ZoneInfo
+    SERVICE_TIMEZONE = ZoneInfo("America/New_York")
+except Exception:  # tzdata unavailable -- traffic hours fall back to UTC
+    SERVICE_TIMEZONE = timezone.utc
+
+ETA_CELL_DEG = 0.1
+
+# Straight-line to road distance.
+ROAD_FACTOR = 1.3
+
+# Prior speed (km/h) by local hour of day: free-flowing at night, slowest
+# in the morning and evening peaks.
+DEFAULT_SPEED_KMH_BY_HOUR = [
+    45, 45, 45, 45, 45, 42,     # 00-05
+    35, 24, 24, 30, 32, 32,     # 06-11
+    30, 32, 32, 28, 22, 22,     # 12-17
+    26, 34, 38, 40, 42, 45,     # 18-23
+]
+
+# How many hours of observed driving a cell/hour needs before its own data
+# outweighs the prior.
+PRIOR_WEIGHT_HOURS = 0.5
+
+# Speed samples are taken from consecutive pings this far apart ...
+MIN_SAMPLE_SECONDS = 20
+MAX_SAMPLE_SECONDS = 600
+# ... and kept only when plausible for a moving truck.
+MIN_SAMPLE_KMH = 3.0
+MAX_SAMPLE_KMH = 130.0
+
+# Points sampled along a trip to average pace over the cells it crosses.
+PATH_SAMPLES = 12
+
+ETA_PROFILE_REFRESH_SECONDS = float(os.environ.get("ETA_PROFILE_REFRESH_SECONDS", "900"))
+ETA_SEED_DAYS = int(os.environ.get("ETA_SEED_DAYS", "7"))
+
+SECONDS_PER_DAY = 86400
+
+
+def local_hour(when=None):
+    """Hour of day in the service area's time zone (naive datetimes are UTC)."""
+    if when is None:
+        when = datetime.now(timezone.utc)
+    elif when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.astimezone(SERVICE_TIMEZONE).hour
+
+
+class EtaEngine:
+    """Grid speed profile, its learner and the pace-row cache."""
+
+    def __init__(self, bounds=SERVICE_AREA_BOUNDS, cell_deg=ETA_CELL_DEG,
+                 refresh_seconds=ETA_PROFILE_REFRESH_SECONDS):
+        self.cell_deg = cell_deg
+        self.refresh_seconds = refresh_seconds
+        self.south = bounds["south"]
+        self.west = bounds["west"]
+        self.rows = int(np.ceil((bounds["north"] - self.south) / cell_deg))
+        self.cols = int(np.ceil((bounds["east"] - self.west) / cell_deg))
+        self.n_cells = self.rows * self.cols
+
+        r, c = np.divmod(np.arange(self.n_cells), self.cols)
+        self.centre_lat = self.south + (r + 0.5) * cell_deg
+        self.centre_lng = self.west + (c + 0.5) * cell_deg
+
+        self._prior = np.tile(np.asarray(DEFAULT_SPEED_KMH_BY_HOUR, dtype=float), (self.n_cells, 1))
+        self._km = np.zeros((self.n_cells, 24))
+        self._hours = np.zeros((self.n_cells, 24))
+        self._last_ping = {}        # contractor id -> (lat, lng, monotonic seconds)
+        self._learn_lock = threading.Lock()
+        self._samples_since_publish = 0
+
+        self._pace = 60.0 / self._prior    # minutes per km, per cell and hour
+        self._published_at = time.monotonic()
+        self._rows_cache = OrderedDict()    # (origin cell, hour) -> pace row
+        self._cache_size = self.n_cells * 24
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._thread = None
+
+    # -- learning --------------------------------------------------------------
+
+    def observe(self, contractor_id, lat, lng, when=None, now=None):
+        """Record a GPS ping; consecutive pings become speed samples."""
+        try:
+            lat, lng = float(lat), float(lng)
+        except (TypeError, ValueError):
+            return
+        now = time.monotonic() if now is None else now
+        with self._learn_lock:
+            previous = self._last_ping.get(contractor_id)
+            self._last_ping[contractor_id] = (lat, lng, now)
+        if previous is None:
+            return
+        seconds = now - previous[2]
+        if not MIN_SAMPLE_SECONDS <= seconds <= MAX_SAMPLE_SECONDS:
+            return
+        km = _haversine(previous[0], previous[1], lat, lng) * ROAD_FACTOR
+        kmh = km / (seconds / 3600.0)
+        if not MIN_SAMPLE_KMH <= kmh <= MAX_SAMPLE_KMH:
+            return
+        cell = self._cell_of((previous[0] + lat) / 2, (previous[1] + lng) / 2)
+        if cell is None:
+            return
+        hour = local_hour(when)
+        with self._learn_lock:
+            self._km[cell, hour] += km
+            self._hours[cell, hour] += seconds / 3600.0
+            self._samples_since_publish += 1
+
+    def learn_track(self, t, lat, lng):
+        """Learn from one driver's recorded track (POSIX seconds and
+        positions, in time order) in one pass; returns the samples kept.
+        Same rules as ``observe()``, applied to every consecutive pair."""
+        t, lat, lng = (np.asarray(v, dtype=float) for v in (t, lat, lng))
+        if len(t) < 2:
+            return 0
+        seconds = np.diff(t)
+        km = _pair_distance_km(np.column_stack([lat[:-1], lng[:-1]]),
+                               np.column_stack([lat[1:], lng[1:]])) * ROAD_FACTOR
+        keep = (seconds >= MIN_SAMPLE_SECONDS) & (seconds <= MAX_SAMPLE_SECONDS)
+        kmh = np.zeros_like(km)
+        np.divide(km, seconds / 3600.0, out=kmh, where=keep)
+        keep &= (kmh >= MIN_SAMPLE_KMH) & (kmh <= MAX_SAMPLE_KMH)
+
+        r = np.floor(((lat[:-1] + lat[1:]) / 2 - self.south) / self.cell_deg).astype(int)
+        c = np.floor(((lng[:-1] + lng[1:]) / 2 - self.west) / self.cell_deg).astype(int)
+        keep &= (r >= 0) & (r < self.rows) & (c >= 0) & (c < self.cols)
+        if not keep.any():
+            return 0
+        # Local hour of each sample's end, converted once per UTC hour
+        stamps, inverse = np.unique((t[1:][keep] // 3600).astype(np.int64), return_inverse=True)
+        hours = np.array([local_hour(datetime.fromtimestamp(int(s) * 3600, timezone.utc))
+                          for s in stamps])[inverse]
+        cells = r[keep] * self.cols + c[keep]
+        with self._learn_lock:
+            np.add.at(self._km, (cells, hours), km[keep])
+            np.add.at(self._hours, (cells, hours), seconds[keep] / 3600.0)
+            self._samples_since_publish += int(keep.sum())
+        return int(keep.sum())
+
+    def seed(self, history, days=ETA_SEED_DAYS, now=None):
+        """Learn from the last *days* days of *history* (a LocationHistory)
+        up to *now*, then publish.  Returns the samples learned."""
+        now = time.time() if now is None else now
+        today = int(now // SECONDS_PER_DAY)
+        samples = 0
+        for day in range(today - days, today + 1):
+            for _contractor_id, t, lat, lng in history.day_tracks(day):
+                upto = np.searchsorted(t, now, side="right")
+                samples += self.learn_track(t[:upto], lat[:upto], lng[:upto])
+        self.publish()
+        logger.info("ETA profile seeded with %d speed samples from %d days of history", samples, days)
+        return samples
+
+    def start(self, history=None):
+        """Seed from *history* and keep the profile and the coming hours'
+        rows fresh on a background thread (once per process)."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(history,), name="eta-refresh", daemon=True)
+        self._thread.start()
+
+    def _run(self, history):
+        try:
+            if history is not None:
+                self.seed(history)
+        except Exception:
+            logger.exception("Failed to seed the ETA profile from location history")
+        while True:
+            try:
+                if self._samples_since_publish:
+                    self.publish()
+                hour = local_hour()
+                self.precompute(hours=(hour, (hour + 1) % 24))
+            except Exception:
+                logger.exception("ETA profile refresh failed")
+            time.sleep(self.refresh_seconds)
+
+    def publish(self):
+        """Fold the learned samples into the live profile and drop cached rows."""
+        with self._learn_lock:
+            speed = ((self._km + PRIOR_WEIGHT_HOURS * self._prior)
+                     / (self._hours + PRIOR_WEIGHT_HOURS))
+            samples = self._samples_since_publish
+            self._samples_since_publish = 0
+        with self._cache_lock:
+            self._pace = 60.0 / speed
+            self._rows_cache.clear()
+            self._published_at = time.monotonic()
+        if samples:
+            logger.info("ETA profile republished with %d new speed samples", samples)
+
+    def _maybe_publish(self):
+        # Without the refresh thread (scripts, tests) queries publish
+        if (self._thread is None and self._samples_since_publish
+                and time.monotonic() - self._published_at >= self.refresh_seconds):
+            self.publish()
+
+    # -- queries ---------------------------------------------------------------
+
+    def precompute(self, hours=range(24)):
+        """Fill the cache with every origin-cell row for *hours*."""
+        for hour in hours:
+            for cell in range(self.n_cells):
+                self._row(cell, hour)
+
+    def eta(self, origins, destinations, when=None):
+        """Minutes from every origin to every destination, as a
+        ``len(origins) x len(destinations)`` array.  Points are ``(lat, lng)``."""
+        self._maybe_publish()
+        o = np.asarray(origins, dtype=float).reshape(-1, 2)
+        d = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        hour = local_hour(when)
+
+        km = _distance_km(o, d) * ROAD_FACTOR
+        co = self._cells(o)
+        cd = self._cells(d)
+        unique, inverse = np.unique(co, return_inverse=True)
+        rows = np.stack([self._row(int(cell), hour) for cell in unique]) if len(unique) else \
+            np.empty((0, self.n_cells))
+        pace = rows[inverse][:, cd]
+        return km * pace
+
+    def eta_pairs(self, origins, destinations, when=None):
+        """Minutes from each origin to the destination at the same index, as
+        a ``len(origins)`` array -- what ``eta(...).diagonal()`` would give
+        without building the full matrix."""
+        self._maybe_publish()
+        o = np.asarray(origins, dtype=float).reshape(-1, 2)
+        d = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        if len(o) != len(d):
+            raise ValueError("eta_pairs needs as many destinations as origins")
+        hour = local_hour(when)
+
+        km = _pair_distance_km(o, d) * ROAD_FACTOR
+        co = self._cells(o)
+        cd = self._cells(d)
+        unique, inverse = np.unique(co, return_inverse=True)
+        rows = np.stack([self._row(int(cell), hour) for cell in unique]) if len(unique) else \
+            np.empty((0, self.n_cells))
+        return km * rows[inverse, cd]
+
+    def eta_minutes(self, origin, destination, when=None):
+        """Minutes between two ``(lat, lng)`` points, or None if either is missing."""
+        if origin is None or destination is None or None in origin or None in destination:
+            return None
+        return float(self.eta([origin], [destination], when)[0, 0])
+
+    def stats(self):
+        with self._learn_lock:
+            observed = int((self._hours > 0).sum())
+            hours = float(self._hours.sum())
+        return {
+            "cells": self.n_cells,
+            "cell_deg": self.cell_deg,
+            "observed_cell_hours": observed,
+            "observed_driving_hours": round(hours, 2),
+            "cached_rows": len(self._rows_cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+    # -- internals -------------------------------------------------------------
+
+    def _cell_of(self, lat, lng):
+        r = int((lat - self.south) // self.cell_deg)
+        c = int((lng - self.west) // self.cell_deg)
+        if 0 <= r < self.rows and 0 <= c < self.cols:
+            return r * self.cols + c
+        return None
+
+    def _cells(self, points):
+        """Grid cell per point; points outside the grid use the nearest cell."""
+        r = np.clip(((points[:, 0] - self.south) // self.cell_deg).astype(int), 0, self.rows - 1)
+        c = np.clip(((points[:, 1] - self.west) // self.cell_deg).astype(int), 0, self.cols - 1)
+        return r * self.cols + c
+
+    def _row(self, cell, hour):
+        key = (cell, hour)
+        with self._cache_lock:
+            row = self._rows_cache.get(key)
+            if row is not None:
+                self._rows_cache.move_to_end(key)
+                self.cache_hits += 1
+                return row
+            pace = self._pace[:, hour]
+        self.cache_misses += 1
+
+        # Average pace over PATH_SAMPLES points on the straight line from
+        # this cell's centre to every other cell's centre.
+        f = (np.arange(PATH_SAMPLES) + 0.5) / PATH_SAMPLES
+        lat = self.centre_lat[cell] + np.outer(self.centre_lat - self.centre_lat[cell], f)
+        lng = self.centre_lng[cell] + np.outer(self.centre_lng - self.centre_lng[cell], f)
+        r = ((lat - self.south) // self.cell_deg).astype(int)
+        c = ((lng - self.west) // self.cell_deg).astype(int)
+        row = pace[r * self.cols + c].mean(axis=1)
+
+        with self._cache_lock:
+            self._rows_cache[key] = row
+            while len(self._rows_cache) > self._cache_size:
+                self._rows_cache.popitem(last=False)
+        return row
+
+
+def _distance_km(o, d):
+    """Haversine distances (km) between every row of *o* and of *d*."""
+    return _haversine_km(o[:, None, 0], o[:, None, 1], d[None, :, 0], d[None, :, 1])
+
+
+def _pair_distance_km(o, d):
+    """Haversine distances (km) between matching rows of *o* and *d*."""
+    return _haversine_km(o[:, 0], o[:, 1], d[:, 0], d[:, 1])
+
+
+def _haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(v) for v in (lat1, lng1, lat2, lng2))
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# Process-wide engine used by dispatch, tracking and route sequencing.
+eta_engine = EtaEngine()
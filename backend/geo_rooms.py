@@ -0,0 +1,171 @@
+"""
+Geo-cell Socket.IO rooms for fleet-wide driver broadcasts.
+
+``job:new`` used to be one emit per nearby driver (after a distance check
+per driver) and ``job:accepted`` one emit per online driver, so both grew
+with the fleet.  Driver sockets are now kept in the room of the grid cell
+they are in,
+
+    cell:<row>:<col>    GEO_ROOM_CELL_DEG cells (~5.5 km at 0.05)
+    drivers             every dispatchable driver, located or not
+
+and a broadcast is one emit to the list of cell rooms that intersect the
+job's radius -- about a hundred rooms for 30 km, whatever the fleet size.
+The cells stick out of the circle, so drivers up to one cell diagonal
+(~7 km at 0.05) beyond the radius can also get the event; the driver app
+shows every job:new it receives, so keep cells small.
+
+A driver's socket joins its cell when it joins ``driver:<id>`` and moves
+when a ping crosses a cell edge.  Only online, approved, non-operator
+drivers are placed (operators are never sent new jobs).  Placement is
+decided where the ping, availability toggle or approval change is served
+and published through the backplane, so the worker holding the socket
+moves it even when the change was made elsewhere.
+"""
+
+from collections import Counter
+from math import floor
+import logging
+import os
+import threading
+
+from driver_index import bounding_box
+from geofencing import _haversine
+from socket_backplane import backplane
+
+logger = logging.getLogger(__name__)
+
+GEO_ROOM_CELL_DEG = float(os.environ.get("GEO_ROOM_CELL_DEG", "0.05"))
+
+# Every placed driver, for broadcasts about jobs without a position.
+FLEET_ROOM = "drivers"
+
+
+class GeoRooms:
+    """Which cell room each driver's sockets belong in."""
+
+    def __init__(self, cell_deg=GEO_ROOM_CELL_DEG):
+        self.cell_deg = cell_deg
+        self._lock = threading.Lock()
+        self._sids = {}             # contractor id -> set of driver sids on this worker
+        self._driver = {}           # sid -> contractor id
+        self._placed = {}           # contractor id -> tuple of rooms (as last published)
+        self.stats = Counter()
+        backplane.subscribe("geo_rooms.placed", self._on_placed)
+
+    # -- rooms -----------------------------------------------------------------
+
+    def room_for(self, lat, lng):
+        return "cell:{}:{}".format(floor(lat / self.cell_deg), floor(lng / self.cell_deg))
+
+    def rooms_covering(self, lat, lng, radius_km):
+        """Cell rooms that together cover *radius_km* around a point (cells
+        of the bounding box whose nearest point is within the radius)."""
+        lat, lng = float(lat), float(lng)
+        south, west, north, east = bounding_box(lat, lng, radius_km)
+        deg = self.cell_deg
+        rooms = []
+        for i in range(floor(south / deg), floor(north / deg) + 1):
+            near_lat = min(max(lat, i * deg), (i + 1) * deg)
+            for j in range(floor(west / deg), floor(east / deg) + 1):
+                near_lng = min(max(lng, j * deg), (j + 1) * deg)
+                if _haversine(lat, lng, near_lat, near_lng) <= radius_km:
+                    rooms.append("cell:{}:{}".format(i, j))
+        return rooms
+
+    # -- sockets ---------------------------------------------------------------
+
+    def attach(self, sid, contractor_id):
+        """Socket *sid* joined ``driver:<contractor_id>``; put it in the
+        driver's rooms."""
+        with self._lock:
+            self._sids.setdefault(contractor_id, set()).add(sid)
+            self._driver[sid] = contractor_id
+            rooms = self._placed.get(contractor_id, ())
+        self._move([sid], (), rooms)
+        self.update(contractor_id)
+
+    def detach(self, sid):
+        """Socket *sid* left its driver room or disconnected."""
+        with self._lock:
+            contractor_id = self._driver.pop(sid, None)
+            if contractor_id is None:
+                return
+            sids = self._sids.get(contractor_id)
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._sids[contractor_id]
+            rooms = self._placed.get(contractor_id, ())
+        self._move([sid], rooms, ())
+
+    # -- changes ---------------------------------------------------------------
+
+    def update(self, contractor_id, lat=None, lng=None):
+        """Re-place a driver after a ping (*lat*, *lng*), an availability or
+        approval change; tells every worker if its rooms changed."""
+        rooms = self._placement(contractor_id, lat, lng)
+        if self._placed.get(contractor_id, ()) != rooms:
+            backplane.publish("geo_rooms.placed", [contractor_id, list(rooms)])
+
+    def snapshot(self):
+        """Placed drivers, local driver sockets and moves (this worker only)."""
+        with self._lock:
+            placed = sum(1 for rooms in self._placed.values() if rooms)
+            return {
+                "cell_deg": self.cell_deg,
+                "drivers_placed": placed,
+                "cells": len({rooms[1] for rooms in self._placed.values() if len(rooms) > 1}),
+                "local_sockets": len(self._driver),
+                "stats": dict(self.stats),
+            }
+
+    # -- internals -------------------------------------------------------------
+
+    def _placement(self, contractor_id, lat, lng):
+        from driver_index import driver_index
+
+        entry = driver_index.get(contractor_id)
+        if entry is None or entry.is_operator:
+            return ()
+        if lat is None or lng is None:
+            lat, lng = entry.lat, entry.lng
+        if lat is None or lng is None:
+            return (FLEET_ROOM,)
+        return (FLEET_ROOM, self.room_for(float(lat), float(lng)))
+
+    def _on_placed(self, data):
+        contractor_id, rooms = data
+        rooms = tuple(rooms)
+        with self._lock:
+            old = self._placed.get(contractor_id, ())
+            if rooms:
+                self._placed[contractor_id] = rooms
+            else:
+                self._placed.pop(contractor_id, None)
+            sids = list(self._sids.get(contractor_id, ()))
+            self.stats["moves"] += 1
+        self._move(sids, old, rooms)
+
+    def _move(self, sids, old, new):
+        if not sids or old == new:
+            return
+        try:
+            from socket_events import socketio
+
+            server = socketio.server
+            if server is None:
+                return
+            for sid in sids:
+                for room in old:
+                    if room not in new:
+                        server.leave_room(sid, room, namespace="/")
+                for room in new:
+                    if room not in old:
+                        server.enter_room(sid, room, namespace="/")
+        except Exception:
+            logger.exception("Failed to move driver sockets between geo rooms")
+
+
+# Process-wide rooms used by the new-job and job-taken broadcasts.
+geo_rooms = GeoRooms()
@@ -0,0 +1,241 @@
+"""
+Database-side radius search over open jobs.
+
+The driver job feed asks for open (pending / confirmed) jobs near the
+driver, nearest first, a page at a time.  The search runs in the database
+against a spatial index that only covers open, located jobs:
+
+    PostgreSQL  cube + earthdistance, GiST index on ll_to_earth(lat, lng);
+                ``earth_box`` selects candidates from the index and
+                ``earth_distance`` orders them.
+    SQLite      an R*Tree virtual table (jobs_rtree) keyed by the jobs
+                rowid and kept in sync by triggers; the box query touches
+                only nearby entries and the exact distance is computed for
+                those rows.
+
+If neither can be installed (no extension privileges, SQLite built without
+R*Tree) the search falls back to a bounding-box range query on
+``ix_jobs_location``.
+
+Pages use a keyset cursor over (distance, job id), so deep pages cost the
+same as the first.  Open jobs without a location come after every located
+job, ordered by id.  ``install()`` runs at startup, after create_all().
+"""
+
+import base64
+import json
+import logging
+
+from sqlalchemy import text
+
+from driver_index import bounding_box
+from geofencing import _haversine
+
+logger = logging.getLogger(__name__)
+
+# Jobs a driver can still pick up from the feed.
+OPEN_JOB_STATUSES = ("pending", "confirmed")
+
+_OPEN = "status IN ({})".format(", ".join("'{}'".format(s) for s in OPEN_JOB_STATUSES))
+
+# First ring searched beyond the cursor; each further ring is 4x wider.
+RING_START_KM = 2.0
+
+# Which search is available: "earthdistance", "rtree" or "bbox".
+_backend = "bbox"
+
+_PG_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS cube",
+    "CREATE EXTENSION IF NOT EXISTS earthdistance",
+    "CREATE INDEX IF NOT EXISTS ix_jobs_open_earth ON jobs USING gist (ll_to_earth(lat, lng)) "
+    "WHERE {} AND lat IS NOT NULL AND lng IS NOT NULL".format(_OPEN),
+]
+
+_SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS jobs_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+    """CREATE TRIGGER IF NOT EXISTS jobs_rtree_insert AFTER INSERT ON jobs
+    WHEN NEW.lat IS NOT NULL AND NEW.lng IS NOT NULL AND NEW.{open}
+    BEGIN
+        INSERT OR REPLACE INTO jobs_rtree VALUES (NEW.rowid, NEW.lat, NEW.lat, NEW.lng, NEW.lng);
+    END""".format(open=_OPEN),
+    """CREATE TRIGGER IF NOT EXISTS jobs_rtree_update AFTER UPDATE OF lat, lng, status ON jobs
+    BEGIN
+        DELETE FROM jobs_rtree WHERE id = OLD.rowid;
+        INSERT INTO jobs_rtree SELECT NEW.rowid, NEW.lat, NEW.lat, NEW.lng, NEW.lng
+        WHERE NEW.lat IS NOT NULL AND NEW.lng IS NOT NULL AND NEW.{open};
+    END""".format(open=_OPEN),
+    """CREATE TRIGGER IF NOT EXISTS jobs_rtree_delete AFTER DELETE ON jobs
+    BEGIN
+        DELETE FROM jobs_rtree WHERE id = OLD.rowid;
+    END""",
+]
+
+# Rowids of tables without an INTEGER PRIMARY KEY can change on VACUUM, so
+# the tree is rebuilt from the jobs table whenever it is installed.
+_SQLITE_REBUILD = [
+    "DELETE FROM jobs_rtree",
+    "INSERT INTO jobs_rtree SELECT rowid, lat, lat, lng, lng FROM jobs "
+    "WHERE lat IS NOT NULL AND lng IS NOT NULL AND {}".format(_OPEN),
+]
+
+
+def install(db):
+    """Create the spatial index for this database and pick the search path."""
+    global _backend
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        statements, backend = _PG_DDL, "earthdistance"
+    elif dialect == "sqlite":
+        statements, backend = _SQLITE_DDL + _SQLITE_REBUILD, "rtree"
+    else:
+        _backend = "bbox"
+        return _backend
+
+    try:
+        with db.engine.begin() as conn:
+            for stmt in statements:
+                conn.execute(text(stmt))
+        _backend = backend
+    except Exception as exc:
+        if dialect == "postgresql" and _pg_index_exists(db):
+            # Another worker created it first
+            _backend = backend
+        else:
+            _backend = "bbox"
+            logger.warning("Spatial job index unavailable (%s); using bounding-box search", exc)
+    return _backend
+
+
+def backend():
+    return _backend
+
+
+def _pg_index_exists(db):
+    try:
+        with db.engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_jobs_open_earth'"
+            )).first() is not None
+    except Exception:
+        return False
+
+
+# ---------------------------------------------------------------------------
+# Cursor
+# ---------------------------------------------------------------------------
+
+def encode_cursor(distance_km, job_id):
+    """Opaque cursor positioned after the job at *distance_km* (None for the
+    unlocated tail)."""
+    raw = json.dumps([distance_km, job_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return ``(distance_km, job_id)``; raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        distance_km, job_id = json.loads(raw)
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(job_id, str) or not (distance_km is None or isinstance(distance_km, (int, float))):
+        raise ValueError("invalid cursor")
+    return distance_km, job_id
+
+
+# ---------------------------------------------------------------------------
+# Search
+# ---------------------------------------------------------------------------
+
+def open_jobs_page(session, lat, lng, radius_km, limit, cursor=None):
+    """One page of open jobs near ``(lat, lng)``, nearest first.
+
+    Returns ``([(job_id, distance_km), ...], next_cursor)``; *next_cursor*
+    is None on the last page.  With no position every open job is listed,
+    by id, with a distance of None.
+    """
+    after_dist, after_id = decode_cursor(cursor) if cursor else (-1.0, "")
+    located = lat is not None and lng is not None
+
+    page = []
+    if located and after_dist is not None:
+        page = _located_page(session, lat, lng, radius_km, limit + 1, after_dist, after_id)
+        if len(page) > limit:
+            return page[:limit], _cursor_after(page[limit - 1])
+        after_id = ""
+
+    rest = limit - len(page)
+    tail = _unlocated_page(session, rest + 1, after_id, only_unlocated=located)
+    page += tail[:rest]
+    next_cursor = _cursor_after(page[-1]) if len(tail) > rest else None
+    return page, next_cursor
+
+
+def _cursor_after(hit):
+    job_id, distance_km = hit
+    return encode_cursor(distance_km, job_id)
+
+
+def _located_page(session, lat, lng, radius_km, limit, after_dist, after_id):
+    if _backend == "earthdistance":
+        rows = session.execute(text("""
+            SELECT id, dist FROM (
+                SELECT id, earth_distance(ll_to_earth(:lat, :lng), ll_to_earth(lat, lng)) / 1000.0 AS dist
+                FROM jobs
+                WHERE {open} AND lat IS NOT NULL AND lng IS NOT NULL
+                  AND earth_box(ll_to_earth(:lat, :lng), :radius_m) @> ll_to_earth(lat, lng)
+            ) AS near
+            WHERE dist <= :radius_km AND (dist, id) > (:after_dist, :after_id)
+            ORDER BY dist, id
+            LIMIT :limit
+        """.format(open=_OPEN)), {
+            "lat": lat, "lng": lng, "radius_m": radius_km * 1000.0, "radius_km": radius_km,
+            "after_dist": after_dist, "after_id": after_id, "limit": limit,
+        })
+        return [(job_id, float(dist)) for job_id, dist in rows]
+
+    if _backend == "rtree":
+        # CROSS JOIN pins the join order: without it SQLite may walk jobs by
+        # status and probe the tree once per row.
+        sql = text("""
+            SELECT j.id, j.lat, j.lng FROM jobs_rtree AS r CROSS JOIN jobs AS j ON j.rowid = r.id
+            WHERE r.max_lat >= :south AND r.min_lat <= :north
+              AND r.max_lng >= :west AND r.min_lng <= :east
+              AND j.{open}
+        """.format(open=_OPEN))
+    else:
+        sql = text("""
+            SELECT id, lat, lng FROM jobs
+            WHERE lat BETWEEN :south AND :north AND lng BETWEEN :west AND :east
+              AND {open}
+        """.format(open=_OPEN))
+
+    # Search rings of growing radius: once *limit* jobs lie within the ring,
+    # nothing outside it can be nearer, so dense areas never read the whole
+    # search radius.
+    reach = RING_START_KM
+    while True:
+        ring_km = min(max(after_dist, 0.0) + reach, radius_km)
+        south, west, north, east = bounding_box(lat, lng, ring_km)
+        found = []
+        for job_id, job_lat, job_lng in session.execute(
+                sql, {"south": south, "north": north, "west": west, "east": east}):
+            dist = _haversine(lat, lng, job_lat, job_lng)
+            if dist <= ring_km and (dist, job_id) > (after_dist, after_id):
+                found.append((job_id, dist))
+        if len(found) >= limit or ring_km >= radius_km:
+            break
+        reach *= 4
+    found.sort(key=lambda hit: (hit[1], hit[0]))
+    return found[:limit]
+
+
+def _unlocated_page(session, limit, after_id, only_unlocated):
+    where = "AND (lat IS NULL OR lng IS NULL)" if only_unlocated else ""
+    rows = session.execute(text("""
+        SELECT id FROM jobs
+        WHERE {open} {where} AND id > :after_id
+        ORDER BY id
+        LIMIT :limit
+    """.format(open=_OPEN, where=where)), {"after_id": after_id, "limit": limit})
+    return [(job_id, None) for (job_id,) in rows]
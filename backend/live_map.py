@@ -0,0 +1,208 @@
+"""
+Tick-batched driver positions for the admin live map.
+
+Every driver ping used to be forwarded to the admin room as its own
+``admin:contractor-location`` frame, so each dashboard tab received one
+frame per ping across the whole fleet.  Pings now only mark the driver as
+moved; once per ADMIN_MAP_TICK_SECONDS a broadcaster thread sends each
+admin client one frame
+
+    admin:locations   { locations: [{ contractor_id, lat, lng }, ...] }
+
+with the drivers that moved at least ADMIN_MAP_MIN_MOVE_M since they were
+last sent.  An admin can narrow its feed to the map viewport with
+``admin:viewport`` ({ south, west, north, east }, or null for everything);
+clients without a viewport share one room emit per tick, clients with one
+get their own filtered frame (none when nothing in view moved).  Since a
+tick only carries drivers that moved, a client that changes its viewport
+first gets one frame with the last sent position of every driver in the
+new bounds.
+
+Pings are shared with every worker through the backplane, and each
+worker sends frames only to the admin clients connected to it.
+"""
+
+from collections import Counter
+import logging
+import os
+import threading
+import time
+
+from geofencing import _haversine
+from socket_backplane import backplane
+import socket_payloads
+
+logger = logging.getLogger(__name__)
+
+ADMIN_MAP_TICK_SECONDS = float(os.environ.get("ADMIN_MAP_TICK_SECONDS", "1"))
+ADMIN_MAP_MIN_MOVE_M = float(os.environ.get("ADMIN_MAP_MIN_MOVE_M", "25"))
+
+# Admin clients without a viewport; they all get the same frame.
+ALL_DRIVERS_ROOM = "admin:map"
+
+
+class LiveMapBroadcaster:
+    """Latest driver positions per tick and the admin clients to send them to."""
+
+    def __init__(self, tick_seconds=ADMIN_MAP_TICK_SECONDS, min_move_m=ADMIN_MAP_MIN_MOVE_M):
+        self.tick_seconds = tick_seconds
+        self.min_move_m = min_move_m
+        self._lock = threading.Lock()
+        self._moved = {}            # contractor id -> (lat, lng) since the last tick
+        self._sent = {}             # contractor id -> (lat, lng) last broadcast
+        self._viewports = {}        # admin sid -> (south, west, north, east) or None
+        self._frames = Counter()    # admin sid -> frames sent
+        self._joined = {}           # admin sid -> (monotonic join time, pings seen before)
+        self._thread = None
+        self.stats = Counter()
+        self._started_at = time.monotonic()
+        backplane.subscribe("live_map.note", self._on_note)
+
+    # -- inputs ----------------------------------------------------------------
+
+    def note(self, contractor_id, lat, lng):
+        """A driver reported a position (to this or any other worker)."""
+        backplane.publish("live_map.note", [contractor_id, lat, lng])
+
+    def _on_note(self, data):
+        contractor_id, lat, lng = data
+        with self._lock:
+            self._moved[contractor_id] = (lat, lng)
+            self.stats["pings"] += 1
+        self._ensure_thread()
+
+    def subscribe(self, sid, viewport=None):
+        """Start (or re-scope) the feed for admin client *sid*; returns the
+        room it should be in, or None for a per-client feed."""
+        with self._lock:
+            self._viewports[sid] = viewport
+            self._joined.setdefault(sid, (time.monotonic(), self.stats["pings"]))
+        return ALL_DRIVERS_ROOM if viewport is None else None
+
+    def positions(self, viewport=None):
+        """The last sent position of every driver inside *viewport* (all
+        drivers for None), as ``admin:locations`` entries."""
+        with self._lock:
+            sent = list(self._sent.items())
+        if viewport is not None:
+            south, west, north, east = viewport
+            sent = [(cid, (lat, lng)) for cid, (lat, lng) in sent
+                    if south <= lat <= north and west <= lng <= east]
+        return [socket_payloads.driver_location(cid, lat, lng) for cid, (lat, lng) in sent]
+
+    def unsubscribe(self, sid):
+        with self._lock:
+            self._viewports.pop(sid, None)
+            self._frames.pop(sid, None)
+            self._joined.pop(sid, None)
+
+    # -- ticks -----------------------------------------------------------------
+
+    def tick(self):
+        """Send one frame per admin client with the drivers that moved."""
+        with self._lock:
+            moved, self._moved = self._moved, {}
+            changed = []
+            for contractor_id, (lat, lng) in moved.items():
+                last = self._sent.get(contractor_id)
+                if last is not None and _haversine(last[0], last[1], lat, lng) * 1000 < self.min_move_m:
+                    continue
+                self._sent[contractor_id] = (lat, lng)
+                changed.append(socket_payloads.driver_location(contractor_id, lat, lng))
+            viewports = dict(self._viewports)
+            self.stats["ticks"] += 1
+            self.stats["changed"] += len(changed)
+            self.stats["skipped_small_moves"] += len(moved) - len(changed)
+
+        if not changed or not viewports:
+            return 0
+
+        from socket_events import socketio
+        frames = 0
+        everything = [sid for sid, viewport in viewports.items() if viewport is None]
+        if everything:
+            # ignore_queue: the other workers send their own clients the same frame
+            socketio.emit("admin:locations", {"locations": changed}, room=ALL_DRIVERS_ROOM, ignore_queue=True)
+            frames += len(everything)
+        sent_to = list(everything)
+        for sid, viewport in viewports.items():
+            if viewport is None:
+                continue
+            south, west, north, east = viewport
+            visible = [p for p in changed
+                       if south <= p["lat"] <= north and west <= p["lng"] <= east]
+            if visible:
+                socketio.emit("admin:locations", {"locations": visible}, room=sid, ignore_queue=True)
+                frames += 1
+                sent_to.append(sid)
+        with self._lock:
+            for sid in sent_to:
+                if sid in self._joined:
+                    self._frames[sid] += 1
+            self.stats["frames"] += frames
+        return frames
+
+    def snapshot(self):
+        """Frames per second per admin client, against the one frame per ping
+        each would have received before (this worker only)."""
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self.stats)
+            clients = []
+            for sid, viewport in self._viewports.items():
+                joined_at, pings_before = self._joined[sid]
+                seconds = max(now - joined_at, 1e-9)
+                frames = self._frames.get(sid, 0)
+                pings = stats.get("pings", 0) - pings_before
+                clients.append({
+                    "sid": sid,
+                    "viewport": list(viewport) if viewport else None,
+                    "frames_per_s": round(frames / seconds, 2),
+                    "frames_per_s_before": round(pings / seconds, 2),
+                    "reduction": round(pings / frames, 1) if frames else None,
+                })
+        return {
+            "tick_seconds": self.tick_seconds,
+            "min_move_m": self.min_move_m,
+            "pings_per_s": round(stats.get("pings", 0) / max(now - self._started_at, 1e-9), 2),
+            "stats": stats,
+            "clients": clients,
+        }
+
+    # -- internals -------------------------------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="live-map", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.tick_seconds)
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Admin live-map tick failed")
+
+
+def parse_viewport(data):
+    """``(south, west, north, east)`` from an ``admin:viewport`` payload, or
+    None for no filter.  Raises ValueError when malformed."""
+    if not data:
+        return None
+    try:
+        south, west, north, east = (float(data[k]) for k in ("south", "west", "north", "east"))
+    except (KeyError, TypeError):
+        raise ValueError("viewport needs south, west, north and east")
+    if south > north:
+        raise ValueError("south must not exceed north")
+    if west > east:
+        # Spans the antimeridian; not a place we operate, so send everything
+        return None
+    return south, west, north, east
+
+
+# Process-wide broadcaster fed by the GPS endpoints.
+live_map = LiveMapBroadcaster()
@@ -0,0 +1,242 @@
+"""
+Write-behind buffer for driver GPS positions.
+
+Drivers report their position every few seconds over the socket
+(``driver:location``) and REST (``PUT /api/drivers/location``).  Writing
+each ping to ``contractors`` costs a row load and a commit just to
+overwrite two floats, so pings land here instead: the latest position per
+contractor is kept in memory and a flush thread writes every position that
+changed since the last flush in one statement,
+
+    WITH v(id, lat, lng) AS (VALUES (...), (...), ...)
+    UPDATE contractors SET current_lat = v.lat, current_lng = v.lng, ...
+    FROM v WHERE contractors.id = v.id
+
+every LOCATION_FLUSH_SECONDS (PostgreSQL, and SQLite >= 3.33; older SQLite
+falls back to one executemany UPDATE in a single transaction).
+
+Reads don't wait for the flush: Contractor rows loaded by the ORM have
+their position replaced by a buffered one that is not written yet, and the
+driver index overlays it when it reloads.  Once a position is flushed the
+buffer forgets it, so a driver whose pings move to another worker is read
+from the database again.  Across workers the database lags a driver's last
+ping by at most one flush interval plus the write.
+
+Each worker flushes its own pings; ``snapshot()`` reports flush lag (age
+of the oldest position in a batch when it was committed) and batch sizes.
+"""
+
+from collections import Counter, deque
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LOCATION_FLUSH_SECONDS = float(os.environ.get("LOCATION_FLUSH_SECONDS", "3"))
+
+# Rows per statement: three bind parameters each, under SQLite's historical
+# 999-parameter limit.
+FLUSH_CHUNK_ROWS = 300
+
+
+class LocationBuffer:
+    """Latest unflushed position per contractor and the thread that writes them."""
+
+    def __init__(self, flush_seconds=LOCATION_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._app = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}          # contractor id -> (lat, lng, first unflushed ping)
+        self._flushing = {}         # the batch being written, still served to reads
+        self._thread = None
+        self.stats = Counter()
+        self._lag_ms = deque(maxlen=500)
+        self._batch_sizes = deque(maxlen=500)
+        self._last_flush_at = None
+
+    def init_app(self, app):
+        """Start flushing for *app* and overlay buffered positions on Contractor loads."""
+        from sqlalchemy import event
+        from models import Contractor
+
+        self._app = app
+        if not event.contains(Contractor, "load", self._on_load):
+            event.listen(Contractor, "load", self._on_load)
+            event.listen(Contractor, "refresh", self._on_refresh)
+            atexit.register(self.flush)
+
+    # -- pings -----------------------------------------------------------------
+
+    def record(self, contractor_id, lat, lng):
+        """Buffer a GPS ping.  Raises ValueError for non-numeric coordinates."""
+        try:
+            lat, lng = float(lat), float(lng)
+        except TypeError:
+            raise ValueError("lat and lng must be numbers")
+        now = time.monotonic()
+        with self._lock:
+            previous = self._pending.get(contractor_id)
+            self._pending[contractor_id] = (lat, lng, previous[2] if previous else now)
+            self.stats["pings"] += 1
+        if self._app is not None:
+            self._ensure_thread()
+        return lat, lng
+
+    def position(self, contractor_id):
+        """``(lat, lng)`` not yet in the database, or None."""
+        with self._lock:
+            entry = self._pending.get(contractor_id) or self._flushing.get(contractor_id)
+        return (entry[0], entry[1]) if entry else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    # -- flushing --------------------------------------------------------------
+
+    def flush(self):
+        """Write every buffered position now; returns the number written."""
+        if self._app is None:
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                batch = self._flushing = self._pending
+                self._pending = {}
+            if not batch:
+                return 0
+
+            t0 = time.monotonic()
+            try:
+                with self._app.app_context():
+                    self._write(batch)
+            except Exception:
+                logger.exception("Failed to flush %d driver positions", len(batch))
+                with self._lock:
+                    # Newer pings that arrived meanwhile win; keep the original
+                    # first-ping time so the lag stays honest.
+                    for contractor_id, (lat, lng, first) in batch.items():
+                        newer = self._pending.get(contractor_id)
+                        self._pending[contractor_id] = (
+                            (newer[0], newer[1], first) if newer else (lat, lng, first)
+                        )
+                    self._flushing = {}
+                    self.stats["flush_errors"] += 1
+                return 0
+
+            done = time.monotonic()
+            oldest = min(first for _lat, _lng, first in batch.values())
+            with self._lock:
+                self._flushing = {}
+                self.stats["flushes"] += 1
+                self.stats["rows_written"] += len(batch)
+                self._lag_ms.append((done - oldest) * 1000)
+                self._batch_sizes.append(len(batch))
+                self._last_flush_at = done
+            logger.debug("Flushed %d driver positions in %.1f ms", len(batch), (done - t0) * 1000)
+            return len(batch)
+
+    def _write(self, batch):
+        from sqlalchemy import DateTime, bindparam, text
+        from models import db, Contractor, utcnow
+
+        rows = [{"id": contractor_id, "lat": lat, "lng": lng}
+                for contractor_id, (lat, lng, _first) in batch.items()]
+        now = utcnow()
+        table = Contractor.__tablename__
+
+        def statement(sql):
+            return text(sql).bindparams(bindparam("now", type_=DateTime))
+
+        if db.engine.dialect.name == "sqlite" and sqlite3.sqlite_version_info < (3, 33, 0):
+            db.session.execute(
+                statement("UPDATE {} SET current_lat = :lat, current_lng = :lng, updated_at = :now "
+                          "WHERE id = :id".format(table)),
+                [dict(row, now=now) for row in rows],
+            )
+        else:
+            for start in range(0, len(rows), FLUSH_CHUNK_ROWS):
+                chunk = rows[start:start + FLUSH_CHUNK_ROWS]
+                values = ", ".join(
+                    "(:id{0}, CAST(:lat{0} AS FLOAT), CAST(:lng{0} AS FLOAT))".format(i)
+                    for i in range(len(chunk))
+                )
+                params = {"now": now}
+                for i, row in enumerate(chunk):
+                    params["id{}".format(i)] = row["id"]
+                    params["lat{}".format(i)] = row["lat"]
+                    params["lng{}".format(i)] = row["lng"]
+                db.session.execute(statement("""
+                    WITH v(id, lat, lng) AS (VALUES {values})
+                    UPDATE {table} SET current_lat = v.lat, current_lng = v.lng, updated_at = :now
+                    FROM v WHERE {table}.id = v.id
+                """.format(values=values, table=table)), params)
+        db.session.commit()
+
+    def snapshot(self):
+        """Flush counters, lag and batch sizes for the admin API (this worker only)."""
+        with self._lock:
+            lag = sorted(self._lag_ms)
+            sizes = sorted(self._batch_sizes)
+            stats = dict(self.stats)
+            pending = len(self._pending)
+            last = self._last_flush_at
+
+        def pct(samples, q):
+            return round(samples[min(int(len(samples) * q), len(samples) - 1)], 1) if samples else None
+
+        return {
+            "flush_seconds": self.flush_seconds,
+            "pending": pending,
+            "stats": stats,
+            "last_flush_ago_s": round(time.monotonic() - last, 1) if last is not None else None,
+            "flush_lag_ms": {
+                "samples": len(lag),
+                "p50": pct(lag, 0.5),
+                "p99": pct(lag, 0.99),
+                "max": pct(lag, 1.0),
+            },
+            "batch_size": {
+                "samples": len(sizes),
+                "mean": round(sum(sizes) / len(sizes), 1) if sizes else None,
+                "max": sizes[-1] if sizes else None,
+            },
+        }
+
+    # -- internals -------------------------------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="location-flush", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Driver position flush failed")
+
+    def _overlay(self, contractor):
+        position = self.position(contractor.id)
+        if position is not None:
+            from sqlalchemy.orm.attributes import set_committed_value
+            set_committed_value(contractor, "current_lat", position[0])
+            set_committed_value(contractor, "current_lng", position[1])
+
+    def _on_load(self, contractor, _context):
+        self._overlay(contractor)
+
+    def _on_refresh(self, contractor, _context, _attrs):
+        self._overlay(contractor)
+
+
+# Process-wide buffer fed by the GPS endpoints.
+location_buffer = LocationBuffer()
@@ -0,0 +1,493 @@
+"""
+Append-only history of driver GPS positions.
+
+``contractors.current_lat/lng`` only holds the latest position; this keeps
+the track for trip replay (disputes, mileage checks).  Pings are appended
+as fixed 16-byte records
+
+    driver  int32    index into the segment's id list
+    t       int32    seconds since the segment's UTC midnight
+    lat     float32  (~0.2 m resolution at our latitudes)
+    lng     float32
+
+to per-day, per-worker segment files under LOCATION_HISTORY_DIR:
+
+    <dir>/2026-10-16/<host>-<pid>.bin    records, in arrival order
+    <dir>/2026-10-16/<host>-<pid>.ids    contractor ids, one per line
+
+Appending is a struct pack into a buffered file -- no index to maintain,
+no database round trip.  Reads memory-map the segments of the days they
+span and filter with numpy.
+
+Days older than LOCATION_HISTORY_RAW_DAYS are compacted: each driver's
+track is simplified with Douglas-Peucker, measuring time-synchronized
+distance so a replay stays within LOCATION_HISTORY_TOLERANCE_M of every
+ping, and the day is archived to the ``location_tracks`` table, one row
+per driver and host, so it outlives the disk it was recorded on.  (Without
+an app -- scripts -- the day is rewritten as one local ``compact.bin``
+sorted by driver, then time.)  A worker compacts when it rolls over to a
+new day, holding a lock file per day so workers sharing the directory
+don't collide.
+
+Reads merge every host's archived tracks with the raw segments on this
+host's disk.  Raw days exist only in LOCATION_HISTORY_DIR: point it at a
+persistent volume shared by the host's workers, or a redeploy loses the
+days not yet compacted.
+"""
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+import atexit
+import fcntl
+import logging
+import os
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+from geofencing import _haversine
+
+logger = logging.getLogger(__name__)
+
+LOCATION_HISTORY_DIR = os.environ.get(
+    "LOCATION_HISTORY_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "location_history"),
+)
+LOCATION_HISTORY_RAW_DAYS = int(os.environ.get("LOCATION_HISTORY_RAW_DAYS", "2"))
+LOCATION_HISTORY_TOLERANCE_M = float(os.environ.get("LOCATION_HISTORY_TOLERANCE_M", "10"))
+
+# Longest a ping sits in this worker's write buffer before other readers
+# can see it.
+SYNC_SECONDS = 1.0
+
+# Raw segments are in arrival order, which is time order up to clock
+# steps; reads binary-search the window widened by this much.
+CLOCK_SLACK_SECONDS = 120
+
+RECORD = np.dtype([("driver", "<i4"), ("t", "<i4"), ("lat", "<f4"), ("lng", "<f4")])
+_PACK = struct.Struct("<iiff").pack
+
+SECONDS_PER_DAY = 86400
+METRES_PER_DEG = 111195.0
+COMPACT = "compact"
+
+
+def _day_name(day):
+    return datetime.fromtimestamp(day * SECONDS_PER_DAY, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _day_of(name):
+    try:
+        stamp = datetime.strptime(name, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+    return int(stamp) // SECONDS_PER_DAY
+
+
+def epoch_seconds(dt):
+    """POSIX seconds for a datetime; naive values are taken as UTC."""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def douglas_peucker(t, lat, lng, tolerance_m):
+    """Boolean mask of the points Douglas-Peucker keeps at *tolerance_m*.
+
+    Distances are synchronized: a point is compared with where the
+    simplified track puts the driver *at that point's time*, not with the
+    nearest spot on the line.  Replaying the kept points by time is then
+    within the tolerance of every recorded ping, stops included.
+    """
+    n = len(t)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    # Local equirectangular metres are plenty for a city-scale track.
+    t = np.asarray(t, dtype=np.float64)
+    y = np.asarray(lat, dtype=np.float64) * METRES_PER_DEG
+    x = np.asarray(lng, dtype=np.float64) * METRES_PER_DEG * np.cos(np.radians(np.mean(lat)))
+    stack = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j <= i + 1:
+            continue
+        span = t[j] - t[i]
+        ratio = (t[i + 1:j] - t[i]) / span if span > 0 else np.zeros(j - i - 1)
+        dist = np.hypot(x[i] + ratio * (x[j] - x[i]) - x[i + 1:j],
+                        y[i] + ratio * (y[j] - y[i]) - y[i + 1:j])
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance_m:
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return keep
+
+
+def track_distance_km(points):
+    """Length of a ``[(t, lat, lng), ...]`` track."""
+    return sum(_haversine(a[1], a[2], b[1], b[2]) for a, b in zip(points, points[1:]))
+
+
+class LocationHistory:
+    """Day segments of GPS pings written by this worker, and reads over all of them."""
+
+    def __init__(self, root=LOCATION_HISTORY_DIR, raw_days=LOCATION_HISTORY_RAW_DAYS,
+                 tolerance_m=LOCATION_HISTORY_TOLERANCE_M):
+        self.root = root
+        self.raw_days = max(raw_days, 1)   # never compact a day still being written
+        self.tolerance_m = tolerance_m
+        self.host = socket.gethostname()
+        self.worker = "{}-{}".format(self.host, os.getpid())
+        self._app = None
+        self._lock = threading.Lock()
+        self._day = None
+        self._bin = None
+        self._ids_file = None
+        self._ids = {}              # contractor id -> index in today's segment
+        self._synced_at = 0.0
+        atexit.register(self.close)
+
+    def init_app(self, app):
+        """Archive compacted days to *app*'s database (and read them from it)."""
+        self._app = app
+        if os.environ.get("FLASK_ENV") == "production" and "LOCATION_HISTORY_DIR" not in os.environ:
+            logger.warning("LOCATION_HISTORY_DIR is not set: driver GPS history not yet compacted "
+                           "is kept in the app directory and lost on redeploy")
+
+    # -- writes ----------------------------------------------------------------
+
+    def append(self, contractor_id, lat, lng, when=None):
+        """Record one ping (*when* in POSIX seconds, default now)."""
+        when = time.time() if when is None else when
+        day = int(when // SECONDS_PER_DAY)
+        with self._lock:
+            if day != self._day:
+                self._roll(day)
+            index = self._ids.get(contractor_id)
+            if index is None:
+                index = self._ids[contractor_id] = len(self._ids)
+                # The id is on disk before any record that refers to it
+                self._ids_file.write(contractor_id + "\n")
+                self._ids_file.flush()
+            self._bin.write(_PACK(index, int(when) - day * SECONDS_PER_DAY, float(lat), float(lng)))
+            now = time.monotonic()
+            if now - self._synced_at >= SYNC_SECONDS:
+                self._bin.flush()
+                self._synced_at = now
+
+    def close(self):
+        with self._lock:
+            self._close_segment()
+
+    def _roll(self, day):
+        self._close_segment()
+        folder = os.path.join(self.root, _day_name(day))
+        os.makedirs(folder, exist_ok=True)
+        base = os.path.join(folder, self.worker)
+        self._ids = {}
+        if os.path.exists(base + ".ids"):
+            # Same pid as an earlier process (container restart): keep appending
+            with open(base + ".ids") as f:
+                self._ids = {line.rstrip("\n"): i for i, line in enumerate(f)}
+            self._truncate_partial(base + ".bin")
+        self._ids_file = open(base + ".ids", "a")
+        self._bin = open(base + ".bin", "ab")
+        self._day = day
+        threading.Thread(target=self.compact_old_days, name="location-history-compact",
+                         daemon=True).start()
+
+    def _close_segment(self):
+        for f in (self._bin, self._ids_file):
+            if f is not None:
+                f.close()
+        self._bin = self._ids_file = None
+        self._day = None
+
+    @staticmethod
+    def _truncate_partial(path):
+        if os.path.exists(path):
+            size = os.path.getsize(path)
+            if size % RECORD.itemsize:
+                with open(path, "r+b") as f:
+                    f.truncate(size - size % RECORD.itemsize)
+
+    # -- reads -----------------------------------------------------------------
+
+    def track(self, contractor_id, start, end):
+        """Positions of *contractor_id* between two POSIX times, as
+        ``[(t, lat, lng), ...]`` in time order."""
+        with self._lock:
+            if self._bin is not None:
+                self._bin.flush()
+                self._synced_at = time.monotonic()
+
+        parts = []
+        for day in range(int(start // SECONDS_PER_DAY), int(end // SECONDS_PER_DAY) + 1):
+            base = day * SECONDS_PER_DAY
+            lo, hi = start - base, end - base
+            for records in self._day_records(day, contractor_id, lo, hi):
+                mask = (records["t"] >= lo) & (records["t"] <= hi)
+                if mask.any():
+                    hits = records[mask]
+                    parts.append(np.column_stack([
+                        hits["t"].astype(np.float64) + base,
+                        hits["lat"].astype(np.float64),
+                        hits["lng"].astype(np.float64),
+                    ]))
+        if not parts:
+            return []
+        points = np.concatenate(parts)
+        points = points[np.argsort(points[:, 0], kind="stable")]
+        return [(int(t), round(lat, 6), round(lng, 6)) for t, lat, lng in points.tolist()]
+
+    def day_tracks(self, day):
+        """Every driver's positions on *day* (days since the epoch), as
+        ``(contractor_id, t, lat, lng)`` arrays in time order."""
+        with self._lock:
+            if self._bin is not None and self._day == day:
+                self._bin.flush()
+                self._synced_at = time.monotonic()
+
+        tracks = {}
+        archived = self._archived(day)
+        for _source, contractor_id, rows in archived:
+            tracks.setdefault(contractor_id, []).append(rows)
+        folder = os.path.join(self.root, _day_name(day))
+        names = _local_segments(folder, {source for source, _cid, _rows in archived})
+        for name in names:
+            base = os.path.join(folder, name)
+            records = _map(base)
+            if records is None:
+                continue
+            records = np.array(records)
+            with open(base + ".ids") as f:
+                segment_ids = [line.rstrip("\n") for line in f]
+            records = records[np.argsort(records["driver"], kind="stable")]
+            starts = np.flatnonzero(np.diff(records["driver"], prepend=-1))
+            for rows in np.split(records, starts[1:]):
+                index = int(rows["driver"][0])
+                if index < len(segment_ids):
+                    tracks.setdefault(segment_ids[index], []).append(rows)
+        base = day * SECONDS_PER_DAY
+        for contractor_id, parts in tracks.items():
+            rows = np.concatenate(parts)
+            rows = rows[np.argsort(rows["t"], kind="stable")]
+            yield (contractor_id, rows["t"].astype(np.float64) + base,
+                   rows["lat"].astype(np.float64), rows["lng"].astype(np.float64))
+
+    def _day_records(self, day, contractor_id, lo, hi):
+        """This driver's records in each segment of *day*, roughly limited to
+        seconds *lo*..*hi* of the day (callers filter exactly)."""
+        archived = self._archived(day, contractor_id)
+        for _source, _cid, rows in archived:
+            yield rows
+        folder = os.path.join(self.root, _day_name(day))
+        for name in _local_segments(folder, {source for source, _cid, _rows in archived}):
+            records = _map(os.path.join(folder, name))
+            if records is None:
+                continue
+            index = _index_of(os.path.join(folder, name + ".ids"), contractor_id)
+            if index is None:
+                continue
+            if name == COMPACT:
+                # Sorted by driver: slice instead of scanning
+                first = np.searchsorted(records["driver"], index, side="left")
+                last = np.searchsorted(records["driver"], index, side="right")
+                yield records[first:last]
+            else:
+                # bisect probes the strided view; np.searchsorted would copy it
+                times = records["t"]
+                first = bisect_left(times, lo - CLOCK_SLACK_SECONDS)
+                last = bisect_right(times, hi + CLOCK_SLACK_SECONDS)
+                window = records[first:last]
+                yield window[window["driver"] == index]
+
+    # -- compaction ------------------------------------------------------------
+
+    def compact_old_days(self, today=None):
+        """Simplify every raw day older than the retention window; returns
+        ``{day: (records_before, records_after)}``."""
+        today = int(time.time() // SECONDS_PER_DAY) if today is None else today
+        done = {}
+        if not os.path.isdir(self.root):
+            return done
+        for name in sorted(os.listdir(self.root)):
+            day = _day_of(name)
+            if day is None or day > today - self.raw_days:
+                continue
+            try:
+                result = self.compact_day(day)
+            except Exception:
+                logger.exception("Failed to compact location history for %s", name)
+                continue
+            if result is not None:
+                done[name] = result
+        return done
+
+    def compact_day(self, day):
+        """Rewrite one day as a Douglas-Peucker-simplified compact segment.
+        Returns ``(records_before, records_after)``, or None if there was
+        nothing to do or another worker holds the day."""
+        folder = os.path.join(self.root, _day_name(day))
+        with open(os.path.join(folder, ".lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return None
+            names = _segments(folder)
+            raw = [name for name in names if name != COMPACT]
+            # What was compacted before is merged in, not overwritten
+            previous = [COMPACT] if COMPACT in names else []
+            if not raw and (self._app is None or not previous):
+                return None
+
+            ids, tracks = [], {}
+            if self._app is not None:
+                for source, contractor_id, rows in self._archived(day):
+                    if source == self.host:
+                        tracks.setdefault(contractor_id, []).append(rows)
+            for name in raw + previous:
+                base = os.path.join(folder, name)
+                records = _map(base)
+                with open(base + ".ids") as f:
+                    segment_ids = [line.rstrip("\n") for line in f]
+                if records is None:
+                    continue
+                for index, contractor_id in enumerate(segment_ids):
+                    rows = records[records["driver"] == index]
+                    if len(rows):
+                        tracks.setdefault(contractor_id, []).append(np.array(rows))
+            before = sum(len(part) for parts in tracks.values() for part in parts)
+
+            out = []
+            for contractor_id in sorted(tracks):
+                rows = np.concatenate(tracks[contractor_id])
+                rows = rows[np.argsort(rows["t"], kind="stable")]
+                rows = rows[douglas_peucker(rows["t"], rows["lat"], rows["lng"], self.tolerance_m)]
+                rows["driver"] = len(ids)
+                ids.append(contractor_id)
+                out.append(rows)
+            merged = np.concatenate(out) if out else np.zeros(0, dtype=RECORD)
+
+            # Until the raw segments are removed they are the source of truth,
+            # so a run interrupted after this point is simply redone.
+            if self._app is not None:
+                self._archive(day, dict(zip(ids, out)))
+                obsolete = raw + previous
+            else:
+                self._write_compact(folder, ids, merged)
+                obsolete = raw
+            for name in obsolete:
+                for ext in (".bin", ".ids"):
+                    try:
+                        os.remove(os.path.join(folder, name + ext))
+                    except FileNotFoundError:
+                        pass
+            logger.info("Compacted location history for %s: %d -> %d points",
+                        _day_name(day), before, len(merged))
+            return before, len(merged)
+
+    @staticmethod
+    def _write_compact(folder, ids, merged):
+        target = os.path.join(folder, COMPACT)
+        with open(target + ".ids.tmp", "w") as f:
+            f.writelines(contractor_id + "\n" for contractor_id in ids)
+            f.flush()
+            os.fsync(f.fileno())
+        with open(target + ".bin.tmp", "wb") as f:
+            f.write(merged.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(target + ".ids.tmp", target + ".ids")
+        os.replace(target + ".bin.tmp", target + ".bin")
+
+    # -- archive ---------------------------------------------------------------
+
+    def _archive(self, day, tracks):
+        """Store *tracks* ({contractor id: rows}) as this host's archive of
+        *day*, replacing what it archived before."""
+        from models import db, LocationTrack
+
+        name = _day_name(day)
+        with self._app.app_context():
+            try:
+                LocationTrack.query.filter_by(day=name, source=self.host).delete()
+                db.session.add_all([
+                    LocationTrack(day=name, contractor_id=contractor_id, source=self.host,
+                                  points=rows.tobytes(), point_count=len(rows))
+                    for contractor_id, rows in tracks.items()
+                ])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+    def _archived(self, day, contractor_id=None):
+        """Archived ``(source, contractor_id, rows)`` of *day*, for one driver
+        or all of them; empty without an app."""
+        if self._app is None:
+            return []
+        from models import db, LocationTrack
+
+        with self._app.app_context():
+            try:
+                query = LocationTrack.query.filter_by(day=_day_name(day))
+                if contractor_id is not None:
+                    query = query.filter_by(contractor_id=contractor_id)
+                return [(track.source, track.contractor_id, np.frombuffer(track.points, dtype=RECORD))
+                        for track in query]
+            finally:
+                db.session.remove()
+
+
+def _segments(folder):
+    return sorted(name[:-4] for name in os.listdir(folder)
+                  if name.endswith(".bin") and os.path.exists(os.path.join(folder, name[:-4] + ".ids")))
+
+
+def _local_segments(folder, archived_sources=()):
+    """Segments of *folder* to read: the compact one if the day was
+    compacted locally, else the raw ones -- except those of hosts whose
+    archive of the day already holds them (left until compaction removes
+    them)."""
+    if not os.path.isdir(folder):
+        return []
+    names = _segments(folder)
+    if COMPACT in names:
+        return [COMPACT]
+    return [name for name in names if name.rsplit("-", 1)[0] not in archived_sources]
+
+
+def _map(base):
+    """Memory-map a segment's whole records (a torn tail write is ignored)."""
+    path = base + ".bin"
+    try:
+        count = os.path.getsize(path) // RECORD.itemsize
+    except OSError:
+        return None
+    if count == 0:
+        return None
+    return np.memmap(path, dtype=RECORD, mode="r", shape=(count,))
+
+
+def _index_of(path, contractor_id):
+    try:
+        with open(path) as f:
+            for index, line in enumerate(f):
+                if line.rstrip("\n") == contractor_id:
+                    return index
+    except OSError:
+        pass
+    return None
+
+
+# Process-wide history fed by the GPS endpoints.
+location_history = LocationHistory()
@@ -0,0 +1,235 @@
+"""
+Server-directed GPS update rate for driver apps.
+
+Driver apps used to stream a position on every GPS fix whether or not
+anyone was looking.  The server now decides how often it wants each
+driver's position:
+
+    watched   en route to a job that a customer is tracking
+              (Socket.IO job room or SSE stream)        LOCATION_INTERVAL_WATCHED_SECONDS
+    on_job    any other active job                      LOCATION_INTERVAL_ON_JOB_SECONDS
+    idle      online, no active job (dispatch only
+              needs a rough position)                   LOCATION_INTERVAL_IDLE_SECONDS
+    off       offline or not approved                   no updates
+
+and tells the app with
+
+    driver:location-rate   { mode, interval_seconds }   (0 = stop sending)
+
+on its ``driver:<id>`` room whenever the mode changes, and in the
+``PUT /api/drivers/availability`` and ``PUT /api/drivers/location``
+responses.  Pings that arrive sooner than the interval allows (with
+LOCATION_RATE_SLACK for timer jitter) are dropped before they reach the
+location buffer, history, live map or job room.  REST and socket pings
+are budgeted separately, since the app sends each fix over both and only
+the socket one reaches the customer.
+
+Watchers are socket sids in a job room and SSE streams on this worker;
+whether a job is watched at all is shared with every worker through the
+backplane, since the customer and the driver may be on different ones.
+
+Modes are cached per driver, recomputed when a customer starts or stops
+watching, a job changes status or the driver toggles availability, and at
+most every LOCATION_RATE_RECHECK_SECONDS on a ping as a backstop for
+changes made by other workers.
+"""
+
+from collections import Counter
+import logging
+import os
+import threading
+import time
+
+from socket_backplane import backplane
+
+logger = logging.getLogger(__name__)
+
+LOCATION_INTERVAL_WATCHED_SECONDS = float(os.environ.get("LOCATION_INTERVAL_WATCHED_SECONDS", "3"))
+LOCATION_INTERVAL_ON_JOB_SECONDS = float(os.environ.get("LOCATION_INTERVAL_ON_JOB_SECONDS", "15"))
+LOCATION_INTERVAL_IDLE_SECONDS = float(os.environ.get("LOCATION_INTERVAL_IDLE_SECONDS", "30"))
+LOCATION_RATE_SLACK = float(os.environ.get("LOCATION_RATE_SLACK", "0.8"))
+LOCATION_RATE_RECHECK_SECONDS = float(os.environ.get("LOCATION_RATE_RECHECK_SECONDS", "10"))
+
+# Job statuses in which a watching customer gets the fast rate.
+WATCHED_JOB_STATUSES = ("en_route",)
+
+MODES = ("watched", "on_job", "idle", "off")
+
+
+class LocationRatePolicy:
+    """Desired GPS interval per driver, and the pings that exceed it."""
+
+    def __init__(self):
+        self.intervals = {
+            "watched": LOCATION_INTERVAL_WATCHED_SECONDS,
+            "on_job": LOCATION_INTERVAL_ON_JOB_SECONDS,
+            "idle": LOCATION_INTERVAL_IDLE_SECONDS,
+            "off": 0,
+        }
+        # Off for replays that compress time (pings would look over-rate)
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._modes = {}            # contractor id -> (mode, monotonic time decided, job ids)
+        self._last = {}             # (contractor id, channel) -> monotonic time of last accepted ping
+        self._watchers = {}         # job id -> set of local watcher ids (sids, SSE streams)
+        self._watching = {}         # watcher id -> set of job ids
+        self._watched_by = {}       # job id -> set of worker host ids with watchers
+        self.stats = Counter()
+        backplane.subscribe("location_rate.watched", self._on_watched)
+
+    # -- pings -----------------------------------------------------------------
+
+    def allow(self, contractor_id, channel="socket"):
+        """Whether to accept a ping from *contractor_id* over *channel*
+        ("socket" or "rest") now."""
+        if not self.enabled:
+            return True
+        mode = self.mode(contractor_id)
+        interval = self.intervals[mode]
+        now = time.monotonic()
+        key = (contractor_id, channel)
+        with self._lock:
+            if mode == "off":
+                self.stats["dropped_off"] += 1
+                return False
+            last = self._last.get(key)
+            if last is not None and now - last < interval * LOCATION_RATE_SLACK:
+                self.stats["dropped_over_rate"] += 1
+                return False
+            self._last[key] = now
+            self.stats["accepted"] += 1
+            self.stats["accepted_" + mode] += 1
+            return True
+
+    def mode(self, contractor_id):
+        """Current mode, recomputed when the cached one is stale."""
+        cached = self._modes.get(contractor_id)
+        if cached is not None and time.monotonic() - cached[1] < LOCATION_RATE_RECHECK_SECONDS:
+            return cached[0]
+        return self.refresh(contractor_id)
+
+    def interval(self, contractor_id):
+        """Desired seconds between pings (0 = none)."""
+        return self.intervals[self.mode(contractor_id)]
+
+    def directive(self, contractor_id):
+        """The ``driver:location-rate`` payload for *contractor_id*."""
+        mode = self.mode(contractor_id)
+        return {"mode": mode, "interval_seconds": self.intervals[mode]}
+
+    # -- changes ---------------------------------------------------------------
+
+    def refresh(self, contractor_id, notify=True):
+        """Recompute the driver's mode; tell the app if it changed."""
+        mode, job_ids = self._compute(contractor_id)
+        with self._lock:
+            previous = self._modes.get(contractor_id)
+            self._modes[contractor_id] = (mode, time.monotonic(), job_ids)
+            if mode == "off":
+                self._last.pop((contractor_id, "socket"), None)
+                self._last.pop((contractor_id, "rest"), None)
+        if notify and previous is not None and previous[0] != mode:
+            self.stats["mode_changes"] += 1
+            self._notify(contractor_id, mode)
+        return mode
+
+    def job_changed(self, job_id):
+        """A job's status, driver or audience changed."""
+        from driver_index import driver_index
+
+        drivers = {driver_index.driver_of(job_id)}
+        with self._lock:
+            drivers.update(cid for cid, (_m, _t, jobs) in self._modes.items() if job_id in jobs)
+        drivers.discard(None)
+        for contractor_id in drivers:
+            self.refresh(contractor_id)
+
+    def watch(self, sid, job_id):
+        """Watcher *sid* (a socket in the job room, or an SSE stream) started
+        following *job_id*."""
+        with self._lock:
+            first = not self._watchers.get(job_id)
+            self._watchers.setdefault(job_id, set()).add(sid)
+            self._watching.setdefault(sid, set()).add(job_id)
+        if first:
+            backplane.publish("location_rate.watched", [job_id, backplane.host_id, True])
+
+    def unwatch(self, sid, job_id=None):
+        """Watcher *sid* stopped following *job_id* (or every job, on disconnect)."""
+        with self._lock:
+            jobs = self._watching.get(sid, set())
+            left = [job_id] if job_id is not None else list(jobs)
+            emptied = []
+            for jid in left:
+                jobs.discard(jid)
+                sids = self._watchers.get(jid)
+                if sids is not None and sid in sids:
+                    sids.discard(sid)
+                    if not sids:
+                        del self._watchers[jid]
+                        emptied.append(jid)
+            if not jobs:
+                self._watching.pop(sid, None)
+        for jid in emptied:
+            backplane.publish("location_rate.watched", [jid, backplane.host_id, False])
+
+    def watched(self, job_id):
+        """Whether a customer on any worker is following *job_id*."""
+        return bool(self._watched_by.get(job_id))
+
+    def _on_watched(self, data):
+        job_id, host_id, watched = data
+        with self._lock:
+            hosts = self._watched_by.setdefault(job_id, set())
+            if watched:
+                hosts.add(host_id)
+            else:
+                hosts.discard(host_id)
+                if not hosts:
+                    del self._watched_by[job_id]
+        self.job_changed(job_id)
+
+    def snapshot(self):
+        """Drivers per mode and ping counts (this worker only)."""
+        with self._lock:
+            modes = Counter(mode for mode, _t, _jobs in self._modes.values())
+            stats = dict(self.stats)
+            watched_jobs = len(self._watched_by)
+        received = stats.get("accepted", 0) + stats.get("dropped_over_rate", 0) + stats.get("dropped_off", 0)
+        return {
+            "intervals": dict(self.intervals),
+            "drivers": {mode: modes.get(mode, 0) for mode in MODES},
+            "watched_jobs": watched_jobs,
+            "stats": stats,
+            "dropped_fraction": round(1 - stats.get("accepted", 0) / received, 3) if received else None,
+        }
+
+    # -- internals -------------------------------------------------------------
+
+    def _compute(self, contractor_id):
+        from driver_index import driver_index
+
+        if not driver_index.is_indexed(contractor_id):
+            return "off", ()
+        jobs = driver_index.active_jobs(contractor_id)
+        if not jobs:
+            return "idle", ()
+        job_ids = tuple(job_id for job_id, _status in jobs)
+        for job_id, status in jobs:
+            if status in WATCHED_JOB_STATUSES and self._watched_by.get(job_id):
+                return "watched", job_ids
+        return "on_job", job_ids
+
+    def _notify(self, contractor_id, mode):
+        try:
+            from socket_events import socketio
+            socketio.emit("driver:location-rate", {
+                "mode": mode,
+                "interval_seconds": self.intervals[mode],
+            }, room=f"driver:{contractor_id}")
+        except Exception:
+            logger.exception("Failed to send location rate to driver %s", contractor_id)
+
+
+# Process-wide policy consulted by the GPS endpoints.
+location_rate = LocationRatePolicy()
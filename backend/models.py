@@ -11,7 +11,7 @@ from datetime import datetime, timezone
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import (
     Column, String, Float, Boolean, Integer, Text, DateTime, ForeignKey, JSON,
-    CheckConstraint, Index
+    CheckConstraint, Index, LargeBinary
 )
 from sqlalchemy.orm import relationship
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -869,3 +869,18 @@ class OperatorApplication(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
+
+
+# ---------------------------------------------------------------------------
+# LocationTrack (one driver's compacted GPS track for one day, see
+# location_history.py)
+# ---------------------------------------------------------------------------
+class LocationTrack(db.Model):
+    __tablename__ = "location_tracks"
+
+    day = Column(String(10), primary_key=True)  # UTC day, "2026-10-16"
+    contractor_id = Column(String(36), primary_key=True)
+    source = Column(String(255), primary_key=True)  # host that recorded the pings
+    points = Column(LargeBinary, nullable=False)  # location_history.RECORD rows
+    point_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=utcnow)
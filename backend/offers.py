@@ -0,0 +1,230 @@
+"""
+Timed job offers.
+
+Dispatch no longer hands a job to a driver for good: the job is *offered*
+to the best candidate (status "assigned", as before) for OFFER_TTL_SECONDS.
+If the driver accepts, the offer closes; if they decline or let it lapse,
+the job is unassigned and offered to the next candidate, skipping drivers
+who already passed on it, up to OFFER_MAX_ATTEMPTS drivers.  After that the
+job stays confirmed for an admin to assign.
+
+Expiries live in a heap served by one timer thread per worker -- nothing
+polls the database.  When an offer lapses the job row is re-checked, so an
+accept or cancel handled by another worker simply turns the expiry into a
+no-op.
+
+Socket.IO events (room ``driver:<id>``):
+    job:offer           { job_id, address, total_price, distance_km,
+                          expires_at, expires_in }
+    job:offer-expired   { job_id }
+"""
+
+from collections import Counter, deque
+from datetime import datetime, timezone, timedelta
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+OFFER_TTL_SECONDS = float(os.environ.get("OFFER_TTL_SECONDS", "30"))
+OFFER_MAX_ATTEMPTS = int(os.environ.get("OFFER_MAX_ATTEMPTS", "5"))
+
+
+class OfferManager:
+    """Open offers, their expiry heap and the timer thread that serves it."""
+
+    def __init__(self, ttl_seconds=OFFER_TTL_SECONDS, max_attempts=OFFER_MAX_ATTEMPTS):
+        self.ttl_seconds = ttl_seconds
+        self.max_attempts = max_attempts
+        self._app = None
+        self._cond = threading.Condition()
+        self._heap = []             # (deadline, seq, job_id, driver_id)
+        self._seq = itertools.count()
+        self._open = {}             # job id -> (driver id, deadline, opened_at)
+        self._tried = {}            # job id -> driver ids that declined or lapsed
+        self._given_up = set()      # job ids left for manual assignment
+        self._thread = None
+        self.stats = Counter()
+        self._accept_ms = deque(maxlen=500)
+
+    def init_app(self, app):
+        """Enable expiries; without an app, offers never lapse."""
+        self._app = app
+
+    # -- offer lifecycle -------------------------------------------------------
+
+    def open(self, job, contractor, distance_km=None):
+        """Start the clock on *job* being offered to *contractor* and tell
+        the driver.  The assignment itself is written by the caller."""
+        now = time.monotonic()
+        deadline = now + self.ttl_seconds
+        with self._cond:
+            self._open[job.id] = (contractor.id, deadline, now)
+            if self._app is not None:
+                heapq.heappush(self._heap, (deadline, next(self._seq), job.id, contractor.id))
+                self._ensure_thread()
+                self._cond.notify()
+            self.stats["offered"] += 1
+
+        expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+        from socket_events import socketio
+        socketio.emit("job:offer", {
+            "job_id": job.id,
+            "address": job.address,
+            "total_price": job.total_price,
+            "distance_km": round(distance_km, 2) if distance_km is not None else None,
+            "expires_at": expires_at.isoformat(),
+            "expires_in": self.ttl_seconds,
+        }, room="driver:{}".format(contractor.id))
+
+    def accepted(self, job_id, driver_id):
+        """The driver took the job: close its offer and record time-to-accept."""
+        with self._cond:
+            offer = self._open.get(job_id)
+            self._tried.pop(job_id, None)
+            self._given_up.discard(job_id)
+            if offer is None or offer[0] != driver_id:
+                return
+            del self._open[job_id]
+            self.stats["accepted"] += 1
+            self._accept_ms.append((time.monotonic() - offer[2]) * 1000)
+
+    def declined(self, job_id, driver_id):
+        """The driver passed: don't offer them this job again."""
+        with self._cond:
+            offer = self._open.get(job_id)
+            if offer is not None and offer[0] == driver_id:
+                del self._open[job_id]
+            self._tried.setdefault(job_id, set()).add(driver_id)
+            self.stats["declined"] += 1
+
+    def tried(self, job_id):
+        """Drivers who already declined or let an offer for *job_id* lapse."""
+        with self._cond:
+            return set(self._tried.get(job_id, ()))
+
+    def exhausted(self, job_id):
+        """True once the job has been offered to OFFER_MAX_ATTEMPTS drivers."""
+        with self._cond:
+            return len(self._tried.get(job_id, ())) >= self.max_attempts
+
+    def give_up(self, job_id):
+        """Stop offering *job_id* automatically (until it is assigned by
+        hand or accepted)."""
+        self.forget(job_id)
+        with self._cond:
+            self._given_up.add(job_id)
+        self.stats["exhausted"] += 1
+        logger.warning("Job %s was passed on by %d drivers; leaving it for manual assignment",
+                       job_id, self.max_attempts)
+
+    def given_up(self, job_id=None):
+        """Whether *job_id* was left for manual assignment; without a job
+        id, every such job."""
+        with self._cond:
+            if job_id is None:
+                return set(self._given_up)
+            return job_id in self._given_up
+
+    def forget(self, job_id):
+        with self._cond:
+            self._open.pop(job_id, None)
+            self._tried.pop(job_id, None)
+            self._given_up.discard(job_id)
+
+    def snapshot(self):
+        """Counters, time-to-accept and open offers for the admin API."""
+        now = time.monotonic()
+        with self._cond:
+            samples = sorted(self._accept_ms)
+            open_offers = [
+                {"job_id": job_id, "driver_id": driver_id,
+                 "expires_in": round(max(deadline - now, 0.0), 1)}
+                for job_id, (driver_id, deadline, _opened) in self._open.items()
+            ]
+            stats = dict(self.stats)
+            given_up = sorted(self._given_up)
+        return {
+            "ttl_seconds": self.ttl_seconds,
+            "max_attempts": self.max_attempts,
+            "stats": stats,
+            "time_to_accept_ms": {
+                "samples": len(samples),
+                "mean": round(sum(samples) / len(samples), 1) if samples else None,
+                "p50": round(samples[len(samples) // 2], 1) if samples else None,
+            },
+            "open": open_offers,
+            "given_up": given_up,
+        }
+
+    # -- timer -----------------------------------------------------------------
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="offer-timer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    deadline, _seq, job_id, driver_id = self._heap[0]
+                    wait = deadline - time.monotonic()
+                    if wait > 0:
+                        self._cond.wait(wait)
+                        continue
+                    heapq.heappop(self._heap)
+                    offer = self._open.get(job_id)
+                    # Skip offers that were accepted, declined or re-issued
+                    if offer is None or offer[0] != driver_id or offer[1] != deadline:
+                        continue
+                    del self._open[job_id]
+                    self._tried.setdefault(job_id, set()).add(driver_id)
+                    break
+            try:
+                self._expire(job_id, driver_id)
+            except Exception:
+                logger.exception("Failed to expire offer of job %s to %s", job_id, driver_id)
+
+    def _expire(self, job_id, driver_id):
+        with self._app.app_context():
+            from models import db, Job
+            from dispatch import claim_job
+            from driver_index import driver_index
+            from socket_events import socketio, broadcast_job_status
+
+            try:
+                # One conditional UPDATE: an accept that lands first wins
+                if not claim_job(job_id, ("assigned",), {"driver_id": None, "status": "confirmed"},
+                                 driver_id=driver_id):
+                    # Accepted, cancelled or reassigned elsewhere
+                    db.session.rollback()
+                    self.forget(job_id)
+                    return
+                db.session.commit()
+                job = db.session.get(Job, job_id)
+                driver_index.note_job(job)
+                self.stats["expired"] += 1
+                socketio.emit("job:offer-expired", {"job_id": job_id},
+                              room="driver:{}".format(driver_id))
+
+                from routes.payments import _auto_assign_driver
+                _auto_assign_driver(job)
+                db.session.commit()
+                broadcast_job_status(job.id, job.status, job=job)
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                db.session.remove()
+
+
+# Process-wide offer manager used by the dispatch paths.
+offer_manager = OfferManager()
@@ -0,0 +1,516 @@
+"""
+Pricing what-if simulator.
+
+Replays historical jobs through the v2 pricing engine under the live
+pricing config and a candidate config (the same keys accepted by
+``PUT /api/admin/pricing/config``) and reports the revenue delta per job,
+per category, per day and in total.
+
+Jobs are streamed from the database in chunks as plain column tuples -- no
+ORM objects are built -- and each chunk is flattened into NumPy arrays.
+Everything that does not depend on the config under test (unit prices,
+item totals, quantities, zone surge, booking lead time) is computed once
+per job; the config-dependent steps (volume discount, time surge, service
+fee, minimum price) are then applied to whole arrays for both configs.
+
+Replay rules:
+  - Time surge uses the lead time between ``created_at`` (when the job was
+    quoted) and ``scheduled_at``, which is what the customer saw.
+  - Zone surge uses the *current* surge zones at the job's location and
+    scheduled time for both configs, since zones are not part of the
+    config under test.
+  - Revenue is the pre-promo job total, matching ``calculate_estimate``.
+
+Usage (CLI):
+    python pricing_simulator.py '{"minimum_job_price": 99}'
+    python pricing_simulator.py '{"weekend_surge": 0.2}' --days 30
+"""
+
+from datetime import date, timedelta
+import json
+import logging
+import time
+
+import numpy as np
+from sqlalchemy import select, type_coerce, Text
+
+from models import db, Job, utcnow
+from routes.booking import (
+    get_pricing_snapshot,
+    _make_snapshot,
+    _get_item_price,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DAYS = 90
+MAX_DAYS = 365
+CHUNK_SIZE = 20000
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+_NAT = np.iinfo(np.int64).min
+
+# Job statuses that never turned into revenue and are left out of the replay.
+EXCLUDED_STATUSES = ("cancelled",)
+
+
+# ---------------------------------------------------------------------------
+# Config helpers
+# ---------------------------------------------------------------------------
+
+def candidate_snapshot(overrides, live=None):
+    """Return a pricing snapshot with *overrides* layered on the live config.
+
+    Raises ``ValueError`` if an override cannot be compiled (for example a
+    malformed ``volume_discount_tiers`` list).
+    """
+    live = live or get_pricing_snapshot()
+    config = dict(live.config)
+    config.update(overrides)
+    if "volume_discount_tiers" in overrides:
+        config["volume_discount_tiers"] = _coerce_tiers(overrides["volume_discount_tiers"])
+    try:
+        return _make_snapshot(live.generation, dict(live.rules), config, live.surge_index)
+    except (KeyError, TypeError, ValueError) as exc:
+        raise ValueError("Invalid pricing config: {}".format(exc))
+
+
+def _coerce_tiers(raw):
+    """Validate ``volume_discount_tiers`` and convert numeric strings, so a
+    bad tier is a ValueError here rather than a TypeError mid-replay."""
+    if not isinstance(raw, list):
+        raise ValueError("volume_discount_tiers must be a list")
+    tiers = []
+    for i, tier in enumerate(raw):
+        if not isinstance(tier, dict):
+            raise ValueError("volume_discount_tiers[{}] must be an object".format(i))
+        try:
+            min_qty = _tier_number(tier["min_qty"], integer=True)
+            max_qty = tier.get("max_qty")
+            max_qty = None if max_qty is None else _tier_number(max_qty, integer=True)
+            rate = _tier_number(tier["discount_rate"])
+        except KeyError as exc:
+            raise ValueError("volume_discount_tiers[{}] is missing {}".format(i, exc))
+        except (TypeError, ValueError):
+            raise ValueError("volume_discount_tiers[{}]: min_qty and max_qty must be whole numbers "
+                             "and discount_rate a number".format(i))
+        if not 0 <= rate <= 1:
+            raise ValueError("volume_discount_tiers[{}]: discount_rate must be between 0 and 1".format(i))
+        if max_qty is not None and max_qty < min_qty:
+            raise ValueError("volume_discount_tiers[{}]: max_qty is below min_qty".format(i))
+        tiers.append({"min_qty": min_qty, "max_qty": max_qty, "discount_rate": rate})
+    return tiers
+
+
+def _tier_number(value, integer=False):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise TypeError(value)
+    number = float(value)
+    if not np.isfinite(number) or (integer and not number.is_integer()):
+        raise ValueError(value)
+    return int(number) if integer else number
+
+
+def describe_snapshot(snapshot):
+    """The config-dependent pricing parameters, in the admin config shape."""
+    return {
+        "minimum_job_price": snapshot.minimum_job_price,
+        "volume_discount_tiers": [
+            {"min_qty": lo, "max_qty": hi, "discount_rate": rate}
+            for lo, hi, rate in snapshot.volume_discount_tiers
+        ],
+        "same_day_surge": snapshot.same_day_surge,
+        "next_day_surge": snapshot.next_day_surge,
+        "weekend_surge": snapshot.weekend_surge,
+        "service_fee_rate": snapshot.service_fee_rate,
+    }
+
+
+# ---------------------------------------------------------------------------
+# Vectorised pricing
+# ---------------------------------------------------------------------------
+
+def _price_jobs(jobs, snapshot):
+    """Vectorised equivalent of ``_price_cart`` totals for a chunk of jobs."""
+    item_total = jobs["item_total"]
+    quantity = jobs["quantity"]
+
+    # Volume discount -- the first matching tier wins, so apply in reverse.
+    rate = np.zeros_like(item_total)
+    for lo, hi, tier_rate in reversed(snapshot.volume_discount_tiers):
+        match = quantity >= lo
+        if hi is not None:
+            match &= quantity <= hi
+        rate = np.where(match, tier_rate, rate)
+    volume_discount = np.round(item_total * rate, 2)
+    items_subtotal = np.round(item_total - volume_discount, 2)
+
+    # Time surge (additive) on top of the zone multiplier
+    lead = jobs["lead_days"]
+    scheduled = jobs["has_schedule"]
+    time_surge = (
+        np.where(scheduled & (lead <= 0), snapshot.same_day_surge, 0.0)
+        + np.where(scheduled & (lead == 1), snapshot.next_day_surge, 0.0)
+        + np.where(scheduled & jobs["weekend"], snapshot.weekend_surge, 0.0)
+    )
+    surged = np.round(items_subtotal * (jobs["zone_surge"] * (1.0 + time_surge)), 2)
+
+    service_fee = np.round(surged * snapshot.service_fee_rate, 2)
+    return np.maximum(np.round(surged + service_fee, 2), snapshot.minimum_job_price)
+
+
+def _parse_items(raw_items):
+    """Decode a chunk's ``items`` column with one JSON call.
+
+    The column is selected as text so SQLite hands back raw JSON; drivers
+    that decode JSON themselves (psycopg2) return lists, which pass through.
+    """
+    items = list(raw_items)
+    pending = [i for i, value in enumerate(items) if isinstance(value, str)]
+    if not pending:
+        return items
+    try:
+        decoded = json.loads("[" + ",".join(items[i] for i in pending) + "]")
+    except ValueError:
+        # A malformed row -- fall back to decoding one at a time
+        decoded = []
+        for i in pending:
+            try:
+                decoded.append(json.loads(items[i]))
+            except ValueError:
+                decoded.append(None)
+    for i, value in zip(pending, decoded):
+        items[i] = value
+    return items
+
+
+def _register_line_key(key, live, catalogue, categories):
+    """Resolve the unit price and category of a new (category, size) key."""
+    category = (key[0] or "other").lower()
+    cat_idx = categories.get(category)
+    if cat_idx is None:
+        cat_idx = categories[category] = len(categories)
+    idx = catalogue["index"][key] = len(catalogue["price"])
+    catalogue["price"].append(_get_item_price(category, key[1], live))
+    catalogue["category"].append(cat_idx)
+    return idx
+
+
+def _points_in_ring(lat, lng, ring):
+    """Vectorised ``geofencing._point_in_polygon`` (same ray-casting rule)."""
+    inside = np.zeros(len(lat), dtype=bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        for (xi, yi), (xj, yj) in zip(ring, ring[-1:] + ring[:-1]):
+            inside ^= ((yi > lng) != (yj > lng)) & (lat < (xj - xi) * (lng - yi) / (yj - yi) + xi)
+    return inside
+
+
+def _hhmm_minutes(value):
+    try:
+        return int(value[:2]) * 60 + int(value[3:5])
+    except (TypeError, ValueError):
+        return None
+
+
+def _zone_surge(surge_index, lat, lng, when):
+    """Highest active zone multiplier per job (vectorised ``multiplier_at``)."""
+    surge = np.ones(len(lat))
+    if not surge_index.zones:
+        return surge
+
+    days = when.astype("datetime64[D]")
+    weekday = (days.astype(np.int64) + 3) % 7        # 1970-01-01 was a Thursday
+    minute = (when - days).astype("timedelta64[m]").astype(np.int64)
+    dated = ~np.isnat(when)
+    # Jobs without coordinates see every zone, as multiplier_at does
+    unplaced = np.isnan(lat) | np.isnan(lng)
+
+    for entry in surge_index.zones.values():
+        if entry.multiplier <= 1.0:
+            continue
+        applies = dated.copy()
+        if entry.days is not None:
+            applies &= np.isin(weekday, sorted(entry.days))
+        start = _hhmm_minutes(entry.start_time)
+        if start is not None:
+            applies &= minute >= start
+        end = _hhmm_minutes(entry.end_time)
+        if end is not None:
+            applies &= minute <= end
+        if entry.polygons:
+            south, west, north, east = entry.bbox
+            candidates = np.flatnonzero(
+                applies & (lat >= south) & (lat <= north) & (lng >= west) & (lng <= east)
+            )
+            inside = np.zeros(len(candidates), dtype=bool)
+            for outer, holes in entry.polygons:
+                hit = _points_in_ring(lat[candidates], lng[candidates], outer)
+                for hole in holes:
+                    hit &= ~_points_in_ring(lat[candidates], lng[candidates], hole)
+                inside |= hit
+            unplaced_hits = applies & unplaced
+            applies = np.zeros(len(lat), dtype=bool)
+            applies[candidates[inside]] = True
+            applies |= unplaced_hits
+        surge = np.where(applies, np.maximum(surge, entry.multiplier), surge)
+    return surge
+
+
+def _to_datetime64(values):
+    """Timestamp column values (or None) -> ``datetime64[m]`` (NaT for None).
+
+    SQLite returns the raw ISO strings (the columns are selected as text),
+    which NumPy parses natively.  Drivers that return naive datetimes go
+    through integer minutes, several times faster than letting NumPy
+    convert datetime objects itself.
+    """
+    if any(isinstance(v, str) for v in values):
+        return np.array(values, dtype="datetime64[m]")
+    return np.array([
+        (v.toordinal() - _EPOCH_ORDINAL) * 1440 + v.hour * 60 + v.minute
+        if v is not None else _NAT
+        for v in values
+    ], dtype=np.int64).view("datetime64[m]")
+
+
+def _flatten_chunk(rows, live, catalogue, categories):
+    """Turn a chunk of ``(items, scheduled_at, created_at, lat, lng,
+    total_price)`` rows into job- and line-level arrays.
+
+    The only per-row Python work is walking the item lines; every other
+    column is converted to an array directly.
+    """
+    n = len(rows)
+    items_col, scheduled_col, created_col, lat_col, lng_col, recorded_col = zip(*rows)
+
+    index = catalogue["index"]
+    line_job = []
+    line_key = []
+    line_quantity = []
+    for i, items in enumerate(_parse_items(items_col)):
+        if not items or not isinstance(items, list):
+            continue
+        for entry in items:
+            try:
+                key = (entry.get("category"), entry.get("size"))
+                qty = int(entry.get("quantity", 1))
+            except AttributeError:
+                if not isinstance(entry, str):
+                    continue
+                key, qty = (entry, None), 1  # Legacy list of item names
+            except (TypeError, ValueError):
+                continue
+            if qty <= 0:
+                continue
+            k = index.get(key)
+            if k is None:
+                k = _register_line_key(key, live, catalogue, categories)
+            line_job.append(i)
+            line_key.append(k)
+            line_quantity.append(qty)
+
+    line_job = np.asarray(line_job, dtype=np.int64)
+    line_key = np.asarray(line_key, dtype=np.int64)
+    line_quantity = np.asarray(line_quantity, dtype=np.int64)
+    line_amount = np.asarray(catalogue["price"])[line_key] * line_quantity if len(line_key) else np.zeros(0)
+
+    scheduled = _to_datetime64(scheduled_col)
+    created = _to_datetime64(created_col)
+    has_schedule = ~np.isnat(scheduled)
+    scheduled_day = scheduled.astype("datetime64[D]")
+    created_day = created.astype("datetime64[D]")
+    lead_days = np.where(
+        has_schedule & ~np.isnat(created),
+        (scheduled_day - created_day).astype(np.int64),
+        0,
+    )
+    weekend = has_schedule & ((scheduled_day.astype(np.int64) + 3) % 7 >= 5)
+    when = np.where(has_schedule, scheduled, created)
+
+    lat = np.array(lat_col, dtype=float)
+    lng = np.array(lng_col, dtype=float)
+
+    jobs = {
+        "item_total": np.bincount(line_job, line_amount, minlength=n),
+        "quantity": np.bincount(line_job, line_quantity, minlength=n).astype(np.int64),
+        "lead_days": lead_days,
+        "has_schedule": has_schedule,
+        "weekend": weekend,
+        "zone_surge": _zone_surge(live.surge_index, lat, lng, when),
+        "day": when.astype("datetime64[D]"),
+        "recorded": np.array(recorded_col, dtype=float),
+    }
+    lines = {
+        "job": line_job,
+        "category": np.asarray(catalogue["category"], dtype=np.int64)[line_key] if len(line_key) else line_key,
+        "amount": line_amount,
+        "quantity": line_quantity,
+    }
+    return jobs, lines
+
+
+def _iter_job_chunks(since, chunk_size):
+    stmt = (
+        select(
+            type_coerce(Job.items, Text),
+            type_coerce(Job.scheduled_at, Text),
+            type_coerce(Job.created_at, Text),
+            Job.lat, Job.lng, Job.total_price,
+        )
+        .where(Job.created_at >= since)
+        .where(Job.status.notin_(EXCLUDED_STATUSES))
+        .execution_options(yield_per=chunk_size)
+    )
+    # Core connection: rows come back as plain tuples, no ORM loading.
+    for partition in db.session.connection().execute(stmt).partitions():
+        yield partition
+
+
+# ---------------------------------------------------------------------------
+# Public entry point
+# ---------------------------------------------------------------------------
+
+def simulate_pricing_change(overrides, days=DEFAULT_DAYS, chunk_size=CHUNK_SIZE):
+    """Replay the last *days* of jobs under the live config and *overrides*.
+
+    Returns a JSON-serialisable dict with ``totals``, ``per_job_delta``
+    (distribution), ``by_category`` and ``by_day``.
+    """
+    started = time.perf_counter()
+    live = get_pricing_snapshot()
+    candidate = candidate_snapshot(overrides, live)
+    since = utcnow() - timedelta(days=days)
+
+    catalogue = {"index": {}, "price": [], "category": []}
+    categories = {}
+
+    deltas = []
+    totals = {"jobs": 0, "recorded": 0.0, "live": 0.0, "candidate": 0.0}
+    cat_live = np.zeros(0)
+    cat_candidate = np.zeros(0)
+    cat_quantity = np.zeros(0, dtype=np.int64)
+    unallocated = 0.0
+    by_day = {}
+
+    for rows in _iter_job_chunks(since, chunk_size):
+        jobs, lines = _flatten_chunk(rows, live, catalogue, categories)
+        live_total = _price_jobs(jobs, live)
+        candidate_total = _price_jobs(jobs, candidate)
+        delta = candidate_total - live_total
+        deltas.append(delta)
+
+        totals["jobs"] += len(rows)
+        totals["recorded"] += float(jobs["recorded"].sum())
+        totals["live"] += float(live_total.sum())
+        totals["candidate"] += float(candidate_total.sum())
+
+        # Per category: split each job's total by its lines' share of the
+        # item total.  Jobs with no priced items (minimum-only) have nothing
+        # to split and are reported as unallocated.
+        n_cat = len(categories)
+        if len(cat_live) < n_cat:
+            grow = n_cat - len(cat_live)
+            cat_live = np.concatenate([cat_live, np.zeros(grow)])
+            cat_candidate = np.concatenate([cat_candidate, np.zeros(grow)])
+            cat_quantity = np.concatenate([cat_quantity, np.zeros(grow, dtype=np.int64)])
+        if len(lines["job"]):
+            share = lines["amount"] / jobs["item_total"][lines["job"]]
+            cat_live += np.bincount(lines["category"], share * live_total[lines["job"]], minlength=n_cat)
+            cat_candidate += np.bincount(lines["category"], share * candidate_total[lines["job"]], minlength=n_cat)
+            cat_quantity += np.bincount(lines["category"], lines["quantity"], minlength=n_cat).astype(np.int64)
+        unallocated += float(delta[jobs["item_total"] <= 0].sum())
+
+        # Per day (scheduled date, falling back to created date)
+        dated = ~np.isnat(jobs["day"])
+        day_keys, inverse = np.unique(jobs["day"][dated].astype(np.int64), return_inverse=True)
+        day_jobs = np.bincount(inverse, minlength=len(day_keys))
+        day_live = np.bincount(inverse, live_total[dated], minlength=len(day_keys))
+        day_candidate = np.bincount(inverse, candidate_total[dated], minlength=len(day_keys))
+        for k, epoch_day in enumerate(day_keys.tolist()):
+            bucket = by_day.setdefault(epoch_day, [0, 0.0, 0.0])
+            bucket[0] += int(day_jobs[k])
+            bucket[1] += float(day_live[k])
+            bucket[2] += float(day_candidate[k])
+
+    delta = np.concatenate(deltas) if deltas else np.zeros(0)
+
+    if len(delta):
+        p5, p25, p50, p75, p95 = np.percentile(delta, [5, 25, 50, 75, 95]).tolist()
+        distribution = {
+            "mean": round(float(delta.mean()), 2),
+            "min": round(float(delta.min()), 2),
+            "p5": round(p5, 2),
+            "p25": round(p25, 2),
+            "p50": round(p50, 2),
+            "p75": round(p75, 2),
+            "p95": round(p95, 2),
+            "max": round(float(delta.max()), 2),
+            "jobs_up": int((delta > 0.005).sum()),
+            "jobs_down": int((delta < -0.005).sum()),
+            "jobs_unchanged": int((np.abs(delta) <= 0.005).sum()),
+        }
+    else:
+        distribution = None
+
+    by_category = [
+        {
+            "category": name,
+            "quantity": int(cat_quantity[idx]),
+            "live_revenue": round(float(cat_live[idx]), 2),
+            "candidate_revenue": round(float(cat_candidate[idx]), 2),
+            "delta": round(float(cat_candidate[idx] - cat_live[idx]), 2),
+        }
+        for name, idx in categories.items()
+    ]
+    by_category.sort(key=lambda c: abs(c["delta"]), reverse=True)
+
+    live_revenue = totals["live"]
+    delta_total = totals["candidate"] - live_revenue
+    elapsed = time.perf_counter() - started
+    logger.info("Pricing simulation: %d jobs over %d days in %.2fs", totals["jobs"], days, elapsed)
+
+    return {
+        "window": {
+            "days": days,
+            "since": since.isoformat(),
+            "jobs": totals["jobs"],
+        },
+        "live_config": describe_snapshot(live),
+        "candidate_config": describe_snapshot(candidate),
+        "totals": {
+            "recorded_revenue": round(totals["recorded"], 2),
+            "live_revenue": round(live_revenue, 2),
+            "candidate_revenue": round(totals["candidate"], 2),
+            "delta": round(delta_total, 2),
+            "delta_pct": round(delta_total / live_revenue * 100, 2) if live_revenue else None,
+        },
+        "per_job_delta": distribution,
+        "by_category": by_category,
+        "unallocated_delta": round(unallocated, 2),
+        "by_day": [
+            {
+                "date": str(np.datetime64(epoch_day, "D")),
+                "jobs": count,
+                "live_revenue": round(live_day, 2),
+                "candidate_revenue": round(candidate_day, 2),
+                "delta": round(candidate_day - live_day, 2),
+            }
+            for epoch_day, (count, live_day, candidate_day) in sorted(by_day.items())
+        ],
+        "elapsed_ms": round(elapsed * 1000, 1),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay historical jobs under a candidate pricing config.")
+    parser.add_argument("config", help="JSON object of pricing config overrides")
+    parser.add_argument("--days", type=int, default=DEFAULT_DAYS)
+    args = parser.parse_args()
+
+    from server import app
+
+    with app.app_context():
+        report = simulate_pricing_change(json.loads(args.config), days=args.days)
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,336 @@
+"""
+Multi-stop route sequencing for a driver's day.
+
+Orders a driver's pickups into a short tour that respects each job's
+arrival window (the booked time slot, starting at ``scheduled_at``): a
+window-aware nearest-neighbour tour is improved with 2-opt and Or-opt moves
+until no move lowers the cost, where cost is road kilometres plus a heavy
+penalty per minute of arriving after a window closes.  Stops the driver is
+already working (en route / on site) stay pinned at the front.
+
+Distances are haversine kilometres scaled by ROAD_FACTOR; travel times come
+from the ETA engine's speed profile for the hour of departure, so ETAs are
+estimates, not navigation output.
+
+The optimised order is cached per driver and day under a signature of the
+job set (ids, positions, windows, statuses); ETAs are recomputed from the
+cached order on every request, so they follow the clock without re-solving.
+"""
+
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+import threading
+import time
+
+from geofencing import _haversine
+from eta_engine import eta_engine, ROAD_FACTOR
+
+# Time on site per pickup.
+SERVICE_MINUTES = 30
+
+# Bookings are taken in two-hour slots ("8-10"); scheduled_at is the start.
+ARRIVAL_WINDOW_MINUTES = 120
+
+# One minute past a window costs as much as a 10 km detour.
+LATE_PENALTY_KM_PER_MINUTE = 10.0
+
+# Safety cap on local-search passes (each pass tries every move once).
+MAX_IMPROVEMENT_PASSES = 50
+
+# Wall-clock budget for local search.  Tours that are on time converge well
+# inside it; overbooked days (late whatever the order) return the best tour
+# found so far.
+IMPROVE_BUDGET_SECONDS = 0.025
+
+_EPS = 1e-9
+
+Stop = namedtuple("Stop", [
+    "id",
+    "lat",
+    "lng",
+    "window_start",     # datetime or None
+    "window_end",       # datetime or None
+])
+
+Leg = namedtuple("Leg", [
+    "stop",
+    "eta",              # arrival (after any wait for the window to open)
+    "distance_km",      # from the previous stop (or the start position)
+    "late_minutes",
+])
+
+
+class _Problem:
+    """Distance and travel-time matrices and windows (in minutes after
+    departure) for a set of stops; node ``n`` is the start position when there is one."""
+
+    def __init__(self, stops, start, depart_at):
+        self.stops = stops
+        self.depart_at = depart_at
+        points = [(s.lat, s.lng) for s in stops]
+        self.start = None
+        if start is not None:
+            self.start = len(points)
+            points.append(start)
+        self.dist = [
+            [_haversine(a[0], a[1], b[0], b[1]) * ROAD_FACTOR for b in points]
+            for a in points
+        ]
+        self.minutes = eta_engine.eta(points, points, depart_at).tolist()
+
+        def offset(dt):
+            return None if dt is None else (dt - depart_at).total_seconds() / 60.0
+
+        self.open = [offset(s.window_start) for s in stops]
+        self.close = [offset(s.window_end) for s in stops]
+
+    def evaluate(self, order):
+        """``(cost, km, late_minutes)`` of visiting *order* from the start."""
+        dist, open_, close = self.dist, self.open, self.close
+        t = 0.0
+        km = 0.0
+        late = 0.0
+        prev = self.start
+        for s in order:
+            if prev is not None:
+                km += dist[prev][s]
+                t += self.minutes[prev][s]
+            if open_[s] is not None and t < open_[s]:
+                t = open_[s]
+            if close[s] is not None and t > close[s]:
+                late += t - close[s]
+            t += SERVICE_MINUTES
+            prev = s
+        return km + LATE_PENALTY_KM_PER_MINUTE * late, km, late
+
+    def legs(self, order):
+        legs = []
+        t = 0.0
+        prev = self.start
+        for s in order:
+            d = self.dist[prev][s] if prev is not None else 0.0
+            t += self.minutes[prev][s] if prev is not None else 0.0
+            if self.open[s] is not None and t < self.open[s]:
+                t = self.open[s]
+            late = max(0.0, t - self.close[s]) if self.close[s] is not None else 0.0
+            legs.append(Leg(self.stops[s], self.depart_at + timedelta(minutes=t), d, late))
+            t += SERVICE_MINUTES
+            prev = s
+        return legs
+
+    # -- construction ----------------------------------------------------------
+
+    def nearest_neighbour(self, pinned):
+        """Greedy seed: repeatedly go to the stop that is cheapest to reach
+        next, counting waiting and lateness as well as distance."""
+        order = list(pinned)
+        remaining = [i for i in range(len(self.stops)) if i not in set(order)]
+        t = self._finish_time(order)
+        prev = order[-1] if order else self.start
+        while remaining:
+            best = None
+            for s in remaining:
+                d = self.dist[prev][s] if prev is not None else 0.0
+                arrive = t + (self.minutes[prev][s] if prev is not None else 0.0)
+                wait = max(0.0, self.open[s] - arrive) if self.open[s] is not None else 0.0
+                late = max(0.0, arrive + wait - self.close[s]) if self.close[s] is not None else 0.0
+                key = d + 0.5 * wait + LATE_PENALTY_KM_PER_MINUTE * late
+                if best is None or key < best[0]:
+                    best = (key, s, arrive + wait)
+            _key, s, arrive = best
+            order.append(s)
+            remaining.remove(s)
+            t = arrive + SERVICE_MINUTES
+            prev = s
+        return order
+
+    def _finish_time(self, order):
+        t = 0.0
+        prev = self.start
+        for s in order:
+            if prev is not None:
+                t += self.minutes[prev][s]
+            if self.open[s] is not None and t < self.open[s]:
+                t = self.open[s]
+            t += SERVICE_MINUTES
+            prev = s
+        return t
+
+    # -- improvement -----------------------------------------------------------
+
+    def _d(self, a, b):
+        if a is None or b is None:
+            return 0.0
+        return self.dist[a][b]
+
+    def _prefix(self, order):
+        """Per position: time, km and late minutes after serving order[:m]."""
+        n = len(order)
+        times, kms, lates = [0.0] * (n + 1), [0.0] * (n + 1), [0.0] * (n + 1)
+        t = km = late = 0.0
+        prev = self.start
+        for m, s in enumerate(order, start=1):
+            if prev is not None:
+                km += self.dist[prev][s]
+                t += self.minutes[prev][s]
+            if self.open[s] is not None and t < self.open[s]:
+                t = self.open[s]
+            if self.close[s] is not None and t > self.close[s]:
+                late += t - self.close[s]
+            t += SERVICE_MINUTES
+            times[m], kms[m], lates[m] = t, km, late
+            prev = s
+        return times, kms, lates
+
+    def _cost_from(self, candidate, m, prefix, cutoff):
+        """Cost of *candidate*, which shares its first *m* stops with the
+        order *prefix* was built from.  Returns None as soon as the partial
+        cost reaches *cutoff* (cost only grows along the tour)."""
+        dist, minutes, open_, close = self.dist, self.minutes, self.open, self.close
+        penalty = LATE_PENALTY_KM_PER_MINUTE
+        times, kms, lates = prefix
+        t, km, late = times[m], kms[m], lates[m]
+        prev = candidate[m - 1] if m else self.start
+        for s in candidate[m:]:
+            if prev is not None:
+                km += dist[prev][s]
+                t += minutes[prev][s]
+            w = open_[s]
+            if w is not None and t < w:
+                t = w
+            w = close[s]
+            if w is not None and t > w:
+                late += t - w
+            if km + penalty * late >= cutoff:
+                return None
+            t += SERVICE_MINUTES
+            prev = s
+        return km + penalty * late, late
+
+    def improve(self, order, fixed):
+        """2-opt and Or-opt (segments of 1-3 stops) with first-improvement,
+        never moving the first *fixed* stops, within IMPROVE_BUDGET_SECONDS.
+
+        A move's new length is known in O(1) and the lateness accrued before
+        the first changed stop cannot go away, so moves whose length plus
+        that lateness already reaches the current cost are skipped (on an
+        on-time tour: every move that does not shorten it).  The rest are
+        evaluated from the unchanged prefix and abandoned once the partial
+        cost reaches the current one.
+        """
+        deadline = time.perf_counter() + IMPROVE_BUDGET_SECONDS
+        cost, km, _late = self.evaluate(order)
+        prefix = self._prefix(order)
+        n = len(order)
+
+        def accept(candidate, m, delta):
+            nonlocal order, cost, km, prefix
+            if km + delta + LATE_PENALTY_KM_PER_MINUTE * prefix[2][m] >= cost - _EPS:
+                return False
+            result = self._cost_from(candidate, m, prefix, cost - _EPS)
+            if result is None:
+                return False
+            order = candidate
+            cost = result[0]
+            km += delta
+            prefix = self._prefix(order)
+            return True
+
+        for _pass in range(MAX_IMPROVEMENT_PASSES):
+            improved = False
+
+            # 2-opt: reverse order[i..j]
+            for i in range(fixed, n - 1):
+                if time.perf_counter() > deadline:
+                    return order
+                for j in range(i + 1, n):
+                    a = order[i - 1] if i > 0 else self.start
+                    b, c = order[i], order[j]
+                    e = order[j + 1] if j + 1 < n else None
+                    delta = self._d(a, c) + self._d(b, e) - self._d(a, b) - self._d(c, e)
+                    if km + delta + LATE_PENALTY_KM_PER_MINUTE * prefix[2][i] >= cost - _EPS:
+                        continue
+                    if accept(order[:i] + order[i:j + 1][::-1] + order[j + 1:], i, delta):
+                        improved = True
+
+            # Or-opt: move order[i..i+L-1] to another gap
+            for length in (1, 2, 3):
+                i = fixed
+                while i <= n - length:
+                    if time.perf_counter() > deadline:
+                        return order
+                    seg = order[i:i + length]
+                    rest = order[:i] + order[i + length:]
+                    p = order[i - 1] if i > 0 else self.start
+                    q = order[i + length] if i + length < n else None
+                    removed = self._d(p, seg[0]) + self._d(seg[-1], q) - self._d(p, q)
+                    for k in range(fixed, len(rest) + 1):
+                        if k == i:
+                            continue
+                        u = rest[k - 1] if k > 0 else self.start
+                        v = rest[k] if k < len(rest) else None
+                        added = self._d(u, seg[0]) + self._d(seg[-1], v) - self._d(u, v)
+                        m = min(i, k)
+                        if km + added - removed + LATE_PENALTY_KM_PER_MINUTE * prefix[2][m] >= cost - _EPS:
+                            continue
+                        if accept(rest[:k] + seg + rest[k:], m, added - removed):
+                            improved = True
+                            break
+                    i += 1
+
+            if not improved:
+                break
+        return order
+
+
+def plan_route(stops, start=None, depart_at=None, pinned=(), order=None):
+    """Sequence *stops* (a list of :class:`Stop`) into a tour.
+
+    *start* is the driver's ``(lat, lng)`` if known; *pinned* lists stop ids
+    that must come first, in that order.  Pass a previous result's *order*
+    (stop ids) to skip optimisation and only recompute ETAs.
+
+    Returns ``(order, legs, total_km, late_minutes)``.
+    """
+    if not stops:
+        return [], [], 0.0, 0.0
+
+    problem = _Problem(stops, start, depart_at)
+    index = {s.id: i for i, s in enumerate(stops)}
+    if order is None:
+        fixed = [index[i] for i in pinned if i in index]
+        seq = problem.nearest_neighbour(fixed)
+        seq = problem.improve(seq, len(fixed))
+    else:
+        seq = [index[i] for i in order]
+
+    _cost, km, late = problem.evaluate(seq)
+    return [stops[i].id for i in seq], problem.legs(seq), km, late
+
+
+class RouteCache:
+    """Optimised stop orders keyed by (driver, day), valid while the job-set
+    signature they were computed for is unchanged."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, signature):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != signature:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, signature, order):
+        with self._lock:
+            self._entries[key] = (signature, order)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+route_cache = RouteCache()
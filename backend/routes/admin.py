@@ -19,9 +19,31 @@ from models import (
     PricingConfig, Review, generate_uuid, utcnow,
 )
 from auth_routes import require_auth
+from routes.booking import invalidate_pricing_snapshot, apply_surge_zone_change
+from driver_index import driver_index
+from offers import offer_manager
+from location_history import location_history, epoch_seconds, track_distance_km
+from socket_backplane import backplane
+from geo_rooms import geo_rooms
+import socket_payloads
+from socket_metrics import socket_metrics
+from dispatch import (
+    rank_candidates, run_dispatch_window, claim_job,
+    AUTO_ASSIGN_RADIUS_KM, DEFAULT_CANDIDATE_LIMIT,
+)
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/api/admin")
 
+# Keys accepted by PUT /pricing/config (and POST /pricing/simulate).
+PRICING_CONFIG_KEYS = {
+    "minimum_job_price",
+    "volume_discount_tiers",
+    "same_day_surge",
+    "next_day_surge",
+    "weekend_surge",
+    "service_fee_rate",
+}
+
 
 def require_admin(f):
     """Wrap require_auth and additionally check that the user has admin role."""
@@ -77,6 +99,20 @@ def dashboard(user_id):
     }), 200
 
 
+def _contractor_record(c):
+    """Contractor dict in the shape the admin frontend expects."""
+    c_data = c.to_dict()
+    # Flatten user fields to the top level so the admin frontend can
+    # access name / email / phone directly (instead of c.user.name etc.)
+    user_obj = c_data.pop("user", None) or {}
+    c_data["name"] = user_obj.get("name")
+    c_data["email"] = user_obj.get("email")
+    c_data["phone"] = user_obj.get("phone")
+    # Frontend expects "rating" but the model stores "avg_rating"
+    c_data["rating"] = c_data.get("avg_rating")
+    return c_data
+
+
 @admin_bp.route("/contractors", methods=["GET"])
 @require_admin
 def list_contractors(user_id):
@@ -101,15 +137,7 @@ def list_contractors(user_id):
 
     contractors = []
     for c in pagination.items:
-        c_data = c.to_dict()
-        # Flatten user fields to the top level so the admin frontend can
-        # access name / email / phone directly (instead of c.user.name etc.)
-        user_obj = c_data.pop("user", None) or {}
-        c_data["name"] = user_obj.get("name")
-        c_data["email"] = user_obj.get("email")
-        c_data["phone"] = user_obj.get("phone")
-        # Frontend expects "rating" but the model stores "avg_rating"
-        c_data["rating"] = c_data.get("avg_rating")
+        c_data = _contractor_record(c)
         # Add operator name for fleet contractors
         if c.operator_id and c.operator:
             c_data["operator_name"] = c.operator.user.name if c.operator.user else None
@@ -152,6 +180,8 @@ def approve_contractor(user_id, contractor_id):
     )
     db.session.add(notification)
     db.session.commit()
+    driver_index.upsert(contractor)
+    geo_rooms.update(contractor.id)
 
     return jsonify({"success": True, "contractor": contractor.to_dict()}), 200
 
@@ -178,6 +208,8 @@ def suspend_contractor(user_id, contractor_id):
     )
     db.session.add(notification)
     db.session.commit()
+    driver_index.upsert(contractor)
+    geo_rooms.update(contractor.id)
 
     return jsonify({"success": True, "contractor": contractor.to_dict()}), 200
 
@@ -282,6 +314,35 @@ def get_job_detail(user_id, job_id):
     return jsonify({"success": True, "job": job_data}), 200
 
 
+@admin_bp.route("/jobs/<job_id>/track", methods=["GET"])
+@require_admin
+def get_job_track(user_id, job_id):
+    """Replay the driver's GPS track from started_at to completed_at (or now).
+
+    Points are ``[t, lat, lng]`` with t in POSIX seconds.  Older days are
+    simplified, so distance_km is a slight underestimate for them.
+    """
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if not job.driver_id or not job.started_at:
+        return jsonify({"error": "Job has not been started"}), 409
+
+    start = epoch_seconds(job.started_at)
+    end = epoch_seconds(job.completed_at) if job.completed_at else epoch_seconds(utcnow())
+    points = location_history.track(job.driver_id, start, end)
+
+    return jsonify({
+        "success": True,
+        "job_id": job.id,
+        "driver_id": job.driver_id,
+        "started_at": job.started_at.isoformat(),
+        "completed_at": job.completed_at.isoformat() if job.completed_at else None,
+        "distance_km": round(track_distance_km(points), 2),
+        "points": points,
+    }), 200
+
+
 @admin_bp.route("/pricing/rules", methods=["PUT"])
 @require_admin
 def update_pricing_rules(user_id):
@@ -325,6 +386,7 @@ def update_pricing_rules(user_id):
         updated.append(rule)
 
     db.session.commit()
+    invalidate_pricing_snapshot()
     return jsonify({"success": True, "rules": [r.to_dict() for r in updated]}), 200
 
 
@@ -363,6 +425,7 @@ def upsert_surge_zone(user_id):
 
     zone.updated_at = utcnow()
     db.session.commit()
+    apply_surge_zone_change(zone)
 
     return jsonify({"success": True, "surge_zone": zone.to_dict()}), 200
 
@@ -546,15 +609,13 @@ def analytics(user_id):
 @require_admin
 def map_data(user_id):
     """Return online contractors and active jobs for the live map."""
-    # Online approved contractors with a known location
-    contractors = (
-        Contractor.query
-        .filter_by(is_online=True, approval_status="approved")
-        .filter(Contractor.current_lat.isnot(None), Contractor.current_lng.isnot(None))
-        .all()
-    )
+    # Online approved contractors with a known location (a first position may
+    # still be in the location buffer, so filter after loading)
+    contractors = Contractor.query.filter_by(is_online=True, approval_status="approved").all()
     contractor_points = []
     for c in contractors:
+        if c.current_lat is None or c.current_lng is None:
+            continue
         contractor_points.append({
             "id": c.id,
             "name": c.user.name if c.user else None,
@@ -600,32 +661,103 @@ def map_data(user_id):
 # Pricing Rules (GET)
 # ---------------------------------------------------------------------------
 
+@admin_bp.route("/jobs/<job_id>/candidates", methods=["GET"])
+@require_admin
+def job_candidates(user_id, job_id):
+    """Rank the drivers who could take a job: available first, then nearest.
+
+    Query params: limit (default 10, max 50), radius_km (default 50),
+    include_busy (default true).
+    """
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    try:
+        limit = min(max(int(request.args.get("limit", DEFAULT_CANDIDATE_LIMIT)), 1), 50)
+        radius_km = float(request.args.get("radius_km", AUTO_ASSIGN_RADIUS_KM))
+    except (TypeError, ValueError):
+        return jsonify({"error": "limit and radius_km must be numbers"}), 400
+    if radius_km <= 0:
+        return jsonify({"error": "radius_km must be positive"}), 400
+    include_busy = request.args.get("include_busy", "true").lower() not in ("0", "false", "no")
+
+    candidates = []
+    for cand in rank_candidates(job, limit=limit, radius_km=radius_km, include_busy=include_busy):
+        c_data = _contractor_record(cand.contractor)
+        c_data["distance_km"] = round(cand.distance_km, 2) if cand.distance_km is not None else None
+        c_data["eta_minutes"] = round(cand.eta_minutes, 1) if cand.eta_minutes is not None else None
+        c_data["active_jobs"] = cand.active_jobs
+        c_data["available"] = cand.active_jobs == 0
+        candidates.append(c_data)
+
+    return jsonify({"success": True, "job_id": job.id, "candidates": candidates}), 200
+
+
+@admin_bp.route("/dispatch/run", methods=["POST"])
+@require_admin
+def run_dispatch(user_id):
+    """Run a batched dispatch window now and return its deadhead report."""
+    report = run_dispatch_window()
+    return jsonify({"success": True, "report": report}), 200
+
+
+@admin_bp.route("/dispatch/offers", methods=["GET"])
+@require_admin
+def dispatch_offers(user_id):
+    """Offer counters, time-to-accept and open offers (this worker only)."""
+    return jsonify({"success": True, "offers": offer_manager.snapshot()}), 200
+
+
+@admin_bp.route("/metrics", methods=["GET"])
+@require_admin
+def worker_metrics(user_id):
+    """Socket.IO handler and emit metrics, connections and rooms, plus the
+    GPS buffer, rate modes, live map, tracking streams, geo rooms, chat
+    pipeline and backplane statistics -- one entry per worker, labelled by
+    host_id.  Workers that don't answer within METRICS_GATHER_SECONDS are
+    left out."""
+    workers = socket_metrics.collect()
+    return jsonify({"success": True, "clustered": backplane.clustered, "workers": workers}), 200
+
+
 @admin_bp.route("/jobs/<job_id>/assign", methods=["PUT"])
 @require_admin
 def assign_job(user_id, job_id):
-    """Manually assign a contractor to a job."""
+    """Manually assign a contractor to a job.
+
+    Without a contractor_id the top available candidate is assigned.
+    """
     job = db.session.get(Job, job_id)
     if not job:
         return jsonify({"error": "Job not found"}), 404
 
     data = request.get_json() or {}
     contractor_id = data.get("contractor_id")
-    if not contractor_id:
-        return jsonify({"error": "contractor_id is required"}), 400
-
-    contractor = db.session.get(Contractor, contractor_id)
-    if not contractor:
-        return jsonify({"error": "Contractor not found"}), 404
+    if contractor_id:
+        contractor = db.session.get(Contractor, contractor_id)
+        if not contractor:
+            return jsonify({"error": "Contractor not found"}), 404
+    else:
+        candidates = rank_candidates(job, limit=1)
+        if not candidates:
+            return jsonify({"error": "No available driver for this job"}), 409
+        contractor = candidates[0].contractor
 
     if contractor.approval_status != "approved":
         return jsonify({"error": "Contractor is not approved"}), 403
 
+    # Write the assignment only if the job is still as read above; a driver
+    # accepting or another admin assigning in the meantime wins instead.
+    seen_status, seen_driver = job.status, job.driver_id
+    open_job = seen_status in ("pending", "confirmed")
+
     # If assigning to an operator, set as delegating (operator will assign to fleet)
     if contractor.is_operator:
-        job.operator_id = contractor.id
-        if job.status in ("pending", "confirmed"):
-            job.status = "delegating"
-        job.updated_at = utcnow()
+        values = {"operator_id": contractor.id, "status": "delegating" if open_job else seen_status}
+        if not claim_job(job.id, (seen_status,), values, driver_id=seen_driver):
+            db.session.rollback()
+            return jsonify({"error": "Job changed while assigning; reload and try again"}), 409
 
         # Notify operator
         notification = Notification(
@@ -640,7 +772,7 @@ def assign_job(user_id, job_id):
         db.session.commit()
 
         from socket_events import broadcast_job_status, socketio
-        broadcast_job_status(job.id, job.status, {"operator_id": contractor.id})
+        broadcast_job_status(job.id, job.status, {"operator_id": contractor.id}, job=job)
         socketio.emit("operator:new-job", {
             "job_id": job.id,
             "address": job.address,
@@ -650,10 +782,10 @@ def assign_job(user_id, job_id):
         return jsonify({"success": True, "job": job.to_dict()}), 200
 
     # Regular contractor assignment
-    job.driver_id = contractor.id
-    if job.status in ("pending", "confirmed"):
-        job.status = "assigned"
-    job.updated_at = utcnow()
+    values = {"driver_id": contractor.id, "status": "assigned" if open_job else seen_status}
+    if not claim_job(job.id, (seen_status,), values, driver_id=seen_driver):
+        db.session.rollback()
+        return jsonify({"error": "Job changed while assigning; reload and try again"}), 409
 
     # Notify driver
     notification = Notification(
@@ -677,6 +809,8 @@ def assign_job(user_id, job_id):
     )
     db.session.add(notification_cust)
     db.session.commit()
+    driver_index.note_job(job)
+    offer_manager.forget(job.id)  # an admin assignment is not a timed offer
 
     # --- Email / SMS / Push notifications ---
     driver_name = contractor.user.name if contractor.user else None
@@ -702,13 +836,10 @@ def assign_job(user_id, job_id):
 
     # Broadcast via SocketIO
     from socket_events import broadcast_job_status, socketio
-    broadcast_job_status(job.id, job.status, {"driver_id": contractor.id})
+    broadcast_job_status(job.id, job.status, {"driver_id": contractor.id}, job=job)
 
-    socketio.emit("job:assigned", {
-        "job_id": job.id,
-        "contractor_id": contractor.id,
-        "contractor_name": contractor.user.name if contractor.user else None,
-    }, room="driver:{}".format(contractor.id))
+    socketio.emit("job:assigned", socket_payloads.job_assigned(job, contractor),
+                  room="driver:{}".format(contractor.id))
 
     socketio.emit("job:driver-assigned", {
         "job_id": job.id,
@@ -738,9 +869,10 @@ def admin_cancel_job(user_id, job_id):
     job.status = "cancelled"
     job.updated_at = utcnow()
     db.session.commit()
+    driver_index.note_job(job)
 
     from socket_events import broadcast_job_status
-    broadcast_job_status(job.id, "cancelled", {})
+    broadcast_job_status(job.id, "cancelled", {}, job=job)
 
     return jsonify({"success": True, "job": job.to_dict()}), 200
 
@@ -949,18 +1081,9 @@ def update_pricing_config(user_id):
     if not isinstance(config_data, dict):
         return jsonify({"error": "config must be an object"}), 400
 
-    ALLOWED_KEYS = {
-        "minimum_job_price",
-        "volume_discount_tiers",
-        "same_day_surge",
-        "next_day_surge",
-        "weekend_surge",
-        "service_fee_rate",
-    }
-
     updated = {}
     for key, value in config_data.items():
-        if key not in ALLOWED_KEYS:
+        if key not in PRICING_CONFIG_KEYS:
             continue
 
         row = db.session.get(PricingConfig, key)
@@ -973,10 +1096,56 @@ def update_pricing_config(user_id):
         updated[key] = value
 
     db.session.commit()
+    invalidate_pricing_snapshot()
 
     return jsonify({"success": True, "config": updated}), 200
 
 
+# ---------------------------------------------------------------------------
+# Pricing what-if simulation
+# ---------------------------------------------------------------------------
+
+@admin_bp.route("/pricing/simulate", methods=["POST"])
+@require_admin
+def simulate_pricing(user_id):
+    """Replay recent jobs under a candidate pricing config.
+
+    Body JSON:
+        config: { <any key accepted by PUT /pricing/config> }
+        days: int (default 90, max 365)
+
+    Nothing is written; returns the revenue delta in total, per job
+    (distribution), per category and per day.
+    """
+    try:
+        from pricing_simulator import simulate_pricing_change, DEFAULT_DAYS, MAX_DAYS
+    except ImportError:
+        return jsonify({"error": "Pricing simulation requires numpy"}), 503
+
+    data = request.get_json() or {}
+    config_data = data.get("config", {})
+
+    if not isinstance(config_data, dict):
+        return jsonify({"error": "config must be an object"}), 400
+    unknown = sorted(set(config_data) - PRICING_CONFIG_KEYS)
+    if unknown:
+        return jsonify({"error": "Unknown config keys: {}".format(", ".join(unknown))}), 400
+
+    try:
+        days = int(data.get("days", DEFAULT_DAYS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "days must be an integer"}), 400
+    if days < 1 or days > MAX_DAYS:
+        return jsonify({"error": "days must be between 1 and {}".format(MAX_DAYS)}), 400
+
+    try:
+        report = simulate_pricing_change(config_data, days=days)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+
+    return jsonify({"success": True, "simulation": report}), 200
+
+
 # ---------------------------------------------------------------------------
 # Database Migration (admin trigger)
 # ---------------------------------------------------------------------------
@@ -8,23 +8,34 @@ job price of $89.
 """
 
 from flask import Blueprint, request, jsonify
+from sqlalchemy.exc import OperationalError, ProgrammingError
 from datetime import datetime, timezone, date as date_type, timedelta
 from math import radians, cos, sin, asin, sqrt
+from collections import namedtuple
+from types import MappingProxyType
+import hashlib
+import json
+import logging
+import threading
+import time
 
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from models import (
-    db, User, Job, Payment, PricingRule, PricingConfig, SurgeZone, Contractor,
+    db, User, Job, Payment, PricingRule, PricingConfig, SurgeZone,
     Notification, PromoCode, generate_uuid, utcnow, generate_referral_code,
 )
 from auth_routes import require_auth, optional_auth
 from extensions import limiter
 from geofencing import is_in_service_area
+from surge_index import SurgeZoneIndex, compile_zone
 
 booking_bp = Blueprint("booking", __name__, url_prefix="/api/booking")
 
+logger = logging.getLogger(__name__)
+
 # ---------------------------------------------------------------------------
 # Constants
 # ---------------------------------------------------------------------------
@@ -116,74 +127,224 @@ TRUCK_SIZE_THRESHOLDS = [
 
 
 # ============================================================================
-# Admin-overridable config loader
+# Pricing snapshot (process-local, versioned)
 # ============================================================================
-def _load_config(key, default):
-    """Load a pricing config value from the DB, falling back to *default*."""
-    try:
-        row = db.session.get(PricingConfig, key)
-        if row is not None and row.value is not None:
-            return row.value
-    except Exception:
-        pass  # DB not ready or table missing -- use default
-    return default
+# Every estimate used to issue one PricingRule query per cart line, one
+# PricingConfig lookup per setting and a full SurgeZone scan.  All of that is
+# now read once into an immutable snapshot that ``calculate_estimate`` uses
+# until an admin pricing write bumps the generation counter.  The TTL is a
+# safety net so that other worker processes (which never see the bump) pick
+# up admin changes within a bounded time.
+PRICING_SNAPSHOT_TTL_SECONDS = float(os.environ.get("PRICING_SNAPSHOT_TTL_SECONDS", "60"))
+
+PricingSnapshot = namedtuple("PricingSnapshot", [
+    "version",                # content fingerprint -- identical across workers
+    "generation",             # local invalidation counter at build time
+    "built_at",               # time.monotonic() at build time
+    "rules",                  # {"<category>[:<size>]": base_price}
+    "config",                 # raw PricingConfig overrides {key: value}
+    "minimum_job_price",
+    "volume_discount_tiers",  # [(min_qty, max_qty, discount_rate), ...]
+    "same_day_surge",
+    "next_day_surge",
+    "weekend_surge",
+    "service_fee_rate",
+    "surge_index",            # SurgeZoneIndex over active zones
+])
+
+_snapshot_lock = threading.Lock()
+_snapshot = None
+_snapshot_generation = 0
+
+
+def _compile_tiers(raw):
+    if raw and isinstance(raw, list):
+        return tuple((t["min_qty"], t.get("max_qty"), t["discount_rate"]) for t in raw)
+    return tuple(VOLUME_DISCOUNT_TIERS)
+
+
+def _build_pricing_snapshot(generation):
+    """Load rules, config and surge zones in three queries."""
+    rules = {
+        r.item_type: float(r.base_price)
+        for r in PricingRule.query.filter(PricingRule.is_active == True).all()
+    }
+    config = _usable_config({
+        c.key: c.value
+        for c in PricingConfig.query.all()
+        if c.value is not None
+    })
+    surge_index = SurgeZoneIndex(
+        compile_zone(z) for z in SurgeZone.query.filter_by(is_active=True).all()
+    )
+    return _make_snapshot(generation, rules, config, surge_index)
+
+
+# PricingConfig keys _make_snapshot reads as plain numbers.
+_NUMERIC_CONFIG_KEYS = ("minimum_job_price", "same_day_surge", "next_day_surge",
+                        "weekend_surge", "service_fee_rate")
+
+
+def _usable_config(config):
+    """*config* without the values _make_snapshot cannot read, each skipped
+    with a warning so that one bad admin entry falls back to its default
+    instead of taking the whole snapshot down."""
+    from pricing_simulator import _coerce_tiers
+
+    config = dict(config)
+    for key in _NUMERIC_CONFIG_KEYS:
+        if key in config:
+            try:
+                float(config[key])
+            except (TypeError, ValueError):
+                logger.warning("Ignoring pricing config %s=%r: not a number", key, config.pop(key))
+    tiers = config.get("volume_discount_tiers")
+    if tiers:
+        try:
+            config["volume_discount_tiers"] = _coerce_tiers(tiers)
+        except ValueError as exc:
+            logger.warning("Ignoring pricing config volume_discount_tiers: %s", exc)
+            del config["volume_discount_tiers"]
+    return config
+
+
+def _snapshot_fingerprint(rules, config, surge_index):
+    zones = [
+        (z.id, z.multiplier, sorted(z.days) if z.days else None,
+         z.start_time, z.end_time, z.boundary)
+        for z in sorted(surge_index.zones.values(), key=lambda z: z.id)
+    ]
+    return hashlib.sha1(json.dumps(
+        [sorted(rules.items()), sorted(config.items()), zones],
+        sort_keys=True, default=str,
+    ).encode("utf-8")).hexdigest()[:16]
+
+
+def _make_snapshot(generation, rules, config, surge_index):
+    fingerprint = _snapshot_fingerprint(rules, config, surge_index)
+
+    return PricingSnapshot(
+        version=fingerprint,
+        generation=generation,
+        built_at=time.monotonic(),
+        rules=MappingProxyType(rules),
+        config=MappingProxyType(config),
+        minimum_job_price=float(config.get("minimum_job_price", MINIMUM_JOB_PRICE)),
+        volume_discount_tiers=_compile_tiers(config.get("volume_discount_tiers")),
+        same_day_surge=float(config.get("same_day_surge", SAME_DAY_SURGE)),
+        next_day_surge=float(config.get("next_day_surge", NEXT_DAY_SURGE)),
+        weekend_surge=float(config.get("weekend_surge", WEEKEND_SURGE)),
+        service_fee_rate=float(config.get("service_fee_rate", SERVICE_FEE_RATE)),
+        surge_index=surge_index,
+    )
+
+
+def get_pricing_snapshot():
+    """Return the current pricing snapshot, rebuilding it if stale.
+
+    Costs zero queries in steady state.  If the pricing tables cannot be
+    read the hardcoded defaults are returned (and not cached) so that
+    pricing keeps working; the error is logged.
+    """
+    global _snapshot
+    snap = _snapshot
+    generation = _snapshot_generation
+    if (snap is not None and snap.generation == generation
+            and time.monotonic() - snap.built_at < PRICING_SNAPSHOT_TTL_SECONDS):
+        return snap
+
+    with _snapshot_lock:
+        snap = _snapshot
+        generation = _snapshot_generation
+        if (snap is not None and snap.generation == generation
+                and time.monotonic() - snap.built_at < PRICING_SNAPSHOT_TTL_SECONDS):
+            return snap
+        try:
+            snap = _build_pricing_snapshot(generation)
+        except (OperationalError, ProgrammingError):
+            # DB not ready or table missing -- use defaults
+            logger.exception("Could not load pricing tables, using default prices")
+            db.session.rollback()
+            return _make_snapshot(generation, {}, {}, SurgeZoneIndex())
+        _snapshot = snap
+        return snap
+
 
+def invalidate_pricing_snapshot():
+    """Drop the cached snapshot.  Call after committing any pricing write."""
+    global _snapshot_generation
+    with _snapshot_lock:
+        _snapshot_generation += 1
 
-def _get_minimum_job_price():
-    return float(_load_config("minimum_job_price", MINIMUM_JOB_PRICE))
 
+def apply_surge_zone_change(zone):
+    """Patch the cached snapshot's surge index after a single zone write.
 
-def _get_volume_discount_tiers():
+    Only the grid cells the zone covers (before and after the edit) are
+    recomputed; rules and config are left as they are.
+    """
+    global _snapshot
+    with _snapshot_lock:
+        snap = _snapshot
+        if snap is None or snap.generation != _snapshot_generation:
+            return  # Nothing cached -- the next estimate does a full build
+        if zone.is_active:
+            surge_index = snap.surge_index.with_zone(compile_zone(zone))
+        else:
+            surge_index = snap.surge_index.without_zone(zone.id)
+        _snapshot = snap._replace(
+            version=_snapshot_fingerprint(dict(snap.rules), dict(snap.config), surge_index),
+            surge_index=surge_index,
+        )
+
+
+# ============================================================================
+# Admin-overridable config accessors
+# ============================================================================
+def _get_minimum_job_price(snapshot=None):
+    return (snapshot or get_pricing_snapshot()).minimum_job_price
+
+
+def _get_volume_discount_tiers(snapshot=None):
     """Return volume discount tiers, preferring DB override."""
-    raw = _load_config("volume_discount_tiers", None)
-    if raw and isinstance(raw, list):
-        return [(t["min_qty"], t.get("max_qty"), t["discount_rate"]) for t in raw]
-    return VOLUME_DISCOUNT_TIERS
+    return (snapshot or get_pricing_snapshot()).volume_discount_tiers
 
 
-def _get_time_surge_rates():
+def _get_time_surge_rates(snapshot=None):
     """Return (same_day, next_day, weekend) surge rates."""
-    same_day = float(_load_config("same_day_surge", SAME_DAY_SURGE))
-    next_day = float(_load_config("next_day_surge", NEXT_DAY_SURGE))
-    weekend = float(_load_config("weekend_surge", WEEKEND_SURGE))
-    return same_day, next_day, weekend
+    snap = snapshot or get_pricing_snapshot()
+    return snap.same_day_surge, snap.next_day_surge, snap.weekend_surge
 
 
-def _get_service_fee_rate():
-    return float(_load_config("service_fee_rate", SERVICE_FEE_RATE))
+def _get_service_fee_rate(snapshot=None):
+    return (snapshot or get_pricing_snapshot()).service_fee_rate
 
 
 # ============================================================================
 # Helpers -- item pricing
 # ============================================================================
-def _get_item_price(category, size=None):
+def _get_item_price(category, size=None, snapshot=None):
     """Return the unit price for a (category, size) pair.
 
     Resolution order:
-      1. Active PricingRule in the database whose ``item_type`` matches
-         ``<category>:<size>`` (size-specific) or ``<category>`` (flat).
+      1. Active PricingRule (from the pricing snapshot) whose ``item_type``
+         matches ``<category>:<size>`` (size-specific) or ``<category>`` (flat).
       2. Hardcoded CATEGORY_PRICES dict (size-aware).
       3. FALLBACK_PRICES flat default.
     """
+    rules = (snapshot or get_pricing_snapshot()).rules
     cat_lower = (category or "other").lower()
     size_lower = (size or "").lower().strip()
 
     # --- Try DB rule (size-specific first, then flat category) ---
     if size_lower:
-        sized_key = "{}:{}".format(cat_lower, size_lower)
-        rule = PricingRule.query.filter(
-            PricingRule.item_type == sized_key,
-            PricingRule.is_active == True,
-        ).first()
-        if rule:
-            return rule.base_price
-
-    rule = PricingRule.query.filter(
-        PricingRule.item_type == cat_lower,
-        PricingRule.is_active == True,
-    ).first()
-    if rule:
-        return rule.base_price
+        price = rules.get("{}:{}".format(cat_lower, size_lower))
+        if price is not None:
+            return price
+
+    price = rules.get(cat_lower)
+    if price is not None:
+        return price
 
     # --- Hardcoded tier ---
     cat_prices = CATEGORY_PRICES.get(cat_lower)
@@ -198,12 +359,12 @@ def _get_item_price(category, size=None):
 # ============================================================================
 # Helpers -- volume discount
 # ============================================================================
-def _volume_discount_rate(total_quantity):
+def _volume_discount_rate(total_quantity, snapshot=None):
     """Return the discount rate based on total item quantity.
 
     Reads from admin-overridable config first, then falls back to defaults.
     """
-    tiers = _get_volume_discount_tiers()
+    tiers = _get_volume_discount_tiers(snapshot)
     for lo, hi, rate in tiers:
         if hi is None and total_quantity >= lo:
             return rate
@@ -212,9 +373,9 @@ def _volume_discount_rate(total_quantity):
     return 0.0
 
 
-def _volume_discount_label(total_quantity):
+def _volume_discount_label(total_quantity, snapshot=None):
     """Human-readable label for the discount tier that applies."""
-    rate = _volume_discount_rate(total_quantity)
+    rate = _volume_discount_rate(total_quantity, snapshot)
     if rate <= 0:
         return None
     pct = int(rate * 100)
@@ -222,34 +383,24 @@ def _volume_discount_label(total_quantity):
 
 
 # ============================================================================
-# Helpers -- zone-based surge (existing behaviour)
+# Helpers -- zone-based surge
 # ============================================================================
-def _active_surge_multiplier(lat=None, lng=None):
-    """Return the highest active surge multiplier that applies right now."""
-    now = datetime.now(timezone.utc)
-    current_day = now.weekday()
-    current_time = now.strftime("%H:%M")
-
-    zones = SurgeZone.query.filter_by(is_active=True).all()
-    max_surge = 1.0
-
-    for zone in zones:
-        if zone.days_of_week and current_day not in zone.days_of_week:
-            continue
-        if zone.start_time and current_time < zone.start_time:
-            continue
-        if zone.end_time and current_time > zone.end_time:
-            continue
-        if zone.surge_multiplier > max_surge:
-            max_surge = zone.surge_multiplier
+def _active_surge_multiplier(lat=None, lng=None, snapshot=None, now=None):
+    """Return the highest surge multiplier active right now at (lat, lng).
 
-    return max_surge
+    Zones with a boundary only apply inside it; zones without one apply
+    everywhere.  Without coordinates every active zone applies, as before
+    boundaries were honoured.
+    """
+    now = now or datetime.now(timezone.utc)
+    surge_index = (snapshot or get_pricing_snapshot()).surge_index
+    return surge_index.multiplier_at(lat, lng, now)
 
 
 # ============================================================================
 # Helpers -- time-based surge (new)
 # ============================================================================
-def _time_based_surge(scheduled_date_str):
+def _time_based_surge(scheduled_date_str, snapshot=None, now=None):
     """Compute additive surge percentage and a human-readable reason list
     based on the *scheduled pickup date* relative to today (UTC).
 
@@ -270,10 +421,10 @@ def _time_based_surge(scheduled_date_str):
     except (ValueError, TypeError):
         return 0.0, []
 
-    today = datetime.now(timezone.utc).date()
+    today = (now or datetime.now(timezone.utc)).date()
     delta_days = (sched - today).days
 
-    same_day_rate, next_day_rate, weekend_rate = _get_time_surge_rates()
+    same_day_rate, next_day_rate, weekend_rate = _get_time_surge_rates(snapshot)
 
     surge = 0.0
     reasons = []
@@ -332,6 +483,41 @@ def calculate_estimate(items, scheduled_date=None, lat=None, lng=None):
     -------
     dict with detailed pricing breakdown.
     """
+    return _price_cart(
+        items, scheduled_date, lat, lng,
+        get_pricing_snapshot(), datetime.now(timezone.utc), None,
+    )
+
+
+def calculate_estimates_batch(carts):
+    """Price many carts against a single snapshot and clock reading.
+
+    ``carts`` is a list of dicts with ``items`` and optional
+    ``scheduled_date``, ``lat`` and ``lng``.  Returns one breakdown per cart,
+    identical to what ``calculate_estimate`` would return for it.  Unit
+    prices, time surge and zone surge are resolved once per distinct key
+    across the whole batch.
+    """
+    snapshot = get_pricing_snapshot()
+    now = datetime.now(timezone.utc)
+    memo = {"price": {}, "time_surge": {}, "zone_surge": {}}
+    return [
+        _price_cart(
+            cart.get("items") or [], cart.get("scheduled_date"),
+            cart.get("lat"), cart.get("lng"), snapshot, now, memo,
+        )
+        for cart in carts
+    ]
+
+
+def _price_cart(items, scheduled_date, lat, lng, snapshot, now, memo):
+    """Shared implementation of ``calculate_estimate``.
+
+    ``memo`` is an optional dict of per-batch lookup caches; pass ``None``
+    for a one-off estimate.
+    """
+    price_memo = memo["price"] if memo is not None else None
+
     item_total = 0.0
     total_quantity = 0
     item_breakdown = []
@@ -343,7 +529,13 @@ def calculate_estimate(items, scheduled_date=None, lat=None, lng=None):
         if quantity <= 0:
             continue
 
-        unit_price = _get_item_price(category, size)
+        if price_memo is None:
+            unit_price = _get_item_price(category, size, snapshot)
+        else:
+            key = (category, size)
+            unit_price = price_memo.get(key)
+            if unit_price is None:
+                unit_price = price_memo[key] = _get_item_price(category, size, snapshot)
         line_total = unit_price * quantity
         item_total += line_total
         total_quantity += quantity
@@ -359,17 +551,30 @@ def calculate_estimate(items, scheduled_date=None, lat=None, lng=None):
         item_breakdown.append(line)
 
     # --- Volume discount ---
-    discount_rate = _volume_discount_rate(total_quantity)
+    discount_rate = _volume_discount_rate(total_quantity, snapshot)
     volume_discount = round(item_total * discount_rate, 2)
-    volume_discount_label = _volume_discount_label(total_quantity)
+    volume_discount_label = _volume_discount_label(total_quantity, snapshot)
 
     items_subtotal = round(item_total - volume_discount, 2)
 
     # --- Zone-based surge multiplier ---
-    zone_surge = _active_surge_multiplier(lat, lng)
+    if memo is None:
+        zone_surge = _active_surge_multiplier(lat, lng, snapshot, now)
+    else:
+        key = (lat, lng)
+        zone_surge = memo["zone_surge"].get(key)
+        if zone_surge is None:
+            zone_surge = memo["zone_surge"][key] = _active_surge_multiplier(lat, lng, snapshot, now)
 
     # --- Time-based surge ---
-    time_surge_pct, surge_reasons = _time_based_surge(scheduled_date)
+    if memo is None:
+        time_surge_pct, surge_reasons = _time_based_surge(scheduled_date, snapshot, now)
+    else:
+        key = scheduled_date if isinstance(scheduled_date, (str, type(None))) else str(scheduled_date)
+        cached = memo["time_surge"].get(key)
+        if cached is None:
+            cached = memo["time_surge"][key] = _time_based_surge(scheduled_date, snapshot, now)
+        time_surge_pct, surge_reasons = cached[0], list(cached[1])
 
     # Combined: zone multiplier is multiplicative, time surge is additive on top
     combined_multiplier = zone_surge * (1.0 + time_surge_pct)
@@ -381,11 +586,11 @@ def calculate_estimate(items, scheduled_date=None, lat=None, lng=None):
         surge_reasons.insert(0, "High-demand zone (x{})".format(round(zone_surge, 2)))
 
     # --- Service fee (admin-overridable) ---
-    fee_rate = _get_service_fee_rate()
+    fee_rate = _get_service_fee_rate(snapshot)
     service_fee = round(surged_subtotal * fee_rate, 2)
 
     # --- Total (with minimum floor, admin-overridable) ---
-    min_price = _get_minimum_job_price()
+    min_price = _get_minimum_job_price(snapshot)
     raw_total = round(surged_subtotal + service_fee, 2)
     total = max(raw_total, min_price)
     minimum_applied = total > raw_total
@@ -414,6 +619,115 @@ def calculate_estimate(items, scheduled_date=None, lat=None, lng=None):
     }
 
 
+# ============================================================================
+# Quote tokens
+# ============================================================================
+# Estimate endpoints return a signed, short-lived quote token that binds the
+# priced breakdown to the cart it was computed for and to the pricing
+# snapshot version.  Booking creation redeems it instead of re-pricing while
+# the token is fresh and pricing is unchanged; anything else falls back to
+# ``calculate_estimate``.
+QUOTE_TOKEN_TTL_SECONDS = int(os.environ.get("QUOTE_TOKEN_TTL_SECONDS", "900"))
+
+# Breakdown fields booking creation persists on the Job / Payment.
+QUOTE_FIELDS = ("base_price", "items_subtotal", "service_fee", "surge_multiplier", "total")
+
+
+def _quote_cart_key(items, scheduled_date, lat, lng):
+    """Normalise the pricing inputs so estimate and booking bodies compare equal."""
+    lines = []
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            quantity = int(item.get("quantity", 1))
+        except (TypeError, ValueError):
+            quantity = 1
+        lines.append([
+            str(item.get("category", "")).lower().strip(),
+            item.get("size") or None,
+            quantity,
+        ])
+    lines.sort(key=lambda line: (line[0], line[1] or "", line[2]))
+
+    if isinstance(scheduled_date, (datetime, date_type)):
+        scheduled_date = scheduled_date.strftime("%Y-%m-%d")
+    elif scheduled_date:
+        scheduled_date = str(scheduled_date)[:10]
+    else:
+        scheduled_date = None
+
+    coords = []
+    for value in (lat, lng):
+        try:
+            coords.append(round(float(value), 5) if value is not None else None)
+        except (TypeError, ValueError):
+            coords.append(None)
+
+    return [lines, scheduled_date, coords]
+
+
+def _quote_hash(cart_key, quote):
+    return hashlib.sha256(json.dumps(
+        [cart_key, [quote[f] for f in QUOTE_FIELDS]], sort_keys=True,
+    ).encode("utf-8")).hexdigest()[:32]
+
+
+def quote_estimate(items, scheduled_date=None, lat=None, lng=None):
+    """Price a cart like ``calculate_estimate`` and issue a quote token for it.
+
+    Returns ``(breakdown, quote_token)``.  The token is signed with the app's
+    SECRET_KEY and pinned to the snapshot the breakdown was priced against.
+    """
+    import jwt
+    from flask import current_app
+
+    snapshot = get_pricing_snapshot()
+    result = _price_cart(items, scheduled_date, lat, lng, snapshot, datetime.now(timezone.utc), None)
+
+    quote = {f: result[f] for f in QUOTE_FIELDS}
+    issued_at = datetime.now(timezone.utc)
+    token = jwt.encode({
+        "typ": "quote",
+        "v": snapshot.version,
+        "h": _quote_hash(_quote_cart_key(items, scheduled_date, lat, lng), quote),
+        "q": quote,
+        "iat": issued_at,
+        "exp": issued_at + timedelta(seconds=QUOTE_TOKEN_TTL_SECONDS),
+    }, current_app.config["SECRET_KEY"], algorithm="HS256")
+    return result, token
+
+
+def redeem_quote_token(token, items, scheduled_date=None, lat=None, lng=None):
+    """Return the quoted price fields if *token* is still good for this cart.
+
+    The token must have a valid signature, be unexpired, match the cart
+    being booked and carry the current pricing snapshot version.  Returns
+    ``None`` otherwise so the caller re-prices with ``calculate_estimate``.
+    """
+    if not token or not isinstance(token, str):
+        return None
+
+    import jwt
+    from flask import current_app
+
+    try:
+        payload = jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"])
+    except jwt.InvalidTokenError:
+        return None
+
+    quote = payload.get("q")
+    if payload.get("typ") != "quote" or not isinstance(quote, dict):
+        return None
+    if any(f not in quote for f in QUOTE_FIELDS):
+        return None
+    if payload.get("v") != get_pricing_snapshot().version:
+        return None
+    if payload.get("h") != _quote_hash(_quote_cart_key(items, scheduled_date, lat, lng), quote):
+        return None
+    return {f: quote[f] for f in QUOTE_FIELDS}
+
+
 def _haversine(lat1, lng1, lat2, lng2):
     """Return distance in kilometres between two GPS points."""
     lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
@@ -451,7 +765,7 @@ def estimate():
 
     scheduled_date = data.get("scheduledDate") or data.get("scheduled_date")
 
-    result = calculate_estimate(items, scheduled_date=scheduled_date, lat=lat, lng=lng)
+    result, quote_token = quote_estimate(items, scheduled_date=scheduled_date, lat=lat, lng=lng)
 
     if result["total_quantity"] == 0:
         return jsonify({"error": "At least one item with a valid category is required"}), 400
@@ -459,6 +773,7 @@ def estimate():
     return jsonify({
         "success": True,
         "estimate": result,
+        "quote_token": quote_token,
     }), 200
 
 
@@ -481,6 +796,7 @@ def create_booking(user_id):
         scheduled_time: str (HH:MM)
         notes: str (optional)
         estimated_price: float
+        quote_token: str (optional, from POST /estimate -- skips re-pricing)
     """
     data = request.get_json()
     if not data:
@@ -549,8 +865,13 @@ def create_booking(user_id):
     photos = data.get("photos", [])
     notes = data.get("notes", "")
 
-    # --- Re-calculate pricing with the v2 engine ---
-    est = calculate_estimate(items, scheduled_date=scheduled_date, lat=lat, lng=lng)
+    # --- Reuse the quoted price, or re-calculate with the v2 engine ---
+    est = redeem_quote_token(
+        data.get("quote_token") or data.get("quoteToken"),
+        items, scheduled_date=scheduled_date, lat=lat, lng=lng,
+    )
+    if est is None:
+        est = calculate_estimate(items, scheduled_date=scheduled_date, lat=lat, lng=lng)
 
     total = est["total"]
     service_fee = est["service_fee"]
@@ -701,22 +1022,14 @@ def _notify_nearby_contractors(job):
     # Lazy imports to avoid circular dependencies
     from socket_events import notify_nearby_drivers
     from notifications import send_push_notification
+    from driver_index import driver_index
 
     if job.lat is None or job.lng is None:
         # No location -- notify all online contractors
-        contractors = Contractor.query.filter_by(
-            is_online=True, approval_status="approved"
-        ).all()
+        contractors = driver_index.drivers()
     else:
-        contractors = Contractor.query.filter_by(
-            is_online=True, approval_status="approved"
-        ).all()
         contractors = [
-            c for c in contractors
-            if c.current_lat is not None
-            and c.current_lng is not None
-            and _haversine(job.lat, job.lng, c.current_lat, c.current_lng)
-            <= NEARBY_CONTRACTOR_RADIUS_KM
+            d for _dist, d in driver_index.within(job.lat, job.lng, NEARBY_CONTRACTOR_RADIUS_KM)
         ]
 
     # Broadcast Socket.IO event to all nearby drivers (once)
@@ -10,8 +10,9 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from datetime import datetime, timezone
 
-from models import db, Job, User, Contractor, ChatMessage, generate_uuid, utcnow
+from models import db, Job, User, Contractor, ChatMessage
 from auth_routes import require_auth
+from chat_pipeline import chat_pipeline, message_payload
 
 chat_bp = Blueprint("chat", __name__, url_prefix="/api/jobs")
 
@@ -94,24 +95,13 @@ def send_message(user_id, job_id):
     if len(text) > 2000:
         return jsonify({"error": "Message must be 2000 characters or fewer"}), 400
 
-    msg = ChatMessage(
-        id=generate_uuid(),
-        job_id=job_id,
-        sender_id=user_id,
-        sender_role=role,
-        message=text,
-    )
-    db.session.add(msg)
-    db.session.commit()
-
-    msg_dict = msg.to_dict()
-
-    # Broadcast via Socket.IO to the job room
+    # Committed with the next chat group commit, which also broadcasts it
+    # to the job room
     try:
-        from socket_events import socketio
-        socketio.emit("chat:message", msg_dict, room=job_id)
-    except Exception:
-        pass  # Socket broadcast is best-effort
+        msg = chat_pipeline.send(job_id, user_id, role, text, client_id=data.get("client_id")).wait()
+    except RuntimeError:
+        return jsonify({"error": "Failed to save message"}), 500
+    msg_dict = message_payload(msg)
 
     return jsonify({"success": True, "message": msg_dict}), 201
 
@@ -131,29 +121,12 @@ def mark_messages_read(user_id, job_id):
     if role is None:
         return jsonify({"error": "You do not have access to this job's chat"}), 403
 
-    # Mark messages from the OTHER sender as read
-    other_role = "driver" if role == "customer" else "customer"
-    now = utcnow()
-
-    updated = (
-        ChatMessage.query
-        .filter_by(job_id=job_id, sender_role=other_role)
-        .filter(ChatMessage.read_at.is_(None))
-        .update({"read_at": now})
-    )
-    db.session.commit()
-
-    # Notify the other party via Socket.IO
+    # Marks messages from the OTHER sender as read and notifies the job room
+    write = chat_pipeline.mark_read(job_id, role)
     try:
-        from socket_events import socketio
-        socketio.emit("chat:read", {
-            "job_id": job_id,
-            "read_by": role,
-            "read_at": now.isoformat(),
-            "count": updated,
-        }, room=job_id)
-    except Exception:
-        pass
+        updated = write.wait() if write is not None else 0
+    except RuntimeError:
+        return jsonify({"error": "Failed to mark messages read"}), 500
 
     return jsonify({"success": True, "marked_read": updated}), 200
 
@@ -4,7 +4,7 @@ Handles contractor registration, availability, location, and job management.
 """
 
 from flask import Blueprint, request, jsonify, current_app
-from datetime import datetime, timezone
+from datetime import datetime, timezone, timedelta
 from math import radians, cos, sin, asin, sqrt
 import logging
 
@@ -14,6 +14,16 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from models import db, User, Contractor, Job, Notification, OperatorInvite, Referral, generate_uuid, utcnow
 from auth_routes import require_auth
+from driver_index import driver_index
+from offers import offer_manager
+from eta_engine import eta_engine
+from location_buffer import location_buffer
+from location_history import location_history
+from live_map import live_map
+from location_rate import location_rate
+from geo_rooms import geo_rooms
+from geo_search import open_jobs_page
+from dispatch import claim_job
 
 drivers_bp = Blueprint("drivers", __name__, url_prefix="/api/drivers")
 
@@ -22,6 +32,13 @@ logger = logging.getLogger(__name__)
 EARTH_RADIUS_KM = 6371.0
 DEFAULT_SEARCH_RADIUS_KM = 30.0
 
+# Statuses a job can be accepted from (an offered job included).
+ACCEPTABLE_JOB_STATUSES = ("pending", "confirmed", "assigned")
+
+# Page size of the available-jobs feed.
+FEED_DEFAULT_LIMIT = 50
+FEED_MAX_LIMIT = 100
+
 
 def _haversine(lat1, lng1, lat2, lng2):
     """Return distance in kilometres between two GPS points."""
@@ -123,7 +140,14 @@ def update_availability(user_id):
         contractor.availability_schedule = data["availability_schedule"]
 
     db.session.commit()
-    return jsonify({"success": True, "contractor": contractor.to_dict()}), 200
+    driver_index.upsert(contractor)
+    geo_rooms.update(contractor.id)
+    location_rate.refresh(contractor.id)
+    return jsonify({
+        "success": True,
+        "contractor": contractor.to_dict(),
+        "location_rate": location_rate.directive(contractor.id),
+    }), 200
 
 
 @drivers_bp.route("/location", methods=["PUT"])
@@ -141,20 +165,44 @@ def update_location(user_id):
     if lat is None or lng is None:
         return jsonify({"error": "lat and lng are required"}), 400
 
+    if not location_rate.allow(contractor.id, "rest"):
+        # Faster than this driver's rate: acknowledged, not applied
+        return jsonify({
+            "success": True,
+            "accepted": False,
+            "lat": lat,
+            "lng": lng,
+            "location_rate": location_rate.directive(contractor.id),
+        }), 200
+
     try:
-        contractor.current_lat = float(lat)
-        contractor.current_lng = float(lng)
-    except (TypeError, ValueError):
+        lat, lng = location_buffer.record(contractor.id, lat, lng)
+    except ValueError:
         return jsonify({"error": "lat and lng must be numbers"}), 400
 
-    db.session.commit()
-    return jsonify({"success": True, "lat": contractor.current_lat, "lng": contractor.current_lng}), 200
+    driver_index.update_location(contractor.id, lat, lng)
+    geo_rooms.update(contractor.id, lat, lng)
+    eta_engine.observe(contractor.id, lat, lng)
+    location_history.append(contractor.id, lat, lng)
+    live_map.note(contractor.id, lat, lng)
+    return jsonify({
+        "success": True,
+        "accepted": True,
+        "lat": lat,
+        "lng": lng,
+        "location_rate": location_rate.directive(contractor.id),
+    }), 200
 
 
 @drivers_bp.route("/jobs/available", methods=["GET"])
 @require_auth
 def get_available_jobs(user_id):
-    """Return pending jobs near the contractor current location."""
+    """Return open jobs near the contractor, nearest first, one page at a time.
+
+    Query params: radius (km), limit (max FEED_MAX_LIMIT), cursor (from the
+    previous page's next_cursor).  The first page also lists the jobs
+    already assigned to this contractor.
+    """
     contractor = Contractor.query.filter_by(user_id=user_id).first()
     if not contractor:
         return jsonify({"error": "Contractor profile not found"}), 404
@@ -162,35 +210,46 @@ def get_available_jobs(user_id):
     if contractor.approval_status != "approved":
         return jsonify({"error": "Contractor is not approved"}), 403
 
-    radius_km = float(request.args.get("radius", DEFAULT_SEARCH_RADIUS_KM))
-
-    # Include pending jobs + jobs already assigned to this contractor
-    pending_jobs = Job.query.filter(
-        db.or_(
-            Job.status.in_(["pending", "confirmed"]),
-            db.and_(
-                Job.driver_id == contractor.id,
-                Job.status.in_(["assigned", "accepted", "en_route", "arrived", "started"]),
-            ),
-        )
-    ).all()
-
-    nearby = []
-    for job in pending_jobs:
-        if job.lat is not None and job.lng is not None and contractor.current_lat is not None and contractor.current_lng is not None:
-            dist = _haversine(contractor.current_lat, contractor.current_lng, job.lat, job.lng)
-            if dist <= radius_km:
-                job_data = job.to_dict()
-                job_data["distance_km"] = round(dist, 2)
-                nearby.append(job_data)
-        else:
-            job_data = job.to_dict()
-            job_data["distance_km"] = None
-            nearby.append(job_data)
-
-    nearby.sort(key=lambda j: j["distance_km"] if j["distance_km"] is not None else float("inf"))
+    try:
+        radius_km = float(request.args.get("radius", DEFAULT_SEARCH_RADIUS_KM))
+        limit = min(max(int(request.args.get("limit", FEED_DEFAULT_LIMIT)), 1), FEED_MAX_LIMIT)
+    except (TypeError, ValueError):
+        return jsonify({"error": "radius and limit must be numbers"}), 400
+    cursor = request.args.get("cursor") or None
 
-    return jsonify({"success": True, "jobs": nearby}), 200
+    lat, lng = contractor.current_lat, contractor.current_lng
+    try:
+        hits, next_cursor = open_jobs_page(db.session, lat, lng, radius_km, limit, cursor)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    jobs_by_id = {}
+    if hits:
+        jobs_by_id = {j.id: j for j in Job.query.filter(Job.id.in_([job_id for job_id, _d in hits]))}
+
+    # The contractor's own jobs head the first page
+    own = []
+    if cursor is None:
+        own = Job.query.filter(
+            Job.driver_id == contractor.id,
+            Job.status.in_(["assigned", "accepted", "en_route", "arrived", "started"]),
+        ).all()
+
+    feed = []
+    for job in own:
+        job_data = job.to_dict()
+        located = None not in (lat, lng, job.lat, job.lng)
+        job_data["distance_km"] = round(_haversine(lat, lng, job.lat, job.lng), 2) if located else None
+        feed.append(job_data)
+    for job_id, dist in hits:
+        job = jobs_by_id.get(job_id)
+        if job is None:
+            continue
+        job_data = job.to_dict()
+        job_data["distance_km"] = round(dist, 2) if dist is not None else None
+        feed.append(job_data)
+
+    return jsonify({"success": True, "jobs": feed, "next_cursor": next_cursor}), 200
 
 
 @drivers_bp.route("/jobs/current", methods=["GET"])
@@ -212,6 +271,110 @@ def get_current_job(user_id):
     return jsonify({"success": True, "job": active_job.to_dict()}), 200
 
 
+# Jobs on a driver's route; the in-progress ones are pinned to the front.
+ROUTE_JOB_STATUSES = ("assigned", "accepted", "en_route", "arrived", "started")
+ROUTE_PINNED_STATUSES = ("started", "arrived", "en_route")
+
+# Departure time for days with no booked slots.
+ROUTE_DAY_START_HOUR = 8
+
+
+def _naive_utc(dt):
+    if dt is not None and dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+@drivers_bp.route("/route", methods=["GET"])
+@require_auth
+def get_route(user_id):
+    """Order the driver's jobs for a day into an efficient tour.
+
+    Query params: date (YYYY-MM-DD, default today).  Returns the stops in
+    visiting order with ETAs and leg distances, plus the total distance.
+    """
+    from route_planner import (
+        Stop, plan_route, route_cache, ARRIVAL_WINDOW_MINUTES,
+    )
+
+    contractor = Contractor.query.filter_by(user_id=user_id).first()
+    if not contractor:
+        return jsonify({"error": "Contractor profile not found"}), 404
+
+    now = _naive_utc(utcnow())
+    date_str = request.args.get("date")
+    try:
+        day = datetime.strptime(date_str, "%Y-%m-%d") if date_str else now.replace(
+            hour=0, minute=0, second=0, microsecond=0)
+    except ValueError:
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+
+    jobs = Job.query.filter(
+        Job.driver_id == contractor.id,
+        Job.status.in_(ROUTE_JOB_STATUSES),
+        Job.scheduled_at >= day,
+        Job.scheduled_at < day + timedelta(days=1),
+    ).order_by(Job.scheduled_at, Job.id).all()
+
+    routable = [j for j in jobs if j.lat is not None and j.lng is not None]
+    window = timedelta(minutes=ARRIVAL_WINDOW_MINUTES)
+    stops = []
+    for j in routable:
+        start = _naive_utc(j.scheduled_at)
+        stops.append(Stop(j.id, j.lat, j.lng, start, start + window if start else None))
+    pinned = [
+        j.id for status in ROUTE_PINNED_STATUSES for j in routable if j.status == status
+    ]
+
+    if contractor.current_lat is not None and contractor.current_lng is not None:
+        start_point = (contractor.current_lat, contractor.current_lng)
+    else:
+        start_point = None
+    opens = [s.window_start for s in stops if s.window_start is not None]
+    day_start = min(opens) if opens else day.replace(hour=ROUTE_DAY_START_HOUR)
+    depart_at = max(now, day_start)
+
+    # Re-solve only when the job set changes; ETAs always use the current
+    # clock and position.
+    signature = tuple((s.id, s.lat, s.lng, s.window_start, j.status) for s, j in zip(stops, routable))
+    cache_key = (contractor.id, day.date())
+    order = route_cache.get(cache_key, signature)
+    cached = order is not None
+    order, legs, total_km, late_minutes = plan_route(
+        stops, start=start_point, depart_at=depart_at, pinned=pinned, order=order,
+    )
+    if not cached:
+        route_cache.put(cache_key, signature, order)
+
+    by_id = {j.id: j for j in routable}
+    route = []
+    for position, leg in enumerate(legs, start=1):
+        j = by_id[leg.stop.id]
+        route.append({
+            "position": position,
+            "job_id": j.id,
+            "status": j.status,
+            "address": j.address,
+            "lat": j.lat,
+            "lng": j.lng,
+            "window_start": leg.stop.window_start.isoformat() if leg.stop.window_start else None,
+            "window_end": leg.stop.window_end.isoformat() if leg.stop.window_end else None,
+            "eta": leg.eta.isoformat(),
+            "leg_distance_km": round(leg.distance_km, 2),
+            "late_minutes": round(leg.late_minutes, 1),
+        })
+
+    return jsonify({
+        "success": True,
+        "date": day.strftime("%Y-%m-%d"),
+        "stops": route,
+        "unrouted_job_ids": [j.id for j in jobs if j.lat is None or j.lng is None],
+        "total_distance_km": round(total_km, 2),
+        "late_minutes": round(late_minutes, 1),
+        "cached": cached,
+    }), 200
+
+
 @drivers_bp.route("/jobs/<job_id>/accept", methods=["POST"])
 @require_auth
 def accept_job(user_id, job_id):
@@ -231,16 +394,15 @@ def accept_job(user_id, job_id):
             "active_job_id": active_job.id
         }), 409
 
-    job = db.session.get(Job, job_id)
-    if not job:
-        return jsonify({"error": "Job not found"}), 404
-
-    if job.status not in ("pending", "confirmed", "assigned"):
+    # One conditional UPDATE claims the job: when several drivers accept the
+    # same broadcast, exactly one of them changes the row.
+    if not claim_job(job_id, ACCEPTABLE_JOB_STATUSES, {"driver_id": contractor.id, "status": "accepted"}):
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
         return jsonify({"error": "Job cannot be accepted (current status: {})".format(job.status)}), 409
-
-    job.driver_id = contractor.id
-    job.status = "accepted"
-    job.updated_at = utcnow()
+    job = db.session.get(Job, job_id)
 
     notification = Notification(
         id=generate_uuid(),
@@ -252,6 +414,8 @@ def accept_job(user_id, job_id):
     )
     db.session.add(notification)
     db.session.commit()
+    driver_index.note_job(job)
+    offer_manager.accepted(job.id, contractor.id)
 
     # Send APNs push + email to customer
     try:
@@ -275,7 +439,7 @@ def accept_job(user_id, job_id):
 
     # Broadcast via SocketIO
     from socket_events import broadcast_job_accepted, socketio
-    broadcast_job_accepted(job.id, contractor.id)
+    broadcast_job_accepted(job.id, contractor.id, job.lat, job.lng)
 
     # Also notify the customer's job room
     socketio.emit("job:driver-assigned", {
@@ -300,29 +464,28 @@ def decline_job(user_id, job_id):
     if not contractor:
         return jsonify({"error": "Contractor profile not found"}), 404
 
-    job = db.session.get(Job, job_id)
-    if not job:
-        return jsonify({"error": "Job not found"}), 404
-
-    if job.driver_id != contractor.id:
-        return jsonify({"error": "Job is not assigned to you"}), 403
-
-    if job.status not in ("assigned", "accepted"):
+    # Unassign driver, revert to confirmed -- only if the job is still ours
+    if not claim_job(job_id, ("assigned", "accepted"), {"driver_id": None, "status": "confirmed"},
+                     driver_id=contractor.id):
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        if job.driver_id != contractor.id:
+            return jsonify({"error": "Job is not assigned to you"}), 403
         return jsonify({"error": "Cannot decline job in status: {}".format(job.status)}), 409
-
-    # Unassign driver, revert to confirmed
-    job.driver_id = None
-    job.status = "confirmed"
-    job.updated_at = utcnow()
     db.session.commit()
+    job = db.session.get(Job, job_id)
+    driver_index.note_job(job)
+    offer_manager.declined(job.id, contractor.id)
 
-    # Re-run auto-assignment to find another driver
+    # Offer the job to the next driver
     from routes.payments import _auto_assign_driver
     _auto_assign_driver(job)
     db.session.commit()
 
     from socket_events import broadcast_job_status
-    broadcast_job_status(job.id, job.status)
+    broadcast_job_status(job.id, job.status, job=job)
 
     return jsonify({"success": True, "job": job.to_dict()}), 200
 
@@ -419,6 +582,7 @@ def update_job_status(user_id, job_id):
     )
     db.session.add(notification)
     db.session.commit()
+    driver_index.note_job(job)
 
     # --- Email / SMS / Push notifications for key status changes ---
     driver_name = contractor.user.name if contractor.user else None
@@ -434,7 +598,13 @@ def update_job_status(user_id, job_id):
             # Email + SMS customer, push to customer
             if customer:
                 if customer.email:
-                    send_driver_en_route_email(customer.email, customer.name, driver_name, job.address)
+                    eta = eta_engine.eta_minutes(
+                        (contractor.current_lat, contractor.current_lng), (job.lat, job.lng)
+                    )
+                    send_driver_en_route_email(
+                        customer.email, customer.name, driver_name, job.address,
+                        eta_minutes=round(eta) if eta is not None else None,
+                    )
                 if customer.phone:
                     send_driver_en_route_sms(customer.phone, driver_name, job.address)
                 send_push_notification(
@@ -498,7 +668,7 @@ def update_job_status(user_id, job_id):
 
     # Broadcast via SocketIO
     from socket_events import broadcast_job_status
-    broadcast_job_status(job.id, new_status)
+    broadcast_job_status(job.id, new_status, job=job)
 
     return jsonify({"success": True, "job": job.to_dict()}), 200
 
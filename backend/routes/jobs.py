@@ -14,6 +14,7 @@ from werkzeug.utils import secure_filename
 from models import db, Job, Contractor, Rating, Payment, User, Notification, generate_uuid, utcnow
 from auth_routes import require_auth
 from notifications import send_push_notification
+from driver_index import driver_index
 
 jobs_bp = Blueprint("jobs", __name__, url_prefix="/api/jobs")
 
@@ -274,6 +275,7 @@ def cancel_job(user_id, job_id):
     db.session.add(customer_notif)
 
     db.session.commit()
+    driver_index.note_job(job)
 
     # --- Send cancellation email to customer ---
     try:
@@ -739,6 +741,7 @@ def decline_volume_adjustment(user_id, job_id):
     job.updated_at = utcnow()
 
     db.session.commit()
+    driver_index.note_job(job)
 
     # Emit socket event to driver
     try:
@@ -17,6 +17,9 @@ from models import (
     generate_uuid, utcnow,
 )
 from auth_routes import require_auth
+from driver_index import driver_index
+from dispatch import claim_job
+import socket_payloads
 
 operator_bp = Blueprint("operator", __name__, url_prefix="/api/operator")
 
@@ -244,10 +247,13 @@ def delegate_job(user_id, operator, job_id):
     if contractor.approval_status != "approved":
         return jsonify({"error": "Contractor is not approved"}), 403
 
-    job.driver_id = contractor.id
-    job.status = "assigned"
-    job.delegated_at = utcnow()
-    job.updated_at = utcnow()
+    # Conditional UPDATE: a second delegation (or a cancel) that got in
+    # first leaves the job alone
+    if not claim_job(job_id, ("delegating",),
+                     {"driver_id": contractor.id, "status": "assigned", "delegated_at": utcnow()},
+                     operator_id=operator.id):
+        db.session.rollback()
+        return jsonify({"error": "Job is not in delegating status"}), 409
 
     # Notify the fleet contractor
     notification = Notification(
@@ -271,6 +277,7 @@ def delegate_job(user_id, operator, job_id):
     )
     db.session.add(notification_cust)
     db.session.commit()
+    driver_index.note_job(job)
 
     # --- Email / SMS / Push notifications ---
     driver_name = contractor.user.name if contractor.user else None
@@ -296,13 +303,10 @@ def delegate_job(user_id, operator, job_id):
 
     # Broadcast via SocketIO
     from socket_events import broadcast_job_status, socketio
-    broadcast_job_status(job.id, "assigned", {"driver_id": contractor.id})
+    broadcast_job_status(job.id, "assigned", {"driver_id": contractor.id}, job=job)
 
-    socketio.emit("job:assigned", {
-        "job_id": job.id,
-        "contractor_id": contractor.id,
-        "contractor_name": contractor.user.name if contractor.user else None,
-    }, room="driver:{}".format(contractor.id))
+    socketio.emit("job:assigned", socket_payloads.job_assigned(job, contractor),
+                  room="driver:{}".format(contractor.id))
 
     return jsonify({"success": True, "job": job.to_dict()}), 200
 
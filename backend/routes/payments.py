@@ -13,6 +13,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models import db, Job, Payment, Contractor, User, Notification, generate_uuid, utcnow
 from auth_routes import require_auth
 from extensions import limiter
+import socket_payloads
 
 payments_bp = Blueprint("payments", __name__, url_prefix="/api/payments")
 
@@ -336,7 +337,7 @@ def confirm_simple_payment():
 
         # Broadcast status update via SocketIO
         from socket_events import broadcast_job_status
-        broadcast_job_status(job.id, job.status)
+        broadcast_job_status(job.id, job.status, job=job)
 
     db.session.commit()
 
@@ -758,116 +759,96 @@ def _handle_payment_succeeded(intent):
 
         # Broadcast status update via SocketIO
         from socket_events import broadcast_job_status
-        broadcast_job_status(job.id, job.status)
+        broadcast_job_status(job.id, job.status, job=job)
 
     db.session.commit()
 
 
 def _auto_assign_driver(job):
-    """Find the nearest online approved contractor and assign the job."""
-    from math import radians, cos, sin, asin, sqrt
+    """Offer the job to the nearest available contractor.
 
-    EARTH_RADIUS_KM = 6371.0
-    AUTO_ASSIGN_RADIUS_KM = 50.0
+    Drivers who already declined or let an offer for this job lapse are
+    skipped, and after OFFER_MAX_ATTEMPTS of them the job is left for an
+    admin.  In batched dispatch mode the job is left for the next dispatch
+    window.
+    """
+    from dispatch import rank_candidates, batched_dispatch_enabled
+    from offers import offer_manager
 
-    def haversine(lat1, lng1, lat2, lng2):
-        lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
-        dlat = lat2 - lat1
-        dlng = lng2 - lng1
-        a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
-        return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+    if offer_manager.given_up(job.id):
+        return
+    if offer_manager.exhausted(job.id):
+        # Too many drivers passed on it -- leave it confirmed for an admin
+        offer_manager.give_up(job.id)
+        return
 
-    query = Contractor.query.filter_by(
-        is_online=True, approval_status="approved", is_operator=False
-    )
+    if batched_dispatch_enabled():
+        return
 
-    # If job belongs to an operator, only assign to that operator's fleet
-    if job.operator_id:
-        query = query.filter_by(operator_id=job.operator_id)
-    else:
-        # Only independent contractors (not in any fleet)
-        query = query.filter(Contractor.operator_id.is_(None))
+    # One query confirms the index's nearest picks and drops busy drivers
+    candidates = rank_candidates(job, limit=1, exclude=offer_manager.tried(job.id))
+    if not candidates:
+        return
 
-    contractors = query.all()
+    best = candidates[0]
+    _assign_driver(job, best.contractor)
+    _announce_assignment(job, best.contractor)
+    offer_manager.open(job, best.contractor, best.distance_km)
 
-    if not contractors:
-        return
 
-    # If job has location, sort by distance; otherwise pick first available
-    best = None
-    best_dist = float("inf")
-
-    for c in contractors:
-        # Skip contractors already handling active jobs
-        active = Job.query.filter(
-            Job.driver_id == c.id,
-            Job.status.in_(["accepted", "en_route", "arrived", "started"]),
-        ).first()
-        if active:
-            continue
-
-        if job.lat is not None and job.lng is not None and c.current_lat is not None and c.current_lng is not None:
-            dist = haversine(job.lat, job.lng, c.current_lat, c.current_lng)
-            if dist <= AUTO_ASSIGN_RADIUS_KM and dist < best_dist:
-                best = c
-                best_dist = dist
-        elif best is None:
-            best = c
-
-    if best:
-        job.driver_id = best.id
-        job.status = "assigned"
-        job.updated_at = utcnow()
+def _assign_driver(job, contractor):
+    """Assign *job* to *contractor* and queue the in-app notifications
+    (uncommitted)."""
+    job.driver_id = contractor.id
+    job.status = "assigned"
+    job.updated_at = utcnow()
 
-        # Notify driver
-        notification = Notification(
-            id=generate_uuid(),
-            user_id=best.user_id,
-            type="job_assigned",
-            title="New Job Assigned",
-            body="You've been assigned a job at {}.".format(job.address or "an address"),
-            data={"job_id": job.id, "address": job.address, "total_price": job.total_price},
-        )
-        db.session.add(notification)
+    # Notify driver
+    notification = Notification(
+        id=generate_uuid(),
+        user_id=contractor.user_id,
+        type="job_assigned",
+        title="New Job Assigned",
+        body="You've been assigned a job at {}.".format(job.address or "an address"),
+        data={"job_id": job.id, "address": job.address, "total_price": job.total_price},
+    )
+    db.session.add(notification)
 
-        # Notify customer
-        notification_cust = Notification(
-            id=generate_uuid(),
-            user_id=job.customer_id,
-            type="job_update",
-            title="Driver Assigned",
-            body="A driver has been assigned to your job.",
-            data={"job_id": job.id, "status": "assigned"},
-        )
-        db.session.add(notification_cust)
+    # Notify customer
+    notification_cust = Notification(
+        id=generate_uuid(),
+        user_id=job.customer_id,
+        type="job_update",
+        title="Driver Assigned",
+        body="A driver has been assigned to your job.",
+        data={"job_id": job.id, "status": "assigned"},
+    )
+    db.session.add(notification_cust)
 
-        # Email customer about driver assignment
-        try:
-            customer = db.session.get(User, job.customer_id)
-            if customer and customer.email:
-                from notifications import send_driver_assigned_email
-                send_driver_assigned_email(
-                    customer.email, customer.name,
-                    best.user.name if best.user else "Your driver",
-                    job.address,
-                    truck_type=best.truck_type,
-                )
-        except Exception:
-            pass  # Notifications must never block the main flow
-
-        # Emit SocketIO events
-        from socket_events import socketio
-        socketio.emit("job:assigned", {
-            "job_id": job.id,
-            "contractor_id": best.id,
-            "contractor_name": best.user.name if best.user else None,
-        }, room="driver:{}".format(best.id))
-
-        socketio.emit("job:status", {
-            "job_id": job.id,
-            "status": "assigned",
-            "driver_id": best.id,
-        }, room=job.id)
+
+def _announce_assignment(job, contractor):
+    """Email the customer and push the assignment over SocketIO."""
+    # Email customer about driver assignment
+    try:
+        customer = db.session.get(User, job.customer_id)
+        if customer and customer.email:
+            from notifications import send_driver_assigned_email
+            send_driver_assigned_email(
+                customer.email, customer.name,
+                contractor.user.name if contractor.user else "Your driver",
+                job.address,
+                truck_type=contractor.truck_type,
+            )
+    except Exception:
+        pass  # Notifications must never block the main flow
+
+    # Emit SocketIO events
+    from socket_events import socketio
+    socketio.emit("job:assigned", socket_payloads.job_assigned(job, contractor),
+                  room="driver:{}".format(contractor.id))
+
+    socketio.emit("job:status", socket_payloads.job_status(job.id, "assigned", {"driver_id": contractor.id}, job=job),
+                  room=job.id)
 
 
 def _handle_payment_failed(intent):
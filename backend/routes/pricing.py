@@ -13,7 +13,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from models import db, PricingRule, SurgeZone
 from routes.booking import (
-    calculate_estimate,
+    calculate_estimates_batch,
+    quote_estimate,
     CATEGORY_PRICES,
     VOLUME_DISCOUNT_TIERS,
     MINIMUM_JOB_PRICE,
@@ -25,28 +26,14 @@ from routes.booking import (
 pricing_bp = Blueprint("pricing", __name__, url_prefix="/api/pricing")
 
 COMMISSION_RATE = 0.20
+MAX_BATCH_CARTS = 1000
 
 
-@pricing_bp.route("/estimate", methods=["POST"])
-def get_estimate():
-    """
-    Calculate a price estimate using the v2 pricing engine.
+def _parse_estimate_request(data):
+    """Normalise a v2 or legacy estimate body into calculate_estimate args.
 
-    Body JSON (v2 format -- preferred):
-        items: [ { category: str, quantity: int, size?: str }, ... ]
-        scheduledDate: str (ISO date)
-        address: { lat: float, lng: float }
-
-    Body JSON (legacy format -- still supported):
-        items: list of str (item-type names)
-        volume: float (cubic yards)
-        lat: float
-        lng: float
-
-    Returns the full v2 breakdown.
+    Returns ``(items, scheduled_date, lat, lng)``.
     """
-    data = request.get_json() or {}
-
     # --- Detect format: v2 (list of dicts) vs legacy (list of strings) ---
     raw_items = data.get("items", [])
 
@@ -67,11 +54,86 @@ def get_estimate():
     lng = address.get("lng") or data.get("lng")
     scheduled_date = data.get("scheduledDate") or data.get("scheduled_date")
 
-    result = calculate_estimate(items, scheduled_date=scheduled_date, lat=lat, lng=lng)
+    return items, scheduled_date, lat, lng
+
+
+@pricing_bp.route("/estimate", methods=["POST"])
+def get_estimate():
+    """
+    Calculate a price estimate using the v2 pricing engine.
+
+    Body JSON (v2 format -- preferred):
+        items: [ { category: str, quantity: int, size?: str }, ... ]
+        scheduledDate: str (ISO date)
+        address: { lat: float, lng: float }
+
+    Body JSON (legacy format -- still supported):
+        items: list of str (item-type names)
+        volume: float (cubic yards)
+        lat: float
+        lng: float
+
+    Returns the full v2 breakdown plus a ``quote_token`` that booking
+    creation accepts in place of re-pricing.
+    """
+    data = request.get_json() or {}
+
+    items, scheduled_date, lat, lng = _parse_estimate_request(data)
+
+    result, quote_token = quote_estimate(items, scheduled_date=scheduled_date, lat=lat, lng=lng)
 
     return jsonify({
         "success": True,
         "estimate": result,
+        "quote_token": quote_token,
+    }), 200
+
+
+@pricing_bp.route("/estimate/batch", methods=["POST"])
+def get_estimate_batch():
+    """
+    Price many carts in one call (partner / ops re-quoting).
+
+    Body JSON:
+        carts: [ <any body accepted by POST /estimate>, ... ]
+
+    Returns ``estimates`` in the same order as ``carts``; each entry is the
+    same breakdown ``POST /estimate`` would return for that cart.  Rules,
+    tiers and surge are resolved once for the whole batch.
+    """
+    data = request.get_json() or {}
+    carts = data.get("carts")
+
+    if not isinstance(carts, list) or not carts:
+        return jsonify({"error": "carts array is required"}), 400
+    if len(carts) > MAX_BATCH_CARTS:
+        return jsonify({
+            "error": "A batch may contain at most {} carts".format(MAX_BATCH_CARTS),
+        }), 400
+
+    parsed = []
+    for index, cart in enumerate(carts):
+        if not isinstance(cart, dict):
+            return jsonify({"error": "carts[{}] must be an object".format(index)}), 400
+        try:
+            items, scheduled_date, lat, lng = _parse_estimate_request(cart)
+            lat = float(lat) if lat is not None else None
+            lng = float(lng) if lng is not None else None
+        except (TypeError, ValueError, AttributeError):
+            return jsonify({"error": "carts[{}] is malformed".format(index)}), 400
+        parsed.append({
+            "items": items,
+            "scheduled_date": scheduled_date,
+            "lat": lat,
+            "lng": lng,
+        })
+
+    results = calculate_estimates_batch(parsed)
+
+    return jsonify({
+        "success": True,
+        "count": len(results),
+        "estimates": results,
     }), 200
 
 
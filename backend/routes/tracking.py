@@ -3,26 +3,79 @@ Customer-facing tracking API routes for Umuve.
 Public endpoints for real-time job status and driver location tracking.
 """
 
-from flask import Blueprint, jsonify
+from collections import namedtuple
+from datetime import datetime, timezone
+from itertools import chain
+import hashlib
+import json
+import threading
+import time
+
+from flask import Blueprint, jsonify, request, current_app, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from models import db, Job, Contractor, User
+from models import db, Job, Contractor, Payment
+from driver_index import driver_index
+from eta_engine import eta_engine
+from tracking_stream import tracking_stream, encode
+from location_rate import location_rate
 
 tracking_bp = Blueprint("tracking", __name__, url_prefix="/api/tracking")
 
+# Statuses in which the driver is still on the way to the customer.
+ETA_JOB_STATUSES = ("assigned", "accepted", "en_route")
 
-@tracking_bp.route("/<job_id>", methods=["GET"])
-def get_tracking_info(job_id):
-    """
-    Public tracking endpoint for customers.
-    Returns job status, driver info (if assigned), and driver location.
-    """
+
+# ============================================================================
+# Tracking views (process-local, per job)
+# ============================================================================
+# Customer pages poll these endpoints every few seconds.  Each poll used to
+# load the job (with its joined payment and rating), the contractor and the
+# contractor's user.  The parts that only change with the job are now read
+# once into a per-job view; the driver's position comes from the in-memory
+# driver index, or the newer ping heard on the backplane, on every poll.  Views are dropped when a commit in this
+# worker touches the job or its payment; the TTL bounds staleness from
+# writes in other workers.  Responses carry an ETag and Last-Modified, and
+# a poll whose If-None-Match still matches gets a 304 without a query.
+TRACKING_VIEW_TTL_SECONDS = float(os.environ.get("TRACKING_VIEW_TTL_SECONDS", "15"))
+TRACKING_VIEW_MAX_JOBS = 10000
+
+TrackingView = namedtuple("TrackingView", [
+    "version",          # content fingerprint -- identical across workers
+    "built_at",         # time.monotonic() at build time
+    "updated_at",       # job.updated_at (aware UTC), for Last-Modified
+    "job",              # tracking fields other than "driver"
+    "job_lat",
+    "job_lng",
+    "driver",           # driver fields other than position and ETA, or None
+    "driver_id",        # None until a driver is assigned
+    "driver_lat",       # position when the view was built
+    "driver_lng",
+])
+
+_views_lock = threading.Lock()
+_views = {}             # job id -> TrackingView
+_served = {}            # job id -> (position, eta_minutes, changed_at)
+
+_CHANGED_JOBS = "tracking_changed_jobs"
+
+
+def _aware(dt):
+    if dt is None:
+        return None
+    return dt if dt.tzinfo is not None else dt.replace(tzinfo=timezone.utc)
+
+
+def _build_view(job_id):
+    """Load the job, payment, driver and driver's name (joined loads)."""
     job = db.session.get(Job, job_id)
     if not job:
-        return jsonify({"error": "Booking not found"}), 404
+        return None
 
     result = {
         "job_id": job.id,
@@ -32,33 +85,231 @@ def get_tracking_info(job_id):
         "total_price": job.total_price,
         "items": job.items or [],
         "created_at": job.created_at.isoformat() if job.created_at else None,
+        "payment_status": job.payment.payment_status if job.payment else None,
     }
 
+    driver = None
+    contractor = db.session.get(Contractor, job.driver_id) if job.driver_id else None
+    if contractor:
+        driver = {
+            "id": contractor.id,
+            "name": contractor.user.name if contractor.user else None,
+            "truck_type": contractor.truck_type,
+            "avg_rating": contractor.avg_rating,
+            "total_jobs": contractor.total_jobs,
+        }
+
+    version = hashlib.sha1(json.dumps(
+        [result, driver], sort_keys=True, default=str,
+    ).encode("utf-8")).hexdigest()[:16]
+
+    return TrackingView(
+        version=version,
+        built_at=time.monotonic(),
+        updated_at=_aware(job.updated_at) or datetime.now(timezone.utc),
+        job=result,
+        job_lat=job.lat,
+        job_lng=job.lng,
+        driver=driver,
+        driver_id=job.driver_id,
+        driver_lat=contractor.current_lat if contractor else None,
+        driver_lng=contractor.current_lng if contractor else None,
+    )
+
+
+def get_tracking_view(job_id):
+    """Cached view of *job_id*, or None if there is no such job."""
+    view = _views.get(job_id)
+    if view is not None and time.monotonic() - view.built_at < TRACKING_VIEW_TTL_SECONDS:
+        return view
+    view = _build_view(job_id)
+    with _views_lock:
+        if view is None:
+            _views.pop(job_id, None)
+            return None
+        if len(_views) >= TRACKING_VIEW_MAX_JOBS and job_id not in _views:
+            _views.clear()
+            _served.clear()
+        _views[job_id] = view
+    return view
+
+
+def invalidate_tracking_view(job_id):
+    """Drop the cached view of one job."""
+    with _views_lock:
+        _views.pop(job_id, None)
+
+
+def mark_job_changed(session, job_id):
+    """Invalidate *job_id*'s view when *session* commits.  ORM writes to
+    Job and Payment are picked up automatically; call this for Core
+    UPDATEs on jobs."""
+    session.info.setdefault(_CHANGED_JOBS, set()).add(job_id)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_jobs(session, _flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Job):
+            mark_job_changed(session, obj.id)
+        elif isinstance(obj, Payment) and obj.job_id:
+            mark_job_changed(session, obj.job_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_jobs(session):
+    for job_id in session.info.pop(_CHANGED_JOBS, ()):
+        invalidate_tracking_view(job_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_jobs(session):
+    session.info.pop(_CHANGED_JOBS, None)
+
+
+def _live_driver(view):
+    """``((lat, lng), eta_minutes, changed_at)`` for the view's driver right
+    now: the newer of the driver index position and the last ping heard on
+    the backplane for this job (the index of a worker the driver doesn't
+    ping lags by up to a refresh), else the position the view was built
+    with.  The ETA is only recomputed when the position moves."""
+    if view.driver is None:
+        return (None, None), None, view.updated_at
+    candidates = [c for c in (driver_index.located(view.driver_id),
+                              tracking_stream.last_position(view.job["job_id"])) if c is not None]
+    if candidates:
+        lat, lng, _as_of = max(candidates, key=lambda c: c[2])
+        position = (lat, lng)
+    else:
+        position = (view.driver_lat, view.driver_lng)
+    served = _served.get(view.job["job_id"])
+    if served is not None and served[0] == position and served[2] >= view.updated_at:
+        return served
+    eta = None
+    if view.job["status"] in ETA_JOB_STATUSES and position[0] is not None:
+        minutes = eta_engine.eta_minutes(position, (view.job_lat, view.job_lng))
+        eta = round(minutes) if minutes is not None else None
+    served = (position, eta, datetime.now(timezone.utc).replace(microsecond=0))
+    _served[view.job["job_id"]] = served
+    return served
+
+
+def _conditional(view, build_body):
+    """Answer with 304 if the client's copy is current, else the body."""
+    position, eta, changed_at = _live_driver(view)
+    etag = hashlib.sha1("{}|{}|{}".format(view.version, position, eta).encode("utf-8")).hexdigest()[:20]
+    last_modified = max(view.updated_at, changed_at)
+
+    if request.if_none_match:
+        not_modified = etag in request.if_none_match
+    else:
+        since = request.if_modified_since
+        not_modified = since is not None and last_modified.replace(microsecond=0) <= since
+
+    if not_modified:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build_body(position, eta))
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Always revalidate: positions change between polls
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _tracking_body(view, position, eta):
+    result = dict(view.job)
     # Include driver info if assigned
-    if job.driver_id:
-        contractor = db.session.get(Contractor, job.driver_id)
-        if contractor:
-            result["driver"] = {
-                "id": contractor.id,
-                "name": contractor.user.name if contractor.user else None,
-                "truck_type": contractor.truck_type,
-                "avg_rating": contractor.avg_rating,
-                "total_jobs": contractor.total_jobs,
-                "lat": contractor.current_lat,
-                "lng": contractor.current_lng,
-            }
-        else:
-            result["driver"] = None
+    if view.driver:
+        result["driver"] = dict(view.driver, lat=position[0], lng=position[1], eta_minutes=eta)
     else:
         result["driver"] = None
+    return result
 
-    # Include payment status
-    if job.payment:
-        result["payment_status"] = job.payment.payment_status
-    else:
-        result["payment_status"] = None
 
-    return jsonify({"success": True, "tracking": result}), 200
+@tracking_bp.route("/<job_id>", methods=["GET"])
+def get_tracking_info(job_id):
+    """
+    Public tracking endpoint for customers.
+    Returns job status, driver info (if assigned), and driver location.
+    """
+    view = get_tracking_view(job_id)
+    if not view:
+        return jsonify({"error": "Booking not found"}), 404
+
+    def body(position, eta):
+        return {"success": True, "tracking": _tracking_body(view, position, eta)}
+
+    return _conditional(view, body)
+
+
+@tracking_bp.route("/<job_id>/stream", methods=["GET"])
+def stream_tracking(job_id):
+    """
+    Server-sent events for one job: a ``snapshot`` (the tracking payload),
+    then ``status`` and ``location`` events as they happen.  A reconnect
+    with Last-Event-ID gets the events it missed instead of a snapshot
+    when this worker still has them.  See tracking_stream.py.
+    """
+    view = get_tracking_view(job_id)
+    if not view:
+        return jsonify({"error": "Booking not found"}), 404
+
+    opened = tracking_stream.open(job_id, view.job["status"], (view.job_lat, view.job_lng))
+    if opened is None:
+        response = jsonify({"error": "Too many tracking streams, poll instead"})
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        return response
+    stream, last_id = opened
+    # A watched job's driver is asked for faster positions
+    watcher = "sse:{:x}".format(id(stream))
+    location_rate.watch(watcher, job_id)
+    app = current_app._get_current_object()
+
+    last_event_id = request.headers.get("Last-Event-ID")
+    first = tracking_stream.replay(job_id, last_event_id) if last_event_id else None
+    # A finished job gets what it is owed and the stream ends
+    ended = stream.ended
+    if first is None:
+        position, eta, _changed_at = _live_driver(view)
+        first = [encode("snapshot", last_id, _tracking_body(view, position, eta))]
+    elif not first and ended:
+        # Nothing missed and nothing more coming: 204 stops EventSource retrying
+        tracking_stream.close(stream)
+        location_rate.unwatch(watcher, job_id)
+        return current_app.response_class(status=204)
+
+    heartbeat = tracking_stream.heartbeat_seconds
+
+    # Everything above ran in the request's app context; the generator
+    # touches only the hub, so the DB session is released before streaming.
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            for frame in first:
+                yield frame
+            if ended:
+                return
+            while True:
+                frames = tracking_stream.wait(stream, heartbeat)
+                if not frames:
+                    yield ": keepalive\n\n"
+                    continue
+                for frame in frames:
+                    yield frame
+                if stream.ended and not stream.frames:
+                    return
+        finally:
+            tracking_stream.close(stream)
+            with app.app_context():
+                location_rate.unwatch(watcher, job_id)
+
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    # Tell nginx-style proxies not to buffer the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 @tracking_bp.route("/<job_id>/driver-location", methods=["GET"])
@@ -67,23 +318,24 @@ def get_driver_location(job_id):
     Get the current driver location for a job.
     Returns lat/lng if a driver is assigned and has a known location.
     """
-    job = db.session.get(Job, job_id)
-    if not job:
+    view = get_tracking_view(job_id)
+    if not view:
         return jsonify({"error": "Job not found"}), 404
 
-    if not job.driver_id:
-        return jsonify({"success": True, "location": None, "message": "No driver assigned yet"}), 200
-
-    contractor = db.session.get(Contractor, job.driver_id)
-    if not contractor or contractor.current_lat is None:
-        return jsonify({"success": True, "location": None, "message": "Driver location unavailable"}), 200
-
-    return jsonify({
-        "success": True,
-        "location": {
-            "lat": contractor.current_lat,
-            "lng": contractor.current_lng,
-            "driver_name": contractor.user.name if contractor.user else None,
-            "status": job.status,
-        },
-    }), 200
+    def body(position, eta):
+        if view.driver_id is None:
+            return {"success": True, "location": None, "message": "No driver assigned yet"}
+        if view.driver is None or position[0] is None:
+            return {"success": True, "location": None, "message": "Driver location unavailable"}
+        return {
+            "success": True,
+            "location": {
+                "lat": position[0],
+                "lng": position[1],
+                "driver_name": view.driver["name"],
+                "status": view.job["status"],
+                "eta_minutes": eta,
+            },
+        }
+
+    return _conditional(view, body)
@@ -4,6 +4,8 @@ Umuve Background Scheduler
 Runs periodic tasks:
 - Generate jobs from due recurring bookings (hourly)
 - Send 24-hour pickup reminders (hourly)
+- Run batched dispatch windows (every DISPATCH_WINDOW_SECONDS, when
+  DISPATCH_MODE=batched)
 
 Only starts when ENABLE_SCHEDULER=true to prevent running on multiple instances.
 """
@@ -107,13 +109,33 @@ def _send_pickup_reminders(app):
             logger.info("Scheduler: sent reminders for %d upcoming jobs", len(jobs))
 
 
+def _run_dispatch_window(app):
+    """Match the confirmed, unassigned jobs collected since the last window."""
+    with app.app_context():
+        from models import db
+        from dispatch import run_dispatch_window
+
+        try:
+            run_dispatch_window()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Scheduler: dispatch window failed")
+        finally:
+            db.session.remove()
+
+
 def init_scheduler(app):
     """Initialize and start the background scheduler.
 
     Only runs if ENABLE_SCHEDULER=true env var is set.
     """
+    from dispatch import batched_dispatch_enabled, DISPATCH_WINDOW_SECONDS
+
     if os.environ.get("ENABLE_SCHEDULER", "").lower() != "true":
         logger.info("Scheduler disabled (set ENABLE_SCHEDULER=true to enable)")
+        if batched_dispatch_enabled():
+            logger.warning("DISPATCH_MODE=batched needs ENABLE_SCHEDULER=true on one "
+                           "instance -- confirmed jobs will not be auto-assigned")
         return None
 
     try:
@@ -141,8 +163,21 @@ def init_scheduler(app):
             name="Send 24h pickup reminders",
         )
 
+        # Batched dispatch: one window at a time, skipped windows coalesce
+        if batched_dispatch_enabled():
+            scheduler.add_job(
+                _run_dispatch_window,
+                "interval",
+                seconds=DISPATCH_WINDOW_SECONDS,
+                args=[app],
+                id="run_dispatch_window",
+                name="Batched dispatch window",
+                max_instances=1,
+                coalesce=True,
+            )
+
         scheduler.start()
-        logger.info("Background scheduler started with 2 jobs")
+        logger.info("Background scheduler started with %d jobs", len(scheduler.get_jobs()))
         return scheduler
     except ImportError:
         logger.warning("APScheduler not installed — scheduler disabled")
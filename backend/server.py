@@ -13,8 +13,19 @@ from database import Database
 from auth_routes import auth_bp, require_auth
 from models import db as sqlalchemy_db
 from socket_events import socketio
+from socket_backplane import (
+    backplane, client_manager_for, socketio_async_mode, patch_database_driver, SOCKETIO_MESSAGE_QUEUE,
+)
+from socket_payloads import socketio_serializer
+from socket_metrics import socket_metrics
 from routes import drivers_bp, pricing_bp, ratings_bp, admin_bp, payments_bp, webhook_bp, booking_bp, upload_bp, jobs_bp, tracking_bp, driver_bp, operator_bp, push_bp, service_area_bp, recurring_bp, referrals_bp, support_bp, chat_bp, onboarding_bp, promos_bp, reviews_bp, operator_applications_bp, migration_bp
 
+# ---------------------------------------------------------------------------
+# Under the eventlet worker, make psycopg2 cooperative before the first
+# connection is opened (one worker per process serves every request)
+# ---------------------------------------------------------------------------
+patch_database_driver()
+
 # ---------------------------------------------------------------------------
 # Sentry error monitoring (optional -- only active when SENTRY_DSN is set)
 # ---------------------------------------------------------------------------
@@ -120,10 +131,15 @@ else:
 # ---------------------------------------------------------------------------
 CORS(app, resources={r"/api/*": {"origins": _allowed_origins}})
 sqlalchemy_db.init_app(app)
+# Rooms are per worker unless SOCKETIO_MESSAGE_QUEUE names a shared queue
+# (see socket_backplane.py); the async mode follows the gunicorn worker class.
+_socket_manager = client_manager_for(SOCKETIO_MESSAGE_QUEUE)
 socketio.init_app(
     app,
     cors_allowed_origins=_allowed_origins,
-    async_mode="threading",  # Threading mode is fully compatible with Socket.IO v4
+    async_mode=socketio_async_mode(),
+    client_manager=_socket_manager,
+    serializer=socketio_serializer(),
     logger=False,
     engineio_logger=False,
     # Explicitly support both Socket.IO v2.x and v4.x protocols
@@ -135,6 +151,8 @@ socketio.init_app(
     ping_interval=25,
     ping_timeout=20,
 )
+backplane.init_app(app, _socket_manager)
+socket_metrics.init_app(socketio)
 
 # ---------------------------------------------------------------------------
 # Rate limiting (in-memory; upgrade to Redis via RATELIMIT_STORAGE_URI)
@@ -245,12 +263,46 @@ def set_security_headers(response):
 with app.app_context():
     sqlalchemy_db.create_all()
 
+# ---------------------------------------------------------------------------
+# Spatial index for the driver job feed (GiST on Postgres, R*Tree on SQLite)
+# ---------------------------------------------------------------------------
+import geo_search
+with app.app_context():
+    _startup_logger.info("Job radius search: %s", geo_search.install(sqlalchemy_db))
+
 # ---------------------------------------------------------------------------
 # Background scheduler (recurring jobs, pickup reminders)
 # ---------------------------------------------------------------------------
 from scheduler import init_scheduler
 _scheduler = init_scheduler(app)
 
+# ---------------------------------------------------------------------------
+# Timed job offers (expiry timer thread starts with the first offer)
+# ---------------------------------------------------------------------------
+from offers import offer_manager
+offer_manager.init_app(app)
+
+# ---------------------------------------------------------------------------
+# Driver GPS write-behind (flush thread starts with the first ping)
+# ---------------------------------------------------------------------------
+from location_buffer import location_buffer
+location_buffer.init_app(app)
+
+# ---------------------------------------------------------------------------
+# Chat group commit (flush thread starts with the first message or receipt)
+# ---------------------------------------------------------------------------
+from chat_pipeline import chat_pipeline
+chat_pipeline.init_app(app)
+
+# ---------------------------------------------------------------------------
+# GPS history (compacted days archived to the database) and the ETA engine
+# (relearns recent history, then keeps its rows warm)
+# ---------------------------------------------------------------------------
+from eta_engine import eta_engine
+from location_history import location_history
+location_history.init_app(app)
+eta_engine.start(location_history)
+
 
 # ---------------------------------------------------------------------------
 # Flask CLI command:  flask db-migrate
@@ -545,7 +597,7 @@ def portal_estimate():
     """
     data = request.get_json() or {}
 
-    from routes.booking import calculate_estimate
+    from routes.booking import quote_estimate
 
     # --- Build items list from whichever format the caller uses ---
     items = data.get("items")
@@ -563,7 +615,7 @@ def portal_estimate():
     lat = address.get("lat")
     lng = address.get("lng")
 
-    est = calculate_estimate(items, scheduled_date=scheduled_date, lat=lat, lng=lng)
+    est, quote_token = quote_estimate(items, scheduled_date=scheduled_date, lat=lat, lng=lng)
 
     # --- Format duration label ---
     duration_min = est["estimated_duration"]
@@ -593,7 +645,9 @@ def portal_estimate():
             "surge_amount": est["surge_amount"],
             "surge_reasons": est["surge_reasons"],
             "minimum_applied": est["minimum_applied"],
-        }
+        },
+        # Pass back to /api/bookings/create to book at this price
+        "quoteToken": quote_token,
     }), 200
 
 
@@ -623,7 +677,7 @@ def portal_create_booking():
     """
     from werkzeug.security import generate_password_hash
     from models import Job, Payment, User, Notification, generate_uuid, utcnow
-    from routes.booking import calculate_estimate, _notify_nearby_contractors
+    from routes.booking import calculate_estimate, redeem_quote_token, _notify_nearby_contractors
 
     data = request.get_json() or {}
 
@@ -703,12 +757,21 @@ def portal_create_booking():
 
     # Use the v2 pricing engine for accurate server-side calculation
     scheduled_date_for_pricing = selected_date[:10] if selected_date and isinstance(selected_date, str) else None
-    est = calculate_estimate(
+    # A valid quote token from /api/bookings/estimate skips re-pricing
+    est = redeem_quote_token(
+        data.get("quoteToken") or data.get("quote_token"),
         items,
         scheduled_date=scheduled_date_for_pricing,
         lat=float(lat) if lat else None,
         lng=float(lng) if lng else None,
     )
+    if est is None:
+        est = calculate_estimate(
+            items,
+            scheduled_date=scheduled_date_for_pricing,
+            lat=float(lat) if lat else None,
+            lng=float(lng) if lng else None,
+        )
 
     # SECURITY: Always use server-calculated price — never trust client totalAmount
     total_amount = est["total"]
@@ -0,0 +1,346 @@
+"""
+Cross-worker message backplane for Socket.IO and the in-process services.
+
+Socket.IO rooms (``driver:<id>``, ``admin``, job rooms) only exist in the
+worker that holds the connection, so with more than one worker an emit
+from a REST call served elsewhere used to reach nobody.  With
+SOCKETIO_MESSAGE_QUEUE set, every emit is published on a shared channel
+and each worker delivers it to its own members:
+
+    redis://host:6379/1      Redis pub/sub (python-socketio's RedisManager)
+    postgresql://...         Postgres LISTEN/NOTIFY; payloads over the
+                             NOTIFY limit are parked in socketio_messages
+                             and sent by id
+    sqlite:////path/to.db    a WAL-mode SQLite table each worker polls
+                             every SOCKETIO_SQLITE_POLL_SECONDS -- for
+                             several workers on one host without Redis
+
+The same channel carries app messages (``backplane.publish(topic, data)``)
+for the per-worker services that must see events raised in other workers:
+tracking streams, location-rate watchers and the admin live map.  A
+publish runs the local handler at once and reaches the other workers
+through the queue; without a queue it is just the local call.
+"""
+
+from collections import Counter
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+SOCKETIO_MESSAGE_QUEUE = os.environ.get("SOCKETIO_MESSAGE_QUEUE") or None
+SOCKETIO_CHANNEL = os.environ.get("SOCKETIO_CHANNEL", "flask-socketio")
+SOCKETIO_SQLITE_POLL_SECONDS = float(os.environ.get("SOCKETIO_SQLITE_POLL_SECONDS", "0.05"))
+
+# NOTIFY payloads must be under 8000 bytes.
+PG_NOTIFY_MAX_BYTES = 7900
+
+# Parked / queued messages older than this are deleted.
+MESSAGE_RETENTION_SECONDS = 60
+
+
+class _AppChannel:
+    """Mixin for PubSubManager backends: peels app messages off the stream
+    before python-socketio sees it.  Backends implement ``_receive()``."""
+
+    def _listen(self):
+        for message in self._receive():
+            data = message
+            if not isinstance(data, dict):
+                try:
+                    data = self.json.loads(message)
+                except ValueError:
+                    continue
+            if data.get("method") == "app":
+                if data.get("host_id") != self.host_id:
+                    backplane.deliver(data)
+                continue
+            yield data
+
+
+class RedisBackplane(_AppChannel, socketio.RedisManager):
+    name = "redis"
+
+    def _receive(self):
+        return socketio.RedisManager._listen(self)
+
+
+class PostgresBackplane(_AppChannel, socketio.PubSubManager):
+    """LISTEN/NOTIFY on the application database (or any Postgres)."""
+
+    name = "postgres"
+
+    def __init__(self, url, channel=SOCKETIO_CHANNEL, write_only=False, logger=None, json=None):
+        # LISTEN takes an identifier, not a parameter
+        channel = channel.replace("-", "_")
+        if not re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", channel):
+            raise ValueError("Postgres channel must be an identifier: {!r}".format(channel))
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.url = url.replace("postgres://", "postgresql://", 1)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._parked = 0
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self.url)
+        conn.autocommit = True
+        return conn
+
+    def _publish(self, data):
+        import psycopg2
+
+        payload = self.json.dumps(data)
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._conn is None or self._conn.closed:
+                        self._conn = self._connect()
+                        with self._conn.cursor() as cur:
+                            cur.execute(
+                                "CREATE TABLE IF NOT EXISTS socketio_messages ("
+                                "id BIGSERIAL PRIMARY KEY, payload TEXT NOT NULL, "
+                                "created_at TIMESTAMPTZ NOT NULL DEFAULT now())")
+                    with self._conn.cursor() as cur:
+                        if len(payload.encode("utf-8")) > PG_NOTIFY_MAX_BYTES:
+                            cur.execute("INSERT INTO socketio_messages (payload) VALUES (%s) RETURNING id",
+                                        (payload,))
+                            notice = "@{}".format(cur.fetchone()[0])
+                            self._parked += 1
+                            if self._parked % 100 == 0:
+                                cur.execute("DELETE FROM socketio_messages WHERE created_at < "
+                                            "now() - make_interval(secs => %s)", (MESSAGE_RETENTION_SECONDS,))
+                        else:
+                            notice = payload
+                        cur.execute("SELECT pg_notify(%s, %s)", (self.channel, notice))
+                    return
+                except psycopg2.Error:
+                    self._conn = None
+                    if attempt:
+                        self._get_logger().exception("Cannot publish to Postgres... giving up")
+
+    def _receive(self):
+        import select
+        import psycopg2
+
+        retry_sleep = 1
+        while True:
+            try:
+                conn = self._connect()
+                with conn.cursor() as cur:
+                    cur.execute("LISTEN {}".format(self.channel))
+                retry_sleep = 1
+                while True:
+                    # select() is cooperative under eventlet/gevent
+                    if select.select([conn], [], [], 5) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notice = conn.notifies.pop(0).payload
+                        if notice.startswith("@"):
+                            with conn.cursor() as cur:
+                                cur.execute("SELECT payload FROM socketio_messages WHERE id = %s",
+                                            (int(notice[1:]),))
+                                row = cur.fetchone()
+                            if row is None:
+                                continue
+                            notice = row[0]
+                        yield notice
+            except psycopg2.Error:
+                self._get_logger().exception("Cannot receive from Postgres... retrying in %s secs", retry_sleep)
+                time.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+
+
+class SQLiteBackplane(_AppChannel, socketio.PubSubManager):
+    """A message table in a shared SQLite file, polled by every worker.
+    Single host only; meant for small deployments without Redis."""
+
+    name = "sqlite"
+
+    def __init__(self, url, channel=SOCKETIO_CHANNEL, write_only=False, logger=None, json=None,
+                 poll_seconds=SOCKETIO_SQLITE_POLL_SECONDS):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.path = urlparse(url).path
+        if self.path.startswith("//"):
+            self.path = self.path[1:]       # sqlite:////abs/path
+        elif self.path.startswith("/"):
+            self.path = self.path[1:]       # sqlite:///relative/path
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._conn = None
+        self._published = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS socketio_messages ("
+                     "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, "
+                     "payload TEXT NOT NULL, created_at REAL NOT NULL)")
+        return conn
+
+    def _publish(self, data):
+        payload = self.json.dumps(data)
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = self._connect()
+                now = time.time()
+                self._conn.execute("INSERT INTO socketio_messages (channel, payload, created_at) "
+                                   "VALUES (?, ?, ?)", (self.channel, payload, now))
+                self._published += 1
+                if self._published % 500 == 0:
+                    self._conn.execute("DELETE FROM socketio_messages WHERE created_at < ?",
+                                       (now - MESSAGE_RETENTION_SECONDS,))
+            except sqlite3.Error:
+                self._conn = None
+                self._get_logger().exception("Cannot publish to SQLite queue %s", self.path)
+
+    def _receive(self):
+        conn = None
+        last_id = None
+        while True:
+            try:
+                if conn is None:
+                    conn = self._connect()
+                    if last_id is None:
+                        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM socketio_messages").fetchone()[0]
+                rows = conn.execute("SELECT id, payload FROM socketio_messages WHERE id > ? AND channel = ? "
+                                    "ORDER BY id LIMIT 1000", (last_id, self.channel)).fetchall()
+            except sqlite3.Error:
+                self._get_logger().exception("Cannot read SQLite queue %s", self.path)
+                conn = None
+                rows = []
+            if rows:
+                last_id = rows[-1][0]
+                for _id, payload in rows:
+                    yield payload
+            else:
+                time.sleep(self.poll_seconds)
+
+
+def client_manager_for(url, channel=SOCKETIO_CHANNEL, write_only=False):
+    """The Socket.IO client manager for a SOCKETIO_MESSAGE_QUEUE URL, or
+    None to keep rooms in this process."""
+    if not url:
+        return None
+    scheme = urlparse(url).scheme.lower()
+    if scheme.split("+", 1)[0] in ("redis", "rediss", "unix"):
+        return RedisBackplane(url, channel=channel, write_only=write_only)
+    if scheme in ("postgres", "postgresql"):
+        return PostgresBackplane(url, channel=channel, write_only=write_only)
+    if scheme == "sqlite":
+        return SQLiteBackplane(url, channel=channel, write_only=write_only)
+    raise ValueError("Unsupported SOCKETIO_MESSAGE_QUEUE scheme: {!r}".format(scheme))
+
+
+class Backplane:
+    """Topic fan-out to this worker and, through the Socket.IO manager's
+    channel, every other worker."""
+
+    def __init__(self):
+        self._handlers = {}         # topic -> callable(data)
+        self.manager = None
+        self.app = None
+        self.stats = Counter()
+
+    @property
+    def clustered(self):
+        return self.manager is not None
+
+    @property
+    def host_id(self):
+        return self.manager.host_id if self.manager is not None else "local"
+
+    def init_app(self, app, manager):
+        self.app = app
+        self.manager = manager
+
+    def subscribe(self, topic, handler):
+        self._handlers[topic] = handler
+
+    def publish(self, topic, data):
+        """Run *topic*'s handler here and in every other worker."""
+        handler = self._handlers.get(topic)
+        if handler is not None:
+            handler(data)
+        if self.manager is not None:
+            self.manager._publish({"method": "app", "topic": topic, "data": data,
+                                   "host_id": self.manager.host_id})
+            self.stats["published"] += 1
+
+    def snapshot(self):
+        """Queue kind and app messages sent / received (this worker only)."""
+        return {
+            "queue": getattr(self.manager, "name", None),
+            "host_id": self.host_id,
+            "topics": sorted(self._handlers),
+            "stats": dict(self.stats),
+        }
+
+    def deliver(self, message):
+        """An app message from another worker (listener thread)."""
+        handler = self._handlers.get(message.get("topic"))
+        if handler is None:
+            return
+        self.stats["received"] += 1
+        try:
+            if self.app is not None:
+                with self.app.app_context():
+                    handler(message.get("data"))
+            else:
+                handler(message.get("data"))
+        except Exception:
+            logger.exception("Backplane handler for %s failed", message.get("topic"))
+
+
+def socketio_async_mode():
+    """SOCKETIO_ASYNC_MODE, else whatever the gunicorn worker patched in
+    (eventlet / gevent), else threading."""
+    mode = os.environ.get("SOCKETIO_ASYNC_MODE")
+    if mode:
+        return mode
+    import sys
+    if "eventlet" in sys.modules:
+        from eventlet.patcher import is_monkey_patched
+        if is_monkey_patched("socket"):
+            return "eventlet"
+    if "gevent" in sys.modules:
+        from gevent.monkey import is_module_patched
+        if is_module_patched("socket"):
+            return "gevent"
+    return "threading"
+
+
+def patch_database_driver(mode=None):
+    """Make psycopg2 yield to the event loop under eventlet / gevent.
+
+    Monkey-patching only reaches pure-Python I/O; psycopg2 talks to the
+    server from C, so without a wait callback every query blocks the whole
+    worker -- all its sockets, SSE streams and requests -- for its round
+    trip.  Returns True when psycogreen installed one."""
+    mode = mode or socketio_async_mode()
+    if mode not in ("eventlet", "gevent"):
+        return False
+    try:
+        import importlib
+        green = importlib.import_module("psycogreen.{}".format(mode))
+    except ImportError:
+        logger.warning("psycogreen is not installed: database queries will block the %s hub", mode)
+        return False
+    green.patch_psycopg()
+    logger.info("psycopg2 made cooperative for %s", mode)
+    return True
+
+
+# Process-wide backplane; server.py attaches the queue.
+backplane = Backplane()
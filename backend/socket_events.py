@@ -5,34 +5,42 @@ Socket.IO event handlers for Umuve real-time features.
 - New-job alerts to nearby drivers
 """
 
-from math import radians, cos, sin, asin, sqrt
+import logging
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask import request
 
-from models import db, Contractor, Job
+from driver_index import driver_index
+from eta_engine import eta_engine
+from location_buffer import location_buffer
+from location_history import location_history
+from live_map import live_map, parse_viewport, ALL_DRIVERS_ROOM
+from tracking_stream import tracking_stream
+from location_rate import location_rate
+from geo_rooms import geo_rooms, FLEET_ROOM
+import socket_payloads
+from chat_pipeline import chat_pipeline
+
+logger = logging.getLogger(__name__)
 
 socketio = SocketIO()
 
-EARTH_RADIUS_KM = 6371.0
 DRIVER_BROADCAST_RADIUS_KM = 30.0
-
-
-def _haversine(lat1, lng1, lat2, lng2):
-    lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
-    dlat = lat2 - lat1
-    dlng = lng2 - lng1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
-    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+# job:accepted also reaches drivers who saw job:new and have moved since.
+JOB_TAKEN_MARGIN_KM = 15.0
 
 
 @socketio.on("connect")
 def handle_connect():
-    print("[socket] Client connected: {}".format(request.sid))
+    # Counted by role in socket_metrics
+    logger.debug("Client connected: %s", request.sid)
 
 
 @socketio.on("disconnect")
 def handle_disconnect():
-    print("[socket] Client disconnected: {}".format(request.sid))
+    logger.debug("Client disconnected: %s", request.sid)
+    live_map.unsubscribe(request.sid)
+    location_rate.unwatch(request.sid)
+    geo_rooms.detach(request.sid)
 
 
 @socketio.on("join")
@@ -42,6 +50,11 @@ def handle_join(data):
     if room:
         join_room(room)
         emit("joined", {"room": room}, room=request.sid)
+        if room.startswith("driver:"):
+            # Driver apps learn their GPS rate on (re)connect
+            emit("driver:location-rate", location_rate.directive(room[len("driver:"):]), room=request.sid)
+            # ...and get new-job / job-taken broadcasts through their cell
+            geo_rooms.attach(request.sid, room[len("driver:"):])
 
 
 @socketio.on("leave")
@@ -49,19 +62,46 @@ def handle_leave(data):
     room = data.get("room")
     if room:
         leave_room(room)
+        if room.startswith("driver:"):
+            geo_rooms.detach(request.sid)
 
 
 @socketio.on("admin:join")
 def handle_admin_join():
     """Admin clients join the admin room for live map updates."""
     join_room("admin")
+    join_room(live_map.subscribe(request.sid))
     emit("joined", {"room": "admin"}, room=request.sid)
 
 
+@socketio.on("admin:viewport")
+def handle_admin_viewport(data):
+    """
+    Limit live map positions to the admin's viewport.
+    data = { south, west, north, east }, or null for every driver
+    """
+    try:
+        viewport = parse_viewport(data)
+    except ValueError as exc:
+        emit("admin:error", {"error": str(exc)}, room=request.sid)
+        return
+    if live_map.subscribe(request.sid, viewport):
+        join_room(ALL_DRIVERS_ROOM)
+    else:
+        leave_room(ALL_DRIVERS_ROOM)
+    # Ticks only carry drivers that moved: send what the new view holds now
+    locations = live_map.positions(viewport)
+    if locations:
+        emit("admin:locations", {"locations": locations}, room=request.sid)
+        live_map.stats["catch_up_frames"] += 1
+
+
 @socketio.on("admin:leave")
 def handle_admin_leave():
     """Admin clients leave the admin room."""
     leave_room("admin")
+    leave_room(ALL_DRIVERS_ROOM)
+    live_map.unsubscribe(request.sid)
 
 
 @socketio.on("operator:join")
@@ -89,6 +129,7 @@ def handle_customer_join(data):
     if job_id:
         join_room(job_id)
         emit("joined", {"room": job_id}, room=request.sid)
+        location_rate.watch(request.sid, job_id)
 
 
 @socketio.on("customer:leave")
@@ -97,6 +138,7 @@ def handle_customer_leave(data):
     job_id = data.get("job_id")
     if job_id:
         leave_room(job_id)
+        location_rate.unwatch(request.sid, job_id)
 
 
 @socketio.on("driver:location")
@@ -112,55 +154,53 @@ def handle_driver_location(data):
 
     if not contractor_id or lat is None or lng is None:
         return
+    # Faster than the rate this driver was told to use
+    if not location_rate.allow(contractor_id):
+        return
 
     try:
-        contractor = db.session.get(Contractor, contractor_id)
-        if contractor:
-            contractor.current_lat = float(lat)
-            contractor.current_lng = float(lng)
-            db.session.commit()
-    except Exception:
-        db.session.rollback()
+        lat, lng = location_buffer.record(contractor_id, lat, lng)
+    except ValueError:
+        return
+    driver_index.update_location(contractor_id, lat, lng)
+    geo_rooms.update(contractor_id, lat, lng)
+    eta_engine.observe(contractor_id, lat, lng)
+    location_history.append(contractor_id, lat, lng)
+    # Admin live map: sent with the next tick
+    live_map.note(contractor_id, lat, lng)
 
     if job_id:
         # Broadcast to everyone in the job room (customers tracking this job)
-        emit("driver:location", {
-            "contractor_id": contractor_id,
-            "lat": lat,
-            "lng": lng,
-        }, room=job_id)
-
-    # Broadcast to admin room for live map
-    socketio.emit("admin:contractor-location", {
-        "contractor_id": contractor_id,
-        "lat": lat,
-        "lng": lng,
-    }, room="admin")
-
-
-def broadcast_job_status(job_id, status, extra=None):
-    """Utility called from REST routes to push status updates via socket."""
-    payload = {"job_id": job_id, "status": status}
-    if extra:
-        payload.update(extra)
+        emit("driver:location", socket_payloads.driver_location(contractor_id, lat, lng), room=job_id)
+        # Customers on the SSE stream: throttled, sent with the next tick
+        tracking_stream.note_position(job_id, lat, lng)
+
+
+def broadcast_job_status(job_id, status, extra=None, job=None):
+    """Utility called from REST routes to push status updates via socket.
+    Pass the *job* row when at hand; its updated_at versions the event."""
+    payload = socket_payloads.job_status(job_id, status, extra, job=job)
     socketio.emit("job:status", payload, room=job_id)
+    tracking_stream.publish_status(job_id, payload)
+    location_rate.job_changed(job_id)
     # Also notify admin room
     socketio.emit("admin:job-status", payload, room="admin")
 
 
-def broadcast_job_accepted(job_id, driver_id):
+def broadcast_job_accepted(job_id, driver_id, lat=None, lng=None):
     """
-    Broadcast job acceptance to ALL online approved contractors.
+    Broadcast job acceptance to the drivers who may have it in their feed.
     Unlike broadcast_job_status (which targets the job room),
-    this targets every driver room so they can remove the job from their feed.
+    this targets the geo-cell rooms around the job (*lat*, *lng*), or every
+    driver when the job has no position, so they can remove it from their feed.
     """
-    contractors = Contractor.query.filter_by(
-        is_online=True, approval_status="approved", is_operator=False
-    ).all()
-    payload = {"job_id": job_id, "status": "accepted", "driver_id": driver_id}
-    for c in contractors:
-        # Emit to each driver's personal room
-        socketio.emit("job:accepted", payload, room=f"driver:{c.id}")
+    payload = socket_payloads.job_status(job_id, "accepted", {"driver_id": driver_id})
+    if lat is None or lng is None:
+        rooms = FLEET_ROOM
+    else:
+        rooms = geo_rooms.rooms_covering(lat, lng, DRIVER_BROADCAST_RADIUS_KM + JOB_TAKEN_MARGIN_KM)
+    socketio.emit("job:accepted", payload, room=rooms)
+    location_rate.job_changed(job_id)
     # Also notify admin room
     socketio.emit("admin:job-status", payload, room="admin")
 
@@ -168,11 +208,12 @@ def broadcast_job_accepted(job_id, driver_id):
 @socketio.on("chat:send")
 def handle_chat_send(data):
     """
-    Receive a chat message via Socket.IO, persist to DB, and broadcast to job room.
-    data = { job_id, sender_id, sender_role, message }
+    Receive a chat message via Socket.IO, persist it with the next group
+    commit and acknowledge the sender; chat_pipeline broadcasts it to the
+    job room once committed.
+    data = { job_id, sender_id, sender_role, message, client_id (optional) }
+    Ack: { success, id, created_at, client_id } or { error }
     """
-    from models import ChatMessage, generate_uuid
-
     job_id = data.get("job_id")
     sender_id = data.get("sender_id")
     sender_role = data.get("sender_role")
@@ -180,101 +221,73 @@ def handle_chat_send(data):
 
     if not job_id or not sender_id or not sender_role or not message:
         emit("chat:error", {"error": "Missing required fields"}, room=request.sid)
-        return
+        return {"error": "Missing required fields"}
 
     if sender_role not in ("customer", "driver"):
         emit("chat:error", {"error": "Invalid sender_role"}, room=request.sid)
-        return
+        return {"error": "Invalid sender_role"}
 
     if len(message) > 2000:
         emit("chat:error", {"error": "Message too long"}, room=request.sid)
-        return
+        return {"error": "Message too long"}
 
     try:
-        msg = ChatMessage(
-            id=generate_uuid(),
-            job_id=job_id,
-            sender_id=sender_id,
-            sender_role=sender_role,
-            message=message,
-        )
-        db.session.add(msg)
-        db.session.commit()
-
-        msg_dict = msg.to_dict()
-        emit("chat:message", msg_dict, room=job_id)
-    except Exception as e:
-        db.session.rollback()
+        msg = chat_pipeline.send(job_id, sender_id, sender_role, message,
+                                 client_id=data.get("client_id")).wait()
+    except RuntimeError:
         emit("chat:error", {"error": "Failed to save message"}, room=request.sid)
+        return {"error": "Failed to save message"}
+    return {
+        "success": True,
+        "id": msg["id"],
+        "created_at": msg["created_at"].isoformat(),
+        "client_id": msg["client_id"],
+    }
 
 
 @socketio.on("chat:typing")
 def handle_chat_typing(data):
     """
-    Broadcast typing indicator to the job room.
+    Broadcast typing indicator to the job room (throttled per sender).
     data = { job_id, sender_id, sender_role, is_typing }
     """
     job_id = data.get("job_id")
     if not job_id:
         return
+    is_typing = bool(data.get("is_typing", True))
+    if not chat_pipeline.typing(job_id, data.get("sender_id") or request.sid, is_typing):
+        return
     emit("chat:typing", {
         "job_id": job_id,
         "sender_id": data.get("sender_id"),
         "sender_role": data.get("sender_role"),
-        "is_typing": data.get("is_typing", True),
+        "is_typing": is_typing,
     }, room=job_id, include_self=False)
 
 
 @socketio.on("chat:read")
 def handle_chat_read(data):
     """
-    Mark messages as read and notify the sender.
+    Mark the other party's messages as read; coalesced with other receipts
+    for the job in the next group commit, which notifies the job room.
     data = { job_id, reader_role }
     """
-    from models import ChatMessage
-    from datetime import datetime, timezone
-
     job_id = data.get("job_id")
     reader_role = data.get("reader_role")
-    if not job_id or not reader_role:
+    if not job_id or reader_role not in ("customer", "driver"):
         return
-
-    other_role = "driver" if reader_role == "customer" else "customer"
-    now = datetime.now(timezone.utc)
-
-    try:
-        updated = (
-            ChatMessage.query
-            .filter_by(job_id=job_id, sender_role=other_role)
-            .filter(ChatMessage.read_at.is_(None))
-            .update({"read_at": now})
-        )
-        db.session.commit()
-
-        if updated > 0:
-            emit("chat:read", {
-                "job_id": job_id,
-                "read_by": reader_role,
-                "read_at": now.isoformat(),
-                "count": updated,
-            }, room=job_id)
-    except Exception:
-        db.session.rollback()
+    chat_pipeline.mark_read(job_id, reader_role)
 
 
 def notify_nearby_drivers(job):
     """
     Called after a new job is created.
-    Emits a job:new event to all online approved contractors within range.
+    Emits a job:new event to the geo-cell rooms covering the broadcast radius.
     """
+    payload = socket_payloads.job_new(job)
     if job.lat is None or job.lng is None:
-        socketio.emit("job:new", job.to_dict(), namespace="/")
+        socketio.emit("job:new", payload, namespace="/")
         return
 
-    contractors = Contractor.query.filter_by(is_online=True, approval_status="approved", is_operator=False).all()
-    for c in contractors:
-        if c.current_lat is None or c.current_lng is None:
-            continue
-        dist = _haversine(job.lat, job.lng, c.current_lat, c.current_lng)
-        if dist <= DRIVER_BROADCAST_RADIUS_KM:
-            socketio.emit("job:new", job.to_dict(), room=f"driver:{c.id}")
+    rooms = geo_rooms.rooms_covering(job.lat, job.lng, DRIVER_BROADCAST_RADIUS_KM)
+    socketio.emit("job:new", payload, room=rooms)
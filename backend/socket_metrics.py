@@ -0,0 +1,291 @@
+"""
+Counters and latency histograms for the Socket.IO path.
+
+Hooks the python-socketio server Flask-SocketIO creates, so every handler
+(in socket_events or anywhere else) and every emit (handler ``emit()``,
+``socketio.emit`` from REST routes and background threads) is measured
+without touching the call sites:
+
+    handlers      calls, errors and a latency histogram per event
+    emits         count, latency histogram and recipients per event --
+                  sockets on this worker the emit reached
+    connections   live sockets by role, learned from the room they join
+                  (driver:<id>, admin:join, customer:join, operator:join;
+                  "unknown" until then)
+    rooms         sizes per kind of room (driver, cell, job, admin, ...),
+                  read from the manager when the snapshot is taken
+
+Recording is two perf_counter() calls, a bisect and a few attribute
+updates per handler call or emit, with the histograms bound when the
+handler is wrapped -- a couple of microseconds against handlers and emits that
+take tens to thousands (bench/bench_socket_metrics.py measures it).
+SOCKET_METRICS_ENABLED=0 leaves the server unhooked.
+
+Everything is per worker; with a message queue each worker counts the
+emits raised in it and the sockets it delivered them to.  ``collect()``
+asks every worker over the backplane for its ``worker_snapshot()`` -- these
+statistics plus those of the other per-worker services (GPS buffer, rate
+modes, live map, tracking streams, geo rooms, chat pipeline, backplane) --
+and returns them labelled by host id, for the admin metrics endpoint.
+"""
+
+from bisect import bisect_left
+from collections import Counter
+import importlib
+import os
+import socket
+import threading
+import time
+import uuid
+
+from socket_backplane import backplane
+
+SOCKET_METRICS_ENABLED = os.environ.get("SOCKET_METRICS_ENABLED", "1") not in ("0", "false", "no")
+
+# Histogram upper bounds: milliseconds, and recipients / members.
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+# How long collect() waits for the other workers to answer.
+METRICS_GATHER_SECONDS = float(os.environ.get("METRICS_GATHER_SECONDS", "0.5"))
+
+# Per-worker services reported next to the socket metrics:
+# (key, module, singleton with a snapshot() method).
+WORKER_SOURCES = (
+    ("backplane", "socket_backplane", "backplane"),
+    ("location_buffer", "location_buffer", "location_buffer"),
+    ("location_rate", "location_rate", "location_rate"),
+    ("live_map", "live_map", "live_map"),
+    ("tracking_streams", "tracking_stream", "tracking_stream"),
+    ("geo_rooms", "geo_rooms", "geo_rooms"),
+    ("chat", "chat_pipeline", "chat_pipeline"),
+)
+
+# Events that tell us what a socket is.
+ROLE_EVENTS = {
+    "admin:join": "admin",
+    "customer:join": "customer",
+    "operator:join": "operator",
+}
+
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "total", "sum", "max")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the *q* quantile."""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        buckets = {"le_{}".format(b): c for b, c in zip(self.bounds, self.counts) if c}
+        if self.counts[-1]:
+            buckets["inf"] = self.counts[-1]
+        return {
+            "count": self.total,
+            "mean": round(self.sum / self.total, 3) if self.total else None,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": round(self.max, 3),
+            "buckets": buckets,
+        }
+
+
+def _room_kind(room):
+    if ":" in room:
+        return room.split(":", 1)[0]
+    if room in ("admin", "drivers"):
+        return room
+    return "job"
+
+
+class SocketMetrics:
+    """Per-event handler and emit statistics for this worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handlers = {}         # event -> _Histogram (ms)
+        self._series = {}           # event -> (_Histogram (ms), _Histogram (sockets)) per emit
+        self._roles = {}            # sid -> role
+        self.errors = Counter()     # event -> handler exceptions
+        self.server = None
+        self._started_at = time.monotonic()
+        self._requests = {}         # collect() request id -> worker snapshots received
+        backplane.subscribe("socket_metrics.request", self._on_request)
+        backplane.subscribe("socket_metrics.reply", self._on_reply)
+
+    def init_app(self, socketio):
+        """Wrap the handlers and emit of *socketio*'s server (call after
+        ``socketio.init_app``)."""
+        if not SOCKET_METRICS_ENABLED or socketio.server is None:
+            return
+        server = self.server = socketio.server
+        for namespace, handlers in server.handlers.items():
+            for event, handler in list(handlers.items()):
+                handlers[event] = self._timed(event, handler)
+        emit = server.emit
+        clock = time.perf_counter
+        series = self._series
+
+        def timed_emit(event, data=None, to=None, room=None, skip_sid=None, namespace=None, **kwargs):
+            start = clock()
+            try:
+                return emit(event, data, to=to, room=room, skip_sid=skip_sid, namespace=namespace, **kwargs)
+            finally:
+                ms = (clock() - start) * 1000
+                hists = series.get(event) or self._new_series(event)
+                hists[0].add(ms)
+                hists[1].add(self._recipients_of(namespace or "/", to or room))
+        server.emit = timed_emit
+
+    # -- recording -------------------------------------------------------------
+    # No lock on the hot path: eventlet workers run one green thread at a
+    # time and never switch inside these updates; under the threading
+    # server (development) a concurrent update can at worst be lost.
+
+    def _timed(self, event, handler):
+        hist = self._handlers[event] = _Histogram(LATENCY_BUCKETS_MS)
+        errors = self.errors
+        clock = time.perf_counter
+        track = self._track_role if event in ROLE_EVENTS or event in ("connect", "disconnect", "join") else None
+
+        def timed(sid, *args):
+            start = clock()
+            try:
+                return handler(sid, *args)
+            except Exception:
+                errors[event] += 1
+                raise
+            finally:
+                hist.add((clock() - start) * 1000)
+                if track is not None:
+                    track(event, sid, args)
+        timed.__name__ = getattr(handler, "__name__", event)
+        return timed
+
+    def _track_role(self, event, sid, args):
+        if event == "connect":
+            self._roles.setdefault(sid, "unknown")
+        elif event == "disconnect":
+            self._roles.pop(sid, None)
+        elif event in ROLE_EVENTS:
+            self._roles[sid] = ROLE_EVENTS[event]
+        elif args and isinstance(args[0], dict) and str(args[0].get("room", "")).startswith("driver:"):
+            self._roles[sid] = "driver"
+
+    def _new_series(self, event):
+        with self._lock:
+            hists = self._series.get(event)
+            if hists is None:
+                hists = self._series[event] = (_Histogram(LATENCY_BUCKETS_MS), _Histogram(SIZE_BUCKETS))
+            return hists
+
+    def _recipients_of(self, namespace, target):
+        """Sockets on this worker in *target* (room, list of rooms or None
+        for the namespace); overlapping rooms are counted once per room."""
+        rooms = self.server.manager.rooms.get(namespace)
+        if not rooms:
+            return 0
+        if target is None:
+            return len(rooms.get(None, ()))
+        if target.__class__ is str:
+            return len(rooms.get(target, ()))
+        try:
+            return sum(len(rooms.get(r, ())) for r in target)
+        except TypeError:
+            return 0
+
+    # -- reading ---------------------------------------------------------------
+
+    def snapshot(self):
+        """Handler and emit statistics, connections and room sizes."""
+        with self._lock:
+            handlers = {event: dict(h.to_dict(), errors=self.errors.get(event, 0))
+                        for event, h in sorted(self._handlers.items()) if h.total}
+            emits = {event: dict(ms.to_dict(), recipients=sockets.to_dict())
+                     for event, (ms, sockets) in sorted(self._series.items())}
+            roles = Counter(list(self._roles.values()))
+        return {
+            "enabled": self.server is not None,
+            "uptime_seconds": round(time.monotonic() - self._started_at),
+            "connections": dict(roles, total=sum(roles.values())),
+            "handlers_ms": handlers,
+            "emits_ms": emits,
+            "rooms": self.room_sizes(),
+        }
+
+    def worker_snapshot(self):
+        """This worker's socket metrics and per-worker service statistics."""
+        snapshot = {"host_id": backplane.host_id, "host": socket.gethostname(),
+                    "pid": os.getpid(), "sockets": self.snapshot()}
+        for key, module, name in WORKER_SOURCES:
+            snapshot[key] = getattr(importlib.import_module(module), name).snapshot()
+        return snapshot
+
+    def collect(self, timeout=METRICS_GATHER_SECONDS):
+        """``worker_snapshot()`` of every worker, sorted by host id: this
+        worker's at once, the others' as they answer within *timeout*."""
+        request_id = uuid.uuid4().hex
+        with self._lock:
+            self._requests[request_id] = []
+        try:
+            backplane.publish("socket_metrics.request", {"request_id": request_id})
+            if backplane.clustered:
+                time.sleep(timeout)
+        finally:
+            with self._lock:
+                workers = self._requests.pop(request_id)
+        return sorted(workers, key=lambda w: w["host_id"])
+
+    def _on_request(self, data):
+        backplane.publish("socket_metrics.reply", {"request_id": data["request_id"],
+                                                   "worker": self.worker_snapshot()})
+
+    def _on_reply(self, data):
+        with self._lock:
+            workers = self._requests.get(data["request_id"])
+            if workers is not None:
+                workers.append(data["worker"])
+
+    def room_sizes(self):
+        """Member counts per kind of room on this worker (sid rooms left out)."""
+        if self.server is None:
+            return {}
+        kinds = {}
+        for namespace, rooms in list(self.server.manager.rooms.items()):
+            sids = rooms.get(None, {})
+            for room, members in list(rooms.items()):
+                if room is None or room in sids:
+                    continue
+                kind = kinds.get(_room_kind(room))
+                if kind is None:
+                    kind = kinds[_room_kind(room)] = _Histogram(SIZE_BUCKETS)
+                kind.add(len(members))
+        return {kind: {"rooms": h.total, "members": int(h.sum), "max": int(h.max),
+                       "p50": h.quantile(0.5), "p99": h.quantile(0.99)}
+                for kind, h in sorted(kinds.items())}
+
+
+# Process-wide metrics; server.py hooks them into the Socket.IO server.
+socket_metrics = SocketMetrics()
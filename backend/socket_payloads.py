@@ -0,0 +1,112 @@
+"""
+Compact payloads for the high-volume Socket.IO events.
+
+``job:new`` used to carry the whole ``job.to_dict()`` -- about 40 fields,
+photo URL arrays and every timestamp -- to every driver in range, and
+the other job events each built their own ad-hoc dict.  The payloads
+below carry only what the apps render:
+
+    job:new          id, status, address, lat, lng, items, volume_estimate,
+                     scheduled_at, total_price, notes, v
+    job:status       job_id, status, v (+ the caller's extra fields)
+    job:accepted     job_id, status, driver_id, v
+    job:assigned     job_id, contractor_id, contractor_name, v
+    driver:location  contractor_id, lat, lng (also admin:locations entries
+                     and tracking stream frames)
+
+``v`` is the job's version: the millisecond timestamp of the change
+(``updated_at`` when the row is at hand).  A client applies a ``job:status``
+as a delta onto its copy of the job only when ``v`` is newer than what it
+holds, so a late event from another worker cannot roll a job back.  Apps
+that need the full job fetch it over REST.
+
+Coordinates are rounded to COORD_DIGITS decimals (~1 m).  Each payload is
+built once per broadcast and python-socketio encodes one packet per emit
+for all of its recipients.
+
+SOCKETIO_SERIALIZER=msgpack switches the packet codec to python-socketio's
+MessagePack serializer (needs the ``msgpack`` package).  Every client must
+then speak it -- socket.io-msgpack-parser on the web; the iOS Socket.IO
+client has no MessagePack parser, so keep the default while the apps
+connect to the same server.
+"""
+
+from datetime import datetime, timezone
+import os
+import time
+
+SOCKETIO_SERIALIZER = os.environ.get("SOCKETIO_SERIALIZER", "default")
+
+# ~1.1 m of latitude.
+COORD_DIGITS = 5
+
+
+def socketio_serializer():
+    """The Socket.IO packet codec from SOCKETIO_SERIALIZER ("default" or
+    "msgpack")."""
+    if SOCKETIO_SERIALIZER not in ("default", "msgpack"):
+        raise ValueError("SOCKETIO_SERIALIZER must be 'default' or 'msgpack', got {!r}".format(SOCKETIO_SERIALIZER))
+    if SOCKETIO_SERIALIZER == "msgpack":
+        import msgpack  # noqa: F401 -- fail at startup, not on the first emit
+    return SOCKETIO_SERIALIZER
+
+
+def version(job=None):
+    """Millisecond timestamp of the job's last change (now, without a job)."""
+    stamp = getattr(job, "updated_at", None) or getattr(job, "created_at", None)
+    if stamp is None:
+        return int(time.time() * 1000)
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=timezone.utc)
+    return int((stamp - datetime(1970, 1, 1, tzinfo=timezone.utc)).total_seconds() * 1000)
+
+
+def _coord(value):
+    return round(value, COORD_DIGITS) if value is not None else None
+
+
+def _item(item):
+    if isinstance(item, dict):
+        return {"category": item.get("category") or "other", "quantity": item.get("quantity")}
+    return {"category": str(item), "quantity": None}
+
+
+def job_new(job):
+    """``job:new`` for the driver feed and new-job alert."""
+    return {
+        "id": job.id,
+        "status": job.status,
+        "address": job.address,
+        "lat": _coord(job.lat),
+        "lng": _coord(job.lng),
+        "items": [_item(item) for item in (job.items or [])],
+        "volume_estimate": job.volume_estimate,
+        "scheduled_at": job.scheduled_at.isoformat() if job.scheduled_at else None,
+        "total_price": job.total_price,
+        "notes": job.notes,
+        "v": version(job),
+    }
+
+
+def job_status(job_id, status, extra=None, job=None):
+    """``job:status`` / ``job:accepted`` delta for one job."""
+    payload = {"job_id": job_id, "status": status}
+    if extra:
+        payload.update(extra)
+    payload["v"] = version(job)
+    return payload
+
+
+def job_assigned(job, contractor):
+    """``job:assigned`` to the driver a job was given to."""
+    return {
+        "job_id": job.id,
+        "contractor_id": contractor.id,
+        "contractor_name": contractor.user.name if contractor.user else None,
+        "v": version(job),
+    }
+
+
+def driver_location(contractor_id, lat, lng):
+    """One driver position (``driver:location``, ``admin:locations``)."""
+    return {"contractor_id": contractor_id, "lat": _coord(lat), "lng": _coord(lng)}
@@ -0,0 +1,332 @@
+"""
+Spatial index for zone-based surge pricing.
+
+Surge zones carry a GeoJSON-style ``boundary`` polygon plus optional
+day-of-week and HH:MM time windows.  ``SurgeZoneIndex`` compiles them into
+a uniform lat/lng grid whose cells hold, for every (weekday, hour) bucket,
+the zones that can apply there -- sorted by multiplier, highest first.  A
+lookup is one dict access plus a point-in-polygon test for the first few
+candidates, independent of how many zones exist elsewhere.
+
+Zones without a boundary apply everywhere (a city-wide surge), which keeps
+the behaviour of zones created before boundaries were enforced.  A lookup
+without coordinates (estimates made before there is an address) is not
+placed anywhere, so every active zone can apply to it -- the highest
+active multiplier, as before boundaries were honoured.
+
+Indexes are immutable: ``with_zone`` / ``without_zone`` return a new index
+that only recomputes the cells the changed zone touches, so admin edits do
+not require a full rebuild.
+"""
+
+from collections import namedtuple
+from math import floor
+
+from geofencing import _point_in_polygon
+
+# ~5.5 km cells at South Florida latitudes.
+GRID_CELL_DEG = 0.05
+
+# Zones whose bounding box would cover more cells than this are treated as
+# "large" and checked for every lookup instead of being rasterised.
+MAX_CELLS_PER_ZONE = 20000
+
+HOURS_PER_WEEK = 7 * 24
+
+SurgeZoneEntry = namedtuple("SurgeZoneEntry", [
+    "id",
+    "multiplier",
+    "days",         # frozenset of weekday ints (0=Monday) or None for every day
+    "start_time",   # "HH:MM" or None
+    "end_time",     # "HH:MM" or None
+    "polygons",     # tuple of (outer_ring, holes); empty tuple = everywhere
+    "bbox",         # (south, west, north, east) or None
+    "boundary",     # raw boundary JSON (kept for the snapshot fingerprint)
+])
+
+
+# ---------------------------------------------------------------------------
+# Compilation
+# ---------------------------------------------------------------------------
+
+def compile_zone(zone):
+    """Compile a SurgeZone row (or any object with the same attributes)."""
+    days = None
+    if zone.days_of_week:
+        try:
+            days = frozenset(int(d) for d in zone.days_of_week)
+        except (TypeError, ValueError):
+            days = None
+
+    polygons = parse_boundary(zone.boundary)
+    bbox = None
+    if polygons:
+        lats = [p[0] for outer, _holes in polygons for p in outer]
+        lngs = [p[1] for outer, _holes in polygons for p in outer]
+        bbox = (min(lats), min(lngs), max(lats), max(lngs))
+
+    return SurgeZoneEntry(
+        id=zone.id,
+        multiplier=float(zone.surge_multiplier or 1.0),
+        days=days,
+        start_time=zone.start_time or None,
+        end_time=zone.end_time or None,
+        polygons=polygons,
+        bbox=bbox,
+        boundary=zone.boundary,
+    )
+
+
+def parse_boundary(boundary):
+    """Normalise a boundary into ``((outer_ring, holes), ...)``.
+
+    Rings are lists of ``(lat, lng)`` tuples.  Accepted shapes:
+
+    - GeoJSON ``Polygon`` / ``MultiPolygon`` geometry or ``Feature``
+    - a bare GeoJSON ring: ``[[lng, lat], ...]``
+    - a list of ``{"lat": .., "lng": ..}`` points (as used by geofencing)
+
+    Anything unrecognised (including ``None`` / ``[]``) yields ``()``.
+    """
+    if not boundary:
+        return ()
+
+    if isinstance(boundary, dict):
+        if boundary.get("type") == "Feature":
+            return parse_boundary(boundary.get("geometry"))
+        gtype = boundary.get("type")
+        coords = boundary.get("coordinates") or []
+        if gtype == "Polygon":
+            return _polygon_from_geojson(coords)
+        if gtype == "MultiPolygon":
+            out = ()
+            for poly in coords:
+                out += _polygon_from_geojson(poly)
+            return out
+        return ()
+
+    if isinstance(boundary, list):
+        if all(isinstance(p, dict) for p in boundary):
+            ring = _ring([(p.get("lat"), p.get("lng")) for p in boundary])
+            return ((ring, ()),) if ring else ()
+        # Bare GeoJSON ring ([lng, lat] pairs) or Polygon coordinates
+        if boundary and isinstance(boundary[0], list) and boundary[0] and isinstance(boundary[0][0], list):
+            return _polygon_from_geojson(boundary)
+        ring = _ring([(p[1], p[0]) for p in boundary if isinstance(p, (list, tuple)) and len(p) >= 2])
+        return ((ring, ()),) if ring else ()
+
+    return ()
+
+
+def _polygon_from_geojson(rings):
+    parsed = [
+        _ring([(p[1], p[0]) for p in r if isinstance(p, (list, tuple)) and len(p) >= 2])
+        for r in rings or []
+    ]
+    if not parsed or not parsed[0]:
+        return ()
+    return ((parsed[0], tuple(h for h in parsed[1:] if h)),)
+
+
+def _ring(points):
+    try:
+        ring = [(float(lat), float(lng)) for lat, lng in points]
+    except (TypeError, ValueError):
+        return None
+    # GeoJSON rings repeat the first vertex at the end; the ray-casting test
+    # closes rings implicitly.
+    if len(ring) > 1 and ring[0] == ring[-1]:
+        ring = ring[:-1]
+    return ring if len(ring) >= 3 else None
+
+
+def _contains(entry, lat, lng):
+    if not entry.polygons:
+        return True
+    if lat is None or lng is None:
+        return True
+    south, west, north, east = entry.bbox
+    if lat < south or lat > north or lng < west or lng > east:
+        return False
+    for outer, holes in entry.polygons:
+        if _point_in_polygon(lat, lng, outer) and not any(
+            _point_in_polygon(lat, lng, h) for h in holes
+        ):
+            return True
+    return False
+
+
+def _hour_slots(entry):
+    """Return the (weekday * 24 + hour) buckets in which *entry* may apply."""
+    days = entry.days if entry.days is not None else range(7)
+    try:
+        first = int(entry.start_time[:2]) if entry.start_time else 0
+        last = int(entry.end_time[:2]) if entry.end_time else 23
+    except (TypeError, ValueError):
+        first, last = 0, 23
+    if entry.start_time and entry.end_time and entry.start_time > entry.end_time:
+        return ()  # Window can never match (same rule as the exact check)
+    return tuple(d * 24 + h for d in days if 0 <= d <= 6 for h in range(first, last + 1))
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+class SurgeZoneIndex:
+    """Immutable grid index over compiled surge zones."""
+
+    __slots__ = ("cell_deg", "zones", "_members", "_buckets", "_everywhere", "_default_buckets",
+                 "_all_buckets")
+
+    def __init__(self, entries=(), cell_deg=GRID_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.zones = {e.id: e for e in entries}
+        self._members = {}        # cell -> frozenset of rasterised zone ids
+        self._everywhere = frozenset()  # ids of boundary-less or oversized zones
+        everywhere = set()
+        for e in self.zones.values():
+            cells = self._cells_for(e)
+            if cells is None:
+                everywhere.add(e.id)
+                continue
+            for cell in cells:
+                self._members.setdefault(cell, set()).add(e.id)
+        self._everywhere = frozenset(everywhere)
+        self._members = {k: frozenset(v) for k, v in self._members.items()}
+        memo = {}
+        self._default_buckets = self._bucketise(self._everywhere, memo)
+        self._all_buckets = self._bucketise(frozenset(self.zones), memo)
+        self._buckets = {
+            cell: self._bucketise(ids | self._everywhere, memo)
+            for cell, ids in self._members.items()
+        }
+
+    # -- lookups ------------------------------------------------------------
+
+    def multiplier_at(self, lat, lng, when):
+        """Return the highest surge multiplier (>= 1.0) active at a point."""
+        slot = when.weekday() * 24 + when.hour
+        hhmm = when.strftime("%H:%M")
+
+        # Unplaced lookups see every zone
+        buckets = self._all_buckets
+        if lat is not None and lng is not None:
+            try:
+                lat, lng = float(lat), float(lng)
+            except (TypeError, ValueError):
+                lat = lng = None
+            else:
+                buckets = self._buckets.get(self._cell(lat, lng), self._default_buckets)
+
+        for entry in buckets[slot]:
+            if entry.multiplier <= 1.0:
+                break
+            if entry.start_time and hhmm < entry.start_time:
+                continue
+            if entry.end_time and hhmm > entry.end_time:
+                continue
+            if not _contains(entry, lat, lng):
+                continue
+            return entry.multiplier
+        return 1.0
+
+    # -- incremental updates -------------------------------------------------
+
+    def with_zone(self, entry):
+        """Return a new index with *entry* inserted or replaced."""
+        old = self.zones.get(entry.id)
+        zones = dict(self.zones)
+        zones[entry.id] = entry
+        return self._derive(zones, old, entry)
+
+    def without_zone(self, zone_id):
+        """Return a new index with *zone_id* removed (no-op if absent)."""
+        old = self.zones.get(zone_id)
+        if old is None:
+            return self
+        zones = dict(self.zones)
+        del zones[zone_id]
+        return self._derive(zones, old, None)
+
+    def _derive(self, zones, old, new):
+        idx = SurgeZoneIndex.__new__(SurgeZoneIndex)
+        idx.cell_deg = self.cell_deg
+        idx.zones = zones
+
+        old_cells = self._cells_for(old) if old is not None else ()
+        new_cells = self._cells_for(new) if new is not None else ()
+        zone_id = (old or new).id
+
+        everywhere = set(self._everywhere)
+        everywhere.discard(zone_id)
+        if new is not None and new_cells is None:
+            everywhere.add(zone_id)
+        idx._everywhere = frozenset(everywhere)
+
+        members = dict(self._members)
+        for cell in old_cells or ():
+            ids = members.get(cell, frozenset()) - {zone_id}
+            if ids:
+                members[cell] = ids
+            else:
+                members.pop(cell, None)
+        for cell in new_cells or ():
+            members[cell] = members.get(cell, frozenset()) | {zone_id}
+        idx._members = members
+
+        memo = {}
+        idx._default_buckets = idx._bucketise(idx._everywhere, memo)
+        idx._all_buckets = idx._bucketise(frozenset(zones), memo)
+        if old_cells is None or new_cells is None or idx._everywhere != self._everywhere:
+            # A city-wide zone changed -- every cell's buckets include it.
+            idx._buckets = {
+                cell: idx._bucketise(ids | idx._everywhere, memo)
+                for cell, ids in members.items()
+            }
+        else:
+            buckets = dict(self._buckets)
+            for cell in set(old_cells) | set(new_cells):
+                if cell in members:
+                    buckets[cell] = idx._bucketise(members[cell] | idx._everywhere, memo)
+                else:
+                    buckets.pop(cell, None)
+            idx._buckets = buckets
+        return idx
+
+    # -- internals -----------------------------------------------------------
+
+    def _cell(self, lat, lng):
+        return (floor(lat / self.cell_deg), floor(lng / self.cell_deg))
+
+    def _cells_for(self, entry):
+        """Grid cells covered by *entry*'s bounding box, or None for 'everywhere'."""
+        if not entry.polygons:
+            return None
+        south, west, north, east = entry.bbox
+        lo = self._cell(south, west)
+        hi = self._cell(north, east)
+        if (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1) > MAX_CELLS_PER_ZONE:
+            return None
+        return [(i, j) for i in range(lo[0], hi[0] + 1) for j in range(lo[1], hi[1] + 1)]
+
+    def _bucketise(self, ids, memo):
+        """Return the 168 per-hour candidate tuples for a set of zone ids.
+
+        Neighbouring cells usually share the same member set, so results
+        are memoised per build in *memo*.
+        """
+        cached = memo.get(ids)
+        if cached is not None:
+            return cached
+        slots = [[] for _ in range(HOURS_PER_WEEK)]
+        for zone_id in ids:
+            entry = self.zones[zone_id]
+            for slot in _hour_slots(entry):
+                slots[slot].append(entry)
+        buckets = tuple(
+            tuple(sorted(s, key=lambda e: e.multiplier, reverse=True)) if s else ()
+            for s in slots
+        )
+        memo[ids] = buckets
+        return buckets
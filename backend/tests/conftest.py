@@ -0,0 +1,81 @@
+"""
+Shared fixtures for the Umuve backend tests.
+
+The app is imported once per session against a throwaway SQLite database;
+tests create their own rows (random ids), so they don't need a clean
+database between them.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+_tmpdir = tempfile.mkdtemp(prefix="umuve-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///{}".format(os.path.join(_tmpdir, "test.db"))
+os.environ.setdefault("FLASK_ENV", "development")
+os.environ.setdefault("LOCATION_HISTORY_DIR", os.path.join(_tmpdir, "location_history"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app():
+    from server import app as flask_app
+    from extensions import limiter
+
+    flask_app.config["TESTING"] = True
+    limiter.enabled = False
+    return flask_app
+
+
+@pytest.fixture
+def db(app):
+    from models import db as sqlalchemy_db
+
+    with app.app_context():
+        yield sqlalchemy_db
+        sqlalchemy_db.session.remove()
+
+
+@pytest.fixture
+def make_user(db):
+    from models import User, generate_uuid
+
+    def make(role="customer", **fields):
+        user = User(id=generate_uuid(), email="{}-{}@test.umuve".format(role, generate_uuid()[:8]),
+                    role=role, name=role.title(), **fields)
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make
+
+
+@pytest.fixture
+def make_driver(db, make_user):
+    from models import Contractor, generate_uuid
+
+    def make(**fields):
+        user = make_user("driver")
+        fields.setdefault("approval_status", "approved")
+        fields.setdefault("is_online", True)
+        contractor = Contractor(id=generate_uuid(), user_id=user.id, **fields)
+        db.session.add(contractor)
+        db.session.commit()
+        return contractor
+    return make
+
+
+@pytest.fixture
+def make_job(db, make_user):
+    from models import Job, generate_uuid
+
+    def make(**fields):
+        fields.setdefault("customer_id", make_user("customer").id)
+        fields.setdefault("status", "confirmed")
+        fields.setdefault("address", "1 Test St, Fort Lauderdale, FL")
+        job = Job(id=generate_uuid(), **fields)
+        db.session.add(job)
+        db.session.commit()
+        return job
+    return make
@@ -0,0 +1,72 @@
+"""Chat read receipts: coalesced per job and role, skipped once nothing is unread."""
+
+import pytest
+
+from chat_pipeline import ChatPipeline
+from socket_backplane import backplane
+
+
+@pytest.fixture
+def pipeline(app, monkeypatch):
+    # Restore the process-wide pipeline's backplane handler afterwards
+    monkeypatch.setitem(backplane._handlers, "chat_pipeline.unread",
+                        backplane._handlers.get("chat_pipeline.unread"))
+    pipeline = ChatPipeline(flush_ms=60000)     # flushed by hand below
+    pipeline.init_app(app)
+    return pipeline
+
+
+@pytest.fixture
+def chat_job(make_job, make_driver):
+    return make_job(status="en_route", driver_id=make_driver().id)
+
+
+def _unread(db, job_id, sender_role):
+    from models import ChatMessage
+
+    db.session.expire_all()
+    return ChatMessage.query.filter_by(job_id=job_id, sender_role=sender_role, read_at=None).count()
+
+
+def test_read_events_in_one_window_become_one_update(db, pipeline, chat_job):
+    sends = [pipeline.send(chat_job.id, chat_job.customer_id, "customer", "Hi {}".format(i)) for i in range(3)]
+    pipeline.flush()
+    assert [w.wait(0)["message"] for w in sends] == ["Hi 0", "Hi 1", "Hi 2"]
+
+    reads = [pipeline.mark_read(chat_job.id, "driver") for _ in range(5)]
+    assert pipeline.flush() == 1
+    assert [w.wait(0) for w in reads] == [3] * 5
+    assert pipeline.stats["read_updates"] == 1
+    assert pipeline.stats["reads_coalesced"] == 4
+    assert _unread(db, chat_job.id, "customer") == 0
+
+
+def test_clean_pair_is_skipped_until_a_new_message(db, pipeline, chat_job):
+    pipeline.send(chat_job.id, chat_job.customer_id, "customer", "Hi")
+    pipeline.flush()
+    pipeline.mark_read(chat_job.id, "driver")
+    pipeline.flush()
+
+    assert pipeline.mark_read(chat_job.id, "driver") is None
+    assert pipeline.stats["reads_skipped"] == 1
+    # The customer reading the driver's side is a different pair
+    assert pipeline.mark_read(chat_job.id, "customer") is not None
+
+    pipeline.send(chat_job.id, chat_job.customer_id, "customer", "Still there?")
+    pipeline.flush()
+    read = pipeline.mark_read(chat_job.id, "driver")
+    assert read is not None
+    pipeline.flush()
+    assert read.wait(0) == 1
+    assert _unread(db, chat_job.id, "customer") == 0
+
+
+def test_message_committed_during_a_read_keeps_the_pair_dirty(db, pipeline, chat_job):
+    pipeline.send(chat_job.id, chat_job.customer_id, "customer", "Hi")
+    pipeline.flush()
+    pipeline.mark_read(chat_job.id, "driver")
+    # Another worker commits a message before this receipt's group is written
+    backplane.publish("chat_pipeline.unread", [(chat_job.id, "customer")])
+    pipeline.flush()
+
+    assert pipeline.mark_read(chat_job.id, "driver") is not None
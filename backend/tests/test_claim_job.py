@@ -0,0 +1,90 @@
+"""claim_job: of several racing claims on one job, exactly one changes it."""
+
+import threading
+
+from dispatch import claim_job
+from routes.drivers import ACCEPTABLE_JOB_STATUSES
+
+
+def _race(app, claims):
+    """Run each ``claim_job`` argument tuple on its own thread and session,
+    released together; returns who won, in the order given."""
+    from models import db
+
+    barrier = threading.Barrier(len(claims))
+    won = [None] * len(claims)
+
+    def run(i, args, match):
+        with app.app_context():
+            try:
+                barrier.wait()
+                won[i] = claim_job(*args, **match)
+                db.session.commit()
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=run, args=(i, args, match)) for i, (args, match) in enumerate(claims)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return won
+
+
+def _status(db, job_id):
+    from models import Job
+
+    db.session.expire_all()
+    job = db.session.get(Job, job_id)
+    return job.status, job.driver_id
+
+
+def test_one_of_many_accepts_wins(app, db, make_driver, make_job):
+    drivers = [make_driver() for _ in range(8)]
+    job = make_job()
+
+    won = _race(app, [((job.id, ACCEPTABLE_JOB_STATUSES, {"driver_id": d.id, "status": "accepted"}), {})
+                      for d in drivers])
+
+    assert won.count(True) == 1
+    assert _status(db, job.id) == ("accepted", drivers[won.index(True)].id)
+
+
+def test_accept_racing_offer_expiry(app, db, make_driver, make_job):
+    driver = make_driver()
+    for _ in range(10):
+        job = make_job(status="assigned", driver_id=driver.id)
+
+        accepted, expired = _race(app, [
+            ((job.id, ACCEPTABLE_JOB_STATUSES, {"driver_id": driver.id, "status": "accepted"}), {}),
+            ((job.id, ("assigned",), {"driver_id": None, "status": "confirmed"}), {"driver_id": driver.id}),
+        ])
+
+        if expired:
+            # The accept may still land on the re-opened job
+            assert _status(db, job.id) == (("accepted", driver.id) if accepted else ("confirmed", None))
+        else:
+            assert accepted
+            assert _status(db, job.id) == ("accepted", driver.id)
+
+
+def test_two_dispatch_windows_racing(app, db, make_driver, make_job):
+    drivers = make_driver(), make_driver()
+    for _ in range(10):
+        job = make_job()
+
+        won = _race(app, [((job.id, ("confirmed",), {"driver_id": d.id, "status": "assigned"}), {"driver_id": None})
+                          for d in drivers])
+
+        assert won.count(True) == 1
+        assert _status(db, job.id) == ("assigned", drivers[won.index(True)].id)
+
+
+def test_stale_match_changes_nothing(db, make_driver, make_job):
+    first, second = make_driver(), make_driver()
+    job = make_job(status="assigned", driver_id=first.id)
+
+    assert not claim_job(job.id, ("assigned",), {"driver_id": None, "status": "confirmed"}, driver_id=second.id)
+    assert not claim_job(job.id, ("confirmed",), {"driver_id": second.id, "status": "assigned"})
+    db.session.rollback()
+    assert _status(db, job.id) == ("assigned", first.id)
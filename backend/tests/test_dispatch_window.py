@@ -0,0 +1,95 @@
+"""Batched dispatch window: claims against feed accepts, and the offer cap."""
+
+import pytest
+
+import dispatch
+from dispatch import claim_job, run_dispatch_window
+from driver_index import driver_index
+from offers import offer_manager
+
+pytestmark = pytest.mark.dispatch
+
+LAT, LNG = 26.1224, -80.1373
+
+
+@pytest.fixture
+def window(db, make_driver, make_job):
+    """A located confirmed job with one free driver next to it, and no other
+    open jobs or free drivers competing for the window."""
+    from models import Job, Contractor
+
+    Job.query.filter(Job.status.in_(("confirmed", "assigned"))).update(
+        {"status": "cancelled"}, synchronize_session=False)
+    Contractor.query.update({"is_online": False}, synchronize_session=False)
+    db.session.commit()
+    driver = make_driver(current_lat=LAT + 0.01, current_lng=LNG)
+    job = make_job(status="confirmed", lat=LAT, lng=LNG, total_price=200.0)
+    driver_index.expire()
+    yield job, driver
+    offer_manager.forget(job.id)
+
+
+def _reload(db, job_id):
+    from models import Job
+
+    db.session.expire_all()
+    return db.session.get(Job, job_id)
+
+
+def test_window_assigns_free_driver(db, window):
+    job, driver = window
+
+    report = run_dispatch_window()
+
+    assert report["assigned"] == 1
+    job = _reload(db, job.id)
+    assert (job.status, job.driver_id) == ("assigned", driver.id)
+
+
+def test_window_skips_job_accepted_during_solve(db, window, make_driver, monkeypatch):
+    job, driver = window
+    rival = make_driver()
+    solve = dispatch.solve_assignment
+
+    def solve_while_rival_accepts(cost):
+        # A driver takes the job from the feed while the window is solving
+        assert claim_job(job.id, ("confirmed", "assigned"), {"driver_id": rival.id, "status": "accepted"})
+        db.session.commit()
+        return solve(cost)
+    monkeypatch.setattr(dispatch, "solve_assignment", solve_while_rival_accepts)
+
+    report = run_dispatch_window()
+
+    assert report["lost"] == 1
+    assert report["assigned"] == 0
+    job = _reload(db, job.id)
+    assert (job.status, job.driver_id) == ("accepted", rival.id)
+
+
+def test_window_gives_up_after_max_attempts(db, window):
+    job, driver = window
+    exhausted = offer_manager.stats["exhausted"]
+    offer_manager._tried[job.id] = {"passed-{}".format(i) for i in range(offer_manager.max_attempts)}
+
+    assert run_dispatch_window() is None
+    assert offer_manager.given_up(job.id)
+    assert offer_manager.stats["exhausted"] == exhausted + 1
+    job = _reload(db, job.id)
+    assert (job.status, job.driver_id) == ("confirmed", None)
+
+    # Later windows leave it alone until an admin or a driver takes it
+    assert run_dispatch_window() is None
+    assert offer_manager.stats["exhausted"] == exhausted + 1
+
+
+def test_given_up_job_is_not_auto_assigned(db, window):
+    from routes.payments import _auto_assign_driver
+
+    job, driver = window
+    offer_manager.give_up(job.id)
+
+    _auto_assign_driver(job)
+    db.session.commit()
+
+    job = _reload(db, job.id)
+    assert job.driver_id is None
@@ -0,0 +1,60 @@
+"""Pairwise ETAs against the full matrix."""
+
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from eta_engine import EtaEngine
+
+WHEN = datetime(2026, 3, 2, 13, 0, tzinfo=timezone.utc)
+
+
+def test_eta_pairs_matches_matrix_diagonal():
+    engine = EtaEngine()
+    rng = np.random.default_rng(7)
+    origins = np.column_stack([rng.uniform(25.7, 26.4, 50), rng.uniform(-80.5, -80.1, 50)])
+    destinations = np.column_stack([rng.uniform(25.7, 26.4, 50), rng.uniform(-80.5, -80.1, 50)])
+
+    pairs = engine.eta_pairs(origins, destinations, WHEN)
+
+    assert pairs.shape == (50,)
+    np.testing.assert_allclose(pairs, engine.eta(origins, destinations, WHEN).diagonal())
+
+
+def test_eta_pairs_empty_and_mismatched():
+    engine = EtaEngine()
+    assert engine.eta_pairs([], [], WHEN).shape == (0,)
+    with pytest.raises(ValueError):
+        engine.eta_pairs([(26.1, -80.1)], [], WHEN)
+
+
+def test_seed_learns_speeds_from_location_history(tmp_path):
+    from location_history import LocationHistory
+
+    history = LocationHistory(root=str(tmp_path))
+    start = WHEN.timestamp()
+    # 60 pings 30 s apart heading north at 0.003 deg (~0.43 road km) each:
+    # about 52 km/h, against a prior of 32 km/h at this hour
+    for k in range(60):
+        history.append("driver-1", 26.00 + 0.003 * k, -80.2, when=start + 30 * k)
+    history.close()
+
+    engine = EtaEngine()
+    before = engine.eta_minutes((26.0, -80.2), (26.15, -80.2), WHEN)
+    samples = engine.seed(history, days=1, now=WHEN.timestamp() + 3600)
+
+    assert samples == 59
+    assert engine.stats()["observed_driving_hours"] > 0.45
+    assert engine.eta_minutes((26.0, -80.2), (26.15, -80.2), WHEN) < before
+
+
+def test_seed_ignores_history_after_now(tmp_path):
+    from location_history import LocationHistory
+
+    history = LocationHistory(root=str(tmp_path))
+    for k in range(10):
+        history.append("driver-1", 26.00 + 0.003 * k, -80.2, when=WHEN.timestamp() + 30 * k)
+    history.close()
+
+    assert EtaEngine().seed(history, days=1, now=WHEN.timestamp()) == 0
@@ -0,0 +1,26 @@
+"""Geo-cell rooms covering a broadcast radius."""
+
+import random
+
+import pytest
+
+from geo_rooms import GeoRooms
+from geofencing import _haversine
+
+RADIUS_KM = 30.0
+
+
+@pytest.mark.parametrize("lat,lng", [(26.12, -80.14), (25.77, -80.19), (30.33, -81.66), (0.01, -0.01)])
+def test_rooms_cover_radius_and_overshoot_at_most_one_cell(lat, lng):
+    rooms = GeoRooms(cell_deg=0.05)
+    covering = set(rooms.rooms_covering(lat, lng, RADIUS_KM))
+    rng = random.Random(1)
+
+    for _ in range(5000):
+        a, b = lat + rng.uniform(-0.5, 0.5), lng + rng.uniform(-0.5, 0.5)
+        distance = _haversine(lat, lng, a, b)
+        if distance <= RADIUS_KM:
+            assert rooms.room_for(a, b) in covering
+        elif rooms.room_for(a, b) in covering:
+            # One 0.05-degree cell diagonal is under 8 km
+            assert distance <= RADIUS_KM + 8.0
@@ -0,0 +1,20 @@
+"""Admin live map feed after a viewport change."""
+
+from live_map import live_map
+from socket_events import socketio
+
+
+def test_new_viewport_gets_the_drivers_already_in_it(app):
+    live_map._on_note(["map-driver-in", 26.10, -80.10])
+    live_map._on_note(["map-driver-out", 27.50, -80.10])
+    live_map.tick()
+
+    client = socketio.test_client(app)
+    client.emit("admin:join")
+    client.emit("admin:viewport", {"south": 26.0, "west": -80.2, "north": 26.2, "east": -80.0})
+
+    frames = [m["args"][0] for m in client.get_received() if m["name"] == "admin:locations"]
+    ids = {p["contractor_id"] for frame in frames for p in frame["locations"]}
+    assert "map-driver-in" in ids
+    assert "map-driver-out" not in ids
+    client.disconnect()
@@ -0,0 +1,77 @@
+"""Compacted location history is archived to the database."""
+
+import numpy as np
+import pytest
+
+from location_history import LocationHistory, SECONDS_PER_DAY
+
+DAY = 20000     # 2024-10-04
+
+
+@pytest.fixture
+def history(app, db, tmp_path):
+    from models import LocationTrack
+
+    LocationTrack.query.filter_by(day="2024-10-04").delete()
+    db.session.commit()
+    history = LocationHistory(root=str(tmp_path / "host-a"))
+    history.compact_old_days = lambda today=None: {}
+    history.init_app(app)
+    return history
+
+
+def _drive(history, contractor_id, start, pings=120):
+    for k in range(pings):
+        # Straight north at a constant 10 m per 3 s ping, then a turn east
+        lat = 26.1 + min(k, 60) * 9e-5
+        lng = -80.2 + max(k - 60, 0) * 1e-4
+        history.append(contractor_id, lat, lng, when=start + 3 * k)
+
+
+def test_compacted_day_is_read_from_the_archive_on_a_fresh_disk(app, history, tmp_path):
+    start = DAY * SECONDS_PER_DAY + 12 * 3600
+    _drive(history, "driver-1", start)
+    _drive(history, "driver-2", start)
+    history.close()
+
+    before, after = history.compact_day(DAY)
+    assert (before, after) == (240, 6)
+    assert not [name for name in (tmp_path / "host-a" / "2024-10-04").iterdir() if name.suffix == ".bin"]
+
+    # A new container: empty history directory, same database
+    fresh = LocationHistory(root=str(tmp_path / "host-b"))
+    fresh.init_app(app)
+    track = fresh.track("driver-1", start, start + 3600)
+    assert [p[0] for p in track] == [start, start + 180, start + 357]
+    assert track == history.track("driver-1", start, start + 3600)
+    assert sorted(cid for cid, *_ in fresh.day_tracks(DAY)) == ["driver-1", "driver-2"]
+
+
+def test_recompacting_a_day_keeps_what_was_archived(history):
+    start = DAY * SECONDS_PER_DAY + 12 * 3600
+    _drive(history, "driver-1", start)
+    history.close()
+    history.compact_day(DAY)
+
+    # A late segment for the same day (e.g. a worker that was down)
+    _drive(history, "driver-1", start + 7200, pings=10)
+    history.close()
+    history.compact_day(DAY)
+
+    times = [p[0] for p in history.track("driver-1", start, start + 86399)]
+    assert times[:3] == [start, start + 180, start + 357]
+    assert times[-1] == start + 7200 + 27
+    assert times == sorted(times)
+
+
+def test_without_an_app_the_day_is_compacted_locally(tmp_path):
+    history = LocationHistory(root=str(tmp_path))
+    history.compact_old_days = lambda today=None: {}
+    start = DAY * SECONDS_PER_DAY + 12 * 3600
+    _drive(history, "driver-1", start)
+    history.close()
+
+    assert history.compact_day(DAY) == (120, 3)
+    assert (tmp_path / "2024-10-04" / "compact.bin").exists()
+    t, lat, lng = next(iter(history.day_tracks(DAY)))[1:]
+    assert np.allclose(t - start, [0, 180, 357])
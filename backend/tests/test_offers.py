@@ -0,0 +1,51 @@
+"""Offer expiry against a concurrent accept."""
+
+from dispatch import claim_job
+from offers import offer_manager
+
+
+def _reload(db, job_id):
+    from models import Job
+
+    db.session.expire_all()
+    return db.session.get(Job, job_id)
+
+
+def test_expiry_after_accept_leaves_job_with_driver(db, make_driver, make_job):
+    driver = make_driver()
+    job = make_job(status="assigned", driver_id=driver.id)
+
+    # The driver accepts between the timer firing and the revert
+    assert claim_job(job.id, ("assigned",), {"status": "accepted"}, driver_id=driver.id)
+    db.session.commit()
+    offer_manager._expire(job.id, driver.id)
+
+    job = _reload(db, job.id)
+    assert job.status == "accepted"
+    assert job.driver_id == driver.id
+
+
+def test_expiry_returns_unanswered_offer_to_pool(db, make_driver, make_job):
+    driver = make_driver()
+    job = make_job(status="assigned", driver_id=driver.id)
+    expired = offer_manager.stats["expired"]
+
+    # As the timer thread does before expiring: don't offer it to them again
+    offer_manager._tried.setdefault(job.id, set()).add(driver.id)
+    offer_manager._expire(job.id, driver.id)
+
+    job = _reload(db, job.id)
+    assert job.driver_id != driver.id
+    assert offer_manager.stats["expired"] == expired + 1
+
+
+def test_expiry_of_reassigned_offer_is_a_no_op(db, make_driver, make_job):
+    first, second = make_driver(), make_driver()
+    job = make_job(status="assigned", driver_id=second.id)
+    expired = offer_manager.stats["expired"]
+
+    offer_manager._expire(job.id, first.id)
+
+    job = _reload(db, job.id)
+    assert (job.status, job.driver_id) == ("assigned", second.id)
+    assert offer_manager.stats["expired"] == expired
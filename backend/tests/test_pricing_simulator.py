@@ -0,0 +1,47 @@
+"""POST /api/admin/pricing/simulate rejects malformed configs with a 400."""
+
+import pytest
+
+from pricing_simulator import candidate_snapshot
+
+
+@pytest.fixture
+def simulate(app, make_user):
+    from auth_routes import generate_token
+
+    headers = {"Authorization": "Bearer " + generate_token(make_user("admin").id)}
+    client = app.test_client()
+    return lambda config: client.post("/api/admin/pricing/simulate", json={"config": config, "days": 7},
+                                      headers=headers)
+
+
+@pytest.mark.parametrize("tiers", [
+    "abc",
+    [1, 2],
+    [{"min_qty": "abc", "max_qty": 3, "discount_rate": 0.0}],
+    [{"min_qty": [1], "max_qty": 3, "discount_rate": 0.0}],
+    [{"min_qty": 1, "max_qty": 3, "discount_rate": "ten percent"}],
+    [{"min_qty": 1.5, "max_qty": 3, "discount_rate": 0.1}],
+    [{"min_qty": 1, "max_qty": 3}],
+    [{"min_qty": 1, "max_qty": 3, "discount_rate": 1.5}],
+    [{"min_qty": 5, "max_qty": 3, "discount_rate": 0.1}],
+    [{"min_qty": True, "max_qty": 3, "discount_rate": 0.1}],
+])
+def test_bad_tiers_are_a_400(simulate, tiers):
+    response = simulate({"volume_discount_tiers": tiers})
+    assert response.status_code == 400
+    assert "volume_discount_tiers" in response.get_json()["error"]
+
+
+@pytest.mark.parametrize("key,value", [("minimum_job_price", "abc"), ("service_fee_rate", [0.1])])
+def test_bad_scalars_are_a_400(simulate, key, value):
+    assert simulate({key: value}).status_code == 400
+
+
+def test_numeric_strings_are_coerced(db, simulate):
+    tiers = [{"min_qty": "1", "max_qty": "3", "discount_rate": "0"},
+             {"min_qty": "4", "max_qty": None, "discount_rate": "0.1"}]
+
+    assert simulate({"volume_discount_tiers": tiers}).status_code == 200
+    snapshot = candidate_snapshot({"volume_discount_tiers": tiers})
+    assert snapshot.volume_discount_tiers == ((1, 3, 0.0), (4, None, 0.1))
@@ -0,0 +1,43 @@
+"""Bad PricingConfig entries fall back to their defaults, one key at a time."""
+
+import pytest
+
+from routes.booking import (
+    MINIMUM_JOB_PRICE, VOLUME_DISCOUNT_TIERS, get_pricing_snapshot, invalidate_pricing_snapshot,
+)
+
+
+@pytest.fixture
+def pricing_config(db):
+    from models import PricingConfig
+
+    def configure(**values):
+        for key, value in values.items():
+            db.session.merge(PricingConfig(key=key, value=value))
+        db.session.commit()
+        invalidate_pricing_snapshot()
+
+    yield configure
+    PricingConfig.query.delete()
+    db.session.commit()
+    invalidate_pricing_snapshot()
+
+
+def test_bad_keys_are_skipped_with_a_warning(pricing_config, caplog):
+    pricing_config(minimum_job_price="ninety", volume_discount_tiers=[{"min_qty": 1}], weekend_surge=0.2)
+
+    snapshot = get_pricing_snapshot()
+
+    assert snapshot.minimum_job_price == MINIMUM_JOB_PRICE
+    assert snapshot.volume_discount_tiers == tuple(VOLUME_DISCOUNT_TIERS)
+    assert snapshot.weekend_surge == 0.2
+    assert "minimum_job_price" in caplog.text
+    assert "volume_discount_tiers" in caplog.text
+    # Cached: the bad keys don't force a rebuild on every estimate
+    assert get_pricing_snapshot() is snapshot
+
+
+def test_string_numbers_in_tiers_are_converted(pricing_config):
+    pricing_config(volume_discount_tiers=[{"min_qty": "1", "max_qty": "5", "discount_rate": "0.1"}])
+
+    assert get_pricing_snapshot().volume_discount_tiers == ((1, 5, 0.1),)
@@ -0,0 +1,76 @@
+"""Quote tokens are only honoured for the cart, prices and snapshot they were issued for."""
+
+import jwt
+import pytest
+
+import routes.booking as booking
+from routes.booking import quote_estimate, redeem_quote_token, invalidate_pricing_snapshot
+
+ITEMS = [{"category": "furniture", "quantity": 2}, {"category": "appliances", "quantity": 1}]
+DATE = "2030-06-12"
+LAT, LNG = 26.1224, -80.1373
+
+
+@pytest.fixture
+def quote(app, db):
+    invalidate_pricing_snapshot()
+    with app.test_request_context():
+        yield quote_estimate(ITEMS, scheduled_date=DATE, lat=LAT, lng=LNG)
+
+
+def _redeem(token, items=ITEMS, lat=LAT):
+    return redeem_quote_token(token, items, scheduled_date=DATE, lat=lat, lng=LNG)
+
+
+def test_redeems_for_the_same_cart(quote):
+    result, token = quote
+    assert _redeem(token) == {f: result[f] for f in booking.QUOTE_FIELDS}
+    # Item order and coordinate noise don't matter
+    assert _redeem(token, items=list(reversed(ITEMS)), lat=LAT + 1e-7) is not None
+
+
+def test_rejects_a_different_cart(quote):
+    _result, token = quote
+    assert _redeem(token, items=ITEMS[:1]) is None
+    assert _redeem(token, lat=LAT + 0.01) is None
+
+
+def test_rejects_tampered_tokens(app, quote):
+    _result, token = quote
+    payload = jwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
+
+    # Lower price, re-signed with someone else's key
+    payload["q"]["total"] = 1.0
+    assert _redeem(jwt.encode(payload, "someone-elses-secret-key-0123456789abcdef", algorithm="HS256")) is None
+    # Lower price with the real key but the original hash: the hash covers the quote
+    assert _redeem(jwt.encode(payload, app.config["SECRET_KEY"], algorithm="HS256")) is None
+    # Flipped signature byte
+    head, body, signature = token.split(".")
+    flipped = ("A" if signature[0] != "A" else "B") + signature[1:]
+    assert _redeem(".".join([head, body, flipped])) is None
+    assert _redeem("garbage") is None
+    assert _redeem(None) is None
+
+
+def test_rejects_expired_tokens(app, db, monkeypatch):
+    monkeypatch.setattr(booking, "QUOTE_TOKEN_TTL_SECONDS", -1)
+    with app.test_request_context():
+        _result, token = quote_estimate(ITEMS, scheduled_date=DATE, lat=LAT, lng=LNG)
+    assert _redeem(token) is None
+
+
+def test_rejects_tokens_from_a_stale_snapshot(db, quote):
+    from models import PricingConfig
+
+    _result, token = quote
+    db.session.add(PricingConfig(key="service_fee_rate", value=0.5))
+    db.session.commit()
+    invalidate_pricing_snapshot()
+    try:
+        assert _redeem(token) is None
+    finally:
+        db.session.delete(db.session.get(PricingConfig, "service_fee_rate"))
+        db.session.commit()
+        invalidate_pricing_snapshot()
+    # Back on the snapshot it was priced against
+    assert _redeem(token) is not None
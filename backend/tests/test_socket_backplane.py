@@ -0,0 +1,39 @@
+"""psycopg2 patching for the cooperative gunicorn workers."""
+
+import sys
+import types
+
+import socket_backplane
+from socket_backplane import patch_database_driver
+
+
+def _fake_psycogreen(monkeypatch, mode):
+    calls = []
+    package = types.ModuleType("psycogreen")
+    green = types.ModuleType("psycogreen." + mode)
+    green.patch_psycopg = lambda: calls.append(mode)
+    monkeypatch.setitem(sys.modules, "psycogreen", package)
+    monkeypatch.setitem(sys.modules, "psycogreen." + mode, green)
+    return calls
+
+
+def test_patches_psycopg_for_the_worker_hub(monkeypatch):
+    calls = _fake_psycogreen(monkeypatch, "eventlet")
+    monkeypatch.setattr(socket_backplane, "socketio_async_mode", lambda: "eventlet")
+
+    assert patch_database_driver() is True
+    assert calls == ["eventlet"]
+
+
+def test_threading_mode_leaves_psycopg_alone(monkeypatch):
+    calls = _fake_psycogreen(monkeypatch, "eventlet")
+
+    assert patch_database_driver("threading") is False
+    assert calls == []
+
+
+def test_missing_psycogreen_warns(monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, "psycogreen", None)
+
+    assert patch_database_driver("gevent") is False
+    assert "psycogreen is not installed" in caplog.text
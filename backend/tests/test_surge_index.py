@@ -0,0 +1,62 @@
+"""Zone surge lookups with and without coordinates."""
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from surge_index import SurgeZoneIndex, compile_zone
+
+# A Saturday, 14:30 UTC
+WHEN = datetime(2026, 10, 17, 14, 30, tzinfo=timezone.utc)
+
+MIAMI = [{"lat": 25.70, "lng": -80.30}, {"lat": 25.70, "lng": -80.10},
+         {"lat": 25.90, "lng": -80.10}, {"lat": 25.90, "lng": -80.30}]
+
+
+def _zone(zone_id, multiplier, boundary=None, **fields):
+    fields.setdefault("days_of_week", None)
+    fields.setdefault("start_time", None)
+    fields.setdefault("end_time", None)
+    return compile_zone(SimpleNamespace(id=zone_id, surge_multiplier=multiplier, boundary=boundary, **fields))
+
+
+@pytest.fixture
+def index():
+    return SurgeZoneIndex([_zone("miami", 1.5, MIAMI), _zone("citywide", 1.2)])
+
+
+def test_polygon_zone_applies_inside_only(index):
+    assert index.multiplier_at(25.80, -80.20, WHEN) == 1.5
+    assert index.multiplier_at(26.12, -80.14, WHEN) == 1.2
+
+
+@pytest.mark.parametrize("lat,lng", [(None, None), (25.80, None), ("n/a", "n/a")])
+def test_unplaced_lookup_keeps_highest_active_multiplier(index, lat, lng):
+    assert index.multiplier_at(lat, lng, WHEN) == 1.5
+
+
+def test_unplaced_lookup_respects_time_windows():
+    index = SurgeZoneIndex([_zone("evening", 2.0, MIAMI, start_time="18:00", end_time="22:00")])
+    assert index.multiplier_at(None, None, WHEN) == 1.0
+    assert index.multiplier_at(None, None, WHEN.replace(hour=19)) == 2.0
+
+
+def test_incremental_updates_keep_unplaced_lookups(index):
+    index = index.with_zone(_zone("storm", 1.8, MIAMI))
+    assert index.multiplier_at(None, None, WHEN) == 1.8
+    index = index.without_zone("storm").without_zone("miami")
+    assert index.multiplier_at(None, None, WHEN) == 1.2
+
+
+def test_simulator_replay_matches_live_lookup(index):
+    import numpy as np
+    from pricing_simulator import _zone_surge
+
+    points = [(25.80, -80.20), (26.12, -80.14), (None, None)]
+    lat = np.array([p[0] for p in points], dtype=float)
+    lng = np.array([p[1] for p in points], dtype=float)
+    when = np.array([WHEN.replace(tzinfo=None)] * len(points), dtype="datetime64[m]")
+
+    replayed = _zone_surge(index, lat, lng, when)
+    assert list(replayed) == [index.multiplier_at(a, b, WHEN) for a, b in points]
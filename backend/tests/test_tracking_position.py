@@ -0,0 +1,33 @@
+"""The tracking endpoint serves the newest driver position it knows of."""
+
+import time
+
+from driver_index import driver_index
+from tracking_stream import tracking_stream
+
+
+def _driver_position(client, job_id):
+    driver = client.get("/api/tracking/" + job_id).get_json()["tracking"]["driver"]
+    return driver["lat"], driver["lng"]
+
+
+def test_newer_backplane_ping_beats_the_driver_index(app, make_driver, make_job):
+    driver = make_driver(current_lat=26.10, current_lng=-80.10)
+    job = make_job(status="en_route", driver_id=driver.id, lat=26.20, lng=-80.20)
+    driver_index.reload()
+    client = app.test_client()
+
+    assert _driver_position(client, job.id) == (26.10, -80.10)
+
+    # Another worker heard the driver; this worker's index won't see it
+    # until its next reload
+    tracking_stream._on_position([job.id, 26.11, -80.11, time.time()])
+    assert _driver_position(client, job.id) == (26.11, -80.11)
+
+    # A ping through this worker is newer still
+    driver_index.update_location(driver.id, 26.12, -80.12)
+    assert _driver_position(client, job.id) == (26.12, -80.12)
+
+    # A late, older ping from elsewhere is ignored
+    tracking_stream._on_position([job.id, 26.05, -80.05, time.time() - 60])
+    assert _driver_position(client, job.id) == (26.12, -80.12)
@@ -0,0 +1,46 @@
+"""The admin metrics endpoint reports every worker, labelled by host id."""
+
+from socket_backplane import backplane
+from socket_metrics import socket_metrics
+
+
+def _admin_headers(make_user):
+    from auth_routes import generate_token
+
+    return {"Authorization": "Bearer " + generate_token(make_user("admin").id)}
+
+
+def test_single_worker_reports_every_service(app, make_user):
+    response = app.test_client().get("/api/admin/metrics", headers=_admin_headers(make_user))
+
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["clustered"] is False
+    [worker] = body["workers"]
+    assert worker["host_id"] == "local"
+    assert {"sockets", "backplane", "location_buffer", "location_rate", "live_map",
+            "tracking_streams", "geo_rooms", "chat"} <= set(worker)
+
+
+class _Queue:
+    """A message queue with one other worker on it, which answers metrics
+    requests with a canned snapshot."""
+
+    host_id = "worker-a"
+    name = "test"
+
+    def _publish(self, message):
+        if message["topic"] == "socket_metrics.request":
+            backplane.deliver({"method": "app", "topic": "socket_metrics.reply", "host_id": "worker-b",
+                               "data": {"request_id": message["data"]["request_id"],
+                                        "worker": {"host_id": "worker-b", "pid": 2}}})
+
+
+def test_collect_gathers_other_workers_over_the_backplane(app, monkeypatch):
+    monkeypatch.setattr(backplane, "manager", _Queue())
+
+    workers = socket_metrics.collect(timeout=0)
+
+    assert [w["host_id"] for w in workers] == ["worker-a", "worker-b"]
+    assert "sockets" in workers[0]
+    assert socket_metrics._requests == {}
@@ -0,0 +1,311 @@
+"""
+Server-sent event streams for customer job tracking.
+
+Customers who cannot hold a Socket.IO connection used to poll
+``GET /api/tracking/<job_id>`` every few seconds.  They can instead open
+``GET /api/tracking/<job_id>/stream`` and receive
+
+    event: status     the ``job:status`` payload from broadcast_job_status
+    event: location   { job_id, lat, lng, eta_minutes }, at most one per
+                      TRACKING_STREAM_POSITION_SECONDS per job
+
+Driver pings for a job only replace its pending position; a ticker thread
+sends the latest one per job per interval, so a driver pinging every
+second costs a stream one frame every few seconds.  Frames are encoded
+once per job and shared by all of its streams.
+
+Statuses and pings reach every worker through the backplane, so a stream
+sees events raised in any worker; resume history is per worker.  Each
+worker also remembers the newest ping per watched job, which the polling
+endpoint prefers over its driver index when it is fresher.
+
+Streams do not poll: each waits on its own event with the heartbeat as
+timeout and only wakes for a frame or a keepalive comment.  Under the
+eventlet worker that is a parked green thread per stream, so one worker
+holds thousands of idle streams.
+
+Every frame carries an id ``<history>:<seq>``.  The last
+TRACKING_STREAM_HISTORY frames of each job are kept, and a reconnect whose
+Last-Event-ID is still covered gets exactly the frames it missed; anything
+else (another worker, a restart, too far behind) gets a fresh snapshot.
+"""
+
+from collections import Counter, deque
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from socket_backplane import backplane
+from socket_payloads import COORD_DIGITS
+
+logger = logging.getLogger(__name__)
+
+TRACKING_STREAM_POSITION_SECONDS = float(os.environ.get("TRACKING_STREAM_POSITION_SECONDS", "2"))
+TRACKING_STREAM_HEARTBEAT_SECONDS = float(os.environ.get("TRACKING_STREAM_HEARTBEAT_SECONDS", "15"))
+TRACKING_STREAM_HISTORY = int(os.environ.get("TRACKING_STREAM_HISTORY", "50"))
+TRACKING_STREAM_MAX_CLIENTS = int(os.environ.get("TRACKING_STREAM_MAX_CLIENTS", "5000"))
+
+# A job's history is kept this long after its last stream closes, so a
+# client on a flaky connection can still resume.
+HISTORY_IDLE_SECONDS = 300
+
+# Jobs whose last heard position is remembered (cleared when full).
+POSITION_MEMORY_JOBS = 10000
+
+# After one of these a stream sends the frame and ends.
+TERMINAL_STATUSES = ("completed", "cancelled")
+
+
+def encode(event, event_id, data):
+    """One SSE frame."""
+    return "id: {}\nevent: {}\ndata: {}\n\n".format(
+        event_id, event, json.dumps(data, separators=(",", ":"), default=str))
+
+
+class _Stream:
+    """Frames waiting for one client, and the event that wakes it."""
+
+    __slots__ = ("job_id", "frames", "wake", "ended")
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.frames = deque(maxlen=TRACKING_STREAM_HISTORY)
+        self.wake = threading.Event()
+        self.ended = False          # a terminal status is queued
+
+
+class _JobFeed:
+    """Per-job state: open streams, recent frames and the ETA target."""
+
+    __slots__ = ("token", "seq", "history", "streams", "status", "target", "pending", "idle_since")
+
+    def __init__(self):
+        self.token = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.history = deque(maxlen=TRACKING_STREAM_HISTORY)    # (seq, frame)
+        self.streams = set()
+        self.status = None
+        self.target = (None, None)      # job (lat, lng), for the ETA
+        self.pending = None             # latest (lat, lng) since the last tick
+        self.idle_since = None
+
+    def last_id(self):
+        return "{}:{}".format(self.token, self.seq)
+
+
+class TrackingStreamHub:
+    """Fans job status changes and throttled driver positions out to the
+    tracking streams open on this worker."""
+
+    def __init__(self, position_seconds=TRACKING_STREAM_POSITION_SECONDS,
+                 heartbeat_seconds=TRACKING_STREAM_HEARTBEAT_SECONDS,
+                 max_clients=TRACKING_STREAM_MAX_CLIENTS):
+        self.position_seconds = position_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._feeds = {}            # job id -> _JobFeed
+        self._heard = {}            # job id -> newest (lat, lng, time.time()) from any worker
+        self._clients = 0
+        self._thread = None
+        self.stats = Counter()
+        backplane.subscribe("tracking_stream.status", self._on_status)
+        backplane.subscribe("tracking_stream.position", self._on_position)
+
+    # -- streams ---------------------------------------------------------------
+
+    def open(self, job_id, status, target):
+        """Register a stream for *job_id* (currently *status*, destination
+        *target*).  Returns ``(stream, last_id)``, or None when this worker
+        already holds max_clients streams."""
+        with self._lock:
+            if self._clients >= self.max_clients:
+                self.stats["rejected"] += 1
+                return None
+            feed = self._feeds.get(job_id)
+            if feed is None:
+                feed = self._feeds[job_id] = _JobFeed()
+            if feed.status not in TERMINAL_STATUSES:
+                feed.status = status
+            feed.target = target
+            feed.idle_since = None
+            stream = _Stream(job_id)
+            stream.ended = feed.status in TERMINAL_STATUSES
+            feed.streams.add(stream)
+            self._clients += 1
+            self.stats["opened"] += 1
+            last_id = feed.last_id()
+        self._ensure_thread()
+        return stream, last_id
+
+    def close(self, stream):
+        with self._lock:
+            feed = self._feeds.get(stream.job_id)
+            if feed is None or stream not in feed.streams:
+                return
+            feed.streams.discard(stream)
+            self._clients -= 1
+            self.stats["closed"] += 1
+            if not feed.streams:
+                feed.pending = None
+                feed.idle_since = time.monotonic()
+
+    def replay(self, job_id, last_event_id):
+        """Frames after *last_event_id*, oldest first, or None if this
+        worker cannot tell what the client missed."""
+        try:
+            token, seq = last_event_id.split(":")
+            seq = int(seq)
+        except (AttributeError, ValueError):
+            return None
+        with self._lock:
+            feed = self._feeds.get(job_id)
+            if feed is None or feed.token != token or seq > feed.seq:
+                return None
+            missed = [frame for n, frame in feed.history if n > seq]
+            oldest = feed.history[0][0] if feed.history else feed.seq + 1
+            if seq < oldest - 1:
+                # Some of what it missed has already been dropped
+                return None
+            self.stats["resumed"] += 1
+            return missed
+
+    def wait(self, stream, timeout):
+        """Frames for *stream*, or an empty list after *timeout* seconds."""
+        if not stream.frames:
+            stream.wake.wait(timeout)
+        stream.wake.clear()
+        frames = []
+        while stream.frames:
+            frames.append(stream.frames.popleft())
+        return frames
+
+    # -- inputs ----------------------------------------------------------------
+
+    def publish_status(self, job_id, payload):
+        """A ``job:status`` broadcast for *job_id* (sent to every worker)."""
+        backplane.publish("tracking_stream.status", dict(payload, job_id=job_id))
+
+    def note_position(self, job_id, lat, lng):
+        """A driver ping for *job_id*; sent with the next tick."""
+        from location_rate import location_rate
+
+        # Only jobs someone follows (an SSE stream registers as a watcher)
+        if location_rate.watched(job_id):
+            backplane.publish("tracking_stream.position", [job_id, lat, lng, time.time()])
+
+    def last_position(self, job_id):
+        """``(lat, lng, at)`` of the newest ping heard for *job_id* from any
+        worker, *at* being the sender's wall time; None if none was."""
+        return self._heard.get(job_id)
+
+    def _on_status(self, payload):
+        job_id = payload["job_id"]
+        if payload.get("status") in TERMINAL_STATUSES:
+            self._heard.pop(job_id, None)
+        with self._lock:
+            feed = self._feeds.get(job_id)
+            if feed is None:
+                return
+            feed.status = payload.get("status", feed.status)
+            self._publish(feed, "status", payload)
+            self.stats["status_frames"] += 1
+            if feed.status in TERMINAL_STATUSES:
+                for stream in feed.streams:
+                    stream.ended = True
+
+    def _on_position(self, data):
+        job_id, lat, lng, at = data
+        heard = self._heard.get(job_id)
+        if heard is None or at >= heard[2]:
+            if heard is None and len(self._heard) >= POSITION_MEMORY_JOBS:
+                self._heard.clear()
+            self._heard[job_id] = (lat, lng, at)
+        feed = self._feeds.get(job_id)
+        if feed is None or not feed.streams:
+            return
+        with self._lock:
+            feed.pending = (lat, lng)
+            self.stats["pings"] += 1
+
+    # -- ticks -----------------------------------------------------------------
+
+    def tick(self):
+        """Send each job's latest pending position; forget idle jobs."""
+        from eta_engine import eta_engine
+        from routes.tracking import ETA_JOB_STATUSES
+
+        now = time.monotonic()
+        with self._lock:
+            moved = []
+            for job_id, feed in list(self._feeds.items()):
+                if feed.pending is not None:
+                    moved.append((job_id, feed, feed.pending, feed.status, feed.target))
+                    feed.pending = None
+                elif feed.idle_since is not None and now - feed.idle_since > HISTORY_IDLE_SECONDS:
+                    del self._feeds[job_id]
+
+        # ETAs outside the lock: a stream waking up must not wait on them.
+        # One eta_pairs() call for every moved job.
+        etas = {}
+        wanted = [m for m in moved if m[3] in ETA_JOB_STATUSES and None not in m[4]]
+        if wanted:
+            minutes = eta_engine.eta_pairs([m[2] for m in wanted], [m[4] for m in wanted])
+            for m, value in zip(wanted, minutes):
+                etas[m[0]] = round(float(value))
+        frames = [(feed, {"job_id": job_id, "lat": round(lat, COORD_DIGITS), "lng": round(lng, COORD_DIGITS),
+                          "eta_minutes": etas.get(job_id)})
+                  for job_id, feed, (lat, lng), _status, _target in moved]
+
+        with self._lock:
+            for feed, data in frames:
+                self._publish(feed, "location", data)
+            self.stats["ticks"] += 1
+            self.stats["location_frames"] += len(frames)
+        return len(frames)
+
+    def snapshot(self):
+        """Open streams and frame counts (this worker only)."""
+        with self._lock:
+            return {
+                "clients": self._clients,
+                "max_clients": self.max_clients,
+                "jobs": sum(1 for feed in self._feeds.values() if feed.streams),
+                "position_seconds": self.position_seconds,
+                "heartbeat_seconds": self.heartbeat_seconds,
+                "stats": dict(self.stats),
+            }
+
+    # -- internals -------------------------------------------------------------
+
+    def _publish(self, feed, event, data):
+        """Append one frame to the feed's history and its streams.  Caller
+        holds the lock."""
+        feed.seq += 1
+        frame = encode(event, feed.last_id(), data)
+        feed.history.append((feed.seq, frame))
+        for stream in feed.streams:
+            stream.frames.append(frame)
+            stream.wake.set()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="tracking-stream", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.position_seconds)
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Tracking stream tick failed")
+
+
+# Process-wide hub fed by broadcast_job_status and driver pings.
+tracking_stream = TrackingStreamHub()
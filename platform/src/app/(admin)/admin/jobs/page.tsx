@@ -23,6 +23,7 @@ import {
   adminApi,
   type AdminJobRecord,
   type AdminContractorRecord,
+  type AdminJobCandidate,
 } from "@/lib/api";
 
 const STATUS_TABS = [
@@ -203,7 +204,8 @@ function AssignDriverModal({
   onClose: () => void;
   onAssigned: () => void;
 }) {
-  const [contractors, setContractors] = useState<AdminContractorRecord[]>([]);
+  const [operators, setOperators] = useState<AdminContractorRecord[]>([]);
+  const [candidates, setCandidates] = useState<AdminJobCandidate[]>([]);
   const [loading, setLoading] = useState(true);
   const [assigning, setAssigning] = useState<string | null>(null);
   const [error, setError] = useState<string | null>(null);
@@ -211,8 +213,12 @@ function AssignDriverModal({
   useEffect(() => {
     async function load() {
       try {
-        const res = await adminApi.contractors({ status: "approved" });
-        setContractors(res.contractors || []);
+        const [ops, ranked] = await Promise.all([
+          adminApi.contractors({ status: "approved", type: "operator" }),
+          adminApi.jobCandidates(job.id),
+        ]);
+        setOperators(ops.contractors || []);
+        setCandidates(ranked.candidates || []);
       } catch {
         setError("Failed to load drivers");
       } finally {
@@ -220,7 +226,7 @@ function AssignDriverModal({
       }
     }
     load();
-  }, []);
+  }, [job.id]);
 
   const handleAssign = async (contractorId: string) => {
     setAssigning(contractorId);
@@ -271,11 +277,11 @@ function AssignDriverModal({
                 Loading available drivers...
               </span>
             </div>
-          ) : contractors.length === 0 ? (
+          ) : operators.length === 0 && candidates.length === 0 ? (
             <div className="text-center py-12">
               <Truck className="h-10 w-10 text-muted-foreground/50 mx-auto mb-3" />
               <p className="text-sm text-muted-foreground">
-                No approved drivers available.
+                No online drivers available for this job.
               </p>
               <p className="text-xs text-muted-foreground mt-1">
                 Register and approve drivers in the Contractors tab first.
@@ -284,11 +290,11 @@ function AssignDriverModal({
           ) : (
             <div className="space-y-4">
               {/* Operators Section */}
-              {contractors.filter((c) => c.is_operator).length > 0 && (
+              {operators.length > 0 && (
                 <div>
                   <p className="text-xs font-medium text-muted-foreground uppercase tracking-wider mb-2">Fleet Operators</p>
                   <div className="space-y-2">
-                    {contractors.filter((c) => c.is_operator).map((c) => (
+                    {operators.map((c) => (
                       <div
                         key={c.id}
                         className="flex items-center justify-between rounded-lg border border-amber-200 bg-amber-50/50 p-3 hover:bg-amber-50 transition-colors"
@@ -331,11 +337,11 @@ function AssignDriverModal({
               )}
 
               {/* Regular Contractors Section */}
-              {contractors.filter((c) => !c.is_operator).length > 0 && (
+              {candidates.length > 0 && (
                 <div>
                   <p className="text-xs font-medium text-muted-foreground uppercase tracking-wider mb-2">Contractors</p>
                   <div className="space-y-2">
-                    {contractors.filter((c) => !c.is_operator).map((c) => (
+                    {candidates.map((c) => (
                       <div
                         key={c.id}
                         className="flex items-center justify-between rounded-lg border border-border p-3 hover:bg-muted/30 transition-colors"
@@ -352,14 +358,19 @@ function AssignDriverModal({
                             </p>
                             <p className="text-xs text-muted-foreground">
                               {c.truck_type || "No vehicle info"}
-                              {c.is_online && (
+                              {c.distance_km != null && (
+                                <span className="ml-2">{c.distance_km} km away</span>
+                              )}
+                              {c.eta_minutes != null && (
+                                <span className="ml-2">~{Math.round(c.eta_minutes)} min</span>
+                              )}
+                              {c.available ? (
                                 <span className="ml-2 text-green-600">
-                                  ● Online
+                                  ● Available
                                 </span>
-                              )}
-                              {!c.is_online && (
-                                <span className="ml-2 text-muted-foreground">
-                                  ○ Offline
+                              ) : (
+                                <span className="ml-2 text-amber-600">
+                                  ● On a job
                                 </span>
                               )}
                             </p>
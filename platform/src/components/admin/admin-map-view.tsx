@@ -66,18 +66,22 @@ export default function AdminMapView() {
   // Socket.IO for live updates
   // -----------------------------------------------------------------------
 
-  const { isConnected } = useAdminMapSocket({
-    onContractorLocation: useCallback(
-      (data: { contractor_id: string; lat: number; lng: number }) => {
+  const { isConnected, setViewport } = useAdminMapSocket({
+    onContractorLocations: useCallback(
+      (updates: { contractor_id: string; lat: number; lng: number }[]) => {
         setContractors((prev) => {
-          const idx = prev.findIndex((c) => c.id === data.contractor_id);
-          if (idx === -1) {
+          const byId = new Map(updates.map((u) => [u.contractor_id, u]));
+          let unknown = byId.size;
+          const next = prev.map((c) => {
+            const u = byId.get(c.id);
+            if (!u) return c;
+            unknown -= 1;
+            return { ...c, lat: u.lat, lng: u.lng };
+          });
+          if (unknown > 0) {
             // Unknown contractor — refetch to get full info
             fetchMapData();
-            return prev;
           }
-          const next = [...prev];
-          next[idx] = { ...next[idx], lat: data.lat, lng: data.lng };
           return next;
         });
       },
@@ -117,6 +121,15 @@ export default function AdminMapView() {
         if (!cancelled) setMapLoaded(true);
       });
 
+      // Live positions only for drivers in view
+      const sendViewport = () => {
+        const b = map.getBounds();
+        if (!b) return;
+        setViewport({ south: b.getSouth(), west: b.getWest(), north: b.getNorth(), east: b.getEast() });
+      };
+      map.on("load", sendViewport);
+      map.on("moveend", sendViewport);
+
       mapRef.current = map;
     });
 
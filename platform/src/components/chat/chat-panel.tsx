@@ -136,6 +136,10 @@ export function ChatPanel({ jobId, isOpen, onClose, userRole }: ChatPanelProps)
       setMessages((prev) => {
         // Deduplicate by id
         if (prev.some((m) => m.id === msg.id)) return prev;
+        // Our own message: replace the optimistic copy
+        if (msg.client_id && prev.some((m) => m.id === msg.client_id)) {
+          return prev.map((m) => (m.id === msg.client_id ? msg : m));
+        }
         return [...prev, msg];
       });
       // If the new message is from the other party, mark as read
@@ -246,13 +250,32 @@ export function ChatPanel({ jobId, isOpen, onClose, userRole }: ChatPanelProps)
     try {
       const socket = getSocket();
       if (socket.connected) {
-        // Send via socket for real-time delivery
-        socket.emit("chat:send", {
-          job_id: jobId,
-          sender_id: user?.id,
-          sender_role: userRole,
-          message: text,
-        });
+        // Send via socket for real-time delivery; the ack carries the
+        // stored id once the message is committed
+        socket.emit(
+          "chat:send",
+          {
+            job_id: jobId,
+            sender_id: user?.id,
+            sender_role: userRole,
+            message: text,
+            client_id: optimisticMsg.id,
+          },
+          (ack: { success?: boolean; id?: string; created_at?: string; error?: string }) => {
+            setMessages((prev) =>
+              ack?.success && ack.id
+                ? prev.some((m) => m.id === ack.id)
+                  ? prev.filter((m) => m.id !== optimisticMsg.id)
+                  : prev.map((m) =>
+                      m.id === optimisticMsg.id
+                        ? { ...m, id: ack.id as string, created_at: ack.created_at || m.created_at }
+                        : m
+                    )
+                : prev.filter((m) => m.id !== optimisticMsg.id)
+            );
+            if (!ack?.success) setError("Failed to send message");
+          }
+        );
       } else {
         // Fallback to REST
         const res = await chatApi.sendMessage(jobId, text);
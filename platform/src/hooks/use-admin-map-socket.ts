@@ -11,23 +11,36 @@ interface ContractorLocationUpdate {
   lng: number;
 }
 
+interface ContractorLocationsFrame {
+  locations: ContractorLocationUpdate[];
+}
+
 interface JobStatusUpdate {
   job_id: string;
   status: string;
 }
 
+export interface MapViewport {
+  south: number;
+  west: number;
+  north: number;
+  east: number;
+}
+
 interface UseAdminMapSocketOptions {
-  onContractorLocation?: (data: ContractorLocationUpdate) => void;
+  /** Drivers that moved since the last tick (one batch per second). */
+  onContractorLocations?: (data: ContractorLocationUpdate[]) => void;
   onJobStatus?: (data: JobStatusUpdate) => void;
 }
 
 export function useAdminMapSocket(options: UseAdminMapSocketOptions = {}) {
   const [isConnected, setIsConnected] = useState(false);
   const socketRef = useRef<Socket | null>(null);
+  const viewportRef = useRef<MapViewport | null>(null);
 
   // Use refs for callbacks to avoid socket recreation when callbacks change
-  const onContractorLocationRef = useRef(options.onContractorLocation);
-  onContractorLocationRef.current = options.onContractorLocation;
+  const onContractorLocationsRef = useRef(options.onContractorLocations);
+  onContractorLocationsRef.current = options.onContractorLocations;
 
   const onJobStatusRef = useRef(options.onJobStatus);
   onJobStatusRef.current = options.onJobStatus;
@@ -45,6 +58,7 @@ export function useAdminMapSocket(options: UseAdminMapSocketOptions = {}) {
     socket.on("connect", () => {
       setIsConnected(true);
       socket.emit("admin:join");
+      if (viewportRef.current) socket.emit("admin:viewport", viewportRef.current);
     });
 
     socket.on("disconnect", () => {
@@ -55,8 +69,8 @@ export function useAdminMapSocket(options: UseAdminMapSocketOptions = {}) {
       setIsConnected(false);
     });
 
-    socket.on("admin:contractor-location", (data: ContractorLocationUpdate) => {
-      onContractorLocationRef.current?.(data);
+    socket.on("admin:locations", (data: ContractorLocationsFrame) => {
+      onContractorLocationsRef.current?.(data.locations);
     });
 
     socket.on("admin:job-status", (data: JobStatusUpdate) => {
@@ -71,5 +85,11 @@ export function useAdminMapSocket(options: UseAdminMapSocketOptions = {}) {
     };
   }, []);
 
-  return { isConnected };
+  /** Only receive positions inside the visible map area (null for all). */
+  const setViewport = useCallback((viewport: MapViewport | null) => {
+    viewportRef.current = viewport;
+    socketRef.current?.emit("admin:viewport", viewport);
+  }, []);
+
+  return { isConnected, setViewport };
 }
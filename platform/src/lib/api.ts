@@ -506,6 +506,13 @@ export interface AdminContractorRecord {
   created_at: string;
 }
 
+export interface AdminJobCandidate extends AdminContractorRecord {
+  distance_km: number | null;
+  eta_minutes: number | null;
+  active_jobs: number;
+  available: boolean;
+}
+
 export interface AdminCustomerRecord {
   id: string;
   name: string;
@@ -685,6 +692,12 @@ export const adminApi = {
       body: JSON.stringify({ contractor_id: contractorId }),
     }),
 
+  /** GET /api/admin/jobs/:id/candidates -- drivers ranked by availability and distance */
+  jobCandidates: (jobId: string, limit?: number) =>
+    apiFetch<{ success: boolean; candidates: AdminJobCandidate[] }>(
+      `/api/admin/jobs/${jobId}/candidates${limit ? `?limit=${limit}` : ""}`
+    ),
+
   /** PUT /api/admin/jobs/:id/cancel -- cancel a job */
   cancelJob: (jobId: string) =>
     apiFetch<{ success: boolean }>(`/api/admin/jobs/${jobId}/cancel`, {
@@ -1360,6 +1373,8 @@ export interface ChatMessageRecord {
   message: string;
   read_at: string | null;
   created_at: string;
+  /** Echo of the sender's optimistic id on socket-sent messages */
+  client_id?: string;
 }
 
 export const chatApi = {